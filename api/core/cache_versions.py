@@ -0,0 +1,20 @@
+"""
+Contadores de versión en memoria para invalidar cachés del proceso.
+Los managers incrementan la versión al escribir y las cachés la comparan antes de servir un valor.
+"""
+import threading
+
+_lock = threading.Lock()
+_versiones = {}
+
+def bump_version(namespace: str, key=None) -> int:
+    """Incrementa y devuelve la versión de (namespace, key)"""
+    with _lock:
+        version = _versiones.get((namespace, key), 0) + 1
+        _versiones[(namespace, key)] = version
+        return version
+
+def get_version(namespace: str, key=None) -> int:
+    """Devuelve la versión actual de (namespace, key); 0 si nunca se ha modificado"""
+    with _lock:
+        return _versiones.get((namespace, key), 0)
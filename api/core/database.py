@@ -10,6 +10,42 @@ engine = create_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Motor asíncrono (asyncpg) para el procesador de emails asíncrono; se crea en el primer uso
+ASYNC_DATABASE_URL = get_env_variable("ASYNC_DATABASE_URL", None)
+_async_sessionmaker = None
+
+
+def _async_url(url: str) -> str:
+    """Convierte la URL síncrona (psycopg2) en su equivalente asyncpg."""
+    driver, _, resto = url.partition("://")
+    if driver.startswith("postgresql"):
+        return f"postgresql+asyncpg://{resto}"
+    return url
+
+
+def get_async_sessionmaker():
+    """Fábrica de AsyncSession sobre el motor asíncrono (requiere asyncpg)."""
+    global _async_sessionmaker
+    if _async_sessionmaker is None:
+        from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+        async_engine = create_async_engine(ASYNC_DATABASE_URL or _async_url(DATABASE_URL))
+        # expire_on_commit=False: los objetos siguen siendo legibles tras el commit sin otra consulta
+        _async_sessionmaker = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    return _async_sessionmaker
+
+
+def sesion_independiente(db):
+    """
+    Sesión nueva (con su propia conexión) sobre el mismo motor que db, síncrona o asíncrona según db.
+    Una Session no se puede usar desde dos hilos ni una AsyncSession desde dos tareas a la vez: las ramas
+    del grafo que corren en paralelo con otra que ya usa la sesión del email abren la suya con esta función.
+    """
+    if hasattr(db, "run_sync"):
+        from sqlalchemy.ext.asyncio import AsyncSession
+        return AsyncSession(bind=db.bind, autoflush=False, expire_on_commit=False)
+    return sessionmaker(autocommit=False, autoflush=False, bind=db.get_bind())()
+
+
 def get_db():
     db = SessionLocal()
     try:
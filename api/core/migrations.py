@@ -0,0 +1,71 @@
+# Migraciones ligeras e idempotentes
+"""
+Base.metadata.create_all solo crea tablas nuevas: no añade índices ni columnas a tablas existentes.
+Aquí se declaran las sentencias DDL necesarias para bases de datos ya creadas.
+Todas deben ser idempotentes (IF NOT EXISTS) porque se ejecutan en cada arranque.
+"""
+import logging
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# Ingesta idempotente: un message_id de Gmail solo se guarda una vez.
+# Una base de datos anterior puede tener ya message_id duplicados y entonces el índice único no se podría crear:
+# antes se conserva el email más antiguo de cada message_id (procesado si alguno de sus duplicados lo estaba)
+# y las respuestas de la outbox de los duplicados pasan a apuntar a él.
+INDICE_UNICO_MESSAGE_ID = """
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'uq_emails_message_id') THEN
+        CREATE TEMP TABLE emails_duplicados ON COMMIT DROP AS
+            SELECT e.id, g.id_conservado, e.processed
+              FROM emails e
+              JOIN (SELECT message_id, MIN(id) AS id_conservado FROM emails
+                     WHERE message_id <> '' GROUP BY message_id HAVING COUNT(*) > 1) g ON g.message_id = e.message_id
+             WHERE e.id <> g.id_conservado;
+        UPDATE emails SET processed = true
+         WHERE NOT processed AND id IN (SELECT id_conservado FROM emails_duplicados WHERE processed);
+        UPDATE outbox_emails o SET email_id = d.id_conservado FROM emails_duplicados d WHERE o.email_id = d.id;
+        DELETE FROM emails WHERE id IN (SELECT id FROM emails_duplicados);
+        CREATE UNIQUE INDEX uq_emails_message_id ON emails (message_id) WHERE message_id <> '';
+    END IF;
+END $$
+"""
+
+MIGRATIONS = [
+    INDICE_UNICO_MESSAGE_ID,
+    # Reclamación de emails con lease para varios procesadores
+    "ALTER TABLE emails ADD COLUMN IF NOT EXISTS claimed_by VARCHAR",
+    "ALTER TABLE emails ADD COLUMN IF NOT EXISTS claimed_until TIMESTAMP WITH TIME ZONE",
+    "CREATE INDEX IF NOT EXISTS ix_emails_pendientes ON emails (date, id) WHERE processed = false",
+    # Estadísticas de procesamiento (emails procesados por día)
+    "ALTER TABLE emails ADD COLUMN IF NOT EXISTS processed_at TIMESTAMP WITH TIME ZONE",
+    "CREATE INDEX IF NOT EXISTS ix_emails_processed_at ON emails (processed_at)",
+    # Presupuesto mensual de tokens por campaña
+    "ALTER TABLE campaigns ADD COLUMN IF NOT EXISTS presupuesto_tokens INTEGER",
+    # Intentos de procesamiento y emails descartados tras agotarlos
+    "ALTER TABLE emails ADD COLUMN IF NOT EXISTS intentos INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE emails ADD COLUMN IF NOT EXISTS fallido BOOLEAN NOT NULL DEFAULT false",
+    "ALTER TABLE emails ADD COLUMN IF NOT EXISTS ultimo_error VARCHAR",
+]
+
+# Sin estas migraciones la aplicación no puede funcionar (la ingesta usa ON CONFLICT sobre uq_emails_message_id):
+# si fallan, el arranque se detiene en lugar de seguir con un aviso en el log
+MIGRACIONES_CRITICAS = {INDICE_UNICO_MESSAGE_ID}
+
+
+def apply_migrations(engine):
+    """
+    Aplica las migraciones pendientes. Un fallo en una sentencia no impide aplicar las demás,
+    salvo en las de MIGRACIONES_CRITICAS, que detienen el arranque.
+    """
+    if engine.dialect.name != 'postgresql':
+        return
+    for sentencia in MIGRATIONS:
+        try:
+            with engine.begin() as conn:
+                conn.execute(text(sentencia))
+        except Exception as e:
+            logger.error(f"Error al aplicar la migración '{sentencia}': {e}")
+            if sentencia in MIGRACIONES_CRITICAS:
+                raise RuntimeError(f"No se pudo aplicar una migración imprescindible: {e}") from e
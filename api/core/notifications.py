@@ -0,0 +1,131 @@
+# Canal de notificaciones entre la ingesta y el procesamiento
+"""
+Permite despertar al procesador en cuanto la ingesta guarda emails nuevos, en lugar de sondear la base de datos:
+- En PostgreSQL usa LISTEN/NOTIFY, así funciona también entre procesos y máquinas.
+- Siempre avisa además en el propio proceso (threading.Event), que es el mecanismo de respaldo
+  si la base de datos no soporta NOTIFY o la conexión de escucha se ha caído.
+- Los oyentes con payload (suscribir_payload) reciben el payload de cada aviso; las cachés los usan para
+  invalidar entradas cuando otro proceso modifica los datos. Mientras no hay escucha activa (escuchando)
+  pueden perderse avisos, y cada vez que la escucha se conecta o se cae cambia la época (epoca).
+"""
+import logging
+import select
+import threading
+import time
+from sqlalchemy import text
+from api.core.database import engine
+from utils.env_loader import get_env_variable
+
+logger = logging.getLogger(__name__)
+
+EMAIL_NOTIFY_CHANNEL = get_env_variable("EMAIL_NOTIFY_CHANNEL", "aimailrol_emails")
+SCENE_NOTIFY_CHANNEL = get_env_variable("SCENE_NOTIFY_CHANNEL", "aimailrol_scenes")
+
+
+class Notifier:
+    """Notificador de un canal: los suscriptores registran un threading.Event que se activa en cada aviso."""
+
+    def __init__(self, canal: str, engine=None):
+        self.canal = canal
+        self.engine = engine
+        self._eventos = []
+        self._oyentes = []
+        self._lock = threading.Lock()
+        self._listener = None
+        self.escuchando = False
+        self.epoca = 0
+
+    @property
+    def usa_postgres(self) -> bool:
+        return self.engine is not None and self.engine.dialect.name == 'postgresql'
+
+    def suscribir(self, evento: threading.Event):
+        """Registra un evento que se activará con cada notificación (y arranca la escucha en PostgreSQL)."""
+        with self._lock:
+            self._eventos.append(evento)
+            self._arrancar_escucha()
+
+    def suscribir_payload(self, oyente):
+        """Registra una función que recibe el payload de cada notificación (y arranca la escucha en PostgreSQL)."""
+        with self._lock:
+            self._oyentes.append(oyente)
+            self._arrancar_escucha()
+
+    def _arrancar_escucha(self):
+        if self.usa_postgres and self._listener is None:
+            self._listener = threading.Thread(target=self._escuchar, daemon=True, name=f"listen-{self.canal}")
+            self._listener.start()
+
+    def notify(self, payload: str = ""):
+        """
+        Avisa a los suscriptores. Debe llamarse después del commit de los datos nuevos.
+        Un fallo de NOTIFY no se propaga: el procesador sigue teniendo su sondeo de respaldo.
+        """
+        self._despertar(payload)
+        if not self.usa_postgres:
+            return
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(text("SELECT pg_notify(:canal, :payload)"), {"canal": self.canal, "payload": payload})
+        except Exception as e:
+            logger.warning(f"No se pudo enviar NOTIFY en {self.canal}: {e}")
+
+    def notify_en(self, db, payload: str = ""):
+        """
+        Encola el NOTIFY en la transacción de db: PostgreSQL solo lo entrega si se hace commit, y en el mismo
+        instante en que los cambios se hacen visibles. No avisa en el propio proceso (lo hace quien confirma).
+        """
+        if self.usa_postgres:
+            db.execute(text("SELECT pg_notify(:canal, :payload)"), {"canal": self.canal, "payload": payload})
+
+    def _despertar(self, payload: str = ""):
+        with self._lock:
+            eventos = list(self._eventos)
+            oyentes = list(self._oyentes)
+        for evento in eventos:
+            evento.set()
+        for oyente in oyentes:
+            try:
+                oyente(payload)
+            except Exception as e:
+                logger.warning(f"Error en un oyente de {self.canal}: {e}")
+
+    def _cambiar_escucha(self, escuchando: bool):
+        with self._lock:
+            self.escuchando = escuchando
+            self.epoca += 1
+
+    def _escuchar(self):
+        """Hilo de escucha LISTEN; se reconecta si la conexión se pierde."""
+        while True:
+            conexion = None
+            try:
+                conexion = self.engine.raw_connection()
+                driver = conexion.driver_connection
+                driver.autocommit = True
+                with driver.cursor() as cursor:
+                    cursor.execute(f'LISTEN "{self.canal}"')
+                self._cambiar_escucha(True)
+                logger.info(f"Escuchando notificaciones en el canal {self.canal}")
+                while True:
+                    if select.select([driver], [], [], 60)[0]:
+                        driver.poll()
+                        while driver.notifies:
+                            self._despertar(driver.notifies.pop(0).payload)
+            except Exception as e:
+                if self.escuchando:
+                    self._cambiar_escucha(False)
+                logger.warning(f"Escucha de {self.canal} interrumpida, reintentando: {e}")
+                time.sleep(5)
+            finally:
+                if conexion is not None:
+                    try:
+                        conexion.invalidate()
+                    except Exception:
+                        pass
+
+
+# Notificador global de emails nuevos pendientes de procesar
+email_notifier = Notifier(EMAIL_NOTIFY_CHANNEL, engine)
+# Notificador global de cambios en escenas (payload: scene_id) para invalidar las cachés de otros procesos
+scene_notifier = Notifier(SCENE_NOTIFY_CHANNEL, engine)
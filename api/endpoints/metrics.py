@@ -0,0 +1,20 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
+from sqlalchemy.orm import Session
+from api.core.database import get_db
+from api.managers.email_manager import EmailManager
+from ia.langgraph.orquestador_langgraph import orquestador_langgraph
+from utils.metrics import metricas, EMAILS_PENDIENTES
+
+router = APIRouter(prefix="/metrics", tags=["metrics"])
+
+@router.get("", response_class=PlainTextResponse)
+def read_metrics(db: Session = Depends(get_db)):
+    """Métricas en formato de texto de Prometheus (cola, ritmo, latencias por nodo y uso del LLM por perfil)."""
+    EMAILS_PENDIENTES.set(EmailManager.count_pending_emails(db))
+    return PlainTextResponse(metricas.exportar(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@router.get("/stats")
+def read_processing_stats():
+    """Resumen del procesamiento: emails pendientes, procesados hoy y ritmo del último minuto."""
+    return orquestador_langgraph.get_processing_stats()
@@ -1,4 +1,5 @@
 from sqlalchemy.orm import Session
+from api.core.cache_versions import bump_version
 from api.models.campaign import Campaign
 from api.models.character import Character
 from api.models.story import Story
@@ -11,12 +12,14 @@ class CampaignManager:
             nombre=campaign.nombre,
             descripcion=campaign.descripcion,
             nombre_clave=campaign.nombre_clave,
-            resumen=campaign.resumen
+            resumen=campaign.resumen,
+            presupuesto_tokens=campaign.presupuesto_tokens
         )
         if campaign.character_ids:
             db_campaign.characters = db.query(Character).filter(Character.id.in_(campaign.character_ids)).all()
         db.add(db_campaign)
         db.commit()
+        bump_version("routing")
         db.refresh(db_campaign)
         return db_campaign
 
@@ -43,6 +46,7 @@ class CampaignManager:
             else:
                 setattr(db_campaign, field, value)
         db.commit()
+        bump_version("routing")
         db.refresh(db_campaign)
         return db_campaign
 
@@ -53,6 +57,7 @@ class CampaignManager:
             return False
         db.delete(db_campaign)
         db.commit()
+        bump_version("routing")
         return True
 
     @staticmethod
@@ -63,6 +68,7 @@ class CampaignManager:
         if campaign and character:
             campaign.characters.append(character)
             db.commit()
+            bump_version("routing")
             db.refresh(campaign)
         return campaign
 
@@ -74,6 +80,7 @@ class CampaignManager:
         if campaign and character and character in campaign.characters:
             campaign.characters.remove(character)
             db.commit()
+            bump_version("routing")
             db.refresh(campaign)
         return campaign
 
@@ -1,4 +1,5 @@
 from sqlalchemy.orm import Session
+from api.core.cache_versions import bump_version
 from api.models.character import Character
 from api.models.associations import campaign_characters, story_characters
 from api.schemas.character import CharacterCreate, CharacterUpdate
@@ -11,6 +12,7 @@ class CharacterManager:
         db_character = Character(**character.model_dump())
         db.add(db_character)
         db.commit()
+        bump_version("routing")
         db.refresh(db_character)
         return db_character
 
@@ -33,6 +35,7 @@ class CharacterManager:
         character = CharacterManager.get(db, character_id)
         db.delete(character)
         db.commit()
+        bump_version("routing")
         return character
 
     @staticmethod
@@ -42,6 +45,7 @@ class CharacterManager:
         for key, value in character_data.model_dump(exclude_unset=True).items():
             setattr(character, key, value)
         db.commit()
+        bump_version("routing")
         db.refresh(character)
         return character
 
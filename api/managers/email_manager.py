@@ -1,9 +1,17 @@
-from typing import List
-from sqlalchemy.orm import Session
+from typing import List, Optional
+from datetime import date, datetime, time, timedelta, timezone
+from sqlalchemy import text, func, and_, or_
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from api.models.email import Email
 from api.schemas.email import EmailCreate, EmailOut
 from fastapi import HTTPException
 
+# Partición de los emails sin escena: los workers la planifican como una escena más y claim_next_email
+# la traduce a scene_id IS NULL (los ids de escena reales empiezan en 1)
+SIN_ESCENA = 0
+
+
 class EmailManager:
     @staticmethod
     def create(db: Session, email: EmailCreate):
@@ -14,6 +22,31 @@ class EmailManager:
         db.refresh(db_email)
         return db_email
 
+    @staticmethod
+    def bulk_ingest(db: Session, emails: List[EmailCreate]) -> List[int]:
+        """
+        Inserta en una sola transacción todos los emails de un ciclo de lectura.
+        Los message_id ya guardados se omiten (ON CONFLICT DO NOTHING), por lo que volver a leer
+        los mismos mensajes tras un fallo no crea duplicados.
+        Devuelve los ids de los emails realmente insertados.
+        """
+        if not emails:
+            return []
+        filas = [email.model_dump() for email in emails]
+        stmt = (
+            pg_insert(Email)
+            .values(filas)
+            .on_conflict_do_nothing(index_elements=[Email.message_id], index_where=text("message_id <> ''"))
+            .returning(Email.id)
+        )
+        try:
+            ids = [fila[0] for fila in db.execute(stmt)]
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        return ids
+
     @staticmethod
     def get(db: Session, email_id: int):
         """Obtiene un email por ID"""
@@ -50,9 +83,229 @@ class EmailManager:
         return db_email
 
     @staticmethod
-    def get_next_email(db: Session) -> Email:
-        """Devuelve el email no procesado más antiguo"""
-        return db.query(Email).filter(Email.processed == False).order_by(Email.date.asc()).first()
+    def get_next_email(db: Session, scene_id: int = None) -> Email:
+        """Devuelve el email no procesado más antiguo (de la escena indicada, si se indica)"""
+        query = db.query(Email).filter(Email.processed == False)
+        if scene_id is not None:
+            query = query.filter(Email.scene_id == scene_id)
+        return query.order_by(Email.date.asc(), Email.id.asc()).first()
+
+    @staticmethod
+    def _claimable_query(db: Session, ahora: datetime):
+        """
+        Emails que se pueden reclamar: sin procesar, sin lease vigente y que sean el más antiguo sin procesar
+        de su escena (aunque ese más antiguo esté reclamado por otro worker).
+        Los emails fallidos (intentos agotados) no se reclaman ni bloquean a los siguientes de su escena.
+        """
+        anterior = aliased(Email)
+        hay_anterior = (
+            db.query(anterior.id)
+            .filter(
+                anterior.scene_id == Email.scene_id,
+                anterior.processed == False,
+                anterior.fallido == False,
+                or_(anterior.date < Email.date, and_(anterior.date == Email.date, anterior.id < Email.id)),
+            )
+            .exists()
+        )
+        return db.query(Email).filter(
+            Email.processed == False,
+            Email.fallido == False,
+            or_(Email.claimed_until.is_(None), Email.claimed_until < ahora),
+            ~hay_anterior,
+        )
+
+    @staticmethod
+    def get_claimable_scene_ids(db: Session, limit: int = None) -> List[int]:
+        """
+        Escenas cuyo siguiente email se puede reclamar ahora, empezando por el email más antiguo.
+        Los emails sin escena se devuelven agrupados en la partición SIN_ESCENA.
+        """
+        query = (
+            EmailManager._claimable_query(db, datetime.now(tz=timezone.utc))
+            .order_by(Email.date.asc(), Email.id.asc())
+            .with_entities(func.coalesce(Email.scene_id, SIN_ESCENA))
+        )
+        if limit:
+            query = query.limit(limit)
+        # Varios emails sin escena se pueden reclamar a la vez, pero forman una sola partición
+        return list(dict.fromkeys(scene_id for (scene_id,) in query.all()))
+
+    @staticmethod
+    def claim_next_email(db: Session, worker_id: str, lease_segundos: int = 600, scene_id: int = None,
+                         max_intentos: int = None) -> Optional[Email]:
+        """
+        Reclama el siguiente email pendiente para worker_id durante lease_segundos.
+        - FOR UPDATE SKIP LOCKED: dos procesos nunca reclaman el mismo email.
+        - Solo se puede reclamar el email más antiguo sin procesar de su escena, aunque esté reclamado por otro
+          worker: así se mantiene el orden estricto dentro de cada escena entre procesos y máquinas.
+        - Los leases caducados (worker caído) se pueden volver a reclamar.
+        - scene_id=SIN_ESCENA reclama solo emails sin escena; scene_id=None, cualquier email.
+        - Cada reclamación cuenta como un intento. Un email que ya agotó max_intentos sin liberarse (el worker
+          murió procesándolo) se marca como fallido y se reclama el siguiente.
+        Hace commit para que la reclamación sea visible para los demás workers.
+        """
+        ahora = datetime.now(tz=timezone.utc)
+        query = EmailManager._claimable_query(db, ahora)
+        if scene_id == SIN_ESCENA:
+            query = query.filter(Email.scene_id.is_(None))
+        elif scene_id is not None:
+            query = query.filter(Email.scene_id == scene_id)
+        query = query.order_by(Email.date.asc(), Email.id.asc()).limit(1).with_for_update(skip_locked=True, of=Email)
+        while True:
+            email = query.first()
+            if not email:
+                db.commit()
+                return None
+            if max_intentos and email.intentos >= max_intentos:
+                EmailManager._marcar_fallido(email, "Lease caducado tras agotar los intentos")
+                db.flush()
+                continue
+            break
+        email.claimed_by = worker_id
+        email.claimed_until = ahora + timedelta(seconds=lease_segundos)
+        email.intentos += 1
+        db.commit()
+        return email
+
+    @staticmethod
+    def claim_scene_batch(db: Session, worker_id: str, lease_segundos: int = 600, scene_id: int = None,
+                          ventana_segundos: int = 120, max_emails: int = 5, max_intentos: int = None) -> List[Email]:
+        """
+        Reclama el siguiente email pendiente (como claim_next_email) junto con los emails posteriores de la
+        misma escena recibidos dentro de ventana_segundos desde el primero, hasta max_emails en total.
+        Los emails posteriores se bloquean con SKIP LOCKED para no esperar a otra transacción que los tenga
+        bloqueados; el grupo se corta en el primero que no se haya podido reclamar, así siempre es consecutivo.
+        Devuelve la lista ordenada por fecha (vacía si no hay emails pendientes).
+        """
+        primero = EmailManager.claim_next_email(db, worker_id, lease_segundos, scene_id, max_intentos)
+        if not primero:
+            return []
+        if primero.scene_id is None or max_emails <= 1:
+            return [primero]
+        ahora = datetime.now(tz=timezone.utc)
+        posteriores = (
+            db.query(Email)
+            .filter(
+                Email.scene_id == primero.scene_id,
+                Email.processed == False,
+                Email.fallido == False,
+                Email.id != primero.id,
+                or_(Email.date > primero.date, and_(Email.date == primero.date, Email.id > primero.id)),
+                Email.date <= primero.date + timedelta(seconds=ventana_segundos),
+            )
+        )
+        orden = [
+            email_id for (email_id,) in
+            posteriores.with_entities(Email.id).order_by(Email.date.asc(), Email.id.asc()).limit(max_emails - 1).all()
+        ]
+        reclamables = {
+            email.id: email for email in (
+                posteriores
+                .filter(Email.id.in_(orden), or_(Email.claimed_until.is_(None), Email.claimed_until < ahora))
+                .with_for_update(skip_locked=True, of=Email)
+                .all()
+            )
+        } if orden else {}
+        siguientes = []
+        for email_id in orden:
+            if email_id not in reclamables:
+                break
+            siguientes.append(reclamables[email_id])
+        for email in siguientes:
+            email.claimed_by = worker_id
+            email.claimed_until = primero.claimed_until
+            email.intentos += 1
+        db.commit()
+        return [primero] + siguientes
+
+    @staticmethod
+    def extend_claim(db: Session, email_id: int, worker_id: str, lease_segundos: int = 600) -> bool:
+        """Renueva el lease de un email reclamado por worker_id. Devuelve False si el lease ya no es suyo."""
+        actualizados = (
+            db.query(Email)
+            .filter(Email.id == email_id, Email.claimed_by == worker_id, Email.processed == False)
+            .update({Email.claimed_until: datetime.now(tz=timezone.utc) + timedelta(seconds=lease_segundos)},
+                    synchronize_session=False)
+        )
+        db.commit()
+        return actualizados > 0
+
+    @staticmethod
+    def mark_as_processed(db: Session, email_id: int, worker_id: str = None) -> bool:
+        """
+        Marca un email como procesado y libera su reclamación. No hace commit: forma parte de la
+        transacción del procesamiento. Si se indica worker_id, solo lo marca si el lease sigue siendo suyo
+        (si caducó y otro worker lo reclamó, devuelve False y el llamador debe descartar su resultado).
+        """
+        query = db.query(Email).filter(Email.id == email_id)
+        if worker_id is not None:
+            query = query.filter(Email.claimed_by == worker_id)
+        actualizados = query.update(
+            {Email.processed: True, Email.processed_at: datetime.now(tz=timezone.utc),
+             Email.claimed_by: None, Email.claimed_until: None},
+            synchronize_session='fetch'
+        )
+        return actualizados > 0
+
+    @staticmethod
+    def count_pending_emails(db: Session) -> int:
+        """Número de emails sin procesar (profundidad de la cola), sin contar los fallidos"""
+        return db.query(func.count(Email.id)).filter(Email.processed == False, Email.fallido == False).scalar() or 0
+
+    @staticmethod
+    def count_failed_emails(db: Session) -> int:
+        """Número de emails que agotaron sus intentos y esperan revisión manual"""
+        return db.query(func.count(Email.id)).filter(Email.processed == False, Email.fallido == True).scalar() or 0
+
+    @staticmethod
+    def count_processed_today(db: Session, dia: date = None) -> int:
+        """Número de emails marcados como procesados en el día indicado (hoy por defecto, hora local)"""
+        inicio = datetime.combine(dia or date.today(), time.min).astimezone()
+        return (
+            db.query(func.count(Email.id))
+            .filter(Email.processed_at >= inicio, Email.processed_at < inicio + timedelta(days=1))
+            .scalar()
+        ) or 0
+
+    @staticmethod
+    def release_claim(db: Session, email_id: int, worker_id: str, reintentar_en_segundos: int = 0,
+                      error: str = None, max_intentos: int = None, contar_intento: bool = True) -> Optional[Email]:
+        """
+        Libera un email reclamado sin procesarlo (p. ej. tras un error). Con reintentar_en_segundos el email
+        no se puede volver a reclamar hasta pasado ese tiempo, en ningún worker.
+        Si ya ha agotado max_intentos queda como fallido (para revisión manual) y deja de bloquear su escena.
+        Con contar_intento=False se devuelve el intento gastado al reclamarlo (el email se aplaza por una causa
+        ajena a él, como el presupuesto de tokens agotado) y nunca se marca como fallido.
+        Devuelve el email liberado, o None si el lease ya no era de worker_id.
+        """
+        email = db.query(Email).filter(Email.id == email_id, Email.claimed_by == worker_id).first()
+        if not email:
+            db.commit()
+            return None
+        if error:
+            email.ultimo_error = error[:2000]
+        agotado = contar_intento and max_intentos and email.intentos >= max_intentos
+        if not contar_intento:
+            email.intentos = max(email.intentos - 1, 0)
+        if agotado:
+            EmailManager._marcar_fallido(email)
+        else:
+            email.claimed_by = None
+            email.claimed_until = None
+            if reintentar_en_segundos:
+                email.claimed_until = datetime.now(tz=timezone.utc) + timedelta(seconds=reintentar_en_segundos)
+        db.commit()
+        return email
+
+    @staticmethod
+    def _marcar_fallido(email: Email, error: str = None):
+        """Saca el email de la cola tras agotar sus intentos (sin commit)."""
+        email.fallido = True
+        email.claimed_by = None
+        email.claimed_until = None
+        if error:
+            email.ultimo_error = error
 
     @staticmethod
     def get_emails_processed_not_sumarized_by_scene_id(db: Session, scene_id: int):
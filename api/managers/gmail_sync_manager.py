@@ -0,0 +1,28 @@
+from typing import Optional
+from datetime import datetime, timezone
+from sqlalchemy.orm import Session
+from api.models.gmail_sync import GmailSyncState
+
+class GmailSyncManager:
+    @staticmethod
+    def get_sync_state(db: Session, cuenta: str = "me") -> Optional[GmailSyncState]:
+        """Obtiene el estado de sincronización de una cuenta de Gmail"""
+        return db.query(GmailSyncState).filter(GmailSyncState.cuenta == cuenta).first()
+
+    @staticmethod
+    def get_history_id(db: Session, cuenta: str = "me") -> Optional[str]:
+        """Devuelve el último historyId guardado para la cuenta, o None si nunca se sincronizó"""
+        return db.query(GmailSyncState.history_id).filter(GmailSyncState.cuenta == cuenta).scalar()
+
+    @staticmethod
+    def save_history_id(db: Session, history_id: str, cuenta: str = "me", resincronizacion: bool = False) -> GmailSyncState:
+        """Guarda el checkpoint de historyId tras un ciclo de ingesta completado"""
+        sync_state = GmailSyncManager.get_sync_state(db, cuenta)
+        if not sync_state:
+            sync_state = GmailSyncState(cuenta=cuenta)
+            db.add(sync_state)
+        sync_state.history_id = str(history_id)
+        if resincronizacion:
+            sync_state.ultima_resincronizacion = datetime.now(tz=timezone.utc)
+        db.commit()
+        return sync_state
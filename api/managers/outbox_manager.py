@@ -0,0 +1,116 @@
+import random
+from typing import Any, Dict, List, Optional
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from api.models.outbox import OutboxEmail, OutboxStatus
+
+class OutboxManager:
+    @staticmethod
+    def enqueue(db: Session, email_respuesta: Dict[str, Any], email_id: Optional[int] = None) -> OutboxEmail:
+        """
+        Encola una respuesta para su envío. No hace commit: se confirma junto con la transacción
+        del procesamiento, así que una respuesta nunca se pierde ni se envía sin haberse guardado el turno.
+        """
+        recipients = email_respuesta.get('recipients') or []
+        if isinstance(recipients, str):
+            recipients = [r.strip() for r in recipients.split(',') if r.strip()]
+        outbox = OutboxEmail(
+            email_id=email_id,
+            campaign_id=email_respuesta.get('campaign_id'),
+            scene_id=email_respuesta.get('scene_id'),
+            subject=email_respuesta.get('subject', ''),
+            body=email_respuesta.get('body', ''),
+            recipients=recipients,
+            thread_id=email_respuesta.get('thread_id') or '',
+            in_reply_to=email_respuesta.get('in_reply_to') or '',
+            estado=OutboxStatus.PENDIENTE,
+        )
+        db.add(outbox)
+        return outbox
+
+    @staticmethod
+    def claim_batch(db: Session, limit: int = 20) -> List[OutboxEmail]:
+        """
+        Reclama hasta limit respuestas pendientes cuyo próximo intento ya ha llegado y las marca como 'enviando'.
+        FOR UPDATE SKIP LOCKED permite varios remitentes sin enviar dos veces el mismo mensaje.
+        Las filas se devuelven desvinculadas de la sesión para poder enviarlas desde otros hilos.
+        """
+        ahora = datetime.now(tz=timezone.utc)
+        pendientes = (
+            db.query(OutboxEmail)
+            .filter(OutboxEmail.estado == OutboxStatus.PENDIENTE, OutboxEmail.proximo_intento <= ahora)
+            .order_by(OutboxEmail.proximo_intento.asc(), OutboxEmail.id.asc())
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+        for outbox in pendientes:
+            outbox.estado = OutboxStatus.ENVIANDO
+            outbox.reclamado_en = ahora
+            outbox.intentos += 1
+        db.flush()
+        for outbox in pendientes:
+            db.expunge(outbox)
+        db.commit()
+        return pendientes
+
+    @staticmethod
+    def mark_sent(db: Session, outbox_id: int, gmail_message_id: Optional[str] = None) -> Optional[OutboxEmail]:
+        """Marca una respuesta como enviada y guarda la latencia de entrega"""
+        outbox = db.query(OutboxEmail).filter(OutboxEmail.id == outbox_id).first()
+        if not outbox:
+            return None
+        ahora = datetime.now(tz=timezone.utc)
+        outbox.estado = OutboxStatus.ENVIADO
+        outbox.gmail_message_id = gmail_message_id
+        outbox.fecha_envio = ahora
+        outbox.ultimo_error = None
+        if outbox.fecha_creacion:
+            outbox.latencia_entrega_ms = (ahora - outbox.fecha_creacion).total_seconds() * 1000
+        db.commit()
+        return outbox
+
+    @staticmethod
+    def mark_failed(db: Session, outbox_id: int, error: str, max_intentos: int = 5,
+                    backoff_base: float = 5.0, backoff_max: float = 900.0, reintentable: bool = True) -> Optional[OutboxEmail]:
+        """
+        Registra un fallo de envío. Si quedan intentos, reprograma el envío con backoff exponencial y jitter;
+        si no, la respuesta queda en estado 'error' para revisión manual.
+        """
+        outbox = db.query(OutboxEmail).filter(OutboxEmail.id == outbox_id).first()
+        if not outbox:
+            return None
+        outbox.ultimo_error = error[:2000]
+        outbox.reclamado_en = None
+        if reintentable and outbox.intentos < max_intentos:
+            espera = min(backoff_max, backoff_base * (2 ** (outbox.intentos - 1)))
+            espera = random.uniform(espera / 2, espera)
+            outbox.estado = OutboxStatus.PENDIENTE
+            outbox.proximo_intento = datetime.now(tz=timezone.utc) + timedelta(seconds=espera)
+        else:
+            outbox.estado = OutboxStatus.ERROR
+        db.commit()
+        return outbox
+
+    @staticmethod
+    def recover_stale(db: Session, timeout_segundos: int = 300) -> int:
+        """
+        Devuelve a 'pendiente' los envíos reclamados que llevan demasiado tiempo en 'enviando'
+        (p. ej. el proceso murió a mitad de envío). Devuelve cuántos se han recuperado.
+        """
+        limite = datetime.now(tz=timezone.utc) - timedelta(seconds=timeout_segundos)
+        recuperados = (
+            db.query(OutboxEmail)
+            .filter(OutboxEmail.estado == OutboxStatus.ENVIANDO, OutboxEmail.reclamado_en < limite)
+            .update({OutboxEmail.estado: OutboxStatus.PENDIENTE, OutboxEmail.reclamado_en: None},
+                    synchronize_session=False)
+        )
+        db.commit()
+        return recuperados
+
+    @staticmethod
+    def count_by_status(db: Session) -> Dict[str, int]:
+        """Nº de respuestas en cada estado"""
+        filas = db.query(OutboxEmail.estado, func.count(OutboxEmail.id)).group_by(OutboxEmail.estado).all()
+        return {estado.value: total for estado, total in filas}
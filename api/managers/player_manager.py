@@ -1,4 +1,5 @@
 from sqlalchemy.orm import Session
+from api.core.cache_versions import bump_version
 from api.models.player import Player, PlayerStatus
 from api.schemas.player import PlayerCreate, PlayerUpdate
 from sqlalchemy.exc import IntegrityError
@@ -14,6 +15,7 @@ class PlayerManager:
         db.add(db_player)
         try:
             db.commit()
+            bump_version("routing")
             db.refresh(db_player)
         except IntegrityError:
             db.rollback()
@@ -39,6 +41,7 @@ class PlayerManager:
         player = PlayerManager.get(db, player_id)
         db.delete(player)
         db.commit()
+        bump_version("routing")
         return player
 
     @staticmethod
@@ -48,6 +51,7 @@ class PlayerManager:
         for key, value in player_data.items():
             setattr(player, key, value)
         db.commit()
+        bump_version("routing")
         db.refresh(player)
         return player
 
@@ -1,6 +1,8 @@
 from typing import List, Optional
 from datetime import datetime, timezone
 from sqlalchemy.orm import Session
+from api.core.cache_versions import bump_version
+from api.core.notifications import scene_notifier
 from api.schemas.scene import SceneCreate, SceneUpdate
 from api.models.scene import Scene
 
@@ -26,6 +28,7 @@ class SceneManager:
         db_scene = Scene(**scene.model_dump())
         db.add(db_scene)
         db.commit()
+        bump_version("routing")
         db.refresh(db_scene)
         return db_scene
 
@@ -40,6 +43,9 @@ class SceneManager:
         if scene_update.activa == False and not db_scene.fecha_cierre:
             db_scene.fecha_cierre = datetime.now(tz=timezone.utc)
         db.commit()
+        bump_version("routing")
+        bump_version("scene", scene_id)
+        scene_notifier.notify(str(scene_id))
         db.refresh(db_scene)
         return db_scene
 
@@ -51,6 +57,9 @@ class SceneManager:
             return False
         db.delete(db_scene)
         db.commit()
+        bump_version("routing")
+        bump_version("scene", scene_id)
+        scene_notifier.notify(str(scene_id))
         return True
 
     @staticmethod
@@ -63,6 +72,18 @@ class SceneManager:
         """Obtiene la fase actual de una escena por ID"""
         return db.query(Scene.fase_actual).filter(Scene.id == scene_id).scalar()
 
+    @staticmethod
+    def update_actual_phase(db: Session, scene_id: int, fase: str) -> bool:
+        """
+        Cambia la fase actual de una escena sin hacer commit (forma parte de la transacción del procesamiento).
+        El aviso a los demás procesos viaja en la misma transacción; tras el commit el llamador debe ejecutar
+        bump_version("scene", scene_id) para invalidar las cachés del propio proceso.
+        """
+        actualizadas = db.query(Scene).filter(Scene.id == scene_id).update({Scene.fase_actual: fase}, synchronize_session=False)
+        if actualizadas:
+            scene_notifier.notify_en(db, str(scene_id))
+        return actualizadas > 0
+
     @staticmethod
     def get_scene_summary_by_id(db: Session, scene_id: int) -> Optional[str]:
         """Obtiene el resumen de una escena por ID"""
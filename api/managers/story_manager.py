@@ -1,4 +1,5 @@
 from sqlalchemy.orm import Session
+from api.core.cache_versions import bump_version
 from api.models.story import Story
 from api.models.character import Character
 from api.schemas.story import StoryCreate, StoryUpdate
@@ -27,6 +28,7 @@ class StoryManager:
         db_story = Story(**story.model_dump())
         db.add(db_story)
         db.commit()
+        bump_version("routing")
         db.refresh(db_story)
         return db_story
 
@@ -46,6 +48,7 @@ class StoryManager:
                 setattr(db_story, field, value)
         db_story.fecha_actualizacion = datetime.now(tz=timezone.utc)
         db.commit()
+        bump_version("routing")
         db.refresh(db_story)
         return db_story
 
@@ -57,6 +60,7 @@ class StoryManager:
             return False
         db.delete(db_story)
         db.commit()
+        bump_version("routing")
         return True
 
     @staticmethod
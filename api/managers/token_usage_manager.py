@@ -0,0 +1,38 @@
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from api.managers.scene_manager import SceneManager
+from api.models.campaign import Campaign
+from api.models.story import Story
+from api.models.token_usage import TokenUsage
+
+class TokenUsageManager:
+    @staticmethod
+    def registrar(db: Session, perfil: str, prompt_tokens: int, completion_tokens: int,
+                  campaign_id: Optional[int] = None, story_id: Optional[int] = None,
+                  scene_id: Optional[int] = None) -> TokenUsage:
+        """Guarda el consumo de una llamada y lo suma a Story.tokens_est (la historia se deduce de la escena)."""
+        if story_id is None and scene_id is not None:
+            story_id = SceneManager.get_story_id_by_scene_id(db, scene_id)
+        uso = TokenUsage(campaign_id=campaign_id, story_id=story_id, scene_id=scene_id, perfil=perfil,
+                         prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+        db.add(uso)
+        if story_id is not None:
+            db.query(Story).filter(Story.id == story_id).update(
+                {Story.tokens_est: func.coalesce(Story.tokens_est, 0) + prompt_tokens + completion_tokens},
+                synchronize_session=False)
+        db.commit()
+        return uso
+
+    @staticmethod
+    def consumo_campana(db: Session, campaign_id: int, desde: datetime) -> int:
+        """Tokens (prompt + respuesta) consumidos por la campaña desde la fecha indicada"""
+        total = db.query(func.coalesce(func.sum(TokenUsage.prompt_tokens + TokenUsage.completion_tokens), 0)).filter(
+            TokenUsage.campaign_id == campaign_id, TokenUsage.fecha >= desde).scalar()
+        return int(total or 0)
+
+    @staticmethod
+    def presupuesto_campana(db: Session, campaign_id: int) -> Optional[int]:
+        """Presupuesto mensual de tokens de la campaña (None si no tiene uno propio)"""
+        return db.query(Campaign.presupuesto_tokens).filter(Campaign.id == campaign_id).scalar()
@@ -11,5 +11,6 @@ class Campaign(Base):
     nombre_clave = Column(String, nullable=False, unique=True)
     resumen = Column(Text, nullable=True)
     activa = Column(Boolean, nullable=False, default=True)  # Nuevo campo para indicar si la campaña está activa
+    presupuesto_tokens = Column(Integer, nullable=True)  # Tokens al mes; None = TOKEN_BUDGET_CAMPAIGN (ver ia/token_metering.py)
     characters = relationship("Character", secondary=campaign_characters, back_populates="campaigns")
     stories = relationship("Story", back_populates="campaign")
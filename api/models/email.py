@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, ARRAY, DateTime, func, Enum as SAEnum, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, ARRAY, DateTime, func, Enum as SAEnum, ForeignKey, Index, text
 from api.core.database import Base
 from enum import Enum
 
@@ -9,6 +9,12 @@ class EmailType(str, Enum):
 
 class Email(Base):
     __tablename__ = "emails"
+    __table_args__ = (
+        # Un mensaje de Gmail solo puede ingestarse una vez (los emails sin message_id quedan fuera)
+        Index('uq_emails_message_id', 'message_id', unique=True, postgresql_where=text("message_id <> ''")),
+        # Cola de procesamiento: emails pendientes por fecha
+        Index('ix_emails_pendientes', 'date', 'id', postgresql_where=text("processed = false")),
+    )
     id = Column(Integer, primary_key=True, index=True)
     player_id = Column(Integer, index=True)
     character_id = Column(Integer, index=True)
@@ -23,7 +29,13 @@ class Email(Base):
     message_id = Column(String, nullable=False, default="")
     date = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
     processed = Column(Boolean, nullable=False, default=False) #indica si el email fue procesado por el agente
+    processed_at = Column(DateTime(timezone=True), nullable=True, index=True)  # Momento en que se marcó como procesado
     resumido = Column(Boolean, nullable=False, default=False)  # Indica si el email fue utilizado para generar un resumen
+    claimed_by = Column(String, nullable=True)  # Worker que tiene reclamado el email para procesarlo
+    claimed_until = Column(DateTime(timezone=True), nullable=True)  # Fin del lease; después otro worker puede reclamarlo
+    intentos = Column(Integer, nullable=False, default=0, server_default=text("0"))  # Veces que se ha reclamado para procesarlo
+    fallido = Column(Boolean, nullable=False, default=False, server_default=text("false"))  # Agotó los intentos: no se vuelve a reclamar
+    ultimo_error = Column(String, nullable=True)  # Último error de procesamiento
 
     def set_type(self, value):
         if isinstance(value, EmailType):
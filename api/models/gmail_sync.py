@@ -0,0 +1,10 @@
+from sqlalchemy import Column, Integer, String, DateTime, func
+from api.core.database import Base
+
+class GmailSyncState(Base):
+    __tablename__ = "gmail_sync_state"
+    id = Column(Integer, primary_key=True, index=True)
+    cuenta = Column(String, nullable=False, unique=True, default="me")  # userId de Gmail sincronizado
+    history_id = Column(String, nullable=True)  # Último historyId procesado (uint64 como texto)
+    ultima_resincronizacion = Column(DateTime(timezone=True), nullable=True)  # Última resincronización completa
+    fecha_actualizacion = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
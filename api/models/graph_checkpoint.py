@@ -0,0 +1,31 @@
+from sqlalchemy import Column, Integer, String, LargeBinary, DateTime, func
+from api.core.database import Base
+
+
+class GraphCheckpoint(Base):
+    """Checkpoint de LangGraph de una ejecución del grafo de procesamiento (uno por paso completado)."""
+    __tablename__ = "graph_checkpoints"
+    thread_id = Column(String, primary_key=True)
+    checkpoint_ns = Column(String, primary_key=True, default="")
+    checkpoint_id = Column(String, primary_key=True)
+    parent_checkpoint_id = Column(String, nullable=True)
+    tipo = Column(String, nullable=False)  # Formato de serialización del checkpoint
+    checkpoint = Column(LargeBinary, nullable=False)
+    tipo_metadatos = Column(String, nullable=False)
+    metadatos = Column(LargeBinary, nullable=False)
+    fecha = Column(DateTime(timezone=True), server_default=func.now(), nullable=False, index=True)
+
+
+class GraphCheckpointWrite(Base):
+    """Escritura pendiente de un nodo asociada a un checkpoint (necesaria para reanudar a mitad de un paso)."""
+    __tablename__ = "graph_checkpoint_writes"
+    thread_id = Column(String, primary_key=True)
+    checkpoint_ns = Column(String, primary_key=True, default="")
+    checkpoint_id = Column(String, primary_key=True)
+    task_id = Column(String, primary_key=True)
+    idx = Column(Integer, primary_key=True)
+    channel = Column(String, nullable=False)
+    tipo = Column(String, nullable=False)
+    valor = Column(LargeBinary, nullable=False)
+    task_path = Column(String, nullable=False, default="")
+    fecha = Column(DateTime(timezone=True), server_default=func.now(), nullable=False, index=True)
@@ -0,0 +1,35 @@
+from sqlalchemy import Column, Integer, String, Text, Float, ARRAY, DateTime, ForeignKey, Index, func, Enum as SAEnum
+from api.core.database import Base
+from enum import Enum
+
+class OutboxStatus(str, Enum):
+    PENDIENTE = "pendiente"
+    ENVIANDO = "enviando"
+    ENVIADO = "enviado"
+    ERROR = "error"
+
+
+class OutboxEmail(Base):
+    """Respuesta pendiente de envío. Se inserta en la misma transacción que el procesamiento del email."""
+    __tablename__ = "outbox_emails"
+    __table_args__ = (
+        Index('ix_outbox_emails_estado_proximo_intento', 'estado', 'proximo_intento'),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    email_id = Column(Integer, ForeignKey('emails.id'), index=True, nullable=True)  # Email al que responde
+    campaign_id = Column(Integer, nullable=True)
+    scene_id = Column(Integer, nullable=True)
+    subject = Column(String, nullable=False)
+    body = Column(Text, nullable=False)
+    recipients = Column(ARRAY(String), nullable=False)  # Solo compatible con PostgreSQL
+    thread_id = Column(String, nullable=False, default="")
+    in_reply_to = Column(String, nullable=False, default="")
+    estado = Column(SAEnum(OutboxStatus), nullable=False, default=OutboxStatus.PENDIENTE)
+    intentos = Column(Integer, nullable=False, default=0)
+    proximo_intento = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    reclamado_en = Column(DateTime(timezone=True), nullable=True)  # Inicio del envío en curso (para recuperar envíos colgados)
+    ultimo_error = Column(Text, nullable=True)
+    gmail_message_id = Column(String, nullable=True)
+    fecha_creacion = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    fecha_envio = Column(DateTime(timezone=True), nullable=True)
+    latencia_entrega_ms = Column(Float, nullable=True)  # Desde que se encola hasta que Gmail acepta el envío
@@ -0,0 +1,18 @@
+from sqlalchemy import Column, Integer, String, DateTime, Index, func
+from api.core.database import Base
+
+
+class TokenUsage(Base):
+    """Tokens consumidos por una llamada al LLM, atribuidos a campaña, historia y escena (solo se insertan filas)."""
+    __tablename__ = "token_usage"
+    __table_args__ = (
+        Index('ix_token_usage_campaign_fecha', 'campaign_id', 'fecha'),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    campaign_id = Column(Integer, nullable=True)
+    story_id = Column(Integer, nullable=True, index=True)
+    scene_id = Column(Integer, nullable=True)
+    perfil = Column(String, nullable=False)  # Perfil con el que se hizo la llamada (tras degradar por presupuesto)
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    completion_tokens = Column(Integer, nullable=False, default=0)
+    fecha = Column(DateTime(timezone=True), server_default=func.now(), nullable=False, index=True)
@@ -6,6 +6,7 @@ class CampaignBase(BaseModel):
     descripcion: Optional[str] = None
     nombre_clave: str
     resumen: Optional[str] = None
+    presupuesto_tokens: Optional[int] = None
     character_ids: Optional[List[int]] = None
 
 class CampaignCreate(CampaignBase):
@@ -16,6 +17,7 @@ class CampaignUpdate(BaseModel):
     descripcion: Optional[str] = None
     nombre_clave: Optional[str] = None
     resumen: Optional[str] = None
+    presupuesto_tokens: Optional[int] = None
     character_ids: Optional[List[int]] = None
 
 class CampaignOut(CampaignBase):
@@ -0,0 +1,70 @@
+# Benchmark offline de la ingesta de Gmail (mensaje a mensaje vs. por lotes)
+"""
+Mide el rendimiento de GmailService contra FakeGmailService: mensajes por segundo,
+llamadas a la API por mensaje y round trips HTTP por mensaje.
+
+Uso:
+    python -m benchmarks.gmail_ingestion_benchmark --mensajes 100 --latencia 0.02
+"""
+import argparse
+import os
+import re
+import time
+
+os.environ.setdefault("GMAIL_SCOPES", "https://www.googleapis.com/auth/gmail.modify")
+
+from services.fake_gmail import FakeGmailService, construir_mensaje_gmail
+from services.gmail_service import GmailService
+
+
+def generar_mensajes(n, proporcion_ignorados=0.3):
+    """Genera n mensajes no leídos; una parte no lleva palabra clave de campaña."""
+    mensajes = []
+    for i in range(n):
+        if i < n * proporcion_ignorados:
+            subject = f"Oferta especial {i}"
+        else:
+            subject = f"[CAMPANA] (HISTORIA) Turno {i}"
+        mensajes.append(construir_mensaje_gmail(
+            f"msg{i:05d}", subject, f"jugador{i % 5}@example.com", "narrador@example.com",
+            f"Mi personaje avanza por el pasillo {i}."
+        ))
+    return mensajes
+
+
+def ejecutar(n, latencia, batched):
+    fake = FakeGmailService(generar_mensajes(n), latencia=latencia)
+    gmail = GmailService(service=fake)
+    inicio = time.perf_counter()
+    mensajes = gmail.fetch_unread_messages(batched=batched)
+    read_ids, ignored_ids = [], []
+    for msg in mensajes:
+        subject = next(h['value'] for h in msg['payload']['headers'] if h['name'] == 'Subject')
+        (read_ids if re.search(r'\[(.*?)\]', subject) else ignored_ids).append(msg['id'])
+    gmail.apply_ingestion_labels(read_ids, ignored_ids, batched=batched)
+    duracion = time.perf_counter() - inicio
+    return {
+        'modo': 'lote' if batched else 'individual',
+        'mensajes': len(mensajes),
+        'segundos': duracion,
+        'mensajes_por_segundo': len(mensajes) / duracion if duracion else float('inf'),
+        'llamadas_api_por_mensaje': fake.llamadas_api / max(len(mensajes), 1),
+        'round_trips_por_mensaje': fake.peticiones_http / max(len(mensajes), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--mensajes", type=int, default=100)
+    parser.add_argument("--latencia", type=float, default=0.02, help="segundos por round trip HTTP")
+    args = parser.parse_args()
+    for batched in (False, True):
+        r = ejecutar(args.mensajes, args.latencia, batched)
+        print(f"{r['modo']:>10}: {r['mensajes']} mensajes en {r['segundos']:.2f}s "
+              f"({r['mensajes_por_segundo']:.1f} msg/s), "
+              f"{r['llamadas_api_por_mensaje']:.2f} llamadas API/msg, "
+              f"{r['round_trips_por_mensaje']:.2f} round trips/msg")
+
+
+if __name__ == "__main__":
+    main()
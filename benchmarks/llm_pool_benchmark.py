@@ -0,0 +1,118 @@
+# Benchmark del pool de modelos LLM por perfil
+"""
+Compara:
+- Construcción: un AzureChatOpenAI nuevo por cliente y perfil (como hacía IAClient al crearse o en set_perfil)
+  frente a pedir al pool la vista del perfil (llm_pool.modelo).
+- Latencia por petición contra un servidor local que imita la API de chat completions de Azure:
+  un modelo y un cliente HTTP nuevos por llamada frente al pool ya caliente (conexión keep-alive reutilizada).
+Sin TLS ni red: con Azure el coste de una conexión nueva es bastante mayor.
+
+Uso:
+    python -m benchmarks.llm_pool_benchmark --clientes 200 --peticiones 100
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+os.environ.setdefault("AZURE_OPENAI_API_KEY", "benchmark")
+os.environ.setdefault("AZURE_OPENAI_DEPLOYMENT_NAME", "benchmark")
+
+import httpx
+from langchain_core.messages import HumanMessage
+from langchain_openai import AzureChatOpenAI
+
+from ia.ia_client import IAClient, cliente_http_compartido, cliente_http_async_compartido
+from ia.llm_pool import LLMPool
+
+RESPUESTA = json.dumps({
+    "id": "chatcmpl-benchmark", "object": "chat.completion", "created": 0, "model": "benchmark",
+    "choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}, "finish_reason": "stop"}],
+    "usage": {"prompt_tokens": 5, "completion_tokens": 1, "total_tokens": 6},
+}).encode()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(RESPUESTA)))
+        self.end_headers()
+        self.wfile.write(RESPUESTA)
+
+    def log_message(self, *args):
+        pass
+
+
+def _llm_como_antes(perfil, endpoint, http_client=None):
+    """AzureChatOpenAI tal como lo construía IAClient._init_llm antes del pool."""
+    params = IAClient.PERFILES[perfil]
+    return AzureChatOpenAI(
+        azure_deployment=os.environ["AZURE_OPENAI_DEPLOYMENT_NAME"],
+        azure_endpoint=endpoint,
+        api_version="2024-02-15-preview",
+        api_key=os.environ["AZURE_OPENAI_API_KEY"],
+        temperature=params["temperature"],
+        top_p=params["top_p"],
+        max_tokens=params["max_tokens"],
+        http_client=http_client,
+    )
+
+
+def construccion(clientes, endpoint):
+    perfiles = list(IAClient.PERFILES)
+    inicio = time.perf_counter()
+    for i in range(clientes):
+        _llm_como_antes(perfiles[i % len(perfiles)], endpoint)
+    antes = (time.perf_counter() - inicio) / clientes
+    pool = LLMPool(IAClient.PERFILES, cliente_http_compartido, cliente_http_async_compartido)
+    inicio = time.perf_counter()
+    for i in range(clientes):
+        pool.modelo(perfiles[i % len(perfiles)])
+    despues = (time.perf_counter() - inicio) / clientes
+    return antes, despues
+
+
+def latencia(peticiones, endpoint):
+    mensajes = [HumanMessage(content="Hola")]
+    inicio = time.perf_counter()
+    for _ in range(peticiones):
+        with httpx.Client() as cliente:
+            _llm_como_antes("precisa", endpoint, cliente).invoke(mensajes)
+    fria = (time.perf_counter() - inicio) / peticiones
+    pool = LLMPool(IAClient.PERFILES, cliente_http_compartido, cliente_http_async_compartido)
+    pool.modelo("precisa").invoke(mensajes)  # calienta el modelo y la conexión
+    inicio = time.perf_counter()
+    for i in range(peticiones):
+        pool.modelo("precisa" if i % 2 else "creativa").invoke(mensajes)
+    caliente = (time.perf_counter() - inicio) / peticiones
+    return fria, caliente
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clientes", type=int, default=200)
+    parser.add_argument("--peticiones", type=int, default=100)
+    args = parser.parse_args()
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    endpoint = f"http://127.0.0.1:{servidor.server_address[1]}/"
+    os.environ["AZURE_OPENAI_ENDPOINT"] = endpoint
+    try:
+        antes, despues = construccion(args.clientes, endpoint)
+        print(f"Construcción por cliente: AzureChatOpenAI nuevo {antes * 1000:.2f} ms, "
+              f"vista del pool {despues * 1000:.4f} ms (x{antes / max(despues, 1e-9):.0f})")
+        fria, caliente = latencia(args.peticiones, endpoint)
+        print(f"Petición al LLM local: cliente nuevo {fria * 1000:.2f} ms, pool caliente {caliente * 1000:.2f} ms")
+    finally:
+        servidor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
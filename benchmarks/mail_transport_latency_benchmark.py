@@ -0,0 +1,69 @@
+# Benchmark de latencia de llegada: transporte push (Maildir) frente a sondeo fijo
+"""
+Entrega mensajes en un Maildir temporal a intervalos aleatorios y mide cuánto tarda el transporte
+en verlos (desde la entrega hasta que fetch_pending los devuelve).
+Se compara con la latencia media teórica de un sondeo cada --intervalo segundos (intervalo / 2).
+
+Uso:
+    python -m benchmarks.mail_transport_latency_benchmark --mensajes 50 --intervalo 15
+"""
+import argparse
+import random
+import statistics
+import tempfile
+import threading
+import time
+from email.message import EmailMessage
+
+from services.transports.maildir_transport import MaildirTransport, entregar_en_maildir
+
+
+def _contenido(i):
+    msg = EmailMessage()
+    msg['Message-ID'] = f"<bench{i}@example.com>"
+    msg['From'] = "jugador@example.com"
+    msg['To'] = "narrador@example.com"
+    msg['Subject'] = f"[CAMPANA](HISTORIA) Turno {i}"
+    msg.set_content(f"Mi personaje avanza por el pasillo {i}.")
+    return msg.as_bytes()
+
+
+def ejecutar(n, separacion_max):
+    with tempfile.TemporaryDirectory() as path:
+        transport = MaildirTransport(path)
+        entregas = {}
+
+        def productor():
+            for i in range(n):
+                time.sleep(random.uniform(0, separacion_max))
+                entregas[f"<bench{i}@example.com>"] = time.perf_counter()
+                entregar_en_maildir(path, _contenido(i))
+
+        hilo = threading.Thread(target=productor)
+        hilo.start()
+        latencias = []
+        while len(latencias) < n:
+            transport.wait_for_mail(1)
+            mensajes = transport.fetch_pending(100)
+            ahora = time.perf_counter()
+            latencias += [ahora - entregas[m.message_id] for m in mensajes]
+            transport.acknowledge([m.ref for m in mensajes], [], "IGNORADOS_POR_IA")
+        hilo.join()
+        return latencias
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--mensajes", type=int, default=50)
+    parser.add_argument("--separacion", type=float, default=0.05, help="segundos máximos entre entregas")
+    parser.add_argument("--intervalo", type=float, default=15, help="intervalo del sondeo con el que comparar")
+    args = parser.parse_args()
+    latencias = ejecutar(args.mensajes, args.separacion)
+    print(f"Maildir (push): media {statistics.mean(latencias) * 1000:.1f} ms, "
+          f"p95 {sorted(latencias)[int(len(latencias) * 0.95) - 1] * 1000:.1f} ms, "
+          f"máx {max(latencias) * 1000:.1f} ms")
+    print(f"Sondeo cada {args.intervalo:.0f}s: media teórica {args.intervalo / 2 * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
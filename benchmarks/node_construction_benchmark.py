@@ -0,0 +1,120 @@
+# Benchmark del coste de construir nodos y clientes IA por email
+"""
+Compara, por email narrativo (recopilar contexto, analizar, responder):
+- Antes: cada helper construía su nodo, y cada nodo un IAClient con su AzureChatOpenAI y su propio cliente HTTP
+  (4 clientes por email: resumen x2, clasificación y creativa).
+- Después: los nodos salen del node_registry y comparten los IAClient por perfil y un único pool HTTP.
+También mide, contra un servidor HTTP local, el coste de abrir una conexión nueva por llamada frente a
+reutilizar la conexión keep-alive del pool compartido (sin TLS; con Azure la diferencia es mayor).
+
+No hace llamadas al LLM: solo mide construcción y conexiones.
+
+Uso:
+    python -m benchmarks.node_construction_benchmark --emails 50 --peticiones 200
+"""
+import argparse
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+os.environ.setdefault("AZURE_OPENAI_ENDPOINT", "https://benchmark.openai.azure.com/")
+os.environ.setdefault("AZURE_OPENAI_API_KEY", "benchmark")
+os.environ.setdefault("AZURE_OPENAI_DEPLOYMENT_NAME", "benchmark")
+
+from langchain_openai import AzureChatOpenAI
+
+from ia.ia_client import IAClient
+from ia.langgraph.nodes.context_gathering_node import ContextGatheringNode
+from ia.langgraph.nodes.narrative_email_analysis_node import NarrativeEmailAnalysisNode
+from ia.langgraph.nodes.narrative_response_generation_node import NarrativeResponseGenerationNode
+from ia.langgraph.nodes.registry import NodeRegistry
+
+PERFILES_POR_EMAIL = ["resumen", "resumen", "clasificacion", "creativa"]
+NODOS_POR_EMAIL = [ContextGatheringNode, NarrativeEmailAnalysisNode, NarrativeResponseGenerationNode]
+
+
+def _llm_como_antes(perfil):
+    """AzureChatOpenAI tal como se construía antes: un cliente HTTP nuevo por instancia."""
+    params = IAClient.PERFILES[perfil]
+    return AzureChatOpenAI(
+        azure_deployment=os.environ["AZURE_OPENAI_DEPLOYMENT_NAME"],
+        azure_endpoint=os.environ["AZURE_OPENAI_ENDPOINT"],
+        api_version="2024-02-15-preview",
+        api_key=os.environ["AZURE_OPENAI_API_KEY"],
+        temperature=params["temperature"],
+        top_p=params["top_p"],
+        max_tokens=params["max_tokens"],
+    )
+
+
+def construccion_antes(emails):
+    inicio = time.perf_counter()
+    for _ in range(emails):
+        for perfil in PERFILES_POR_EMAIL:
+            _llm_como_antes(perfil)
+    return (time.perf_counter() - inicio) / emails
+
+
+def construccion_despues(emails):
+    registro = NodeRegistry()
+    inicio = time.perf_counter()
+    registro.precargar(NODOS_POR_EMAIL)  # se paga una vez, al compilar el grafo
+    for _ in range(emails):
+        for clase in NODOS_POR_EMAIL:
+            registro.get(clase)
+    return (time.perf_counter() - inicio) / emails
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, *args):
+        pass
+
+
+def conexiones(peticiones):
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{servidor.server_address[1]}/"
+    try:
+        inicio = time.perf_counter()
+        for _ in range(peticiones):
+            with httpx.Client() as cliente:
+                cliente.get(url)
+        nueva = (time.perf_counter() - inicio) / peticiones
+        with httpx.Client() as cliente:
+            cliente.get(url)
+            inicio = time.perf_counter()
+            for _ in range(peticiones):
+                cliente.get(url)
+            reutilizada = (time.perf_counter() - inicio) / peticiones
+    finally:
+        servidor.shutdown()
+    return nueva, reutilizada
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--emails", type=int, default=50)
+    parser.add_argument("--peticiones", type=int, default=200)
+    args = parser.parse_args()
+    antes = construccion_antes(args.emails)
+    despues = construccion_despues(args.emails)
+    print(f"Construcción por email: antes {antes * 1000:.2f} ms, después {despues * 1000:.3f} ms "
+          f"(x{antes / max(despues, 1e-9):.0f})")
+    nueva, reutilizada = conexiones(args.peticiones)
+    print(f"Petición HTTP local: conexión nueva {nueva * 1000:.2f} ms, keep-alive {reutilizada * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
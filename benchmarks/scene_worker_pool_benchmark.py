@@ -0,0 +1,69 @@
+# Benchmark del pool de workers por escena
+"""
+Simula emails pendientes repartidos entre varias escenas, cada uno con una latencia fija de LLM,
+y mide el throughput del SceneWorkerPool según el nº de escenas activas (procesamiento en serie = 1 worker).
+
+Uso:
+    python -m benchmarks.scene_worker_pool_benchmark --emails-por-escena 5 --latencia 0.05 --workers 8
+"""
+import argparse
+import threading
+import time
+from collections import defaultdict, deque
+
+from jobs.scene_worker_pool import SceneWorkerPool
+
+
+class ColaSimulada:
+    """Emails pendientes por escena, procesados con una latencia fija."""
+
+    def __init__(self, escenas, emails_por_escena, latencia):
+        self.latencia = latencia
+        self.pendientes = {s: deque(range(emails_por_escena)) for s in range(escenas)}
+        self.orden = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def listar_escenas(self):
+        with self._lock:
+            return [s for s, cola in self.pendientes.items() if cola]
+
+    def procesar(self, scene_id):
+        with self._lock:
+            if not self.pendientes[scene_id]:
+                return False
+            email = self.pendientes[scene_id][0]
+        time.sleep(self.latencia)  # llamada al LLM
+        with self._lock:
+            self.pendientes[scene_id].popleft()
+            self.orden[scene_id].append(email)
+        return True
+
+
+def ejecutar(escenas, emails_por_escena, latencia, workers):
+    cola = ColaSimulada(escenas, emails_por_escena, latencia)
+    pool = SceneWorkerPool(cola.procesar, cola.listar_escenas, max_concurrencia=workers)
+    inicio = time.perf_counter()
+    pool.drenar()
+    duracion = time.perf_counter() - inicio
+    pool.shutdown()
+    ordenado = all(orden == sorted(orden) for orden in cola.orden.values())
+    total = escenas * emails_por_escena
+    return total / duracion, ordenado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--emails-por-escena", type=int, default=5)
+    parser.add_argument("--latencia", type=float, default=0.05, help="segundos por email (llamada al LLM)")
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+    serie, _ = ejecutar(8, args.emails_por_escena, args.latencia, 1)
+    print(f"Serie (1 worker, 8 escenas): {serie:.1f} emails/s")
+    for escenas in (1, 2, 4, 8, 16):
+        throughput, ordenado = ejecutar(escenas, args.emails_por_escena, args.latencia, args.workers)
+        print(f"{escenas:>2} escenas activas, {args.workers} workers: {throughput:6.1f} emails/s "
+              f"(x{throughput / serie:.1f}), orden por escena {'correcto' if ordenado else 'INCORRECTO'}")
+
+
+if __name__ == "__main__":
+    main()
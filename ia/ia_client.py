@@ -3,12 +3,60 @@
 Módulo para gestionar la conexión y procesamiento de mensajes con la IA.
 """
 
-from langchain_openai import AzureChatOpenAI
+import asyncio
+import json
+import logging
+import threading
+import time
+from typing import AsyncIterator, Iterator
+import httpx
 from langchain_core.messages import HumanMessage, SystemMessage
 from utils.env_loader import get_env_variable
 from utils.utils import clean_json_response
+from utils.metrics import registrar_llamada_llm
+from ia.llm_cache import llm_cache, clave_cache
+from ia.token_metering import medidor_tokens, PERFIL_ECONOMICO, DESPLIEGUE_ECONOMICO
+from ia.llm_pool import LLMPool
+from ia.llm_governor import llm_governor
 from enum import Enum
 
+logger = logging.getLogger(__name__)
+
+# Pool HTTP compartido por todos los clientes: conexiones keep-alive reutilizadas entre llamadas y perfiles
+IA_HTTP_MAX_CONNECTIONS = int(get_env_variable("IA_HTTP_MAX_CONNECTIONS", "20"))
+IA_HTTP_MAX_KEEPALIVE = int(get_env_variable("IA_HTTP_MAX_KEEPALIVE", "10"))
+IA_HTTP_TIMEOUT = float(get_env_variable("IA_HTTP_TIMEOUT", "120"))
+
+_http_client = None
+_http_async_client = None
+_http_lock = threading.Lock()
+
+
+def cliente_http_compartido() -> httpx.Client:
+    """Devuelve el cliente httpx compartido (se crea la primera vez que se usa)."""
+    global _http_client
+    with _http_lock:
+        if _http_client is None:
+            _http_client = httpx.Client(
+                limits=httpx.Limits(max_connections=IA_HTTP_MAX_CONNECTIONS,
+                                    max_keepalive_connections=IA_HTTP_MAX_KEEPALIVE),
+                timeout=IA_HTTP_TIMEOUT,
+            )
+        return _http_client
+
+
+def cliente_http_async_compartido() -> httpx.AsyncClient:
+    """Devuelve el cliente httpx asíncrono compartido, para las llamadas con ainvoke."""
+    global _http_async_client
+    with _http_lock:
+        if _http_async_client is None:
+            _http_async_client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=IA_HTTP_MAX_CONNECTIONS,
+                                    max_keepalive_connections=IA_HTTP_MAX_KEEPALIVE),
+                timeout=IA_HTTP_TIMEOUT,
+            )
+        return _http_async_client
+
 class PerfilesEnum(str,Enum):
     CREATIVA = "creativa"
     PRECISA = "precisa"
@@ -17,6 +65,10 @@ class PerfilesEnum(str,Enum):
     CLASIFICACION = "clasificacion"
 
 class IAClient:
+    # Instancias compartidas por perfil (ver IAClient.compartido)
+    _compartidos = {}
+    _compartidos_lock = threading.Lock()
+
     # Perfiles de configuración para la IA
     PERFILES = {
         "creativa": {
@@ -43,6 +95,18 @@ class IAClient:
             "temperature": 0.1,
             "top_p": 0.6,
             "max_tokens": 1024
+        },
+        # Perfiles de las campañas con el presupuesto de tokens agotado (ver ia/token_metering.py): mismos
+        # parámetros y max_tokens que el original, pero sobre el despliegue AZURE_OPENAI_DEPLOYMENT_NAME_ECONOMICO
+        "creativa_economica": {
+            "temperature": 1.0,
+            "top_p": 0.95,
+            "max_tokens": 8094
+        },
+        "resumen_economico": {
+            "temperature": 0.3,
+            "top_p": 0.8,
+            "max_tokens": 4096
         }
     }   
 
@@ -53,34 +117,53 @@ class IAClient:
         """
         self.config = config or {}
         self.perfil = perfil
-        # Carga de variables desde .env
-        self.deployment_name = get_env_variable("AZURE_OPENAI_DEPLOYMENT_NAME", "")
-        self.endpoint = get_env_variable("AZURE_OPENAI_ENDPOINT", "")
-        self.api_version = get_env_variable("AZURE_OPENAI_API_VERSION", "2024-02-15-preview")
-        self.api_key = get_env_variable("AZURE_OPENAI_API_KEY", "")
-        # Inicializa el modelo con los parámetros del perfil
+        # Configuración de Azure leída una sola vez por el pool compartido (ver ia/llm_pool.py)
+        self.deployment_name = llm_pool.deployment_name
+        self.endpoint = llm_pool.endpoint
+        # Modelo compartido con los parámetros del perfil
         self._init_llm()
         self.contexto_inicial = None  # Guardará el SystemMessage de contexto
 
+    @classmethod
+    def compartido(cls, perfil: str = "creativa") -> "IAClient":
+        """
+        Devuelve la instancia compartida del perfil indicado, creándola la primera vez.
+        Los nodos y cadenas la reutilizan en cada email en lugar de construir un cliente nuevo.
+        No se debe llamar a set_perfil ni generar_contexto_inicial sobre una instancia compartida.
+        """
+        perfil = perfil.value if isinstance(perfil, PerfilesEnum) else perfil
+        with cls._compartidos_lock:
+            cliente = cls._compartidos.get(perfil)
+            if cliente is None:
+                cliente = cls._compartidos[perfil] = cls(perfil=perfil)
+            return cliente
+
+    @classmethod
+    def calentar_conexiones(cls, perfiles=None):
+        """
+        Crea por adelantado los clientes compartidos y abre una conexión con el endpoint,
+        para que el primer email no pague la creación del cliente ni el handshake TLS.
+        """
+        for perfil in perfiles or list(PerfilesEnum):
+            cls.compartido(perfil)
+        endpoint = llm_pool.endpoint
+        if not endpoint:
+            return
+        try:
+            cliente_http_compartido().get(endpoint, timeout=10)
+        except Exception as e:
+            logger.warning(f"No se pudo precalentar la conexión con {endpoint}: {e}")
+
 
     def _init_llm(self):
         """
-        Inicializa el modelo LLM con los parámetros del perfil actual.
+        Toma del pool compartido el modelo con los parámetros del perfil actual (no construye un cliente nuevo).
         """
-        params = self.PERFILES.get(self.perfil, self.PERFILES["creativa"])
-        self.llm = AzureChatOpenAI(
-            azure_deployment=self.deployment_name,
-            azure_endpoint=self.endpoint,
-            api_version=self.api_version,
-            api_key=self.api_key,
-            temperature=params["temperature"],
-            top_p=params["top_p"],
-            max_tokens=params["max_tokens"]
-        )
+        self.llm = llm_pool.modelo(self.perfil if self.perfil in self.PERFILES else "creativa")
 
     def set_perfil(self, perfil: str):
         """
-        Cambia el perfil de parámetros de la IA y reinicializa el modelo.
+        Cambia el perfil de parámetros de la IA (usa la vista del pool de ese perfil, sin crear otro cliente).
         """
         if perfil in self.PERFILES:
             self.perfil = perfil
@@ -96,22 +179,172 @@ class IAClient:
         self.contexto_inicial = SystemMessage(content=texto_contexto)
 
 
-    def procesar_mensaje(self, mensaje: str, contexto: str = None) -> str:
+    def _perfil_efectivo(self, perfil: str = None) -> str:
+        """Nombre del perfil con el que se hace una llamada (el propio si no se indica otro)."""
+        perfil = perfil.value if isinstance(perfil, PerfilesEnum) else perfil
+        return perfil or self.perfil
+
+    def _llm_para(self, perfil: str = None):
+        """Modelo a usar en una llamada: el propio o la vista del pool para el perfil indicado."""
+        perfil = self._perfil_efectivo(perfil)
+        if perfil == self.perfil:
+            return self.llm
+        return llm_pool.modelo(perfil)
+
+    def _construir_mensajes(self, mensaje: str, contexto=None) -> list:
+        """Mensajes de sistema y usuario; un contexto que no sea texto se envía serializado como JSON."""
+        mensajes = []
+        # Ejemplo de contexto: puedes pasar un historial de mensajes o instrucciones de sistema
+        if contexto:
+            if not isinstance(contexto, str):
+                contexto = json.dumps(contexto, ensure_ascii=False, default=str)
+            mensajes.append(SystemMessage(content=contexto))
+        mensajes.append(HumanMessage(content=mensaje))
+        return mensajes
+
+    def _clave_cache(self, perfil: str, mensajes: list):
+        """Clave de la llamada en llm_cache, o None si el perfil no se cachea."""
+        if not llm_cache.activa_para(perfil):
+            return None
+        return clave_cache(llm_pool.despliegue(perfil), self.PERFILES[perfil], mensajes)
+
+    def _leer_cache(self, clave, perfil: str):
+        if clave is None:
+            return None
+        try:
+            return llm_cache.get(clave, perfil)
+        except Exception as e:
+            logger.warning(f"No se pudo leer la caché del LLM: {e}")
+            return None
+
+    def _guardar_cache(self, clave, perfil: str, respuesta: str):
+        if clave is None:
+            return
+        try:
+            llm_cache.put(clave, perfil, respuesta)
+        except Exception as e:
+            logger.warning(f"No se pudo guardar en la caché del LLM: {e}")
+
+    def procesar_mensaje(self, mensaje: str, contexto=None, perfil: str = None) -> str:
         """
         Procesa un mensaje usando la IA de Azure OpenAI y devuelve la respuesta generada.
         Permite especificar un perfil de parámetros para esta llamada.
         :param mensaje: Texto a enviar a la IA.
-        :param contexto: Diccionario opcional con contexto adicional (por ejemplo, historial, sistema, etc.).
+        :param contexto: Texto o diccionario opcional con contexto adicional (por ejemplo, historial, sistema, etc.).
         :param perfil: (opcional) Nombre del perfil de parámetros a usar para esta llamada.
         :return: Respuesta generada por la IA.
         """
-        mensajes = []
-        # Ejemplo de contexto: puedes pasar un historial de mensajes o instrucciones de sistema
-        if contexto:          
-            mensajes.append(SystemMessage(content=contexto))
-          
-        mensajes.append(HumanMessage(content=mensaje))
-        response = self.llm.invoke(mensajes)       
-        
+        # Si la campaña en curso agotó su presupuesto de tokens se usa un perfil más barato (ver ia/token_metering.py)
+        perfil = medidor_tokens.perfil_para(self._perfil_efectivo(perfil))
+        mensajes = self._construir_mensajes(mensaje, contexto)
+        # Los perfiles deterministas se sirven desde la caché si ya se hizo la misma llamada (ver ia/llm_cache.py)
+        clave = self._clave_cache(perfil, mensajes)
+        respuesta = self._leer_cache(clave, perfil)
+        if respuesta is not None:
+            return respuesta
+        inicio = time.perf_counter()
+        try:
+            # Cuotas, concurrencia adaptativa, reintentos y circuit breaker compartidos (ver ia/llm_governor.py)
+            response = llm_governor.ejecutar(perfil, lambda: self._llm_para(perfil).invoke(mensajes),
+                                             mensajes, self.PERFILES[perfil]["max_tokens"])
+        except Exception:
+            registrar_llamada_llm(perfil, time.perf_counter() - inicio, error=True)
+            raise
+        registrar_llamada_llm(perfil, time.perf_counter() - inicio, getattr(response, "usage_metadata", None))
+        medidor_tokens.registrar(perfil, mensajes, response)
+        self._guardar_cache(clave, perfil, response.content)
+        return response.content
+
+    async def aprocesar_mensaje(self, mensaje: str, contexto=None, perfil: str = None) -> str:
+        """
+        Versión asíncrona de procesar_mensaje: la espera al LLM no ocupa ningún hilo.
+        Usa el cliente httpx asíncrono compartido (ver cliente_http_async_compartido).
+        """
+        perfil = await asyncio.to_thread(medidor_tokens.perfil_para, self._perfil_efectivo(perfil))
+        mensajes = self._construir_mensajes(mensaje, contexto)
+        clave = self._clave_cache(perfil, mensajes)
+        respuesta = await asyncio.to_thread(self._leer_cache, clave, perfil) if clave else None
+        if respuesta is not None:
+            return respuesta
+        inicio = time.perf_counter()
+        try:
+            response = await llm_governor.aejecutar(perfil, lambda: self._llm_para(perfil).ainvoke(mensajes),
+                                                    mensajes, self.PERFILES[perfil]["max_tokens"])
+        except Exception:
+            registrar_llamada_llm(perfil, time.perf_counter() - inicio, error=True)
+            raise
+        registrar_llamada_llm(perfil, time.perf_counter() - inicio, getattr(response, "usage_metadata", None))
+        await asyncio.to_thread(medidor_tokens.registrar, perfil, mensajes, response)
+        if clave:
+            await asyncio.to_thread(self._guardar_cache, clave, perfil, response.content)
         return response.content
 
+    def _registrar_stream(self, perfil: str, mensajes: list, acumulado, segundos: float, error: bool):
+        """Métricas y consumo de una respuesta en streaming, completa o cortada por quien la consume."""
+        uso = getattr(acumulado, "usage_metadata", None)
+        registrar_llamada_llm(perfil, segundos, None if error else uso, error=error)
+        if acumulado is not None:
+            # Si se cortó antes del último fragmento no hay usage_metadata y los tokens se estiman con tiktoken
+            medidor_tokens.registrar(perfil, mensajes, acumulado)
+
+    def procesar_mensaje_stream(self, mensaje: str, contexto=None, perfil: str = None) -> Iterator[str]:
+        """
+        Como procesar_mensaje, pero devuelve los fragmentos de la respuesta a medida que el LLM los genera.
+        Si quien lo consume deja de iterar y cierra el generador (contextlib.closing), la petición se corta
+        y el LLM no sigue generando tokens. Solo se guarda en caché una respuesta completa.
+        """
+        perfil = medidor_tokens.perfil_para(self._perfil_efectivo(perfil))
+        mensajes = self._construir_mensajes(mensaje, contexto)
+        clave = self._clave_cache(perfil, mensajes)
+        respuesta = self._leer_cache(clave, perfil)
+        if respuesta is not None:
+            yield respuesta
+            return
+        acumulado = None
+        error = False
+        inicio = time.perf_counter()
+        try:
+            with llm_governor.ranura(perfil, mensajes, self.PERFILES[perfil]["max_tokens"]):
+                for fragmento in self._llm_para(perfil).stream(mensajes, stream_usage=True):
+                    acumulado = fragmento if acumulado is None else acumulado + fragmento
+                    if fragmento.content:
+                        yield fragmento.content
+        except Exception:
+            error = True
+            raise
+        finally:
+            self._registrar_stream(perfil, mensajes, acumulado, time.perf_counter() - inicio, error)
+        if acumulado is not None:
+            self._guardar_cache(clave, perfil, acumulado.content)
+
+    async def aprocesar_mensaje_stream(self, mensaje: str, contexto=None, perfil: str = None) -> AsyncIterator[str]:
+        """Versión asíncrona de procesar_mensaje_stream (cerrarlo con contextlib.aclosing para cortar la petición)."""
+        perfil = await asyncio.to_thread(medidor_tokens.perfil_para, self._perfil_efectivo(perfil))
+        mensajes = self._construir_mensajes(mensaje, contexto)
+        clave = self._clave_cache(perfil, mensajes)
+        respuesta = await asyncio.to_thread(self._leer_cache, clave, perfil) if clave else None
+        if respuesta is not None:
+            yield respuesta
+            return
+        acumulado = None
+        error = False
+        inicio = time.perf_counter()
+        try:
+            async with llm_governor.aranura(perfil, mensajes, self.PERFILES[perfil]["max_tokens"]):
+                async for fragmento in self._llm_para(perfil).astream(mensajes, stream_usage=True):
+                    acumulado = fragmento if acumulado is None else acumulado + fragmento
+                    if fragmento.content:
+                        yield fragmento.content
+        except Exception:
+            error = True
+            raise
+        finally:
+            await asyncio.to_thread(self._registrar_stream, perfil, mensajes, acumulado,
+                                    time.perf_counter() - inicio, error)
+        if clave and acumulado is not None:
+            await asyncio.to_thread(self._guardar_cache, clave, perfil, acumulado.content)
+
+
+# Modelo base único del proceso con una vista por perfil (ver ia/llm_pool.py)
+llm_pool = LLMPool(IAClient.PERFILES, cliente_http_compartido, cliente_http_async_compartido,
+                   despliegues={perfil: DESPLIEGUE_ECONOMICO for perfil in PERFIL_ECONOMICO.values()})
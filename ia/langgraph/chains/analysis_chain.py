@@ -14,7 +14,7 @@ class AnalysisChain:
     """Cadena para análisis complejos de emails largos o ambiguos."""
     
     def __init__(self):
-        self.ia_client = IAClient(perfil="clasificacion")
+        self.ia_client = IAClient.compartido("clasificacion")
     
     def analyze_complex_email(
         self, 
@@ -180,7 +180,7 @@ class HierarchicalAnalysisChain:
     """Cadena para análisis jerárquico de emails con múltiples niveles."""
     
     def __init__(self):
-        self.ia_client = IAClient(perfil="clasificacion")
+        self.ia_client = IAClient.compartido("clasificacion")
     
     def analyze_hierarchical(
         self, 
@@ -13,8 +13,8 @@ class ResponseChain:
     """Cadena para generación de respuestas en múltiples pasos."""
     
     def __init__(self):
-        self.ia_client_creativa = IAClient(perfil="creativa")
-        self.ia_client_precisa = IAClient(perfil="precisa")
+        self.ia_client_creativa = IAClient.compartido("creativa")
+        self.ia_client_precisa = IAClient.compartido("precisa")
     
     def generate_elaborated_response(
         self, 
@@ -242,7 +242,7 @@ class AdaptiveResponseChain:
     """Cadena que adapta el estilo de respuesta según el contexto."""
     
     def __init__(self):
-        self.ia_client = IAClient(perfil="creativa")
+        self.ia_client = IAClient.compartido("creativa")
     
     def generate_adaptive_response(
         self, 
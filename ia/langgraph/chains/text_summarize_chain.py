@@ -3,12 +3,21 @@ from ia.ia_client import IAClient
 # Consejo de extensión para resúmenes: Campaña 300-500 palabras, Story 200-300 palabras, Scene 100-200 palabras.
 class TextSummarizeChain:
     def __init__(self):
-        self.ia_client = IAClient(perfil="resumen")
+        self.ia_client = IAClient.compartido("resumen")
 
     def resumir_emails(self, resumen_previo_scene, emails_nuevos, contexto_extra=None):
         """
         Fusiona el resumen previo de la escena con los emails recientes, generando un nuevo resumen coherente y sintético.
         """
+        mensaje_principal, contexto = self._peticion_resumir_emails(resumen_previo_scene, emails_nuevos, contexto_extra)
+        return self.ia_client.procesar_mensaje(mensaje_principal, contexto=contexto, perfil="resumen")
+
+    async def aresumir_emails(self, resumen_previo_scene, emails_nuevos, contexto_extra=None):
+        """Versión asíncrona de resumir_emails."""
+        mensaje_principal, contexto = self._peticion_resumir_emails(resumen_previo_scene, emails_nuevos, contexto_extra)
+        return await self.ia_client.aprocesar_mensaje(mensaje_principal, contexto=contexto, perfil="resumen")
+
+    def _peticion_resumir_emails(self, resumen_previo_scene, emails_nuevos, contexto_extra=None):
         instrucciones = (
             "Eres un agente experto en resumir mensajes de una partida de rol. Fusiona el resumen previo de la escena con los mensajes recientes. "
             "Mantén lo relevante del resumen previo y añade los eventos y/o acciones importantes de los mensajes recientes. "
@@ -23,13 +32,21 @@ class TextSummarizeChain:
             historial.extend(emails_nuevos)
         mensaje_principal = "Fusiona el resumen previo y los mensajes recientes en un único resumen sintético."
         contexto = {"sistema": instrucciones, "historial": historial}
-        resumen = self.ia_client.procesar_mensaje(mensaje_principal, contexto=contexto, perfil="resumen")
-        return resumen
+        return mensaje_principal, contexto
 
     def resumir_resumenes(self, resumen_superior, lista_resumenes, contexto_extra=None):
         """
         Fusiona varios resúmenes (por ejemplo, de escenas o story_states) en un resumen superior (story_state o campaign).
         """
+        mensaje_principal, contexto = self._peticion_resumir_resumenes(resumen_superior, lista_resumenes, contexto_extra)
+        return self.ia_client.procesar_mensaje(mensaje_principal, contexto=contexto, perfil="resumen")
+
+    async def aresumir_resumenes(self, resumen_superior, lista_resumenes, contexto_extra=None):
+        """Versión asíncrona de resumir_resumenes."""
+        mensaje_principal, contexto = self._peticion_resumir_resumenes(resumen_superior, lista_resumenes, contexto_extra)
+        return await self.ia_client.aprocesar_mensaje(mensaje_principal, contexto=contexto, perfil="resumen")
+
+    def _peticion_resumir_resumenes(self, resumen_superior, lista_resumenes, contexto_extra=None):
         instrucciones = (
             "Eres un agente experto en sintetizar resúmenes de partidas de rol. Fusiona el resumen superior previo con los resúmenes parciales. "
             "Mantén lo relevante del resumen superior y añade los eventos, acciones y cambios importantes de los resúmenes parciales. "
@@ -44,5 +61,4 @@ class TextSummarizeChain:
             historial.extend(lista_resumenes)
         mensaje_principal = "Fusiona el resumen superior previo y los resúmenes parciales en un único resumen sintético."
         contexto = {"sistema": instrucciones, "historial": historial}
-        resumen = self.ia_client.procesar_mensaje(mensaje_principal, contexto=contexto, perfil="resumen")
-        return resumen
\ No newline at end of file
+        return mensaje_principal, contexto
\ No newline at end of file
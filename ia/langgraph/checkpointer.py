@@ -0,0 +1,266 @@
+"""
+Checkpointer persistente de LangGraph sobre SQLAlchemy (PostgreSQL o SQLite).
+Sustituye a MemorySaver:
+- Los checkpoints sobreviven a un reinicio, así que un email a medio procesar se reanuda desde el último
+  nodo completado en lugar de repetir las llamadas al LLM.
+- Compactación: de cada ejecución solo se conservan el último checkpoint y su padre.
+- Retención: los checkpoints de más de GRAPH_CHECKPOINT_RETENTION_HOURS se purgan periódicamente.
+- Los canales no serializables (la sesión de BD) nunca se guardan; se inyectan de nuevo por config.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, Optional, Sequence
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from api.core.database import Base, engine as engine_principal
+from api.models.graph_checkpoint import GraphCheckpoint, GraphCheckpointWrite
+from utils.env_loader import get_env_variable
+
+logger = logging.getLogger(__name__)
+
+# Base de datos de los checkpoints: por defecto la de la aplicación (p. ej. sqlite:///checkpoints.db para separarla)
+GRAPH_CHECKPOINT_URL = get_env_variable("GRAPH_CHECKPOINT_URL", "")
+GRAPH_CHECKPOINT_RETENTION_HOURS = float(get_env_variable("GRAPH_CHECKPOINT_RETENTION_HOURS", "24"))
+GRAPH_CHECKPOINT_PURGE_SECONDS = float(get_env_variable("GRAPH_CHECKPOINT_PURGE_SECONDS", "600"))
+
+# Canales del estado que no se persisten
+CANALES_EXCLUIDOS = frozenset({"db_session"})
+
+
+class SQLAlchemySaver(BaseCheckpointSaver):
+    """Checkpointer de LangGraph que guarda cada checkpoint en graph_checkpoints con su propia sesión."""
+
+    def __init__(self, engine, retencion_horas: float = GRAPH_CHECKPOINT_RETENTION_HOURS,
+                 purgar_cada_segundos: float = GRAPH_CHECKPOINT_PURGE_SECONDS,
+                 canales_excluidos=CANALES_EXCLUIDOS, crear_tablas: bool = False, serde=None):
+        super().__init__(serde=serde)
+        self.engine = engine
+        self.retencion_horas = retencion_horas
+        self.purgar_cada_segundos = purgar_cada_segundos
+        self.canales_excluidos = canales_excluidos
+        self._sesiones = sessionmaker(bind=engine, autoflush=False)
+        self._ultima_purga = time.monotonic()
+        self._purga_lock = threading.Lock()
+        if crear_tablas:
+            Base.metadata.create_all(bind=engine, tables=[GraphCheckpoint.__table__, GraphCheckpointWrite.__table__])
+
+    # --- Lectura ---
+
+    def _to_tuple(self, db, fila: GraphCheckpoint) -> CheckpointTuple:
+        writes = (
+            db.query(GraphCheckpointWrite)
+            .filter(
+                GraphCheckpointWrite.thread_id == fila.thread_id,
+                GraphCheckpointWrite.checkpoint_ns == fila.checkpoint_ns,
+                GraphCheckpointWrite.checkpoint_id == fila.checkpoint_id,
+            )
+            .order_by(GraphCheckpointWrite.task_id, GraphCheckpointWrite.idx)
+            .all()
+        )
+        return CheckpointTuple(
+            config={
+                "configurable": {
+                    "thread_id": fila.thread_id,
+                    "checkpoint_ns": fila.checkpoint_ns,
+                    "checkpoint_id": fila.checkpoint_id,
+                }
+            },
+            checkpoint=self.serde.loads_typed((fila.tipo, fila.checkpoint)),
+            metadata=self.serde.loads_typed((fila.tipo_metadatos, fila.metadatos)),
+            parent_config=(
+                {
+                    "configurable": {
+                        "thread_id": fila.thread_id,
+                        "checkpoint_ns": fila.checkpoint_ns,
+                        "checkpoint_id": fila.parent_checkpoint_id,
+                    }
+                }
+                if fila.parent_checkpoint_id
+                else None
+            ),
+            pending_writes=[
+                (w.task_id, w.channel, self.serde.loads_typed((w.tipo, w.valor))) for w in writes
+            ],
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        """Devuelve el checkpoint indicado en config, o el más reciente de la ejecución (thread_id)."""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        with self._sesiones() as db:
+            query = db.query(GraphCheckpoint).filter(
+                GraphCheckpoint.thread_id == thread_id, GraphCheckpoint.checkpoint_ns == checkpoint_ns
+            )
+            if checkpoint_id := get_checkpoint_id(config):
+                query = query.filter(GraphCheckpoint.checkpoint_id == checkpoint_id)
+            fila = query.order_by(GraphCheckpoint.checkpoint_id.desc()).first()
+            return self._to_tuple(db, fila) if fila else None
+
+    def list(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+             before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> Iterator[CheckpointTuple]:
+        """Lista checkpoints del más reciente al más antiguo."""
+        with self._sesiones() as db:
+            query = db.query(GraphCheckpoint)
+            if config:
+                query = query.filter(GraphCheckpoint.thread_id == config["configurable"]["thread_id"])
+                if (checkpoint_ns := config["configurable"].get("checkpoint_ns")) is not None:
+                    query = query.filter(GraphCheckpoint.checkpoint_ns == checkpoint_ns)
+                if checkpoint_id := get_checkpoint_id(config):
+                    query = query.filter(GraphCheckpoint.checkpoint_id == checkpoint_id)
+            if before and (before_id := get_checkpoint_id(before)):
+                query = query.filter(GraphCheckpoint.checkpoint_id < before_id)
+            resultados = []
+            for fila in query.order_by(GraphCheckpoint.thread_id, GraphCheckpoint.checkpoint_id.desc()).all():
+                if limit is not None and len(resultados) >= limit:
+                    break
+                tupla = self._to_tuple(db, fila)
+                if filter and not all(tupla.metadata.get(k) == v for k, v in filter.items()):
+                    continue
+                resultados.append(tupla)
+        yield from resultados
+
+    # --- Escritura ---
+
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+            new_versions: ChannelVersions) -> RunnableConfig:
+        """Guarda el checkpoint (sin los canales excluidos) y compacta los anteriores de la misma ejecución."""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        parent_id = config["configurable"].get("checkpoint_id")
+        copia = checkpoint.copy()
+        copia["channel_values"] = {
+            canal: valor for canal, valor in checkpoint["channel_values"].items()
+            if canal not in self.canales_excluidos
+        }
+        tipo, datos = self.serde.dumps_typed(copia)
+        tipo_metadatos, metadatos = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+        conservar = [checkpoint["id"]] + ([parent_id] if parent_id else [])
+        with self._sesiones() as db:
+            db.merge(GraphCheckpoint(
+                thread_id=thread_id,
+                checkpoint_ns=checkpoint_ns,
+                checkpoint_id=checkpoint["id"],
+                parent_checkpoint_id=parent_id,
+                tipo=tipo,
+                checkpoint=datos,
+                tipo_metadatos=tipo_metadatos,
+                metadatos=metadatos,
+            ))
+            # Compactación: para reanudar basta con el último checkpoint (y su padre)
+            for modelo in (GraphCheckpoint, GraphCheckpointWrite):
+                db.query(modelo).filter(
+                    modelo.thread_id == thread_id,
+                    modelo.checkpoint_ns == checkpoint_ns,
+                    modelo.checkpoint_id.notin_(conservar),
+                ).delete(synchronize_session=False)
+            db.commit()
+        self._purgar_si_toca()
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[tuple], task_id: str, task_path: str = "") -> None:
+        """Guarda las escrituras de un nodo; las normales no se sobrescriben si ya existían."""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        with self._sesiones() as db:
+            for idx, (canal, valor) in enumerate(writes):
+                if canal in self.canales_excluidos:
+                    continue
+                idx = WRITES_IDX_MAP.get(canal, idx)
+                clave = (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+                if idx >= 0 and db.get(GraphCheckpointWrite, clave) is not None:
+                    continue
+                tipo, datos = self.serde.dumps_typed(valor)
+                db.merge(GraphCheckpointWrite(
+                    thread_id=thread_id,
+                    checkpoint_ns=checkpoint_ns,
+                    checkpoint_id=checkpoint_id,
+                    task_id=task_id,
+                    idx=idx,
+                    channel=canal,
+                    tipo=tipo,
+                    valor=datos,
+                    task_path=task_path,
+                ))
+            db.commit()
+
+    def delete_thread(self, thread_id: str) -> None:
+        """Elimina todos los checkpoints y escrituras de una ejecución."""
+        with self._sesiones() as db:
+            for modelo in (GraphCheckpointWrite, GraphCheckpoint):
+                db.query(modelo).filter(modelo.thread_id == thread_id).delete(synchronize_session=False)
+            db.commit()
+
+    def purgar(self, retencion_horas: float = None) -> int:
+        """Elimina los checkpoints más antiguos que la retención. Devuelve cuántos checkpoints se han borrado."""
+        limite = datetime.now(tz=timezone.utc) - timedelta(hours=retencion_horas or self.retencion_horas)
+        with self._sesiones() as db:
+            db.query(GraphCheckpointWrite).filter(GraphCheckpointWrite.fecha < limite).delete(synchronize_session=False)
+            borrados = db.query(GraphCheckpoint).filter(GraphCheckpoint.fecha < limite).delete(synchronize_session=False)
+            db.commit()
+        if borrados:
+            logger.info(f"Purgados {borrados} checkpoints del grafo anteriores a {limite}")
+        return borrados
+
+    def _purgar_si_toca(self):
+        if time.monotonic() - self._ultima_purga < self.purgar_cada_segundos:
+            return
+        if not self._purga_lock.acquire(blocking=False):
+            return
+        try:
+            self._ultima_purga = time.monotonic()
+            self.purgar()
+        except Exception as e:
+            logger.error(f"Error purgando checkpoints del grafo: {e}")
+        finally:
+            self._purga_lock.release()
+
+    # --- Versiones asíncronas (la E/S se hace en un hilo) ---
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+                    before: Optional[RunnableConfig] = None, limit: Optional[int] = None):
+        for tupla in await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit))):
+            yield tupla
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+                   new_versions: ChannelVersions) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[tuple], task_id: str, task_path: str = "") -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+
+def crear_checkpointer() -> SQLAlchemySaver:
+    """Checkpointer del grafo sobre GRAPH_CHECKPOINT_URL o, si no se indica, sobre la base de datos principal."""
+    if GRAPH_CHECKPOINT_URL:
+        return SQLAlchemySaver(create_engine(GRAPH_CHECKPOINT_URL), crear_tablas=True)
+    return SQLAlchemySaver(engine_principal)
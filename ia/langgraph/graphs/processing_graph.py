@@ -3,67 +3,316 @@ Grafo principal para procesamiento de emails usando LangGraph.
 Orquesta el flujo completo desde análisis hasta respuesta.
 """
 from IPython.display import Image, display
-from typing import Dict, Any, Literal
-from langgraph.graph import StateGraph, END
+from typing import Dict, Any, List, Literal
+from langgraph.graph import StateGraph, START, END
+from langgraph.types import Send
+from langchain_core.runnables import RunnableConfig, RunnableLambda
 from langgraph.prebuilt import ToolNode, tools_condition
-from langgraph.checkpoint.memory import MemorySaver
 from ..states.story_state import EmailState
-from ..nodes.narrative_email_analysis_node import narrative_email_analysis_node
-from ..nodes.combat_email_analysis_node import combat_email_analysis_node
-from ..nodes.context_gathering_node import gather_context_node
-from ..nodes.rules_validation_node import validate_rules_node
-from ..nodes.narrative_response_generation_node import narrative_generate_response_node
-from ..nodes.combat_response_generation_node import combat_generate_response_node
-from ..nodes.state_transition_node import transition_state_node
+from ..nodes.narrative_email_analysis_node import narrative_email_analysis_node, anarrative_email_analysis_node, NarrativeEmailAnalysisNode
+from ..nodes.combat_email_analysis_node import combat_email_analysis_node, CombatEmailAnalysisNode
+from ..nodes.context_gathering_node import gather_context_node, agather_context_node, ContextGatheringNode
+from ..nodes.rules_validation_node import validate_intention_node, avalidate_intention_node, RulesValidationNode
+from ..nodes.narrative_response_generation_node import narrative_generate_response_node, anarrative_generate_response_node, NarrativeResponseGenerationNode
+from ..nodes.combat_response_generation_node import combat_generate_response_node, CombatResponseGenerationNode
+from ..nodes.state_transition_node import transition_state_node, StateTransitionNode
+from ..nodes.registry import node_registry
+from ..checkpointer import crear_checkpointer
 from api.models.scene import PhaseType
 from api.models.email import Email
+from utils.metrics import LATENCIA_NODOS
 from datetime import datetime
 import logging
 
 logger = logging.getLogger(__name__)
 
+
+def _nodo(nombre: str, func, afunc=None):
+    """
+    Nodo usable tanto con invoke (sesión síncrona) como con ainvoke (AsyncSession), con su latencia
+    registrada en el histograma aimailrol_node_latency_seconds (etiqueta nodo=nombre).
+    Los nodos sin versión asíncrona se ejecutan con AsyncSession.run_sync, que les entrega una Session
+    síncrona; funcionan igual pero bloquean el bucle de eventos mientras duran.
+    """
+    if afunc is None:
+        async def afunc(state: EmailState, config: RunnableConfig = None) -> EmailState:
+            configurable = (config or {}).get("configurable") or {}
+            sesion = configurable.get("db_session")
+            if sesion is None or not hasattr(sesion, "run_sync"):
+                return func(state, config)
+            return await sesion.run_sync(
+                lambda db: func(state, {**config, "configurable": {**configurable, "db_session": db}})
+            )
+
+    def medido(state: EmailState, config: RunnableConfig = None):
+        with LATENCIA_NODOS.cronometrar(nodo=nombre):
+            return func(state, config)
+
+    async def amedido(state: EmailState, config: RunnableConfig = None):
+        with LATENCIA_NODOS.cronometrar(nodo=nombre):
+            return await afunc(state, config)
+
+    return RunnableLambda(medido, afunc=amedido, name=nombre)
+
+
 class ProcessingGraph:
     """Grafo principal para procesamiento de emails de rol."""
     
     def __init__(self):
-        self.checkpointer = MemorySaver()  # Para persistir estado entre ejecuciones
+        self.checkpointer = crear_checkpointer()  # Checkpoints persistentes: permiten reanudar un email tras una caída
         self.graph = self._build_graph()
     
     def _build_graph(self) -> StateGraph:
         """Construye el grafo de procesamiento."""
         
+        # Instanciar una sola vez los nodos (y sus clientes IA compartidos); las funciones helper los reutilizan
+        node_registry.precargar([
+            ContextGatheringNode,
+            NarrativeEmailAnalysisNode,
+            CombatEmailAnalysisNode,
+            RulesValidationNode,
+            NarrativeResponseGenerationNode,
+            CombatResponseGenerationNode,
+            StateTransitionNode,
+        ])
+        
         # Crear el grafo con el estado tipado
         workflow = StateGraph(EmailState)
         
-        # Agregar nodos
-        workflow.add_node("gather_context", gather_context_node)
-        workflow.add_node("narrative_email_analysis", narrative_email_analysis_node)
-        workflow.add_node("combat_email_analysis", combat_email_analysis_node)
-        workflow.add_node("narrative_generate_response", narrative_generate_response_node)
-        workflow.add_node("combat_generate_response", combat_generate_response_node)
-        workflow.add_node("transition_state", transition_state_node)
-        
-        # Definir el flujo
-        workflow.set_entry_point("gather_context")
+        # Agregar nodos (cada uno con su versión síncrona y asíncrona)
+        workflow.add_node("gather_context", _nodo("gather_context", gather_context_node, agather_context_node))
+        workflow.add_node("narrative_email_analysis", _nodo("narrative_email_analysis", narrative_email_analysis_node, anarrative_email_analysis_node))
+        workflow.add_node("combat_email_analysis", _nodo("combat_email_analysis", combat_email_analysis_node))
+        workflow.add_node("join_results", self.join_results)
+        workflow.add_node("validate_intention", _nodo("validate_intention", validate_intention_node, avalidate_intention_node))
+        workflow.add_node("narrative_generate_response", _nodo("narrative_generate_response", narrative_generate_response_node, anarrative_generate_response_node))
+        workflow.add_node("combat_generate_response", _nodo("combat_generate_response", combat_generate_response_node))
+        workflow.add_node("transition_state", _nodo("transition_state", transition_state_node))
         
+        # Definir el flujo:
+        # 1. El análisis del email solo necesita el cuerpo y los nombres de los personajes, así que se ejecuta
+        #    en paralelo con la recopilación de contexto (la rama lenta, con los resúmenes del LLM). Solo la
+        #    recopilación de contexto usa la sesión del email; el análisis abre la suya (sesion_independiente).
+        # 2. join_results espera a ambas ramas y reparte una validación de reglas por intención, en paralelo (Send).
+        # 3. La respuesta se genera cuando han terminado todas las validaciones (o directamente si no hay ninguna).
+        # Los nodos devuelven solo lo que cambian; errors y validaciones se acumulan (operator.add en EmailState).
         workflow.add_conditional_edges(
-            "gather_context",
-                lambda state: self.route_analysis_node(state),  # Usar route_analysis_node para decidir el nodo
-            {
-                "narrative_email_analysis": "narrative_email_analysis",
-                "combat_email_analysis": "combat_email_analysis"
-            }
+            START,
+            self.route_fan_out,
+            ["gather_context", "narrative_email_analysis", "combat_email_analysis"]
+        )
+        workflow.add_edge(["gather_context", "narrative_email_analysis"], "join_results")
+        workflow.add_edge(["gather_context", "combat_email_analysis"], "join_results")
+        workflow.add_conditional_edges(
+            "join_results",
+            self.route_validations,
+            ["validate_intention", "narrative_generate_response", "combat_generate_response", END]
+        )
+        workflow.add_conditional_edges(
+            "validate_intention",
+            self.route_response_node,
+            ["narrative_generate_response", "combat_generate_response", END]
         )
-        workflow.add_edge("narrative_email_analysis", "narrative_generate_response")
-        workflow.add_edge("combat_email_analysis", "combat_generate_response")
         workflow.add_edge("narrative_generate_response", END)
         workflow.add_edge("combat_generate_response", END)
         
-
-        
         # Compilar el grafo
         return workflow.compile(checkpointer=self.checkpointer)
     
+    def _build_initial_state(self, email: Email, db_session: Any, current_state: str) -> EmailState:
+        """Estado inicial del grafo para un email."""
+        return {
+            'email_id': email.id,
+            'email_ids': [email.id],
+            'emails_agrupados': None,
+            'email_data': {
+                'sender': email.sender,
+                'recipients': email.recipients,
+                'subject': email.subject,
+                'body': email.body,
+                'thread_id': email.thread_id,
+                'message_id': email.message_id
+            },
+            'clasificacion_intenciones': None,
+            'transicion_detectada': None,
+            'metajuego_detectado': False,
+            'campaign_id': email.campaign_id,
+            'scene_id': email.scene_id,
+            'story_id': None,
+            'player_id': email.player_id,
+            'character_id': None,
+            'json_ambientacion': None,
+            'json_reglas': None,
+            'json_hojas_personajes': None,
+            'json_estado_actual_personajes': None,
+            'contexto_historial': None,
+            'contexto_ultimos_emails': None,
+            'personajes_pj': None,
+            'nombre_personajes_pj': None,
+            'personajes_pnj': None,
+            'contexto_sistema': None,
+            'contexto_usuario': None,
+            'ruleset': None,
+            'intenciones': None,
+            'validaciones': [],
+            'estado_actual': current_state,
+            'estado_nuevo': None,
+            'respuesta_ia': None,
+            'respuesta_truncada': False,
+            'email_respuesta': None,
+            'timestamp': datetime.now(),
+            'processed': False,
+            'errors': []
+        }
+
+    def _run(self, emails: List[Email], db_session: Any, current_state: str) -> Dict[str, Any]:
+        """
+        Ejecuta el grafo y construye el resultado del procesamiento.
+        Si hay checkpoints de una ejecución anterior interrumpida del mismo thread_id, la reanuda
+        desde el último nodo completado en lugar de empezar de cero.
+        """
+        thread_id = self._thread_id(emails)
+        email_ids = [email.id for email in emails]
+        try:
+            # La sesión viaja por config: no forma parte de los checkpoints
+            previo = self.graph.get_state(self._config(thread_id, db_session))
+            initial_state = self._estado_inicial(self._grupo_a_reanudar(emails, previo), db_session, current_state)
+            email_ids = initial_state['email_ids']
+            config = self._config(thread_id, db_session, email_ids)
+            entrada = self._entrada(initial_state, thread_id, previo)
+            if entrada is previo.values:
+                result = previo.values
+            else:
+                if entrada is initial_state and previo.values:
+                    self.discard_checkpoints(thread_id)
+                result = self.graph.invoke(entrada, config)
+            return self._resultado(initial_state, thread_id, result)
+        except Exception as e:
+            return self._error_critico(email_ids, thread_id, e)
+
+    async def _arun(self, emails: List[Email], db_session: Any, current_state: str) -> Dict[str, Any]:
+        """Versión asíncrona de _run: db_session es una AsyncSession y el grafo se ejecuta con ainvoke."""
+        thread_id = self._thread_id(emails)
+        email_ids = [email.id for email in emails]
+        try:
+            previo = await self.graph.aget_state(self._config(thread_id, db_session))
+            initial_state = self._estado_inicial(self._grupo_a_reanudar(emails, previo), db_session, current_state)
+            email_ids = initial_state['email_ids']
+            config = self._config(thread_id, db_session, email_ids)
+            entrada = self._entrada(initial_state, thread_id, previo)
+            if entrada is previo.values:
+                result = previo.values
+            else:
+                if entrada is initial_state and previo.values:
+                    await self.checkpointer.adelete_thread(thread_id)
+                result = await self.graph.ainvoke(entrada, config)
+            return self._resultado(initial_state, thread_id, result)
+        except Exception as e:
+            return self._error_critico(email_ids, thread_id, e)
+
+    @staticmethod
+    def _thread_id(emails: List[Email]) -> str:
+        """
+        Los checkpoints se guardan por el primer email del grupo: tras una caída el lease caduca y el grupo se
+        vuelve a formar al reclamarlo, quizá con más emails, pero siempre empieza por el mismo.
+        """
+        return f"email_{emails[0].id}"
+
+    def _config(self, thread_id: str, db_session: Any, email_ids: List[int] = None) -> Dict[str, Any]:
+        config = {"configurable": {"thread_id": thread_id, "db_session": db_session}}
+        if email_ids:
+            # Composición del grupo en los metadatos del checkpoint (solo admiten valores simples)
+            config["metadata"] = {"grupo_emails": ",".join(str(email_id) for email_id in email_ids)}
+        return config
+
+    @staticmethod
+    def _grupo_del_checkpoint(previo) -> List[int]:
+        """Emails de la ejecución guardada en los checkpoints ([] si no hay ninguna)."""
+        if not previo.values:
+            return []
+        grupo = (previo.metadata or {}).get("grupo_emails")
+        if grupo:
+            return [int(email_id) for email_id in grupo.split(",")]
+        return list(previo.values.get('email_ids') or [])
+
+    def _grupo_a_reanudar(self, emails: List[Email], previo) -> List[Email]:
+        """
+        Emails con los que se ejecuta el grafo: los del grupo de la ejecución interrumpida si todos siguen
+        entre los reclamados (los que hayan llegado después se responden en el turno siguiente), o si no
+        los reclamados, empezando de cero.
+        """
+        grupo = self._grupo_del_checkpoint(previo)
+        por_id = {email.id: email for email in emails}
+        if not grupo or not all(email_id in por_id for email_id in grupo):
+            return emails
+        if len(grupo) != len(emails):
+            logger.info(f"Se reanuda el grupo {grupo} del checkpoint; {len(emails) - len(grupo)} email(s) quedan para otro turno")
+        return [por_id[email_id] for email_id in grupo]
+
+    def _estado_inicial(self, emails: List[Email], db_session: Any, current_state: str) -> EmailState:
+        if len(emails) == 1:
+            logger.info(f"Iniciando procesamiento de email {emails[0].id}")
+            return self._build_initial_state(emails[0], db_session, current_state)
+        return self._build_group_state(emails, db_session, current_state)
+
+    def _entrada(self, initial_state: EmailState, thread_id: str, previo) -> Any:
+        """
+        Decide con qué se ejecuta el grafo según los checkpoints previos del thread_id:
+        None para reanudar, los valores previos si ya se había completado, o el estado inicial
+        (también si los checkpoints son de otro grupo de emails).
+        """
+        if previo.values and self._grupo_del_checkpoint(previo) != initial_state['email_ids']:
+            return initial_state
+        if previo.values and previo.next:
+            logger.info(f"Reanudando {thread_id} desde el checkpoint (pendiente: {', '.join(previo.next)})")
+            return None
+        if previo.values and previo.values.get('processed'):
+            logger.info(f"{thread_id} ya se había completado antes de la caída; se reutiliza su resultado")
+            return previo.values
+        return initial_state
+
+    def _resultado(self, initial_state: EmailState, thread_id: str, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Resultado del procesamiento a partir del estado final del grafo."""
+        processing_result = {
+            'success': result.get('processed', False),
+            'email_id': initial_state['email_id'],
+            'email_ids': initial_state['email_ids'],
+            'thread_id': thread_id,
+            'respuesta_generada': result.get('respuesta_ia'),
+            'respuesta_truncada': result.get('respuesta_truncada', False),
+            'email_respuesta': result.get('email_respuesta'),
+            'intenciones_detectadas': result.get('intenciones', []),
+            'transicion_detectada': result.get('transicion_detectada'),
+            'estado_final': result.get('estado_actual'),
+            'errors': result.get('errors', [])
+        }
+        
+        if processing_result['success']:
+            logger.info(f"Email(s) {initial_state['email_ids']} procesado(s) exitosamente")
+        else:
+            logger.error(f"Error procesando email(s) {initial_state['email_ids']}: {processing_result['errors']}")
+        
+        return processing_result
+
+    def _error_critico(self, email_ids: List[int], thread_id: str, e: Exception) -> Dict[str, Any]:
+        logger.error(f"Error crítico procesando email(s) {email_ids}: {e}")
+        return {
+            'success': False,
+            'email_id': email_ids[0],
+            'email_ids': email_ids,
+            'thread_id': thread_id,
+            'errors': [f"Error crítico: {str(e)}"]
+        }
+
+    def discard_checkpoints(self, thread_id: str):
+        """Elimina los checkpoints de una ejecución (tras confirmarla o descartarla)."""
+        if not thread_id:
+            return
+        try:
+            self.checkpointer.delete_thread(thread_id)
+        except Exception as e:
+            logger.error(f"No se pudieron eliminar los checkpoints de {thread_id}: {e}")
+
     def process_email(
         self, 
         email: Email, 
@@ -81,79 +330,65 @@ class ProcessingGraph:
         Returns:
             Resultado del procesamiento
         """
-        try:
-            logger.info(f"Iniciando procesamiento de email {email.id}")
+        return self._run([email], db_session, current_state)
+
+    def process_email_group(
+        self,
+        emails: List[Email],
+        db_session: Any,
+        current_state: str = PhaseType.narracion
+    ) -> Dict[str, Any]:
+        """
+        Procesa varios emails consecutivos de la misma escena en una sola pasada del grafo:
+        el contexto se recopila una vez y se genera una única respuesta del narrador para todos.
+        
+        Args:
+            emails: Emails de la misma escena ordenados por fecha
+            db_session: Sesión de base de datos
+            current_state: Estado actual del juego
             
-            # Estado inicial
-            initial_state: EmailState = {
+        Returns:
+            Resultado del procesamiento (email_ids contiene los emails respondidos: al reanudar una ejecución
+            interrumpida son los de su grupo, que pueden ser menos que los recibidos)
+        """
+        return self._run(emails, db_session, current_state)
+
+    async def aprocess_email_group(
+        self,
+        emails: List[Email],
+        db_session: Any,
+        current_state: str = PhaseType.narracion
+    ) -> Dict[str, Any]:
+        """
+        Versión asíncrona de process_email_group (también para un solo email).
+        db_session debe ser una AsyncSession: los nodos acceden a la BD con run_sync y llaman al LLM sin bloquear.
+        """
+        return await self._arun(emails, db_session, current_state)
+
+    def _build_group_state(self, emails: List[Email], db_session: Any, current_state: str) -> EmailState:
+        """Estado inicial de un grupo de emails de la misma escena."""
+        logger.info(f"Iniciando procesamiento agrupado de {len(emails)} emails de la escena {emails[0].scene_id}")
+        primero, ultimo = emails[0], emails[-1]
+        initial_state = self._build_initial_state(primero, db_session, current_state)
+        initial_state['email_ids'] = [email.id for email in emails]
+        initial_state['emails_agrupados'] = [
+            {
                 'email_id': email.id,
-                'email_data': {
-                    'sender': email.sender,
-                    'recipients': email.recipients,
-                    'subject': email.subject,
-                    'body': email.body
-                },
-                'clasificacion_intenciones': None,
-                'transicion_detectada': None,
-                'metajuego_detectado': False,
-                'campaign_id': email.campaign_id,
-                'scene_id': email.scene_id,
-                'story_id': None,
                 'player_id': email.player_id,
-                'character_id': None,
-                'json_ambientacion': None,
-                'json_reglas': None,
-                'json_hojas_personajes': None,
-                'json_estado_actual_personajes': None,
-                'contexto_historial': None,
-                'contexto_ultimos_emails': None,
-                'personajes_pj': None,
-                'nombre_personajes_pj': None,
-                'personajes_pnj': None,
-                'contexto_sistema': None,
-                'contexto_usuario': None,
-                'ruleset': None,
-                'validaciones': None,
-                'estado_actual': current_state,
-                'estado_nuevo': None,
-                'respuesta_ia': None,
-                'email_respuesta': None,
-                'timestamp': datetime.now(),
-                'processed': False,
-                'errors': None,
-                'db_session': db_session
-            }
-            
-            # Ejecutar el grafo
-            config = {"configurable": {"thread_id": f"email_{email.id}"}}
-            result = self.graph.invoke(initial_state, config)
-            
-            # Resultado del procesamiento
-            processing_result = {
-                'success': result.get('processed', False),
-                'email_id': email.id,
-                'respuesta_generada': result.get('respuesta_ia'),
-                'email_respuesta': result.get('email_respuesta'),
-                'intenciones_detectadas': result.get('intenciones', []),
-                'transicion_detectada': result.get('transicion_detectada'),
-                'estado_final': result.get('estado_actual'),
-                'errors': result.get('errors', [])
-            }
-            
-            if processing_result['success']:
-                logger.info(f"Email {email.id} procesado exitosamente")
-            else:
-                logger.error(f"Error procesando email {email.id}: {processing_result['errors']}")
-            
-            return processing_result
-            
-        except Exception as e:
-            logger.error(f"Error crítico procesando email {email.id}: {e}")
-            return {
-                'success': False,
-                'email_id': email.id,
-                'errors': [f"Error crítico: {str(e)}"]
+                'sender': email.sender,
+                'subject': email.subject,
+                'body': email.body,
+                'message_id': email.message_id
             }
+            for email in emails
+        ]
+        # El cuerpo combinado es el "último email" que verán los nodos; la respuesta sigue el hilo del más reciente
+        initial_state['email_data'].update({
+            'body': "\n\n".join(f"[{email.sender}]\n{email.body}" for email in emails),
+            'thread_id': ultimo.thread_id or primero.thread_id,
+            'message_id': ultimo.message_id
+        })
+        return initial_state
     
     def get_graph_visualization(self) -> str:
         """Genera una visualización automática del grafo compilado en formato PNG usando Mermaid."""
@@ -176,6 +411,35 @@ class ProcessingGraph:
         elif state.get("estado_actual") == PhaseType.combate:
             return "combat_email_analysis"
         return END
+    
+    def route_fan_out(self, state: EmailState) -> List[str]:
+        """Ramas que arrancan en paralelo: recopilación de contexto y el análisis que corresponde a la fase."""
+        analisis = self.route_analysis_node(state)
+        return ["gather_context"] if analisis == END else ["gather_context", analisis]
+    
+    def join_results(self, state: EmailState) -> Dict[str, Any]:
+        """
+        Punto de unión de la recopilación de contexto y el análisis. Sus resultados ya están en el estado
+        (cada rama escribe claves distintas); aquí solo se registra el resultado conjunto.
+        """
+        logger.info(f"Contexto y análisis listos para email(s) {state.get('email_ids')}"
+                    f" ({len(state.get('errors') or [])} errores)")
+        return {}
+    
+    def route_validations(self, state: EmailState):
+        """Una validación de reglas por intención (en paralelo), o directamente a la respuesta si no hay ninguna."""
+        tareas = node_registry.get(RulesValidationNode).tareas_de_validacion(state)
+        if tareas:
+            return [Send("validate_intention", tarea) for tarea in tareas]
+        return self.route_response_node(state)
+    
+    def route_response_node(self, state: EmailState):
+        """Nodo de respuesta según la fase actual."""
+        if state.get("estado_actual") == PhaseType.narracion:
+            return "narrative_generate_response"
+        elif state.get("estado_actual") == PhaseType.combate:
+            return "combat_generate_response"
+        return END
 
 # Instancia global del grafo
 processing_graph = ProcessingGraph()
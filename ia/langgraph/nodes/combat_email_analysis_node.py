@@ -2,7 +2,9 @@ from typing import Dict, Any
 from langgraph.graph import StateGraph
 
 from ia.ia_client import IAClient, PerfilesEnum
-from ..states.story_state import EmailState
+from langchain_core.runnables import RunnableConfig
+from ..states.story_state import EmailState, estado_de_trabajo, cambios_del_nodo
+from .registry import node_registry
 from api.managers.email_manager import EmailManager
 from api.managers.character_manager import CharacterManager
 from api.managers.player_manager import PlayerManager
@@ -15,7 +17,7 @@ logger = logging.getLogger(__name__)
 class CombatEmailAnalysisNode:
     """Nodo encargado del análisis de emails entrantes en modo combate."""
     def __init__(self):
-        self.ia_client = IAClient(perfil=PerfilesEnum.CLASIFICACION.value)
+        self.ia_client = IAClient.compartido(PerfilesEnum.CLASIFICACION.value)
         # Aquí podrías inicializar otros recursos necesarios, como un cliente IA específico
 
     def __call__(self, state: EmailState) -> EmailState:
@@ -23,9 +25,9 @@ class CombatEmailAnalysisNode:
         return state
 
 # Función helper para usar en el grafo
-def combat_email_analysis_node(state: EmailState) -> EmailState:
+def combat_email_analysis_node(state: EmailState, config: RunnableConfig = None) -> Dict[str, Any]:
     """Función de conveniencia para usar en el grafo LangGraph."""
-    node = CombatEmailAnalysisNode()
-    return node(state)
+    node = node_registry.get(CombatEmailAnalysisNode)
+    return cambios_del_nodo(state, node(estado_de_trabajo(state, config)))
 
 
@@ -4,7 +4,9 @@ Combina análisis, contexto y validaciones para generar la respuesta final.
 """
 
 from typing import Dict, Any
-from ..states.story_state import EmailState
+from langchain_core.runnables import RunnableConfig
+from ..states.story_state import EmailState, estado_de_trabajo, cambios_del_nodo
+from .registry import node_registry
 from ia.ia_client import IAClient
 import logging
 import json
@@ -15,11 +17,11 @@ class CombatResponseGenerationNode:
     """Nodo encargado de generar la respuesta de combate final."""
     
     def __init__(self):
-        self.ia_client = IAClient(perfil="creativa")
+        self.ia_client = IAClient.compartido("creativa")
     
     
 # Función helper para usar en el grafo
-def combat_generate_response_node(state: EmailState) -> EmailState:
+def combat_generate_response_node(state: EmailState, config: RunnableConfig = None) -> Dict[str, Any]:
     """Función de conveniencia para usar en el grafo LangGraph."""
-    node = CombatResponseGenerationNode()
-    return node(state)
+    node = node_registry.get(CombatResponseGenerationNode)
+    return cambios_del_nodo(state, node(estado_de_trabajo(state, config)))
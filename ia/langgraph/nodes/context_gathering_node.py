@@ -4,7 +4,9 @@ Obtiene historial, resúmenes y contexto necesario para la IA.
 """
 
 from typing import Dict, Any, List
-from ..states.story_state import EmailState
+from langchain_core.runnables import RunnableConfig
+from ..states.story_state import EmailState, estado_de_trabajo, cambios_del_nodo
+from .registry import node_registry
 from api.managers.scene_manager import SceneManager
 from api.managers.story_manager import StoryManager
 from api.managers.campaign_manager import CampaignManager
@@ -22,7 +24,7 @@ class ContextGatheringNode:
     """Nodo encargado de recopilar todo el contexto necesario para la IA."""
     
     def __init__(self):
-        self.ia_client = IAClient(perfil="resumen")
+        self.ia_client = IAClient.compartido("resumen")
         self.resumidor_textos = TextSummarizeChain()
     
     def __call__(self, state: EmailState) -> EmailState:
@@ -37,101 +39,130 @@ class ContextGatheringNode:
         """
         try:
             logger.info(f"Recopilando contexto para escena: {state.get('scene_id')}")
-            story_id = SceneManager.get_story_id_by_scene_id(state['db_session'], state.get('scene_id'))
-            # Inicializar gestor de emails donde recuperamos los emails recientes y resumimos si superan un límite sin resumir
-            recopilador = ContextCollectorChain(
-                state['db_session'], 
-                self.resumidor_textos
-            )
-            email_bodies_a_resumir, email_bodies_puros = recopilador.gestionar_emails_para_contexto(
-                scene_id=state.get('scene_id', None),
-                max_emails=10,
-                n_puros=3
-            )
-            if email_bodies_a_resumir:
+            db = state['db_session']
+            datos = self._leer_contexto(db, state)
+            if datos['email_bodies_a_resumir']:
                 # Si hay emails a resumir, procesarlos
-                resumen_previo_scene = SceneManager.get_scene_summary_by_id(
-                    state['db_session'], 
-                    state.get('scene_id')
-                )
-                nuevo_resumen_scene = self.resumidor_textos.resumir_emails(resumen_previo_scene, email_bodies_a_resumir)
-                SceneManager.update_scene_summary_by_id(state['db_session'], state.get('scene_id'), nuevo_resumen_scene)
-            
-            # Inicializar recopilador de contexto
-            ambientacion_json, reglas_json = recopilador.obtener_contexto_ambientacion_y_reglas(
-                state.get('campaign_id')
-            )
-            
-            # Obtener contexto narrativo si hay escena
-            if state.get('scene_id'):
-                campaign_resumen, story_resumen, scene_bodies_a_resumir, scene_bodies_puros = recopilador.recopilar_resumenes_contexto(
-                    scene_id=state['scene_id'],
-                    max_scenes=5,
-                    scenes_puros=3
-                )
-                scene = SceneManager.get_scene_by_id(state['db_session'], state['scene_id'])
-                if (scene_bodies_a_resumir):
-                    story_resumen = self.resumidor_textos.resumir_resumenes(story_resumen, scene_bodies_a_resumir, "El resumen que devuelvas no debe ser superior a 300 palabras.")
-                
-                
-                contexto_narrativo = {
-                    "campaign_resumen": campaign_resumen,
-                    "story_resumen": story_resumen,
-                    "scenes_resumenes": [],
-                    "scene_actual":scene.resumen
-                }
-
-                for related_scene in scene_bodies_puros:
-                    contexto_narrativo["scenes_resumenes"].append(related_scene)
-                    
-                # Obtener ambientación y reglas de campaña
-                if state.get('campaign_id'):
-                    ambientacion_json, reglas_json = recopilador.obtener_contexto_ambientacion_y_reglas(
-                        state['campaign_id']
-                    )
-                else:
-                    logger.warning("No se pudo obtener ambientación y reglas, campaign_id no está definido.")
-                
-                # Obtener personajes
-                character_id_email = CharacterManager.get_character_id_by_player_and_campaign(state['db_session'],
-                                                                                             state.get('player_id'),state.get('campaign_id'))    
-                lista_personajes_pj = CharacterManager.get_characters_by_story_id(
-                    state['db_session'], 
-                    story_id
-                )
-                
-                # Actualizar EmailState con contexto
-                state['story_id']= story_id
-                state['character_id'] = character_id_email
-                state['json_ambientacion'] = ambientacion_json
-                state['json_reglas'] = reglas_json
-                state['json_hojas_personajes'] = self.character_sheets_from_characters(lista_personajes_pj)
-                state['json_estado_actual_personajes'] = self.character_actual_state_from_characters(lista_personajes_pj)
-                state['personajes_pj'] = lista_personajes_pj
-                state['nombre_personajes_pj'] = self.names_from_characters(lista_personajes_pj)
-                state['contexto_historial'] = contexto_narrativo
-                state['contexto_ultimos_emails'] = email_bodies_puros
-                state['contexto_sistema'] = {
-                    'ambientacion': ambientacion_json,
-                    'reglas': reglas_json,
-                    'hojas_personajes': state['json_hojas_personajes']
-                }
-                state['contexto_usuario'] = {
-                    'estado_actual_pjs': state['json_estado_actual_personajes'],
-                    'contexto_historial': contexto_narrativo,
-                    'emails': email_bodies_puros,
-                    'ultimo_email': state.get('email_data', {}).get('body', ''),                    
-                }
-                logger.info("Contexto recopilado exitosamente")
-            
+                nuevo_resumen_scene = self.resumidor_textos.resumir_emails(datos['resumen_previo_scene'], datos['email_bodies_a_resumir'])
+                self._guardar_resumen_scene(db, state, datos, nuevo_resumen_scene)
+            if datos['scene_bodies_a_resumir']:
+                datos['story_resumen'] = self.resumidor_textos.resumir_resumenes(datos['story_resumen'], datos['scene_bodies_a_resumir'], "El resumen que devuelvas no debe ser superior a 300 palabras.")
+            self._completar_estado(state, datos)
+        except Exception as e:
+            self._registrar_error(state, e)
+        
+        return state
+    
+    async def acall(self, state: EmailState) -> EmailState:
+        """
+        Versión asíncrona: las consultas se hacen con la sesión asíncrona (AsyncSession.run_sync sobre
+        los mismos managers) y los resúmenes con el LLM sin bloquear el bucle de eventos.
+        """
+        try:
+            logger.info(f"Recopilando contexto para escena: {state.get('scene_id')}")
+            db = state['db_session']
+            datos = await db.run_sync(self._leer_contexto, state)
+            if datos['email_bodies_a_resumir']:
+                nuevo_resumen_scene = await self.resumidor_textos.aresumir_emails(datos['resumen_previo_scene'], datos['email_bodies_a_resumir'])
+                await db.run_sync(self._guardar_resumen_scene, state, datos, nuevo_resumen_scene)
+            if datos['scene_bodies_a_resumir']:
+                datos['story_resumen'] = await self.resumidor_textos.aresumir_resumenes(datos['story_resumen'], datos['scene_bodies_a_resumir'], "El resumen que devuelvas no debe ser superior a 300 palabras.")
+            self._completar_estado(state, datos)
         except Exception as e:
-            logger.error(f"Error recopilando contexto: {e}")
-            if not state.get('errors'):
-                state['errors'] = []
-            state['errors'].append(f"Error en contexto: {str(e)}")
+            self._registrar_error(state, e)
         
         return state
     
+    def _leer_contexto(self, db, state: EmailState) -> Dict[str, Any]:
+        """Lee de la base de datos todo el contexto necesario (sin llamadas al LLM)."""
+        scene_id = state.get('scene_id')
+        datos = {
+            'story_id': SceneManager.get_story_id_by_scene_id(db, scene_id),
+            'email_bodies_a_resumir': [],
+            'scene_bodies_a_resumir': [],
+            'resumen_previo_scene': None,
+        }
+        # Inicializar gestor de emails donde recuperamos los emails recientes y resumimos si superan un límite sin resumir
+        recopilador = ContextCollectorChain(db, self.resumidor_textos)
+        datos['email_bodies_a_resumir'], datos['email_bodies_puros'] = recopilador.gestionar_emails_para_contexto(
+            scene_id=scene_id,
+            max_emails=10,
+            n_puros=3
+        )
+        if datos['email_bodies_a_resumir']:
+            datos['resumen_previo_scene'] = SceneManager.get_scene_summary_by_id(db, scene_id)
+        
+        # Obtener ambientación y reglas de campaña
+        datos['ambientacion_json'], datos['reglas_json'] = recopilador.obtener_contexto_ambientacion_y_reglas(
+            state.get('campaign_id')
+        )
+        if not state.get('campaign_id'):
+            logger.warning("No se pudo obtener ambientación y reglas, campaign_id no está definido.")
+        
+        # Obtener contexto narrativo si hay escena
+        if scene_id:
+            (datos['campaign_resumen'], datos['story_resumen'],
+             datos['scene_bodies_a_resumir'], datos['scene_bodies_puros']) = recopilador.recopilar_resumenes_contexto(
+                scene_id=scene_id,
+                max_scenes=5,
+                scenes_puros=3
+            )
+            scene = SceneManager.get_scene_by_id(db, scene_id)
+            datos['scene_actual'] = scene.resumen
+            
+            # Obtener personajes
+            datos['character_id'] = CharacterManager.get_character_id_by_player_and_campaign(db,
+                                                                                         state.get('player_id'), state.get('campaign_id'))
+            datos['personajes'] = CharacterManager.get_characters_by_story_id(db, datos['story_id'])
+            datos['hojas_personajes'] = self.character_sheets_from_characters(datos['personajes'])
+            datos['estado_actual_personajes'] = self.character_actual_state_from_characters(datos['personajes'])
+            datos['nombres_personajes'] = self.names_from_characters(datos['personajes'])
+            datos['personajes'] = self.dicts_from_characters(datos['personajes'])
+        return datos
+    
+    def _guardar_resumen_scene(self, db, state: EmailState, datos: Dict[str, Any], nuevo_resumen_scene: str):
+        SceneManager.update_scene_summary_by_id(db, state.get('scene_id'), nuevo_resumen_scene)
+        datos['scene_actual'] = nuevo_resumen_scene
+    
+    def _completar_estado(self, state: EmailState, datos: Dict[str, Any]):
+        """Actualiza EmailState con el contexto recopilado."""
+        if not state.get('scene_id'):
+            return
+        contexto_narrativo = {
+            "campaign_resumen": datos['campaign_resumen'],
+            "story_resumen": datos['story_resumen'],
+            "scenes_resumenes": list(datos['scene_bodies_puros']),
+            "scene_actual": datos['scene_actual']
+        }
+        state['story_id'] = datos['story_id']
+        state['character_id'] = datos['character_id']
+        state['json_ambientacion'] = datos['ambientacion_json']
+        state['json_reglas'] = datos['reglas_json']
+        state['json_hojas_personajes'] = datos['hojas_personajes']
+        state['json_estado_actual_personajes'] = datos['estado_actual_personajes']
+        state['personajes_pj'] = datos['personajes']
+        state['nombre_personajes_pj'] = datos['nombres_personajes']
+        state['contexto_historial'] = contexto_narrativo
+        state['contexto_ultimos_emails'] = datos['email_bodies_puros']
+        state['contexto_sistema'] = {
+            'ambientacion': datos['ambientacion_json'],
+            'reglas': datos['reglas_json'],
+            'hojas_personajes': state['json_hojas_personajes']
+        }
+        state['contexto_usuario'] = {
+            'estado_actual_pjs': state['json_estado_actual_personajes'],
+            'contexto_historial': contexto_narrativo,
+            'emails': datos['email_bodies_puros'],
+            'ultimo_email': state.get('email_data', {}).get('body', ''),
+        }
+        logger.info("Contexto recopilado exitosamente")
+    
+    def _registrar_error(self, state: EmailState, e: Exception):
+        logger.error(f"Error recopilando contexto: {e}")
+        if not state.get('errors'):
+            state['errors'] = []
+        state['errors'].append(f"Error en contexto: {str(e)}")
+    
     def names_from_characters(self, characters: List[Character]) -> List[str]:
         """
         Extrae los nombres de una lista de personajes.
@@ -156,6 +187,29 @@ class ContextGatheringNode:
         """
         return [character.hoja_json for character in characters if hasattr(character, 'hoja_json')]    
     
+    def dicts_from_characters(self, characters: List[Character]) -> List[Dict[str, Any]]:
+        """
+        Convierte los personajes en diccionarios serializables para el estado del grafo
+        (los objetos ORM no se pueden guardar en los checkpoints).
+        
+        Args:
+            characters: Lista de personajes.
+            
+        Returns:
+            Lista de diccionarios con id, player_id, nombre, tipo, hoja_json y estado_actual.
+        """
+        return [
+            {
+                'id': character.id,
+                'player_id': character.player_id,
+                'nombre': character.nombre,
+                'tipo': getattr(character.tipo, 'value', character.tipo),
+                'hoja_json': character.hoja_json,
+                'estado_actual': character.estado_actual,
+            }
+            for character in characters
+        ]
+    
     def character_actual_state_from_characters(self, characters: List[Character]) -> List[Dict[str, Any]]:
         """
         Extrae el estado actual de los personajes de una lista de personajes.
@@ -170,8 +224,14 @@ class ContextGatheringNode:
 
 
 # Función helper para usar en el grafo
-def gather_context_node(state: EmailState) -> EmailState:
+def gather_context_node(state: EmailState, config: RunnableConfig = None) -> Dict[str, Any]:
     """Función de conveniencia para usar en el grafo LangGraph."""
-    node = ContextGatheringNode()
-    return node(state)
+    node = node_registry.get(ContextGatheringNode)
+    return cambios_del_nodo(state, node(estado_de_trabajo(state, config)))
+
+
+async def agather_context_node(state: EmailState, config: RunnableConfig = None) -> Dict[str, Any]:
+    """Versión asíncrona para ProcessingGraph.ainvoke (la sesión de config es una AsyncSession)."""
+    node = node_registry.get(ContextGatheringNode)
+    return cambios_del_nodo(state, await node.acall(estado_de_trabajo(state, config)))
 
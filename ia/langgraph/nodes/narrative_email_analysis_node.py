@@ -7,9 +7,13 @@ from typing import Dict, Any
 from langgraph.graph import StateGraph
 
 from ia.ia_client import IAClient, PerfilesEnum
-from ..states.story_state import EmailState
+from langchain_core.runnables import RunnableConfig
+from ..states.story_state import EmailState, estado_de_trabajo, cambios_del_nodo
+from .registry import node_registry
+from api.core.database import sesion_independiente
 from api.managers.email_manager import EmailManager
 from api.managers.character_manager import CharacterManager
+from api.managers.scene_manager import SceneManager
 from api.managers.player_manager import PlayerManager
 from api.models.scene import PhaseType
 from ia.constantes.listas import TRANSICION_DE_DINÁMICA
@@ -20,7 +24,7 @@ logger = logging.getLogger(__name__)
 class NarrativeEmailAnalysisNode:
     """Nodo encargado del análisis de emails entrantes."""
     def __init__(self):
-        self.ia_client = IAClient(perfil=PerfilesEnum.CLASIFICACION.value)
+        self.ia_client = IAClient.compartido(PerfilesEnum.CLASIFICACION.value)
         # Aquí podrías inicializar otros recursos necesarios, como un cliente IA específico
 
     def __call__(self, state: EmailState, modo: PhaseType = PhaseType.narracion) -> EmailState:
@@ -39,22 +43,46 @@ class NarrativeEmailAnalysisNode:
             # Analizar intenciones en el texto
             texto_email = state['email_data']['body']
             estado_actual = state['estado_actual'] = modo
-            state['nombre_personaje_email'] = CharacterManager.get(state['db_session'], state['character_id']).nombre # Asignar nombre del personaje que envía el email
+            with sesion_independiente(state['db_session']) as db:
+                personajes = self._leer_personajes(db, state)
+            state['nombre_personaje_email'] = personajes['nombre_personaje_email'] # Asignar nombre del personaje que envía el email
             response_dict = self._analizar_narracion_email(
                 texto_email, 
                 estado_actual, 
-                state.get('personajes_pj'), 
+                personajes['personajes'], 
                 state['nombre_personaje_email']
             )
             
-            state['clasificacion_intenciones'] = response_dict
-            transicion =state['transicion_detectada'] = response_dict.get('transicion_dinamica')
+            self._aplicar_analisis(state, response_dict, estado_actual)
+            
+            logger.info(f"Análisis completado. Intenciones encontradas: {state['clasificacion_intenciones']}")
+            
+        except Exception as e:
+            logger.error(f"Error en análisis de email: {e}")
+            if not state.get('errors'):
+                state['errors'] = []
+            state['errors'].append(f"Error en análisis: {str(e)}")
         
+        return state
+    
+    async def acall(self, state: EmailState, modo: PhaseType = PhaseType.narracion) -> EmailState:
+        """Versión asíncrona: el nombre del personaje se consulta con una AsyncSession propia (run_sync)."""
+        try:
+            logger.info(f"Analizando email ID: {state['email_id']}")
             
-            # Actualizar estado si hay cambio detectado
-            if transicion and transicion.get('nuevo_estado') != estado_actual and transicion.get('nuevo_estado') != '':
-                state['estado_nuevo'] = transicion.get('nuevo_estado')
-                logger.info(f"Transición detectada: {estado_actual} -> {state['estado_nuevo']}")
+            texto_email = state['email_data']['body']
+            estado_actual = state['estado_actual'] = modo
+            async with sesion_independiente(state['db_session']) as db:
+                personajes = await db.run_sync(self._leer_personajes, state)
+            state['nombre_personaje_email'] = personajes['nombre_personaje_email']
+            # El análisis usa por ahora la respuesta de prueba y no hace E/S
+            response_dict = self._analizar_narracion_email(
+                texto_email, 
+                estado_actual, 
+                personajes['personajes'], 
+                state['nombre_personaje_email']
+            )
+            self._aplicar_analisis(state, response_dict, estado_actual)
             
             logger.info(f"Análisis completado. Intenciones encontradas: {state['clasificacion_intenciones']}")
             
@@ -66,6 +94,32 @@ class NarrativeEmailAnalysisNode:
         
         return state
     
+    def _leer_personajes(self, db, state: EmailState) -> Dict[str, Any]:
+        """
+        Nombres de los personajes de la historia y del que envía el email.
+        El análisis se ejecuta en paralelo con la recopilación de contexto, así que no puede esperar a que esta
+        rellene character_id y personajes_pj: hace sus propias consultas, que son ligeras, con una sesión propia
+        (db) porque la sesión del email la está usando la recopilación de contexto en otro hilo o tarea.
+        """
+        character_id = state.get('character_id') or CharacterManager.get_character_id_by_player_and_campaign(
+            db, state.get('player_id'), state.get('campaign_id'))
+        story_id = state.get('story_id') or SceneManager.get_story_id_by_scene_id(db, state.get('scene_id'))
+        personajes = CharacterManager.get_characters_by_story_id(db, story_id) if story_id else []
+        return {
+            'nombre_personaje_email': CharacterManager.get(db, character_id).nombre if character_id else None,
+            'personajes': [{'id': personaje.id, 'nombre': personaje.nombre} for personaje in personajes],
+        }
+    
+    def _aplicar_analisis(self, state: EmailState, response_dict: Dict[str, Any], estado_actual):
+        """Guarda la clasificación en el estado y detecta la transición de fase."""
+        state['clasificacion_intenciones'] = response_dict
+        transicion = state['transicion_detectada'] = response_dict.get('transicion_dinamica')
+        
+        # Actualizar estado si hay cambio detectado
+        if transicion and transicion.get('nuevo_estado') != estado_actual and transicion.get('nuevo_estado') != '':
+            state['estado_nuevo'] = transicion.get('nuevo_estado')
+            logger.info(f"Transición detectada: {estado_actual} -> {state['estado_nuevo']}")
+    
     def _analizar_narracion_email(self, texto, estado_actual, lista_personajes_pj=None, personaje_sender=None):
         """
         Analiza un email de rol durante el estado narración y devuelve un JSON con:
@@ -157,7 +211,7 @@ class NarrativeEmailAnalysisNode:
         )
         try:
             if lista_personajes_pj:
-                nombres = [p.nombre for p in lista_personajes_pj]
+                nombres = [p['nombre'] for p in lista_personajes_pj]
                 prompt += f"\nLos nombres de los personajes jugadores en esta campaña son: {nombres}."
             if personaje_sender:
                 prompt += f"\nEl personaje que envía este email es: {personaje_sender} y generalmente es a quien se le aplican estas clasificaciones."
@@ -182,10 +236,16 @@ class NarrativeEmailAnalysisNode:
             }
             
 # Función helper para usar en el grafo
-def narrative_email_analysis_node(state: EmailState) -> EmailState:
+def narrative_email_analysis_node(state: EmailState, config: RunnableConfig = None) -> Dict[str, Any]:
     """Función de conveniencia para usar en el grafo LangGraph."""
-    node = NarrativeEmailAnalysisNode()
-    return node(state)
+    node = node_registry.get(NarrativeEmailAnalysisNode)
+    return cambios_del_nodo(state, node(estado_de_trabajo(state, config)))
+
+
+async def anarrative_email_analysis_node(state: EmailState, config: RunnableConfig = None) -> Dict[str, Any]:
+    """Versión asíncrona para ProcessingGraph.ainvoke."""
+    node = node_registry.get(NarrativeEmailAnalysisNode)
+    return cambios_del_nodo(state, await node.acall(estado_de_trabajo(state, config)))
 
 
 
@@ -3,19 +3,39 @@ Nodo para generación de respuestas narrativas.
 Combina análisis, contexto y validaciones para generar la respuesta final.
 """
 
-from typing import Dict, Any
-from ..states.story_state import EmailState
+from typing import Dict, Any, List
+from contextlib import aclosing, closing
+from langchain_core.runnables import RunnableConfig
+from ..states.story_state import EmailState, estado_de_trabajo, cambios_del_nodo
+from .registry import node_registry
 from ia.ia_client import IAClient
+from utils.env_loader import get_env_variable
+from utils.json_stream import ParserJSONIncremental
 import logging
 import json
+import re
 
 logger = logging.getLogger(__name__)
 
+# Campos de la respuesta JSON con los que ya se puede continuar: al completarse se corta la generación
+CAMPOS_REQUERIDOS = ("cuerpo_mensaje",)
+# Longitud máxima de la respuesta JSON en streaming; por encima se corta (generación desbocada)
+RESPUESTA_MAX_CARACTERES = int(get_env_variable("RESPUESTA_MAX_CARACTERES", "6000"))
+# Final de frase (con las comillas o paréntesis que la cierren) seguido de un espacio o del final del texto
+_FIN_DE_FRASE = re.compile(r'[.!?…]+["»”’\')\]]*(?=\s|$)')
+
+
+def recortar_a_frase_completa(texto: str) -> str:
+    """Texto hasta el final de su última frase completa ("" si no hay ninguna)."""
+    finales = list(_FIN_DE_FRASE.finditer(texto))
+    return texto[:finales[-1].end()] if finales else ""
+
+
 class NarrativeResponseGenerationNode:
     """Nodo encargado de generar la respuesta narrativa final."""
     
     def __init__(self):
-        self.ia_client = IAClient(perfil="creativa")
+        self.ia_client = IAClient.compartido("creativa")
     
     def __call__(self, state: EmailState) -> EmailState:
         """
@@ -30,45 +50,81 @@ class NarrativeResponseGenerationNode:
         try:
             logger.info("Generando respuesta narrativa")
             
-            respuesta = self._ia_response(state)
-            
-            
-            # Construir el prompt completo para la respuesta
-            prompt_sistema = self._build_system_prompt(state)
-            prompt_accion = self._build_action_prompt(state)
+            datos = self._ia_response(state)
+            respuesta = datos.get('cuerpo_mensaje')
+            state['respuesta_truncada'] = bool(respuesta) and datos.get('respuesta_truncada', False)
             
-            # Generar respuesta usando la IA
-            contexto = {
-                "sistema": prompt_sistema,
-                "historial": state.get('contexto_historial', [])
-            }
-            
-            respuesta = self.ia_client.procesar_mensaje(
-                prompt_accion,
-                contexto,
-                "creativa"
-            )
+            if not respuesta:
+                # Sin cuerpo_mensaje en la respuesta JSON se pide la respuesta como texto libre
+                prompt_accion, contexto = self._peticion_respuesta(state)
+                respuesta = self.ia_client.procesar_mensaje(
+                    prompt_accion,
+                    contexto,
+                    "creativa"
+                )
+            self._guardar_respuesta(state, respuesta)
             
-            state['respuesta_ia'] = respuesta
+        except Exception as e:
+            self._registrar_error(state, e)
+        
+        return state
+    
+    async def acall(self, state: EmailState) -> EmailState:
+        """Versión asíncrona de __call__: las llamadas al LLM se hacen con aprocesar_mensaje."""
+        try:
+            logger.info("Generando respuesta narrativa")
             
-            # Preparar email de respuesta
-            email_respuesta = self._format_email_response(state, respuesta)
-            state['email_respuesta'] = email_respuesta
+            datos = await self._aia_response(state)
+            respuesta = datos.get('cuerpo_mensaje')
+            state['respuesta_truncada'] = bool(respuesta) and datos.get('respuesta_truncada', False)
             
-            logger.info("Respuesta generada exitosamente")
+            if not respuesta:
+                prompt_accion, contexto = self._peticion_respuesta(state)
+                respuesta = await self.ia_client.aprocesar_mensaje(
+                    prompt_accion,
+                    contexto,
+                    "creativa"
+                )
+            self._guardar_respuesta(state, respuesta)
             
         except Exception as e:
-            logger.error(f"Error generando respuesta: {e}")
-            if not state.get('errors'):
-                state['errors'] = []
-            state['errors'].append(f"Error en generación: {str(e)}")
-            
-            # Generar respuesta de error básica
-            state['respuesta_ia'] = "Lo siento, ha ocurrido un error procesando tu mensaje. Por favor, intenta de nuevo."
-            state['email_respuesta'] = self._format_error_response(state)
+            self._registrar_error(state, e)
         
         return state
     
+    def _peticion_respuesta(self, state: EmailState):
+        """Construye el prompt de acción y el contexto (sistema e historial) para generar la respuesta."""
+        # Construir el prompt completo para la respuesta
+        prompt_sistema = self._build_system_prompt(state)
+        prompt_accion = self._build_action_prompt(state)
+        
+        contexto = {
+            "sistema": prompt_sistema,
+            "historial": state.get('contexto_historial', [])
+        }
+        return prompt_accion, contexto
+    
+    def _guardar_respuesta(self, state: EmailState, respuesta: str):
+        """Guarda la respuesta de la IA y el email de respuesta en el estado."""
+        state['respuesta_ia'] = respuesta
+        
+        # Preparar email de respuesta
+        email_respuesta = self._format_email_response(state, respuesta)
+        state['email_respuesta'] = email_respuesta
+        
+        logger.info("Respuesta generada exitosamente")
+    
+    def _registrar_error(self, state: EmailState, e: Exception):
+        """Anota el error y deja en el estado una respuesta de error básica."""
+        logger.error(f"Error generando respuesta: {e}")
+        if not state.get('errors'):
+            state['errors'] = []
+        state['errors'].append(f"Error en generación: {str(e)}")
+        
+        # Generar respuesta de error básica
+        state['respuesta_ia'] = "Lo siento, ha ocurrido un error procesando tu mensaje. Por favor, intenta de nuevo."
+        state['email_respuesta'] = self._format_error_response(state)
+    
     def _build_system_prompt(self, state: EmailState) -> str:
         """Construye el prompt de sistema con todo el contexto."""
         prompt_parts = []
@@ -169,12 +225,19 @@ class NarrativeResponseGenerationNode:
             'subject': subject,
             'body': respuesta,
             'thread_id': email_data.get('thread_id', ''),
-            'recipients': [email_data.get('sender', '')],
+            'in_reply_to': email_data.get('message_id', ''),
+            'recipients': self._recipients(state),
             'campaign_id': state.get('campaign_id'),
             'scene_id': state.get('scene_id'),
             'type': 'IAResponse'
         }
     
+    def _recipients(self, state: EmailState) -> List[str]:
+        """Destinatarios de la respuesta: el remitente, o todos los remitentes si se agruparon varios emails."""
+        agrupados = state.get('emails_agrupados') or []
+        remitentes = [email.get('sender', '') for email in agrupados] or [state.get('email_data', {}).get('sender', '')]
+        return list(dict.fromkeys(remitentes))
+    
     def _format_error_response(self, state: EmailState) -> Dict[str, Any]:
         """Formatea una respuesta de error."""
         email_data = state.get('email_data', {})
@@ -183,19 +246,18 @@ class NarrativeResponseGenerationNode:
             'subject': f"Re: {email_data.get('subject', 'Error')}",
             'body': "Lo siento, ha ocurrido un error procesando tu mensaje. Por favor, intenta de nuevo o contacta al administrador.",
             'thread_id': email_data.get('thread_id', ''),
-            'recipients': [email_data.get('sender', '')],
+            'in_reply_to': email_data.get('message_id', ''),
+            'recipients': self._recipients(state),
             'campaign_id': state.get('campaign_id'),
             'scene_id': state.get('scene_id'),
             'type': 'IAResponse'
         }
 
-    def _ia_response(self, state:EmailState) -> str:
-        """Genera una respuesta de prueba para simular la IA."""
-        # Aquí se puede implementar una lógica de prueba o mock
-        
+    def _peticion_ia(self, state: EmailState):
+        """Construye el texto y el contexto de la petición de respuesta narrativa en JSON."""        
         clasificacion_intenciones = state.get('clasificacion_intenciones', [])
         estado_actual = state.get('estado_actual', 'narracion')
-        lista_personajes_pj = [p.nombre for p in state.get('personajes_pj')]
+        lista_personajes_pj = [p['nombre'] for p in state.get('personajes_pj') or []]
         personaje_sender = state.get('nombre_personaje_email', 'Desconocido')
         estructura_json = {
             "fecha_y_lugar": "",
@@ -240,31 +302,97 @@ class NarrativeResponseGenerationNode:
             f"Recuerda que tu respuesta debe ser coherente con el contexto narrativo, las reglas del juego y las acciones del jugador. SIEMPRE en formato JSON válido y sin explicaciones adicionales.\n"
         )
         
-        try:
-            estructura_json_str = json.dumps(estructura_json, ensure_ascii=False)
-            contexto_sistema = json.dumps(state.get('contexto_sistema', []), ensure_ascii=False, indent=2)
-            contexto = prompt + "\n\n" + contexto_sistema + "\n\n" + f"Devuelve SIEMPRE un JSON plano y estrictamente válido en una sola línea, sin explicaciones adicionales, los valores true o false debes ponerlos en minúsculas. No excedas los 1000 caracteres. Usa la siguiente estructura json para tu respuesta: {estructura_json_str}"
-            texto_intro =(
-                "Tu tarea es generar una respuesta narrativa coherente al último email recibido, Vas a recibir un bloque JSON con toda la información de contexto que necesitas para generar tu respuesta. Ese bloque contiene los siguientes campos:\n"
-                " - estado_actual_pjs: contiene una lista de json con las caracteristicas más volátiles de los personajes(estado_actual_personaje) como salud, inventario y efectos temporales.\n"
-                " - contexto_historial: contiene una lista de resumenes de la historia y eventos previos relevantes para la narración en orden de más global y tardía a mas específica y cercana en el tiempo.\n"
-                " - emails: contiene una lista de los últimos emails enviados por los jugadores, ordenados de más antiguo a más reciente. No contiene el último mail.\n"
-                " - ultimo_email: contiene el último email enviado por el jugador, que es el que debes responder.\n"
-                "Este JSON te será entregado justo a continuación. Analízalo cuidadosamente y responde al ultimo_email según las reglas del sistema."
+        estructura_json_str = json.dumps(estructura_json, ensure_ascii=False)
+        contexto_sistema = json.dumps(state.get('contexto_sistema', []), ensure_ascii=False, indent=2)
+        contexto = prompt + "\n\n" + contexto_sistema + "\n\n" + f"Devuelve SIEMPRE un JSON plano y estrictamente válido en una sola línea, sin explicaciones adicionales, los valores true o false debes ponerlos en minúsculas. No excedas los 1000 caracteres. Usa la siguiente estructura json para tu respuesta: {estructura_json_str}"
+        texto_intro =(
+            "Tu tarea es generar una respuesta narrativa coherente al último email recibido, Vas a recibir un bloque JSON con toda la información de contexto que necesitas para generar tu respuesta. Ese bloque contiene los siguientes campos:\n"
+            " - estado_actual_pjs: contiene una lista de json con las caracteristicas más volátiles de los personajes(estado_actual_personaje) como salud, inventario y efectos temporales.\n"
+            " - contexto_historial: contiene una lista de resumenes de la historia y eventos previos relevantes para la narración en orden de más global y tardía a mas específica y cercana en el tiempo.\n"
+            " - emails: contiene una lista de los últimos emails enviados por los jugadores, ordenados de más antiguo a más reciente. No contiene el último mail.\n"
+            " - ultimo_email: contiene el último email enviado por el jugador, que es el que debes responder.\n"
+            "Este JSON te será entregado justo a continuación. Analízalo cuidadosamente y responde al ultimo_email según las reglas del sistema."
+        )
+        if state.get('emails_agrupados'):
+            texto_intro += (
+                f"\nEl ultimo_email agrupa {len(state['emails_agrupados'])} mensajes de distintos jugadores en esta escena, "
+                "cada uno precedido de su remitente entre corchetes. Resuélvelos juntos en una única respuesta dirigida a todos ellos."
             )
-            texto_contextual = json.dumps(state.get('contexto_usuario', {}), ensure_ascii=False, indent=2)
-            texto = texto_intro + "\n\n" + texto_contextual + "\n\n" + "No generes explicaciones fuera del JSON. Concéntrate en redactar la mejor respuesta narrativa posible, teniendo en cuenta el contexto y la intención del jugador.\n"
-            respuesta = self.ia_client.procesar_mensaje(texto, contexto)
-            data = json.loads(respuesta)            
-            logger.info(f"clasificación completado. dict: {data}")
-            return data
-        
+        texto_contextual = json.dumps(state.get('contexto_usuario', {}), ensure_ascii=False, indent=2)
+        texto = texto_intro + "\n\n" + texto_contextual + "\n\n" + "No generes explicaciones fuera del JSON. Concéntrate en redactar la mejor respuesta narrativa posible, teniendo en cuenta el contexto y la intención del jugador.\n"
+        return texto, contexto
+    
+    def _ia_response(self, state: EmailState) -> Dict[str, Any]:
+        """
+        Genera la respuesta narrativa en JSON leyéndola en streaming: en cuanto cuerpo_mensaje está completo
+        (o se supera RESPUESTA_MAX_CARACTERES) se corta la generación y el grafo continúa.
+        """
+        try:
+            texto, contexto = self._peticion_ia(state)
+            parser = ParserJSONIncremental()
+            with closing(self.ia_client.procesar_mensaje_stream(texto, contexto)) as fragmentos:
+                for fragmento in fragmentos:
+                    if self._recibir_fragmento(parser, fragmento):
+                        break
+            return self._resultado_stream(parser)
         except Exception as e:
-            print("Error en la respuesta IA al email:", e)
-            logger.error(f"Error en la respuesta IA al email: {e}")
-            return {
-                "cuerpo_mensaje": "",
-            }
+            return self._respuesta_ia_fallida(e)
+    
+    async def _aia_response(self, state: EmailState) -> Dict[str, Any]:
+        """Versión asíncrona de _ia_response."""
+        try:
+            texto, contexto = self._peticion_ia(state)
+            parser = ParserJSONIncremental()
+            async with aclosing(self.ia_client.aprocesar_mensaje_stream(texto, contexto)) as fragmentos:
+                async for fragmento in fragmentos:
+                    if self._recibir_fragmento(parser, fragmento):
+                        break
+            return self._resultado_stream(parser)
+        except Exception as e:
+            return self._respuesta_ia_fallida(e)
+    
+    def _recibir_fragmento(self, parser: ParserJSONIncremental, fragmento: str) -> bool:
+        """Añade un fragmento de la respuesta; devuelve True si ya se puede cortar la generación."""
+        parser.alimentar(fragmento)
+        if parser.completo or parser.tiene(*CAMPOS_REQUERIDOS):
+            return True
+        if len(parser.texto) >= RESPUESTA_MAX_CARACTERES:
+            logger.warning(f"Respuesta IA cortada al superar {RESPUESTA_MAX_CARACTERES} caracteres")
+            return True
+        return False
+    
+    def _resultado_stream(self, parser: ParserJSONIncremental) -> Dict[str, Any]:
+        """
+        Campos recibidos. Si se cortó por longitud a mitad de cuerpo_mensaje, el texto parcial se recorta a su
+        última frase completa y se marca con respuesta_truncada; si no tiene ninguna frase completa se devuelve
+        sin cuerpo_mensaje, y el nodo pide la respuesta como texto libre.
+        """
+        data = dict(parser.campos)
+        if 'cuerpo_mensaje' not in data:
+            parcial = parser.valor_parcial('cuerpo_mensaje')
+            if parcial is None:
+                return self._parsear_respuesta_ia(parser.texto)
+            recortado = recortar_a_frase_completa(parcial)
+            if not recortado:
+                logger.warning("cuerpo_mensaje cortado sin ninguna frase completa; se pedirá como texto libre")
+                return data
+            logger.warning(f"cuerpo_mensaje cortado: se conservan {len(recortado)} de {len(parcial)} caracteres")
+            data['cuerpo_mensaje'] = recortado
+            data['respuesta_truncada'] = True
+        logger.info(f"clasificación completado. dict: {data}")
+        return data
+    
+    def _parsear_respuesta_ia(self, respuesta: str) -> Dict[str, Any]:
+        data = json.loads(respuesta)            
+        logger.info(f"clasificación completado. dict: {data}")
+        return data
+    
+    def _respuesta_ia_fallida(self, e: Exception) -> Dict[str, Any]:
+        print("Error en la respuesta IA al email:", e)
+        logger.error(f"Error en la respuesta IA al email: {e}")
+        return {
+            "cuerpo_mensaje": "",
+        }
         
     def _analize_ia_response(self, state: EmailState) -> Dict[str, Any]:
         """Analiza la respuesta de la IA y extrae los efectos."""
@@ -295,7 +423,13 @@ class NarrativeResponseGenerationNode:
             "decision_clave_narrativa": False
         }
 # Función helper para usar en el grafo
-def narrative_generate_response_node(state: EmailState) -> EmailState:
+def narrative_generate_response_node(state: EmailState, config: RunnableConfig = None) -> Dict[str, Any]:
     """Función de conveniencia para usar en el grafo LangGraph."""
-    node = NarrativeResponseGenerationNode()
-    return node(state)
+    node = node_registry.get(NarrativeResponseGenerationNode)
+    return cambios_del_nodo(state, node(estado_de_trabajo(state, config)))
+
+
+async def anarrative_generate_response_node(state: EmailState, config: RunnableConfig = None) -> Dict[str, Any]:
+    """Versión asíncrona para ProcessingGraph.ainvoke."""
+    node = node_registry.get(NarrativeResponseGenerationNode)
+    return cambios_del_nodo(state, await node.acall(estado_de_trabajo(state, config)))
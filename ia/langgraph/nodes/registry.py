@@ -0,0 +1,38 @@
+"""
+Registro de instancias de nodos.
+Cada clase de nodo se instancia una sola vez (al compilar el grafo o en su primer uso) y se reutiliza
+en todos los emails. Los nodos no guardan estado del email entre llamadas: todo va en EmailState,
+así que una misma instancia se puede usar desde varios workers a la vez.
+"""
+
+import threading
+from typing import Iterable, Type, TypeVar
+
+T = TypeVar("T")
+
+
+class NodeRegistry:
+    """Instancias únicas de nodos por clase."""
+
+    def __init__(self):
+        self._instancias = {}
+        self._lock = threading.Lock()
+
+    def get(self, clase: Type[T]) -> T:
+        """Devuelve la instancia de la clase de nodo, creándola la primera vez."""
+        instancia = self._instancias.get(clase)
+        if instancia is None:
+            with self._lock:
+                instancia = self._instancias.get(clase)
+                if instancia is None:
+                    instancia = self._instancias[clase] = clase()
+        return instancia
+
+    def precargar(self, clases: Iterable[type]):
+        """Crea por adelantado las instancias de los nodos del grafo."""
+        for clase in clases:
+            self.get(clase)
+
+
+# Registro global de nodos
+node_registry = NodeRegistry()
@@ -4,7 +4,9 @@ Valida acciones contra el ruleset de la campaña.
 """
 
 from typing import Dict, Any, List
-from ..states.story_state import EmailState
+from langchain_core.runnables import RunnableConfig
+from ..states.story_state import EmailState, estado_de_trabajo, cambios_del_nodo
+from .registry import node_registry
 from ia.ia_client import IAClient
 import logging
 import json
@@ -15,7 +17,7 @@ class RulesValidationNode:
     """Nodo encargado de validar acciones contra las reglas del juego."""
     
     def __init__(self):
-        self.ia_client = IAClient(perfil="precisa")
+        self.ia_client = IAClient.compartido("precisa")
     
     def __call__(self, state: EmailState) -> EmailState:
         """
@@ -39,14 +41,7 @@ class RulesValidationNode:
             validaciones = []
             
             # Filtrar intenciones que requieren validación
-            intenciones_a_validar = [
-                intencion for intencion in state['intenciones']
-                if intencion.get('tipo') in [
-                    'accion_con_tirada', 
-                    'combate', 
-                    'accion_sencilla'
-                ]
-            ]
+            intenciones_a_validar = self._intenciones_a_validar(state)
             
             if not intenciones_a_validar:
                 logger.info("No hay intenciones que requieran validación")
@@ -78,6 +73,36 @@ class RulesValidationNode:
         
         return state
     
+    def _intenciones_a_validar(self, state: EmailState) -> List[Dict[str, Any]]:
+        """Intenciones cuyo tipo requiere validación contra las reglas."""
+        return [
+            intencion for intencion in state.get('intenciones') or []
+            if intencion.get('tipo') in [
+                'accion_con_tirada', 
+                'combate', 
+                'accion_sencilla'
+            ]
+        ]
+    
+    def tareas_de_validacion(self, state: EmailState) -> List[Dict[str, Any]]:
+        """
+        Una tarea por intención a validar, con todo lo que necesita, para validarlas en paralelo
+        (ProcessingGraph las reparte con Send al nodo validate_intention).
+        """
+        if not state.get('intenciones') or not state.get('ruleset'):
+            return []
+        reglas_texto = state['ruleset'].get('reglas', '')
+        personaje_info = self._get_character_info(state)
+        return [
+            {
+                'intencion': intencion,
+                'reglas': reglas_texto,
+                'personaje': personaje_info,
+                'estado_actual': state.get('estado_actual', 'narracion'),
+            }
+            for intencion in self._intenciones_a_validar(state)
+        ]
+    
     def _get_character_info(self, state: EmailState) -> Dict[str, Any]:
         """Obtiene información del personaje que está actuando."""
         if not state.get('character_id') or not state.get('personajes_pj'):
@@ -109,69 +134,109 @@ class RulesValidationNode:
             Diccionario con el resultado de la validación
         """
         try:
-            prompt = f"""
-            Eres un validador de reglas para un juego de rol narrativo. 
-            
-            REGLAS DEL JUEGO:
-            {reglas}
-            
-            PERSONAJE:
-            {json.dumps(personaje, indent=2, ensure_ascii=False)}
-            
-            ESTADO DEL JUEGO: {estado_juego}
-            
-            ACCIÓN A VALIDAR:
-            Tipo: {intencion.get('tipo')}
-            Descripción: {intencion.get('bloque')}
-            Entidades: {json.dumps(intencion.get('entidades', {}), ensure_ascii=False)}
-            
-            Valida si esta acción es posible según las reglas y el estado del personaje.
-            
-            Responde en JSON con esta estructura:
-            {{
-                "valida": true/false,
-                "razon": "explicación de por qué es válida o inválida",
-                "requiere_tirada": true/false,
-                "dificultad": "fácil/normal/difícil/muy_difícil" (solo si requiere tirada),
-                "modificadores": ["lista de modificadores aplicables"],
-                "consecuencias": "posibles consecuencias de la acción"
-            }}
-            """
-            
-            contexto = {"sistema": prompt, "historial": []}
             respuesta = self.ia_client.procesar_mensaje(
                 "Valida esta acción", 
-                contexto, 
+                self._contexto_validacion(intencion, reglas, personaje, estado_juego), 
                 "precisa"
             )
-            
-            try:
-                validacion_data = json.loads(respuesta)
-                validacion_data['intencion_original'] = intencion
-                return validacion_data
-            except json.JSONDecodeError:
-                return {
-                    "intencion_original": intencion,
-                    "valida": True,  # Por defecto permitir si no se puede parsear
-                    "razon": "No se pudo validar automáticamente",
-                    "requiere_tirada": False,
-                    "modificadores": [],
-                    "consecuencias": "Desconocidas"
-                }
-                
+            return self._parsear_validacion(respuesta, intencion)
         except Exception as e:
-            logger.error(f"Error validando intención: {e}")
+            return self._validacion_fallida(intencion, e)
+    
+    async def _avalidate_intention(
+        self, 
+        intencion: Dict[str, Any], 
+        reglas: str, 
+        personaje: Dict[str, Any],
+        estado_juego: str
+    ) -> Dict[str, Any]:
+        """Versión asíncrona de _validate_intention."""
+        try:
+            respuesta = await self.ia_client.aprocesar_mensaje(
+                "Valida esta acción", 
+                self._contexto_validacion(intencion, reglas, personaje, estado_juego), 
+                "precisa"
+            )
+            return self._parsear_validacion(respuesta, intencion)
+        except Exception as e:
+            return self._validacion_fallida(intencion, e)
+    
+    def _contexto_validacion(self, intencion: Dict[str, Any], reglas: str, personaje: Dict[str, Any],
+                             estado_juego: str) -> Dict[str, Any]:
+        """Prompt de sistema para validar una intención."""
+        prompt = f"""
+        Eres un validador de reglas para un juego de rol narrativo. 
+        
+        REGLAS DEL JUEGO:
+        {reglas}
+        
+        PERSONAJE:
+        {json.dumps(personaje, indent=2, ensure_ascii=False)}
+        
+        ESTADO DEL JUEGO: {estado_juego}
+        
+        ACCIÓN A VALIDAR:
+        Tipo: {intencion.get('tipo')}
+        Descripción: {intencion.get('bloque')}
+        Entidades: {json.dumps(intencion.get('entidades', {}), ensure_ascii=False)}
+        
+        Valida si esta acción es posible según las reglas y el estado del personaje.
+        
+        Responde en JSON con esta estructura:
+        {{
+            "valida": true/false,
+            "razon": "explicación de por qué es válida o inválida",
+            "requiere_tirada": true/false,
+            "dificultad": "fácil/normal/difícil/muy_difícil" (solo si requiere tirada),
+            "modificadores": ["lista de modificadores aplicables"],
+            "consecuencias": "posibles consecuencias de la acción"
+        }}
+        """
+        
+        return {"sistema": prompt, "historial": []}
+    
+    def _parsear_validacion(self, respuesta: str, intencion: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            validacion_data = json.loads(respuesta)
+            validacion_data['intencion_original'] = intencion
+            return validacion_data
+        except json.JSONDecodeError:
             return {
                 "intencion_original": intencion,
-                "valida": True,  # Por defecto permitir en caso de error
-                "razon": f"Error en validación: {str(e)}",
+                "valida": True,  # Por defecto permitir si no se puede parsear
+                "razon": "No se pudo validar automáticamente",
                 "requiere_tirada": False,
                 "modificadores": [],
-                "consecuencias": "Error en validación"
+                "consecuencias": "Desconocidas"
             }
+    
+    def _validacion_fallida(self, intencion: Dict[str, Any], e: Exception) -> Dict[str, Any]:
+        logger.error(f"Error validando intención: {e}")
+        return {
+            "intencion_original": intencion,
+            "valida": True,  # Por defecto permitir en caso de error
+            "razon": f"Error en validación: {str(e)}",
+            "requiere_tirada": False,
+            "modificadores": [],
+            "consecuencias": "Error en validación"
+        }
 
 # Función helper para usar en el grafo
-def validate_rules_node(state: EmailState) -> EmailState:
+def validate_rules_node(state: EmailState, config: RunnableConfig = None) -> Dict[str, Any]:
     """Función de conveniencia para usar en el grafo LangGraph."""
-    node = RulesValidationNode()
-    return node(state)
+    node = node_registry.get(RulesValidationNode)
+    return cambios_del_nodo(state, node(estado_de_trabajo(state, config)))
+
+
+def validate_intention_node(tarea: Dict[str, Any], config: RunnableConfig = None) -> Dict[str, Any]:
+    """Valida una sola intención (tarea creada por RulesValidationNode.tareas_de_validacion)."""
+    node = node_registry.get(RulesValidationNode)
+    validacion = node._validate_intention(tarea['intencion'], tarea['reglas'], tarea['personaje'], tarea['estado_actual'])
+    return {'validaciones': [validacion]}
+
+
+async def avalidate_intention_node(tarea: Dict[str, Any], config: RunnableConfig = None) -> Dict[str, Any]:
+    """Versión asíncrona de validate_intention_node."""
+    node = node_registry.get(RulesValidationNode)
+    validacion = await node._avalidate_intention(tarea['intencion'], tarea['reglas'], tarea['personaje'], tarea['estado_actual'])
+    return {'validaciones': [validacion]}
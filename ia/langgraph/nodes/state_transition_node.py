@@ -4,7 +4,9 @@ Actualiza el estado de la partida y persiste cambios en BD.
 """
 
 from typing import Dict, Any
-from ..states.story_state import EmailState
+from langchain_core.runnables import RunnableConfig
+from ..states.story_state import EmailState, estado_de_trabajo, cambios_del_nodo
+from .registry import node_registry
 from api.managers.email_manager import EmailManager
 from api.managers.scene_manager import SceneManager
 from api.managers.turn_manager import TurnManager
@@ -177,7 +179,7 @@ class StateTransitionNode:
             logger.error(f"Error actualizando estado de escena: {e}")
 
 # Función helper para usar en el grafo
-def transition_state_node(state: EmailState) -> EmailState:
+def transition_state_node(state: EmailState, config: RunnableConfig = None) -> Dict[str, Any]:
     """Función de conveniencia para usar en el grafo LangGraph."""
-    node = StateTransitionNode()
-    return node(state)
+    node = node_registry.get(StateTransitionNode)
+    return cambios_del_nodo(state, node(estado_de_trabajo(state, config)))
@@ -3,53 +3,92 @@ Nuevo orquestador IA basado en LangGraph.
 Reemplaza el OrquestadorIA original con un sistema más robusto y escalable.
 """
 
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Tuple
 from sqlalchemy.orm import Session
-from api.core.database import SessionLocal
+from api.core.database import SessionLocal, get_async_sessionmaker
 from api.managers.email_manager import EmailManager
 from api.managers.turn_manager import TurnManager
 from api.managers.scene_manager import SceneManager
+from api.managers.outbox_manager import OutboxManager
+from api.core.cache_versions import bump_version
 from api.models.email import Email  
 from api.models.scene import Scene, PhaseType
 from .graphs.processing_graph import processing_graph
+from ia.token_metering import atribuir_consumo, medidor_tokens
+from services.phase_cache import phase_cache
+from utils.env_loader import get_env_variable
+from utils.metrics import registrar_emails_procesados, ritmo_emails
 from datetime import datetime
+import asyncio
 import logging
+import os
+import socket
+import threading
 
 logger = logging.getLogger(__name__)
 
+# Duración del lease sobre un email reclamado y espera antes de reintentar un email que ha fallado
+EMAIL_CLAIM_LEASE_SECONDS = int(get_env_variable("EMAIL_CLAIM_LEASE_SECONDS", "600"))
+EMAIL_RETRY_SECONDS = int(get_env_variable("EMAIL_RETRY_SECONDS", "30"))
+# Reclamaciones de un email antes de darlo por fallido y sacarlo de la cola de su escena
+EMAIL_MAX_ATTEMPTS = int(get_env_variable("EMAIL_MAX_ATTEMPTS", "5"))
+# Espera antes de volver a intentar los emails de una campaña cuyas llamadas al LLM están cortadas por presupuesto
+EMAIL_BUDGET_RETRY_SECONDS = int(get_env_variable("EMAIL_BUDGET_RETRY_SECONDS", "300"))
+# Agrupación de turnos: emails de una misma escena recibidos dentro de la ventana se responden juntos (0 = desactivado)
+EMAIL_COALESCE_WINDOW_SECONDS = int(get_env_variable("EMAIL_COALESCE_WINDOW_SECONDS", "120"))
+EMAIL_COALESCE_MAX_EMAILS = int(get_env_variable("EMAIL_COALESCE_MAX_EMAILS", "5"))
+
+
+def worker_id_actual() -> str:
+    """Identificador único del worker: máquina, proceso e hilo (o tarea asyncio si se llama desde una)."""
+    try:
+        tarea = asyncio.current_task()
+    except RuntimeError:
+        tarea = None
+    nombre = tarea.get_name() if tarea is not None else threading.current_thread().name
+    return f"{socket.gethostname()}:{os.getpid()}:{nombre}"
+
 class OrquestadorLangGraph:
     """Orquestador principal usando LangGraph para procesamiento de emails."""
     
     def __init__(self):
         self.narrative_graph = processing_graph
-        self.game_states = {}  # Cache de estados de juego por campaña
+        self.phase_cache = phase_cache  # Fase actual por escena (invalidada entre procesos con LISTEN/NOTIFY)
     
-    def procesar_email(self) -> Dict[str, Any]:
+    def procesar_email(self, scene_id: Optional[int] = None, worker_id: Optional[str] = None,
+                       agrupar: bool = False) -> Dict[str, Any]:
         """
         Procesa el siguiente email pendiente usando LangGraph.
+        Si se indica scene_id, solo considera los emails de esa escena (ver jobs/scene_worker_pool.py).
+        El email se reclama con un lease (EmailManager.claim_next_email), así varios procesos o máquinas
+        pueden compartir la cola sin procesar dos veces el mismo email. Si el proceso muere, el lease caduca
+        y otro worker lo recupera.
+        Con agrupar=True también se reclaman los emails siguientes de la misma escena recibidos dentro de
+        EMAIL_COALESCE_WINDOW_SECONDS y se responden todos con una sola pasada del grafo.
         
         Returns:
             Resultado del procesamiento:
-            - Si encuentra email: lo procesa completamente
+            - Si encuentra email: lo procesa completamente (email_ids contiene todos los emails respondidos)
             - Si no hay emails pendientes: retorna success=True con reason='no_pending_emails'
         """
         # Crear una sesión para todo el procesamiento
         db_session = SessionLocal()
+        worker_id = worker_id or worker_id_actual()
+        email_ids, sobrantes = [], []
         
         try:
-            # Buscar el siguiente email pendiente
-            email = EmailManager.get_next_email(db_session)
-            if not email:
-                logger.info("No hay emails pendientes para procesar")
-                return {
-                    'success': True,
-                    'message': 'No hay emails pendientes para procesar',
-                    'email_processed': False,
-                    'reason': 'no_pending_emails'
-                }
+            # Reclamar el siguiente email pendiente (y los que se agrupan con él)
+            emails = self._reclamar(db_session, worker_id, scene_id, agrupar)
+            if not emails:
+                return self._sin_emails()
             
-            email_id = email.id
-            logger.info(f"Iniciando procesamiento de email {email_id} de {email.sender} [proceso interrumpido aquí temporalmente]")
+            email = emails[0]
+            email_ids = [e.id for e in emails]
+            logger.info(f"Iniciando procesamiento de email(s) {email_ids} de {', '.join(e.sender for e in emails)}")
+            
+            # Campaña sin presupuesto de tokens: se aplaza sin llamar al LLM ni gastar intentos
+            if medidor_tokens.bloqueada(email.campaign_id):
+                return self._aplazar_por_presupuesto(db_session, email, email_ids, worker_id)
             
             # Determinar estado actual del juego
             current_state = self._get_current_game_state(email, db_session)
@@ -57,63 +96,257 @@ class OrquestadorLangGraph:
             # Determinar qué grafo usar basado en el contexto
             graph_to_use = self._select_graph(email, current_state)
             
-            # Procesar email con el grafo seleccionado
-
-            result = self.narrative_graph.process_email(
-                email, 
-                db_session, 
-                current_state.get('estado_actual', PhaseType.narracion)
-            )
+            # Procesar email(s) con el grafo seleccionado; los tokens del LLM se atribuyen a la campaña y escena
+            with atribuir_consumo(email.campaign_id, scene_id=email.scene_id):
+                result = self.narrative_graph.process_email_group(
+                    emails, 
+                    db_session, 
+                    current_state.get('estado_actual', PhaseType.narracion)
+                )
+            
+            # Al reanudar una ejecución interrumpida se responde su grupo; el resto vuelve a la cola al terminar
+            emails, sobrantes = self._separar_respondidos(emails, result)
+            email_ids = [e.id for e in emails]
             
             # Actualizar estado del juego si el procesamiento fue exitoso
             if result.get('success'):
-                self._update_game_state(email, result, db_session)
+                vigentes, nueva_fase = self._confirmar(db_session, emails, result, worker_id)
+                if not vigentes:
+                    db_session.rollback()
+                    return self._lease_caducado(result, email_ids)
                 
                 # Commit de toda la transacción si fue exitoso
                 db_session.commit()
-                logger.info(f"Procesamiento de email {email_id} completado exitosamente")
-                
-                # Agregar información de éxito al resultado
-                result['email_processed'] = True
-                result['email_id'] = email_id
+                self._tras_commit(email, email_ids, result, nueva_fase)
             else:
-                # Rollback si hubo error en el procesamiento
+                # Rollback si hubo error en el procesamiento y liberar los emails para reintentarlos más tarde
                 db_session.rollback()
-                logger.error(f"Error en procesamiento de email {email_id}, rollback aplicado")
-                result['email_processed'] = False
-            
-            # Enviar email de respuesta si se generó (fuera de la transacción principal)
-            if result.get('success') and result.get('email_respuesta'):
-                self._send_response_email(result['email_respuesta'])
-            
+                if medidor_tokens.bloqueada(email.campaign_id):
+                    return self._aplazar_por_presupuesto(db_session, email, email_ids, worker_id)
+                agotados = self._release_claims(db_session, email_ids, worker_id, self._descripcion_error(result))
+                self._tras_fallo(email_ids, result, agotados)
             
             return result
             
         except Exception as e:
             # Error crítico → rollback completo
             db_session.rollback()
-            logger.error(f"Error crítico procesando email: {e}")
-            return {
-                'success': False,
-                'error': f'Error crítico: {str(e)}'
-            }
+            self._release_claims(db_session, email_ids, worker_id, f"Error crítico: {e}")
+            return self._error_critico(email_ids, e)
         finally:
-            # Siempre cerrar la sesión
+            # Devolver a la cola los emails que no entraron en el grupo y cerrar la sesión
+            self._devolver(db_session, sobrantes, worker_id)
             db_session.close()
     
-    def procesar_emails_pendientes(self, max_emails: int = 10) -> Dict[str, Any]: # no usado por ahora
+    async def aprocesar_email(self, scene_id: Optional[int] = None, worker_id: Optional[str] = None,
+                              agrupar: bool = False) -> Dict[str, Any]:
+        """
+        Versión asíncrona de procesar_email para ejecutar muchos emails a la vez en un mismo bucle de eventos
+        (ver jobs/async_email_processor.py). Usa una AsyncSession (asyncpg): las consultas reutilizan los managers
+        síncronos mediante run_sync y el grafo se ejecuta con ainvoke, así que las llamadas al LLM no ocupan un hilo.
+        """
+        worker_id = worker_id or worker_id_actual()
+        email_ids, sobrantes = [], []
+        
+        async with get_async_sessionmaker()() as db_session:
+            try:
+                emails = await db_session.run_sync(self._reclamar, worker_id, scene_id, agrupar)
+                if not emails:
+                    return self._sin_emails()
+                
+                email = emails[0]
+                email_ids = [e.id for e in emails]
+                logger.info(f"Iniciando procesamiento de email(s) {email_ids} de {', '.join(e.sender for e in emails)}")
+                
+                if await asyncio.to_thread(medidor_tokens.bloqueada, email.campaign_id):
+                    return await db_session.run_sync(self._aplazar_por_presupuesto, email, email_ids, worker_id)
+                
+                current_state = await db_session.run_sync(lambda db: self._get_current_game_state(email, db))
+                
+                with atribuir_consumo(email.campaign_id, scene_id=email.scene_id):
+                    result = await self.narrative_graph.aprocess_email_group(
+                        emails,
+                        db_session,
+                        current_state.get('estado_actual', PhaseType.narracion)
+                    )
+                
+                emails, sobrantes = self._separar_respondidos(emails, result)
+                email_ids = [e.id for e in emails]
+                
+                if result.get('success'):
+                    vigentes, nueva_fase = await db_session.run_sync(self._confirmar, emails, result, worker_id)
+                    if not vigentes:
+                        await db_session.rollback()
+                        return self._lease_caducado(result, email_ids)
+                    
+                    await db_session.commit()
+                    await asyncio.to_thread(self._tras_commit, email, email_ids, result, nueva_fase)
+                else:
+                    await db_session.rollback()
+                    if await asyncio.to_thread(medidor_tokens.bloqueada, email.campaign_id):
+                        return await db_session.run_sync(self._aplazar_por_presupuesto, email, email_ids, worker_id)
+                    agotados = await db_session.run_sync(self._release_claims, email_ids, worker_id,
+                                                         self._descripcion_error(result))
+                    await asyncio.to_thread(self._tras_fallo, email_ids, result, agotados)
+                
+                return result
+            
+            except Exception as e:
+                await db_session.rollback()
+                await db_session.run_sync(self._release_claims, email_ids, worker_id, f"Error crítico: {e}")
+                return self._error_critico(email_ids, e)
+            finally:
+                await db_session.run_sync(self._devolver, sobrantes, worker_id)
+    
+    def _reclamar(self, db_session: Session, worker_id: str, scene_id: Optional[int], agrupar: bool) -> List[Email]:
+        """Reclama el siguiente email pendiente (y, con agrupar, los que se responden junto a él)."""
+        if agrupar and EMAIL_COALESCE_WINDOW_SECONDS > 0:
+            return EmailManager.claim_scene_batch(db_session, worker_id, EMAIL_CLAIM_LEASE_SECONDS, scene_id,
+                                                  EMAIL_COALESCE_WINDOW_SECONDS, EMAIL_COALESCE_MAX_EMAILS,
+                                                  EMAIL_MAX_ATTEMPTS)
+        email = EmailManager.claim_next_email(db_session, worker_id, EMAIL_CLAIM_LEASE_SECONDS, scene_id,
+                                              EMAIL_MAX_ATTEMPTS)
+        return [email] if email else []
+    
+    def _confirmar(self, db_session: Session, emails: List[Email], result: Dict[str, Any],
+                   worker_id: str) -> Tuple[bool, Optional[str]]:
+        """
+        Aplica el resultado en la transacción (sin commit): fase de la escena, respuesta en el outbox y emails procesados.
+        Devuelve si los leases seguían siendo nuestros y la nueva fase de la escena (o None).
+        """
+        email_ids = [e.id for e in emails]
+        nueva_fase = self._update_game_state(emails[0], result, db_session)
+        
+        # Encolar la respuesta en el outbox dentro de la misma transacción
+        if result.get('email_respuesta'):
+            self._enqueue_response_email(db_session, email_ids[-1], result['email_respuesta'])
+        
+        # Marcar como procesados solo si los leases siguen siendo nuestros
+        vigentes = all(EmailManager.mark_as_processed(db_session, email_id, worker_id) for email_id in email_ids)
+        return vigentes, nueva_fase
+    
+    def _tras_commit(self, email: Email, email_ids: List[int], result: Dict[str, Any], nueva_fase: Optional[str]):
+        self.narrative_graph.discard_checkpoints(result.get('thread_id'))
+        if nueva_fase is not None:
+            bump_version("scene", email.scene_id)
+        registrar_emails_procesados(len(email_ids), exito=True)
+        logger.info(f"Procesamiento de email(s) {email_ids} completado exitosamente")
+        
+        # Agregar información de éxito al resultado
+        result['email_processed'] = True
+        result['email_id'] = email.id
+        result['email_ids'] = email_ids
+    
+    def _tras_fallo(self, email_ids: List[int], result: Dict[str, Any], agotados: bool = False):
+        # Los checkpoints se conservan para reanudar en el siguiente intento desde el último nodo completado;
+        # solo se descartan si los emails ya no se van a reintentar
+        if agotados:
+            self.narrative_graph.discard_checkpoints(result.get('thread_id'))
+        registrar_emails_procesados(len(email_ids), exito=False)
+        logger.error(f"Error en procesamiento de email(s) {email_ids}, rollback aplicado")
+        result['email_processed'] = False
+    
+    def _sin_emails(self) -> Dict[str, Any]:
+        logger.info("No hay emails pendientes para procesar")
+        return {
+            'success': True,
+            'message': 'No hay emails pendientes para procesar',
+            'email_processed': False,
+            'reason': 'no_pending_emails'
+        }
+    
+    def _lease_caducado(self, result: Dict[str, Any], email_ids: List[int]) -> Dict[str, Any]:
+        logger.error(f"El lease de los emails {email_ids} ha caducado y los ha reclamado otro worker; se descarta el resultado")
+        registrar_emails_procesados(len(email_ids), exito=False)
+        result['success'] = False
+        result['email_processed'] = False
+        result['error'] = 'Lease caducado'
+        return result
+    
+    def _error_critico(self, email_ids: List[int], e: Exception) -> Dict[str, Any]:
+        logger.error(f"Error crítico procesando email: {e}")
+        if email_ids:
+            registrar_emails_procesados(len(email_ids), exito=False)
+        return {
+            'success': False,
+            'email_id': email_ids[0] if email_ids else None,
+            'email_ids': email_ids,
+            'error': f'Error crítico: {str(e)}'
+        }
+    
+    def _release_claims(self, db_session: Session, email_ids, worker_id: str, error: Optional[str] = None) -> bool:
+        """
+        Libera los emails reclamados tras un fallo; no se reintentan hasta pasado EMAIL_RETRY_SECONDS.
+        Los que ya llevan EMAIL_MAX_ATTEMPTS intentos quedan como fallidos y dejan de bloquear su escena.
+        Devuelve si alguno ha quedado como fallido.
+        """
+        agotados = False
+        for email_id in email_ids:
+            try:
+                email = EmailManager.release_claim(db_session, email_id, worker_id, EMAIL_RETRY_SECONDS,
+                                                   error, EMAIL_MAX_ATTEMPTS)
+                if email is not None and email.fallido:
+                    agotados = True
+                    logger.error(f"El email {email_id} ha agotado sus {email.intentos} intentos y se marca como fallido: {error}")
+            except Exception as release_error:
+                logger.error(f"No se pudo liberar el email {email_id}: {release_error}")
+        return agotados
+    
+    @staticmethod
+    def _separar_respondidos(emails: List[Email], result: Dict[str, Any]) -> Tuple[List[Email], List[int]]:
+        """Emails que cubre el resultado del grafo y ids de los reclamados que han quedado fuera del grupo."""
+        respondidos = set(result.get('email_ids') or [e.id for e in emails])
+        return [e for e in emails if e.id in respondidos], [e.id for e in emails if e.id not in respondidos]
+    
+    def _devolver(self, db_session: Session, email_ids: List[int], worker_id: str):
+        """Devuelve a la cola, sin contar el intento, emails reclamados que no se han llegado a procesar."""
+        for email_id in email_ids:
+            try:
+                EmailManager.release_claim(db_session, email_id, worker_id, contar_intento=False)
+            except Exception as release_error:
+                logger.error(f"No se pudo devolver el email {email_id}: {release_error}")
+    
+    def _aplazar_por_presupuesto(self, db_session: Session, email: Email, email_ids: List[int],
+                                 worker_id: str) -> Dict[str, Any]:
+        """
+        Libera los emails de una campaña que ha superado el margen de su presupuesto de tokens sin contar el intento:
+        se vuelven a probar cada EMAIL_BUDGET_RETRY_SECONDS hasta que se amplíe el presupuesto o cambie el mes.
+        """
+        logger.warning(f"Campaña {email.campaign_id} sin presupuesto de tokens: se aplazan los emails {email_ids}")
+        for email_id in email_ids:
+            try:
+                EmailManager.release_claim(db_session, email_id, worker_id, EMAIL_BUDGET_RETRY_SECONDS,
+                                           "Presupuesto de tokens agotado", contar_intento=False)
+            except Exception as release_error:
+                logger.error(f"No se pudo aplazar el email {email_id}: {release_error}")
+        return {
+            'success': False,
+            'email_processed': False,
+            'email_id': email.id,
+            'email_ids': email_ids,
+            'error': 'Presupuesto de tokens agotado',
+            'reason': 'presupuesto_agotado'
+        }
+    
+    @staticmethod
+    def _descripcion_error(result: Dict[str, Any]) -> str:
+        return str(result.get('error', result.get('errors', 'Error desconocido')))
+    
+    def procesar_emails_pendientes(self, max_emails: int = 10, agrupar: bool = True) -> Dict[str, Any]: # no usado por ahora
         """
         Procesa múltiples emails pendientes en lote.
-        Cada email se procesa en su propia transacción independiente.
+        Cada email (o grupo de emails de una escena) se procesa en su propia transacción independiente.
         
         Args:
             max_emails: Máximo número de emails a procesar
+            agrupar: Si True, los emails de una misma escena dentro de la ventana se responden con una sola respuesta
             
         Returns:
             Resumen del procesamiento en lote
         """
         emails_procesados = 0
         emails_exitosos = 0
+        respuestas_generadas = 0  # pasadas del grafo con éxito (menos que emails si se agrupan)
         errores = []
         
         logger.info(f"Iniciando procesamiento en lote (máximo {max_emails} emails)")
@@ -121,17 +354,19 @@ class OrquestadorLangGraph:
         try:
             while emails_procesados < max_emails:
                 # Procesar siguiente email (cada uno en su propia transacción)
-                result = self.procesar_email()
+                result = self.procesar_email(agrupar=agrupar)
                 
                 # Si no hay más emails, terminar
                 if result.get('reason') == 'no_pending_emails':
                     logger.info("No hay más emails pendientes")
                     break
                 
-                emails_procesados += 1
+                n_emails = len(result.get('email_ids') or [None])
+                emails_procesados += n_emails
                 
                 if result.get('success'):
-                    emails_exitosos += 1
+                    emails_exitosos += n_emails
+                    respuestas_generadas += 1
                     email_id = result.get('email_id', 'unknown')
                     logger.info(f"Email {email_id} procesado exitosamente")
                 else:
@@ -147,6 +382,7 @@ class OrquestadorLangGraph:
                 'success': True,
                 'emails_procesados': emails_procesados,
                 'emails_exitosos': emails_exitosos,
+                'respuestas_generadas': respuestas_generadas,
                 'emails_con_error': len(errores),
                 'errores': errores
             }
@@ -169,19 +405,14 @@ class OrquestadorLangGraph:
             }
     
     def _get_current_game_state(self, email, db_session: Session) -> Dict[str, Any]:
-        """Obtiene el estado actual del juego para el email usando el campo fase_actual."""
+        """
+        Obtiene el estado actual del juego para el email usando el campo fase_actual.
+        La fase sale de la caché de fases, que descarta la entrada en cuanto cualquier proceso cambia la escena.
+        """
         try:
             campaign_id = email.campaign_id
             scene_id = email.scene_id
 
-            # Si tenemos el estado en cache, usarlo
-            if campaign_id in self.game_states:
-                cached_state = self.game_states[campaign_id]
-                # Verificar si el estado está actualizado
-                if cached_state.get('last_updated', datetime.min) > datetime.now().replace(hour=0):
-                    return cached_state
-
-            # Obtener estado actual desde la BD
             # Por defecto, asumir narración libre
             current_state = {
                 'estado_actual': PhaseType.narracion,
@@ -192,11 +423,7 @@ class OrquestadorLangGraph:
 
             # Recuperar fase actual de la escena si existe
             if scene_id:
-                current_state['estado_actual'] = SceneManager.get_actual_phase_by_scene_id(db_session, scene_id)
-
-            # Cachear estado
-            if campaign_id:
-                self.game_states[campaign_id] = current_state
+                current_state['estado_actual'] = self.phase_cache.get(db_session, scene_id) or PhaseType.narracion
 
             return current_state
 
@@ -223,48 +450,43 @@ class OrquestadorLangGraph:
             logger.error(f"Error seleccionando grafo: {e}")
             return PhaseType.narracion
     
-    def _update_game_state(self, email, result: Dict[str, Any], db_session: Session):
-        """Actualiza el estado del juego basado en el resultado del procesamiento."""
+    def _update_game_state(self, email, result: Dict[str, Any], db_session: Session) -> Optional[str]:
+        """
+        Persiste en la escena el cambio de fase detectado durante el procesamiento (sin commit).
+        Devuelve la nueva fase, o None si no hay transición; tras el commit hay que invalidar la versión "scene".
+        """
         try:
-            campaign_id = getattr(email, 'campaign_id', None)
-            if not campaign_id:
-                return
-            
-            # Actualizar estado en cache
-            if campaign_id in self.game_states:
-                state = self.game_states[campaign_id]
-                
-                # Actualizar estado si hubo transición
-                if result.get('transicion_detectada', {}).get('cambio_detectado'):
-                    state['estado_actual'] = result.get('estado_final', state.get('estado_actual'))
-                
-                # Actualizar si el combate terminó
-                if result.get('combat_ended'):
-                    state['estado_actual'] = PhaseType.narracion
-                
-                state['last_updated'] = datetime.now()
-                
-                logger.info(f"Estado del juego actualizado para campaña {campaign_id}")
+            scene_id = getattr(email, 'scene_id', None)
+            if not scene_id:
+                return None
             
-        except Exception as e:
-            logger.error(f"Error actualizando estado del juego: {e}")
-    
-    def _send_response_email(self, email_response: Dict[str, Any]):
-        """Envía el email de respuesta (placeholder - implementar según tu sistema de envío)."""
-        try:
-            # TODO: Implementar envío real de emails según tu configuración
-            # Por ahora solo logeamos que se generó una respuesta
+            nueva_fase = None
+            # Actualizar estado si hubo transición
+            if (result.get('transicion_detectada') or {}).get('cambio_detectado') and result.get('estado_final'):
+                nueva_fase = result['estado_final']
             
-            logger.info(f"Email de respuesta preparado:")
-            logger.info(f"  Asunto: {email_response.get('subject', '')}")
-            logger.info(f"  Destinatarios: {email_response.get('recipients', [])}")
-            logger.info(f"  Thread ID: {email_response.get('thread_id', '')}")
+            # Actualizar si el combate terminó
+            if result.get('combat_ended'):
+                nueva_fase = PhaseType.narracion
             
-            # Aquí iría la integración con tu servicio de envío de emails
-            # Ejemplo: gmail_service.send_email(email_response)
+            if nueva_fase is None:
+                return None
+            SceneManager.update_actual_phase(db_session, scene_id, nueva_fase)
+            logger.info(f"Fase de la escena {scene_id} actualizada a {nueva_fase}")
+            return nueva_fase
             
         except Exception as e:
-            logger.error(f"Error enviando email de respuesta: {e}")
+            logger.error(f"Error actualizando estado del juego: {e}")
+            return None
+    
+    def _enqueue_response_email(self, db_session: Session, email_id: int, email_response: Dict[str, Any]):
+        """
+        Encola el email de respuesta en el outbox (sin commit: se confirma con el resto del procesamiento).
+        El envío lo hace jobs/outbox_sender_cron.py, así el procesamiento no espera a Gmail y un fallo
+        de envío se reintenta sin reprocesar el email.
+        """
+        OutboxManager.enqueue(db_session, email_response, email_id=email_id)
+        logger.info(f"Email de respuesta encolado: {email_response.get('subject', '')} -> {email_response.get('recipients', [])}")
     
     def get_processing_stats(self) -> Dict[str, Any]:
         """Obtiene estadísticas del procesamiento."""
@@ -273,6 +495,7 @@ class OrquestadorLangGraph:
             
             # Contar emails pendientes
             pending_emails = EmailManager.count_pending_emails(db_session)
+            failed_emails = EmailManager.count_failed_emails(db_session)
             
             # Contar emails procesados hoy
             from datetime import date
@@ -282,8 +505,10 @@ class OrquestadorLangGraph:
             
             return {
                 'emails_pendientes': pending_emails,
+                'emails_fallidos': failed_emails,
                 'emails_procesados_hoy': today_processed,
-                'estados_juego_activos': len(self.game_states),
+                'emails_por_minuto': ritmo_emails.por_minuto(),
+                'estados_juego_activos': len(self.phase_cache),
                 'grafos_disponibles': ['normal', 'combat']
             }
             
@@ -2,9 +2,9 @@
 Estado que se pasa entre nodos durante el procesamiento de un email.
 """
 
-from typing import TypedDict, Optional, List, Dict, Any
+import operator
+from typing import Annotated, TypedDict, Optional, List, Dict, Any
 from datetime import datetime
-from api.models.character import Character
 from api.models.scene import PhaseType
 
 class EmailState(TypedDict):
@@ -13,9 +13,12 @@ class EmailState(TypedDict):
     # Email original
     email_id: int
     email_data: Dict[str, Any]  # Datos del email (subject, body, sender, etc.)
+    email_ids: List[int]  # Todos los emails que responde esta ejecución (más de uno si se agrupan por escena)
+    emails_agrupados: Optional[List[Dict[str, Any]]]  # Datos de cada email del grupo (sender, subject, body...)
     
     # Análisis del email
     clasificacion_intenciones: Optional[List[Dict[str, Any]]]  # Lista de intenciones clasificadas
+    intenciones: Optional[List[Dict[str, Any]]]  # Intenciones a validar una a una contra las reglas (tipo, bloque, entidades)
     transicion_detectada: Optional[Dict[str, Any]]  # Cambio de estado detectado
     metajuego_detectado: bool # Indica si se detectó metajuego
     
@@ -34,7 +37,7 @@ class EmailState(TypedDict):
     contexto_sistema: Optional[Dict[str, Any]]  # Prompt de sistema para la IA
     contexto_historial: Optional[Dict[str,Any]]  # Historial narrativo, engloba los resumenes de Campaign Story y Scene
     contexto_ultimos_emails: Optional[List[Dict[str, Any]]]  # Últimos emails que se añadirán al historial sin resumir
-    personajes_pj: Optional[List[Character]]  # Lista de personajes jugadores
+    personajes_pj: Optional[List[Dict[str, Any]]]  # Lista de personajes jugadores (id, nombre, tipo, hoja_json, estado_actual)
     personajes_pnj: Optional[List[Dict[str, Any]]]  # Lista de personajes no jugadores relevantes
     nombre_personajes_pj: Optional[List[str]]  # Nombres de personajes jugadores
     nombre_personajes_pnj: Optional[List[str]]  # Nombres de personajes no jugadores relevantes
@@ -45,7 +48,7 @@ class EmailState(TypedDict):
     
     # Reglas y validaciones
     ruleset: Optional[Dict[str, Any]]  # Reglas de la campaña
-    validaciones: Optional[List[Dict[str, Any]]]  # Validaciones aplicadas
+    validaciones: Annotated[List[Dict[str, Any]], operator.add]  # Validaciones aplicadas (una por intención, acumuladas)
     
     # Estado del juego
     estado_actual: PhaseType  # "narracion" o "accion_en_turno"
@@ -57,12 +60,50 @@ class EmailState(TypedDict):
     
     # Respuesta generada
     respuesta_ia: Optional[str]  # Respuesta generada por la IA
+    respuesta_truncada: bool  # La respuesta se cortó por longitud y se recortó a su última frase completa
     email_respuesta: Optional[Dict[str, Any]]  # Email de respuesta formateado
     
     # Metadatos
     timestamp: datetime
     processed: bool
-    errors: Optional[List[str]]  # Lista de errores durante el procesamiento
+    errors: Annotated[List[str], operator.add]  # Errores durante el procesamiento (cada nodo añade los suyos)
     
     # Datos de la sesión de BD
-    db_session: Optional[Any]  # Sesión de base de datos
+    db_session: Optional[Any]  # Sesión de base de datos: llega por config y nunca se guarda en los checkpoints
+
+
+def inyectar_sesion(state: EmailState, config: Optional[Dict[str, Any]]) -> EmailState:
+    """
+    Pone en el estado la sesión de BD recibida en config["configurable"]["db_session"].
+    La sesión no se persiste en los checkpoints, así que al reanudar un email solo llega por config.
+    """
+    db_session = ((config or {}).get("configurable") or {}).get("db_session")
+    if db_session is not None:
+        state['db_session'] = db_session
+    return state
+
+
+def estado_de_trabajo(state: EmailState, config: Optional[Dict[str, Any]]) -> EmailState:
+    """
+    Copia del estado sobre la que trabaja un nodo, con la sesión de BD inyectada.
+    Los nodos modifican el estado recibido; como varios nodos se ejecutan en paralelo, cada uno trabaja sobre
+    su copia (con su propia lista de errores) y devuelve al grafo solo lo que ha cambiado (ver cambios_del_nodo).
+    """
+    estado = dict(state)
+    estado['errors'] = list(state.get('errors') or [])
+    return inyectar_sesion(estado, config)
+
+
+def cambios_del_nodo(state: EmailState, estado: EmailState) -> Dict[str, Any]:
+    """
+    Actualización parcial que devuelve un nodo: las claves que ha modificado en su copia del estado.
+    De errors solo se devuelven los nuevos, ya que el canal acumula (operator.add); la sesión nunca se devuelve.
+    """
+    cambios = {
+        clave: valor for clave, valor in estado.items()
+        if clave not in ('errors', 'db_session') and (clave not in state or state[clave] != valor)
+    }
+    nuevos_errores = estado['errors'][len(state.get('errors') or []):]
+    if nuevos_errores:
+        cambios['errors'] = nuevos_errores
+    return cambios
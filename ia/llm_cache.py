@@ -0,0 +1,139 @@
+# Caché persistente de respuestas del LLM
+"""
+Evita pagar dos veces la misma llamada al LLM (reintentos tras un rollback, reprocesar un email, pruebas):
+- La clave es un hash xxh3-128 del despliegue, los parámetros del perfil y la lista de mensajes (tipo y contenido),
+  así que cualquier cambio en el prompt o en el perfil es una entrada distinta.
+- Se guarda en SQLite en disco (modo WAL, compartible entre procesos) con TTL y un tamaño máximo:
+  al superarlo se eliminan las entradas usadas hace más tiempo.
+- Solo se cachean los perfiles de LLM_CACHE_PERFILES: por defecto no el creativo, cuyas respuestas
+  deben variar entre llamadas.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Iterable, Optional
+import xxhash
+from utils.env_loader import get_env_variable
+from utils.metrics import LLM_CACHE
+
+LLM_CACHE_PATH = get_env_variable("LLM_CACHE_PATH", os.path.join("cache", "llm_cache.sqlite"))
+LLM_CACHE_TTL = int(get_env_variable("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_MB = float(get_env_variable("LLM_CACHE_MAX_MB", "256"))
+# Perfiles cacheados, separados por comas (vacío = caché desactivada)
+LLM_CACHE_PERFILES = get_env_variable("LLM_CACHE_PERFILES", "precisa,neutral,resumen,clasificacion")
+
+
+def clave_cache(deployment: str, parametros: dict, mensajes: Iterable) -> str:
+    """Clave de contenido de una llamada: despliegue, parámetros del perfil y mensajes."""
+    contenido = {
+        "deployment": deployment,
+        "parametros": parametros,
+        "mensajes": [(mensaje.type, mensaje.content) for mensaje in mensajes],
+    }
+    return xxhash.xxh3_128_hexdigest(json.dumps(contenido, ensure_ascii=False, sort_keys=True, default=str))
+
+
+class LLMCache:
+    """Almacén clave -> respuesta del LLM en SQLite, con TTL y desalojo por tamaño (menos usado recientemente)."""
+
+    def __init__(self, ruta: str = LLM_CACHE_PATH, ttl_segundos: float = LLM_CACHE_TTL,
+                 max_bytes: int = int(LLM_CACHE_MAX_MB * 1024 * 1024), perfiles: Iterable[str] = None):
+        self.ruta = ruta
+        self.ttl_segundos = ttl_segundos
+        self.max_bytes = max_bytes
+        if perfiles is None:
+            perfiles = [perfil.strip() for perfil in LLM_CACHE_PERFILES.split(",") if perfil.strip()]
+        self.perfiles = set(perfiles)
+        self._conexion = None
+        self._lock = threading.Lock()
+        self._bytes = None  # Tamaño total de las respuestas guardadas (se calcula al abrir)
+        self.aciertos = 0
+        self.fallos = 0
+
+    def activa_para(self, perfil: str) -> bool:
+        return perfil in self.perfiles
+
+    def _conectar(self) -> sqlite3.Connection:
+        if self._conexion is None:
+            carpeta = os.path.dirname(self.ruta)
+            if carpeta:
+                os.makedirs(carpeta, exist_ok=True)
+            conexion = sqlite3.connect(self.ruta, check_same_thread=False, timeout=10)
+            conexion.execute("PRAGMA journal_mode=WAL")
+            conexion.execute(
+                "CREATE TABLE IF NOT EXISTS respuestas ("
+                " clave TEXT PRIMARY KEY, perfil TEXT NOT NULL, respuesta TEXT NOT NULL,"
+                " bytes INTEGER NOT NULL, creada REAL NOT NULL, usada REAL NOT NULL)"
+            )
+            conexion.execute("CREATE INDEX IF NOT EXISTS ix_respuestas_usada ON respuestas (usada)")
+            conexion.commit()
+            self._bytes = conexion.execute("SELECT COALESCE(SUM(bytes), 0) FROM respuestas").fetchone()[0]
+            self._conexion = conexion
+        return self._conexion
+
+    def get(self, clave: str, perfil: str) -> Optional[str]:
+        """Respuesta guardada para la clave, o None si no existe o ha caducado."""
+        ahora = time.time()
+        with self._lock:
+            conexion = self._conectar()
+            fila = conexion.execute("SELECT respuesta, creada, bytes FROM respuestas WHERE clave = ?", (clave,)).fetchone()
+            if fila is not None and ahora - fila[1] > self.ttl_segundos:
+                conexion.execute("DELETE FROM respuestas WHERE clave = ?", (clave,))
+                conexion.commit()
+                self._bytes -= fila[2]
+                fila = None
+            if fila is None:
+                self.fallos += 1
+                LLM_CACHE.inc(perfil=perfil, resultado="miss")
+                return None
+            conexion.execute("UPDATE respuestas SET usada = ? WHERE clave = ?", (ahora, clave))
+            conexion.commit()
+            self.aciertos += 1
+        LLM_CACHE.inc(perfil=perfil, resultado="hit")
+        return fila[0]
+
+    def put(self, clave: str, perfil: str, respuesta: str):
+        """Guarda una respuesta y desaloja las menos usadas si se supera el tamaño máximo."""
+        if not isinstance(respuesta, str):
+            return
+        ahora = time.time()
+        tamano = len(respuesta.encode("utf-8"))
+        with self._lock:
+            conexion = self._conectar()
+            anterior = conexion.execute("SELECT bytes FROM respuestas WHERE clave = ?", (clave,)).fetchone()
+            conexion.execute(
+                "INSERT OR REPLACE INTO respuestas (clave, perfil, respuesta, bytes, creada, usada) VALUES (?, ?, ?, ?, ?, ?)",
+                (clave, perfil, respuesta, tamano, ahora, ahora),
+            )
+            self._bytes += tamano - (anterior[0] if anterior else 0)
+            self._desalojar(conexion)
+            conexion.commit()
+
+    def _desalojar(self, conexion: sqlite3.Connection):
+        """Elimina caducadas y, si aún se supera max_bytes, las usadas hace más tiempo."""
+        if self._bytes <= self.max_bytes:
+            return
+        conexion.execute("DELETE FROM respuestas WHERE creada < ?", (time.time() - self.ttl_segundos,))
+        self._bytes = conexion.execute("SELECT COALESCE(SUM(bytes), 0) FROM respuestas").fetchone()[0]
+        for clave, tamano in conexion.execute("SELECT clave, bytes FROM respuestas ORDER BY usada ASC").fetchall():
+            if self._bytes <= self.max_bytes:
+                break
+            conexion.execute("DELETE FROM respuestas WHERE clave = ?", (clave,))
+            self._bytes -= tamano
+
+    def __len__(self):
+        with self._lock:
+            return self._conectar().execute("SELECT COUNT(*) FROM respuestas").fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            conexion = self._conectar()
+            conexion.execute("DELETE FROM respuestas")
+            conexion.commit()
+            self._bytes = 0
+
+
+# Instancia global de la caché (el fichero se abre en el primer uso)
+llm_cache = LLMCache()
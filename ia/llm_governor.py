@@ -0,0 +1,360 @@
+# Regulador de las llamadas a Azure OpenAI
+"""
+Todas las llamadas al LLM del proceso (IAClient, síncronas y asíncronas) pasan por un único regulador que:
+- Respeta las cuotas del despliegue con dos token buckets: peticiones por minuto (LLM_RPM) y tokens por minuto
+  (LLM_TPM). Como Azure, cuenta por petición los tokens del prompt más el max_tokens del perfil,
+  con ráfagas de hasta una sexta parte del minuto (Azure aplica la cuota en ventanas de 10 segundos).
+- Ajusta el número de llamadas simultáneas (AIMD): sube poco a poco con cada respuesta correcta y se reduce
+  a la mitad ante un 429 o cuando la latencia se dispara respecto a la habitual del perfil.
+- Reintenta los 429, 5xx, timeouts y errores de conexión con backoff exponencial con jitter. Si Azure indica
+  Retry-After, se respeta y se pausan también las demás llamadas hasta entonces.
+- Corta el paso con un circuit breaker tras LLM_CIRCUIT_FAILURES fallos seguidos del servicio: durante
+  LLM_CIRCUIT_COOLDOWN segundos las llamadas fallan al momento (CircuitoAbierto) y después se prueba con una sola.
+Los reintentos del SDK de OpenAI se desactivan (max_retries=0 en ia/llm_pool.py) para no reintentar dos veces.
+"""
+import asyncio
+import random
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Awaitable, Callable, Iterable, Optional, TypeVar
+import openai
+from utils.env_loader import get_env_variable
+from utils.metrics import LLM_CIRCUITO, LLM_CONCURRENCIA, LLM_REINTENTOS
+from utils.rate_limit import TokenBucket
+from utils.tokens import count_tokens
+
+# Cuotas del despliegue (0 = sin límite)
+LLM_RPM = int(get_env_variable("LLM_RPM", "0"))
+LLM_TPM = int(get_env_variable("LLM_TPM", "0"))
+LLM_CONCURRENCY_INITIAL = int(get_env_variable("LLM_CONCURRENCY_INITIAL", "8"))
+LLM_CONCURRENCY_MIN = int(get_env_variable("LLM_CONCURRENCY_MIN", "1"))
+LLM_CONCURRENCY_MAX = int(get_env_variable("LLM_CONCURRENCY_MAX", "32"))
+# Una llamada que tarda más de LLM_LATENCY_FACTOR veces la media del perfil se trata como señal de saturación
+LLM_LATENCY_FACTOR = float(get_env_variable("LLM_LATENCY_FACTOR", "3"))
+LLM_MAX_RETRIES = int(get_env_variable("LLM_MAX_RETRIES", "5"))
+LLM_BACKOFF_BASE = float(get_env_variable("LLM_BACKOFF_BASE", "1"))
+LLM_BACKOFF_MAX = float(get_env_variable("LLM_BACKOFF_MAX", "60"))
+LLM_CIRCUIT_FAILURES = int(get_env_variable("LLM_CIRCUIT_FAILURES", "5"))
+LLM_CIRCUIT_COOLDOWN = float(get_env_variable("LLM_CIRCUIT_COOLDOWN", "30"))
+
+T = TypeVar("T")
+
+
+class CircuitoAbierto(RuntimeError):
+    """El LLM ha fallado demasiadas veces seguidas: la llamada no se intenta hasta que pase el enfriamiento."""
+
+
+def _es_rate_limit(e: Exception) -> bool:
+    return isinstance(e, openai.RateLimitError)
+
+
+def _es_fallo_del_servicio(e: Exception) -> bool:
+    """Errores transitorios del servicio (5xx, timeouts, conexión): se reintentan y cuentan para el circuit breaker."""
+    return isinstance(e, (openai.InternalServerError, openai.APIConnectionError))
+
+
+def _retry_after(e: Exception) -> Optional[float]:
+    """Segundos de espera que indica Azure en las cabeceras de la respuesta (retry-after-ms o retry-after)."""
+    respuesta = getattr(e, "response", None)
+    cabeceras = getattr(respuesta, "headers", None) or {}
+    try:
+        if cabeceras.get("retry-after-ms"):
+            return float(cabeceras["retry-after-ms"]) / 1000
+        if cabeceras.get("retry-after"):
+            return float(cabeceras["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+
+class ConcurrenciaAdaptativa:
+    """
+    Semáforo con límite variable (incremento aditivo, reducción multiplicativa) compartido por hilos
+    y corrutinas: las esperas síncronas usan una Condition y las asíncronas un futuro de su bucle de eventos.
+    """
+
+    def __init__(self, inicial: int = LLM_CONCURRENCY_INITIAL, minimo: int = LLM_CONCURRENCY_MIN,
+                 maximo: int = LLM_CONCURRENCY_MAX, intervalo_reduccion: float = 2.0):
+        self.minimo = max(1, minimo)
+        self.maximo = max(self.minimo, maximo)
+        self.limite = float(min(max(inicial, self.minimo), self.maximo))
+        self.intervalo_reduccion = intervalo_reduccion  # Una ráfaga de 429 solo reduce el límite una vez
+        self.en_curso = 0
+        self._ultima_reduccion = 0.0
+        self._cond = threading.Condition()
+        self._esperas_async = []
+        LLM_CONCURRENCIA.set(int(self.limite))
+
+    def _hay_hueco(self) -> bool:
+        return self.en_curso < int(self.limite)
+
+    def _despertar(self):
+        self._cond.notify_all()
+        esperas, self._esperas_async = self._esperas_async, []
+        for loop, futuro in esperas:
+            loop.call_soon_threadsafe(lambda f=futuro: f.done() or f.set_result(None))
+
+    def adquirir(self):
+        with self._cond:
+            self._cond.wait_for(self._hay_hueco)
+            self.en_curso += 1
+
+    async def aadquirir(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._cond:
+                if self._hay_hueco():
+                    self.en_curso += 1
+                    return
+                futuro = loop.create_future()
+                self._esperas_async.append((loop, futuro))
+            await futuro
+
+    def liberar(self):
+        with self._cond:
+            self.en_curso -= 1
+            self._despertar()
+
+    def aumentar(self):
+        with self._cond:
+            anterior = int(self.limite)
+            self.limite = min(self.maximo, self.limite + 1 / self.limite)
+            if int(self.limite) > anterior:
+                LLM_CONCURRENCIA.set(int(self.limite))
+                self._despertar()
+
+    def reducir(self, factor: float = 0.5):
+        with self._cond:
+            ahora = time.monotonic()
+            if ahora - self._ultima_reduccion < self.intervalo_reduccion:
+                return
+            self._ultima_reduccion = ahora
+            self.limite = max(self.minimo, self.limite * factor)
+            LLM_CONCURRENCIA.set(int(self.limite))
+
+
+class CircuitBreaker:
+    """
+    Cerrado -> abierto tras `fallos_para_abrir` fallos seguidos -> semiabierto al enfriarse: pasa una llamada de prueba
+    (otra si la prueba no termina en `enfriamiento` segundos) y según su resultado el circuito se cierra o vuelve a abrirse.
+    """
+
+    CERRADO, ABIERTO, SEMIABIERTO = "cerrado", "abierto", "semiabierto"
+
+    def __init__(self, fallos_para_abrir: int = LLM_CIRCUIT_FAILURES, enfriamiento: float = LLM_CIRCUIT_COOLDOWN):
+        self.fallos_para_abrir = fallos_para_abrir
+        self.enfriamiento = enfriamiento
+        self.estado = self.CERRADO
+        self._fallos = 0
+        self._abierto_hasta = 0.0
+        self._prueba_hasta = 0.0  # Mientras haya una llamada de prueba en curso, no pasan más
+        self._lock = threading.Lock()
+
+    def _cambiar(self, estado: str):
+        self.estado = estado
+        LLM_CIRCUITO.set({self.CERRADO: 0, self.ABIERTO: 1, self.SEMIABIERTO: 0.5}[estado])
+
+    def permitir(self) -> bool:
+        with self._lock:
+            ahora = time.monotonic()
+            if self.estado == self.ABIERTO and ahora >= self._abierto_hasta:
+                self._cambiar(self.SEMIABIERTO)
+                self._prueba_hasta = 0.0
+            if self.estado == self.CERRADO:
+                return True
+            if self.estado == self.SEMIABIERTO and ahora >= self._prueba_hasta:
+                self._prueba_hasta = ahora + self.enfriamiento
+                return True
+            return False
+
+    def registrar_exito(self):
+        """El servicio ha respondido (aunque sea con un error de la petición): el circuito se cierra."""
+        with self._lock:
+            self._fallos = 0
+            if self.estado != self.CERRADO:
+                self._cambiar(self.CERRADO)
+
+    def registrar_fallo(self):
+        with self._lock:
+            self._fallos += 1
+            if self.estado == self.SEMIABIERTO or self._fallos >= self.fallos_para_abrir:
+                self._abierto_hasta = time.monotonic() + self.enfriamiento
+                self._cambiar(self.ABIERTO)
+
+
+class LLMGovernor:
+    """
+    :param rpm: peticiones por minuto del despliegue (0 = sin límite).
+    :param tpm: tokens por minuto del despliegue (0 = sin límite).
+    """
+
+    def __init__(self, rpm: int = LLM_RPM, tpm: int = LLM_TPM, concurrencia: ConcurrenciaAdaptativa = None,
+                 circuito: CircuitBreaker = None, max_reintentos: int = LLM_MAX_RETRIES,
+                 backoff_base: float = LLM_BACKOFF_BASE, backoff_max: float = LLM_BACKOFF_MAX,
+                 factor_latencia: float = LLM_LATENCY_FACTOR):
+        self.peticiones = TokenBucket(rpm / 60, max(1.0, rpm / 6)) if rpm else None
+        self.tokens = TokenBucket(tpm / 60, max(1.0, tpm / 6)) if tpm else None
+        self.concurrencia = concurrencia or ConcurrenciaAdaptativa()
+        self.circuito = circuito or CircuitBreaker()
+        self.max_reintentos = max_reintentos
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.factor_latencia = factor_latencia
+        self._latencia_media = {}  # perfil -> media móvil exponencial de la latencia (segundos)
+        self._pausa_hasta = 0.0  # Retry-After de un 429: ninguna llamada sale antes de este instante (monotonic)
+        self._lock = threading.Lock()
+
+    def _tokens_estimados(self, mensajes: Iterable, max_tokens: int) -> float:
+        if self.tokens is None:
+            return 0
+        prompt = sum(count_tokens(mensaje.content) for mensaje in mensajes)
+        return min(self.tokens.capacidad, prompt + max_tokens)
+
+    def _comprobar_circuito(self):
+        if not self.circuito.permitir():
+            raise CircuitoAbierto("Circuito del LLM abierto por fallos repetidos; se reintentará más tarde")
+
+    def _espera_pausa(self) -> float:
+        return max(0.0, self._pausa_hasta - time.monotonic())
+
+    def _exito(self, perfil: str, segundos: float):
+        self.circuito.registrar_exito()
+        with self._lock:
+            media = self._latencia_media.get(perfil)
+            self._latencia_media[perfil] = segundos if media is None else 0.9 * media + 0.1 * segundos
+        if media is not None and segundos > self.factor_latencia * media:
+            self.concurrencia.reducir()
+        else:
+            self.concurrencia.aumentar()
+
+    def _fallo(self, perfil: str, e: Exception, intento: int) -> Optional[float]:
+        """Registra un intento fallido; devuelve los segundos a esperar antes de reintentar o None si no se reintenta."""
+        if _es_rate_limit(e):
+            self.circuito.registrar_exito()
+            self.concurrencia.reducir()
+            motivo = "rate_limit"
+        elif _es_fallo_del_servicio(e):
+            self.circuito.registrar_fallo()
+            motivo = "error"
+        else:
+            if isinstance(e, openai.APIStatusError):
+                self.circuito.registrar_exito()
+            return None
+        if intento >= self.max_reintentos:
+            return None
+        espera = min(self.backoff_max, self.backoff_base * (2 ** intento))
+        espera = random.uniform(espera / 2, espera)
+        retry_after = _retry_after(e)
+        if retry_after is not None:
+            espera = retry_after + random.uniform(0, self.backoff_base / 2)
+            if motivo == "rate_limit":
+                with self._lock:
+                    self._pausa_hasta = max(self._pausa_hasta, time.monotonic() + retry_after)
+        LLM_REINTENTOS.inc(perfil=perfil, motivo=motivo)
+        return espera
+
+    def _admitir(self, tokens: float):
+        """Espera turno (circuito, pausa por 429, cuotas y concurrencia); ocupa un hueco de concurrencia."""
+        self._comprobar_circuito()
+        time.sleep(self._espera_pausa())
+        if self.peticiones is not None:
+            self.peticiones.acquire()
+        if tokens:
+            self.tokens.acquire(tokens)
+        self.concurrencia.adquirir()
+
+    async def _aadmitir(self, tokens: float):
+        self._comprobar_circuito()
+        await asyncio.sleep(self._espera_pausa())
+        if self.peticiones is not None:
+            await self.peticiones.aacquire()
+        if tokens:
+            await self.tokens.aacquire(tokens)
+        await self.concurrencia.aadquirir()
+
+    def ejecutar(self, perfil: str, llamada: Callable[[], T], mensajes: Iterable = (), max_tokens: int = 0) -> T:
+        """Hace la llamada respetando cuotas, concurrencia y circuito, reintentando los errores transitorios."""
+        tokens = self._tokens_estimados(mensajes, max_tokens)
+        intento = 0
+        while True:
+            self._admitir(tokens)
+            inicio = time.perf_counter()
+            try:
+                resultado = llamada()
+            except Exception as e:
+                espera = self._fallo(perfil, e, intento)
+                if espera is None:
+                    raise
+            else:
+                self._exito(perfil, time.perf_counter() - inicio)
+                return resultado
+            finally:
+                self.concurrencia.liberar()
+            time.sleep(espera)
+            intento += 1
+
+    async def aejecutar(self, perfil: str, llamada: Callable[[], Awaitable[T]], mensajes: Iterable = (),
+                        max_tokens: int = 0) -> T:
+        """Versión asíncrona de ejecutar: llamada devuelve una corrutina nueva en cada intento."""
+        tokens = self._tokens_estimados(mensajes, max_tokens)
+        intento = 0
+        while True:
+            await self._aadmitir(tokens)
+            inicio = time.perf_counter()
+            try:
+                resultado = await llamada()
+            except Exception as e:
+                espera = self._fallo(perfil, e, intento)
+                if espera is None:
+                    raise
+            else:
+                self._exito(perfil, time.perf_counter() - inicio)
+                return resultado
+            finally:
+                self.concurrencia.liberar()
+            await asyncio.sleep(espera)
+            intento += 1
+
+    @contextmanager
+    def ranura(self, perfil: str, mensajes: Iterable = (), max_tokens: int = 0):
+        """
+        Turno para una respuesta en streaming: ocupa la concurrencia mientras dura el bloque y registra el resultado,
+        pero no reintenta (los fragmentos ya entregados no se pueden repetir). Cortar el stream cuenta como éxito.
+        """
+        self._admitir(self._tokens_estimados(mensajes, max_tokens))
+        inicio = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self._fallo(perfil, e, self.max_reintentos)
+            raise
+        except GeneratorExit:
+            self._exito(perfil, time.perf_counter() - inicio)
+            raise
+        else:
+            self._exito(perfil, time.perf_counter() - inicio)
+        finally:
+            self.concurrencia.liberar()
+
+    @asynccontextmanager
+    async def aranura(self, perfil: str, mensajes: Iterable = (), max_tokens: int = 0):
+        """Versión asíncrona de ranura."""
+        await self._aadmitir(self._tokens_estimados(mensajes, max_tokens))
+        inicio = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self._fallo(perfil, e, self.max_reintentos)
+            raise
+        except GeneratorExit:
+            self._exito(perfil, time.perf_counter() - inicio)
+            raise
+        else:
+            self._exito(perfil, time.perf_counter() - inicio)
+        finally:
+            self.concurrencia.liberar()
+
+
+# Regulador global compartido por todos los IAClient
+llm_governor = LLMGovernor()
@@ -0,0 +1,83 @@
+# Pool de modelos LLM compartido por todo el proceso
+"""
+Un único AzureChatOpenAI por proceso (configuración leída una vez y pool HTTP compartido) y, por cada perfil de
+IAClient.PERFILES, una vista del mismo modelo con los parámetros de muestreo del perfil ligados con bind:
+temperature, top_p y max_tokens se envían en cada llamada en lugar de construir un cliente por perfil.
+Cambiar de perfil (IAClient.set_perfil, procesar_mensaje(perfil=...)) solo elige otra vista.
+Un perfil puede usar otro despliegue de Azure (p. ej. uno más barato para los presupuestos agotados, ver
+ia/token_metering.py): se crea un modelo base por despliegue, compartido igualmente por sus perfiles.
+"""
+import threading
+from typing import Callable, Dict
+import httpx
+from langchain_core.runnables import Runnable
+from langchain_openai import AzureChatOpenAI
+from utils.env_loader import get_env_variable
+
+
+class LLMPool:
+    """
+    :param perfiles: nombre de perfil -> parámetros de muestreo (temperature, top_p, max_tokens).
+    :param http_client: función que devuelve el cliente httpx compartido (síncrono).
+    :param http_async_client: función que devuelve el cliente httpx compartido asíncrono.
+    :param despliegues: perfil -> despliegue de Azure, para los perfiles que no usan AZURE_OPENAI_DEPLOYMENT_NAME
+                        (un despliegue vacío equivale al de por defecto).
+    """
+
+    def __init__(self, perfiles: Dict[str, dict], http_client: Callable[[], httpx.Client] = None,
+                 http_async_client: Callable[[], httpx.AsyncClient] = None, despliegues: Dict[str, str] = None):
+        self.perfiles = perfiles
+        self.http_client = http_client
+        self.http_async_client = http_async_client
+        self.deployment_name = get_env_variable("AZURE_OPENAI_DEPLOYMENT_NAME", "")
+        self.endpoint = get_env_variable("AZURE_OPENAI_ENDPOINT", "")
+        self.api_version = get_env_variable("AZURE_OPENAI_API_VERSION", "2024-02-15-preview")
+        self.api_key = get_env_variable("AZURE_OPENAI_API_KEY", "")
+        self.despliegues = {perfil: despliegue for perfil, despliegue in (despliegues or {}).items() if despliegue}
+        self._bases = {}  # despliegue -> AzureChatOpenAI
+        self._modelos = {}
+        self._lock = threading.Lock()
+
+    def despliegue(self, perfil: str) -> str:
+        """Despliegue de Azure al que van las llamadas del perfil."""
+        return self.despliegues.get(perfil, self.deployment_name)
+
+    def _crear_base(self, despliegue: str) -> AzureChatOpenAI:
+        return AzureChatOpenAI(
+            azure_deployment=despliegue,
+            azure_endpoint=self.endpoint,
+            api_version=self.api_version,
+            api_key=self.api_key,
+            max_retries=0,  # Los reintentos los gestiona ia/llm_governor.py
+            http_client=self.http_client() if self.http_client else None,
+            http_async_client=self.http_async_client() if self.http_async_client else None
+        )
+
+    @property
+    def base(self) -> AzureChatOpenAI:
+        """Modelo del despliegue por defecto sin parámetros de muestreo (se crea la primera vez que se usa)."""
+        return self._base_de(self.deployment_name)
+
+    def _base_de(self, despliegue: str) -> AzureChatOpenAI:
+        with self._lock:
+            base = self._bases.get(despliegue)
+            if base is None:
+                base = self._bases[despliegue] = self._crear_base(despliegue)
+            return base
+
+    def modelo(self, perfil: str) -> Runnable:
+        """Modelo compartido con los parámetros de muestreo del perfil ligados a cada llamada."""
+        modelo = self._modelos.get(perfil)
+        if modelo is not None:
+            return modelo
+        if perfil not in self.perfiles:
+            raise ValueError(f"Perfil '{perfil}' no definido.")
+        base = self._base_de(self.despliegue(perfil))
+        with self._lock:
+            modelo = self._modelos.get(perfil)
+            if modelo is None:
+                modelo = self._modelos[perfil] = base.bind(**self.perfiles[perfil])
+            return modelo
+
+    def __len__(self):
+        return len(self._modelos)
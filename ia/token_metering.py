@@ -0,0 +1,197 @@
+# Medición del consumo de tokens y presupuestos por campaña
+"""
+Cuenta los tokens de cada llamada real al LLM (las servidas desde ia/llm_cache.py no consumen cuota):
+- Se usan los de usage_metadata de la respuesta; si el proveedor no los devuelve se estiman con tiktoken.
+- El consumo se atribuye a la campaña, historia y escena del email en curso (atribuir_consumo, que el
+  orquestador abre alrededor del grafo) y se guarda en token_usage. Story.tokens_est acumula el total de la historia.
+- Cada campaña tiene un presupuesto mensual de tokens (Campaign.presupuesto_tokens o TOKEN_BUDGET_CAMPAIGN, 0 = sin límite).
+  Al agotarlo, si hay un despliegue más barato (AZURE_OPENAI_DEPLOYMENT_NAME_ECONOMICO), las llamadas de los
+  perfiles caros pasan a su versión económica (PERFIL_ECONOMICO: mismos parámetros y max_tokens, otro despliegue);
+  si no lo hay siguen con su perfil y solo se avisa en el log.
+- Opcionalmente (TOKEN_BUDGET_HARD_MARGIN, fracción del presupuesto; vacío = desactivado), superado el presupuesto
+  en más de ese margen las llamadas de la campaña fallan con PresupuestoAgotado. El orquestador aplaza entonces
+  los emails de la campaña sin gastar sus intentos, hasta que se amplíe el presupuesto o cambie el mes.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, Optional, Tuple
+from api.core.database import SessionLocal
+from api.managers.token_usage_manager import TokenUsageManager
+from utils.env_loader import get_env_variable
+from utils.metrics import LLM_BLOQUEADAS, LLM_DEGRADADAS
+from utils.tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+TOKEN_BUDGET_CAMPAIGN = int(get_env_variable("TOKEN_BUDGET_CAMPAIGN", "0"))
+# Segundos que se reutiliza el consumo leído de la base de datos antes de volver a consultarlo
+TOKEN_BUDGET_REFRESH_SECONDS = float(get_env_variable("TOKEN_BUDGET_REFRESH_SECONDS", "60"))
+
+# Margen sobre el presupuesto a partir del cual se cortan las llamadas (0.2 = al llegar al 120 %; vacío = nunca)
+_margen = get_env_variable("TOKEN_BUDGET_HARD_MARGIN", "")
+TOKEN_BUDGET_HARD_MARGIN = float(_margen) if _margen else None
+# Despliegue de Azure más barato para las campañas que han agotado su presupuesto (vacío = no se degrada)
+DESPLIEGUE_ECONOMICO = get_env_variable("AZURE_OPENAI_DEPLOYMENT_NAME_ECONOMICO", "")
+
+# Perfil al que se degrada cada perfil cuando la campaña ha agotado su presupuesto (ver IAClient.PERFILES)
+PERFIL_ECONOMICO = {
+    "creativa": "creativa_economica",
+    "resumen": "resumen_economico",
+}
+
+
+class PresupuestoAgotado(RuntimeError):
+    """La campaña ha superado su presupuesto de tokens más el margen: no se hacen más llamadas al LLM este mes."""
+
+# (campaign_id, story_id, scene_id) del procesamiento en curso; los hilos y tareas del grafo lo heredan
+_atribucion: ContextVar[Optional[Tuple[Optional[int], Optional[int], Optional[int]]]] = ContextVar(
+    "atribucion_tokens", default=None)
+
+
+@contextmanager
+def atribuir_consumo(campaign_id: Optional[int], story_id: Optional[int] = None, scene_id: Optional[int] = None):
+    """Atribuye a la campaña, historia y escena indicadas las llamadas al LLM hechas dentro del bloque."""
+    token = _atribucion.set((campaign_id, story_id, scene_id))
+    try:
+        yield
+    finally:
+        _atribucion.reset(token)
+
+
+def inicio_de_mes(ahora: datetime = None) -> datetime:
+    """Comienzo (UTC) del mes natural al que se aplica el presupuesto."""
+    ahora = ahora or datetime.now(timezone.utc)
+    return ahora.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _cargar_campana(campaign_id: int, desde: datetime) -> Tuple[int, Optional[int]]:
+    db = SessionLocal()
+    try:
+        return (TokenUsageManager.consumo_campana(db, campaign_id, desde),
+                TokenUsageManager.presupuesto_campana(db, campaign_id))
+    finally:
+        db.close()
+
+
+def _persistir(perfil: str, prompt_tokens: int, completion_tokens: int, campaign_id: Optional[int],
+               story_id: Optional[int], scene_id: Optional[int]):
+    db = SessionLocal()
+    try:
+        TokenUsageManager.registrar(db, perfil, prompt_tokens, completion_tokens, campaign_id, story_id, scene_id)
+    finally:
+        db.close()
+
+
+class MedidorTokens:
+    """
+    :param cargar_campana: función (campaign_id, desde) -> (tokens consumidos desde la fecha, presupuesto o None).
+    :param persistir: función (perfil, prompt_tokens, completion_tokens, campaign_id, story_id, scene_id).
+    :param presupuesto_por_defecto: tokens al mes de las campañas sin presupuesto propio (0 = sin límite).
+    :param perfiles_economicos: perfil -> perfil al que se degrada con el presupuesto agotado ({} = no se degrada).
+    :param margen_corte: fracción del presupuesto que se puede superar antes de cortar las llamadas (None = nunca).
+    """
+
+    def __init__(self, cargar_campana: Callable = _cargar_campana, persistir: Callable = _persistir,
+                 presupuesto_por_defecto: int = TOKEN_BUDGET_CAMPAIGN,
+                 refresco_segundos: float = TOKEN_BUDGET_REFRESH_SECONDS,
+                 perfiles_economicos: Dict[str, str] = PERFIL_ECONOMICO if DESPLIEGUE_ECONOMICO else None,
+                 margen_corte: Optional[float] = TOKEN_BUDGET_HARD_MARGIN):
+        self.cargar_campana = cargar_campana
+        self.persistir = persistir
+        self.presupuesto_por_defecto = presupuesto_por_defecto
+        self.refresco_segundos = refresco_segundos
+        self.perfiles_economicos = perfiles_economicos or {}
+        self.margen_corte = margen_corte
+        self._campanas = {}  # campaign_id -> [mes, caduca (monotonic), consumo, presupuesto]
+        self._lock = threading.Lock()
+
+    def _estado_campana(self, campaign_id: int):
+        mes = inicio_de_mes()
+        with self._lock:
+            estado = self._campanas.get(campaign_id)
+            if estado is not None and estado[0] == mes and estado[1] > time.monotonic():
+                return estado
+        consumo, presupuesto = self.cargar_campana(campaign_id, mes)
+        if presupuesto is None:
+            presupuesto = self.presupuesto_por_defecto
+        estado = [mes, time.monotonic() + self.refresco_segundos, consumo, presupuesto]
+        with self._lock:
+            self._campanas[campaign_id] = estado
+        return estado
+
+    def uso(self, campaign_id: Optional[int]) -> Optional[float]:
+        """Fracción del presupuesto mensual consumida por la campaña (None si no tiene límite o no se sabe)."""
+        if campaign_id is None:
+            return None
+        try:
+            _, _, consumo, presupuesto = self._estado_campana(campaign_id)
+        except Exception as e:
+            logger.warning(f"No se pudo consultar el presupuesto de tokens de la campaña {campaign_id}: {e}")
+            return None
+        return consumo / presupuesto if presupuesto else None
+
+    def agotado(self, campaign_id: Optional[int]) -> bool:
+        """True si la campaña ha consumido este mes todo su presupuesto."""
+        uso = self.uso(campaign_id)
+        return uso is not None and uso >= 1
+
+    def bloqueada(self, campaign_id: Optional[int]) -> bool:
+        """True si hay margen de corte y la campaña lo ha superado: sus llamadas al LLM se rechazan."""
+        if self.margen_corte is None:
+            return False
+        uso = self.uso(campaign_id)
+        return uso is not None and uso >= 1 + self.margen_corte
+
+    def perfil_para(self, perfil: str) -> str:
+        """
+        Perfil con el que hacer la llamada: el pedido o, si la campaña en curso agotó su presupuesto, su versión
+        económica. Lanza PresupuestoAgotado si la campaña supera el presupuesto en más de margen_corte.
+        """
+        atribucion = _atribucion.get()
+        uso = self.uso(atribucion[0]) if atribucion is not None else None
+        if uso is None or uso < 1:
+            return perfil
+        campaign_id = atribucion[0]
+        if self.margen_corte is not None and uso >= 1 + self.margen_corte:
+            logger.error(f"Campaña {campaign_id} al {uso:.0%} de su presupuesto de tokens: llamada '{perfil}' rechazada")
+            LLM_BLOQUEADAS.inc(perfil=perfil)
+            raise PresupuestoAgotado(f"La campaña {campaign_id} ha superado su presupuesto de tokens ({uso:.0%})")
+        economico = self.perfiles_economicos.get(perfil)
+        if economico is None:
+            logger.warning(f"Campaña {campaign_id} al {uso:.0%} de su presupuesto de tokens (perfil '{perfil}')")
+            return perfil
+        logger.info(f"Campaña {campaign_id} sin presupuesto de tokens: perfil '{perfil}' degradado a '{economico}'")
+        LLM_DEGRADADAS.inc(perfil=perfil, perfil_degradado=economico)
+        return economico
+
+    def registrar(self, perfil: str, mensajes: Iterable, response) -> Tuple[int, int]:
+        """
+        Registra los tokens de una llamada y los atribuye al procesamiento en curso.
+        Un fallo al guardarlos se registra en el log pero no interrumpe el procesamiento.
+        """
+        uso = getattr(response, "usage_metadata", None) or {}
+        prompt_tokens = uso.get("input_tokens")
+        if prompt_tokens is None:
+            prompt_tokens = sum(count_tokens(mensaje.content) for mensaje in mensajes)
+        completion_tokens = uso.get("output_tokens")
+        if completion_tokens is None:
+            completion_tokens = count_tokens(getattr(response, "content", ""))
+        campaign_id, story_id, scene_id = _atribucion.get() or (None, None, None)
+        if campaign_id is not None:
+            with self._lock:
+                estado = self._campanas.get(campaign_id)
+                if estado is not None:
+                    estado[2] += prompt_tokens + completion_tokens
+        try:
+            self.persistir(perfil, prompt_tokens, completion_tokens, campaign_id, story_id, scene_id)
+        except Exception as e:
+            logger.warning(f"No se pudo guardar el consumo de tokens ({prompt_tokens}+{completion_tokens}): {e}")
+        return prompt_tokens, completion_tokens
+
+
+# Instancia global del medidor
+medidor_tokens = MedidorTokens()
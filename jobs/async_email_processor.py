@@ -0,0 +1,161 @@
+# Procesador asíncrono de emails particionado por escena
+"""
+Alternativa a SceneWorkerPool (jobs/scene_worker_pool.py) que corre en el bucle de eventos de FastAPI:
+- Una tarea asyncio por escena con emails pendientes, que la drena por orden de fecha con
+  orquestador_langgraph.aprocesar_email (grafo con ainvoke, LLM asíncrono y AsyncSession).
+- Como mucho max_concurrencia escenas a la vez; al no ocupar un hilo por llamada al LLM en curso,
+  el límite puede ser bastante mayor que EMAIL_WORKERS_MAX.
+- Mismas reglas que el pool de hilos: enfriamiento de la escena tras un fallo y el bucle se despierta
+  cuando una escena termina o la ingesta avisa de emails nuevos (email_notifier).
+Se elige con EMAIL_PROCESSOR_MODE=async (ver main.py).
+"""
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, List
+from api.core.database import get_async_sessionmaker
+from api.core.notifications import email_notifier
+from api.managers.email_manager import EmailManager
+from ia.ia_client import IAClient
+from ia.langgraph.orquestador_langgraph import orquestador_langgraph
+from jobs.scene_worker_pool import EMAIL_SCENE_RETRY_SECONDS, EMAIL_PROCESSOR_IDLE_MAX
+from utils.env_loader import get_env_variable
+
+EMAIL_ASYNC_CONCURRENCY = int(get_env_variable("EMAIL_ASYNC_CONCURRENCY", "32"))
+
+
+class _EventoDesdeHilos:
+    """Adapta un asyncio.Event a la interfaz set() que usa Notifier desde su hilo de escucha."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, evento: asyncio.Event):
+        self._loop = loop
+        self._evento = evento
+
+    def set(self):
+        self._loop.call_soon_threadsafe(self._evento.set)
+
+
+class AsyncSceneProcessor:
+    """
+    :param procesar_escena: corrutina que procesa el siguiente email de la escena; devuelve True si procesó uno
+                            y False si no quedaban emails. Si lanza una excepción la escena entra en enfriamiento.
+    :param listar_escenas: corrutina que devuelve los ids de escena con emails pendientes, por antigüedad.
+    :param notifier: opcional, api.core.notifications.Notifier que avisa de emails nuevos.
+    """
+
+    def __init__(self, procesar_escena: Callable[[int], Awaitable[bool]],
+                 listar_escenas: Callable[[], Awaitable[List[int]]],
+                 max_concurrencia: int = EMAIL_ASYNC_CONCURRENCY, enfriamiento: float = EMAIL_SCENE_RETRY_SECONDS,
+                 notifier=None):
+        self.procesar_escena = procesar_escena
+        self.listar_escenas = listar_escenas
+        self.max_concurrencia = max_concurrencia
+        self.enfriamiento = enfriamiento
+        self.notifier = notifier
+        self._reintentar_en = {}  # scene_id -> instante (monotonic) a partir del cual se puede reintentar
+        self._tareas: Dict[int, asyncio.Task] = {}
+        self._hueco_libre = None  # asyncio.Event, se crea dentro del bucle de eventos
+        self.procesados = 0
+
+    @property
+    def escenas_activas(self):
+        return set(self._tareas)
+
+    def _preparar(self):
+        if self._hueco_libre is None:
+            self._hueco_libre = asyncio.Event()
+            if self.notifier is not None:
+                self.notifier.suscribir(_EventoDesdeHilos(asyncio.get_running_loop(), self._hueco_libre))
+
+    async def planificar(self) -> int:
+        """Lanza una tarea por cada escena pendiente que no esté ya en curso. Devuelve cuántas se han lanzado."""
+        self._preparar()
+        if len(self._tareas) >= self.max_concurrencia:
+            return 0
+        lanzadas = 0
+        ahora = time.monotonic()
+        for scene_id in await self.listar_escenas():
+            if len(self._tareas) >= self.max_concurrencia:
+                break
+            if scene_id in self._tareas or self._reintentar_en.get(scene_id, 0) > ahora:
+                continue
+            self._reintentar_en.pop(scene_id, None)
+            self._tareas[scene_id] = asyncio.create_task(self._drenar_escena(scene_id), name=f"escena-{scene_id}")
+            lanzadas += 1
+        return lanzadas
+
+    async def _drenar_escena(self, scene_id: int):
+        try:
+            while await self.procesar_escena(scene_id):
+                self.procesados += 1
+        except Exception as e:
+            print(f"Error procesando la escena {scene_id}, se reintentará en {self.enfriamiento:.0f}s: {e}")
+            self._reintentar_en[scene_id] = time.monotonic() + self.enfriamiento
+        finally:
+            self._tareas.pop(scene_id, None)
+            self._hueco_libre.set()
+
+    async def esperar(self, timeout: float) -> bool:
+        """Espera a que una escena termine, lleguen emails nuevos o pase timeout."""
+        self._preparar()
+        try:
+            await asyncio.wait_for(self._hueco_libre.wait(), timeout)
+            liberado = True
+        except asyncio.TimeoutError:
+            liberado = False
+        self._hueco_libre.clear()
+        return liberado
+
+    async def drenar(self, timeout: float = None):
+        """Procesa hasta que no quedan escenas pendientes ni tareas activas (útil en pruebas y benchmarks)."""
+        limite = None if timeout is None else time.monotonic() + timeout
+        while True:
+            await self.planificar()
+            if not self._tareas:
+                return
+            if limite is not None and time.monotonic() > limite:
+                return
+            await self.esperar(0.05)
+
+    async def run_forever(self, intervalo_segundos: float = 5, intervalo_maximo: float = EMAIL_PROCESSOR_IDLE_MAX):
+        """Bucle principal, con el mismo sondeo adaptativo que SceneWorkerPool.run_forever."""
+        espera = intervalo_segundos
+        while True:
+            try:
+                hay_trabajo = await self.planificar() > 0 or bool(self._tareas)
+            except Exception as e:
+                print(f"Error planificando escenas: {e}")
+                hay_trabajo = False
+            if hay_trabajo:
+                espera = intervalo_segundos
+            despertado = await self.esperar(espera)
+            if despertado:
+                espera = intervalo_segundos
+            elif not hay_trabajo:
+                espera = min(espera * 2, max(intervalo_maximo, intervalo_segundos))
+
+
+async def _listar_escenas_pendientes() -> List[int]:
+    async with get_async_sessionmaker()() as db:
+        return await db.run_sync(EmailManager.get_claimable_scene_ids)
+
+
+async def _procesar_siguiente_email_de_escena(scene_id: int) -> bool:
+    """Igual que en jobs/email_db_cron.py, con aprocesar_email."""
+    resultado = await orquestador_langgraph.aprocesar_email(scene_id=scene_id, agrupar=True)
+    if resultado.get('reason') in ('no_pending_emails', 'presupuesto_agotado'):
+        return False
+    if resultado.get('success') == True:
+        print(f"Email(s) procesado(s) exitosamente: {resultado.get('email_ids')} (escena {scene_id})")
+        return True
+    raise RuntimeError(f"Error en procesamiento del email {resultado.get('email_id')}: "
+                       f"{resultado.get('error', resultado.get('errors', 'Error desconocido'))}")
+
+
+async def start_async_email_processor(intervalo_segundos=5, max_concurrencia=EMAIL_ASYNC_CONCURRENCY):
+    """Procesa los emails pendientes dentro del bucle de eventos, hasta max_concurrencia escenas a la vez."""
+    print(f"Iniciando procesador asíncrono de emails ({max_concurrencia} escenas a la vez, "
+          f"sondeo de respaldo cada {intervalo_segundos}-{EMAIL_PROCESSOR_IDLE_MAX:.0f} segundos)...")
+    await asyncio.to_thread(IAClient.calentar_conexiones)
+    procesador = AsyncSceneProcessor(_procesar_siguiente_email_de_escena, _listar_escenas_pendientes,
+                                     max_concurrencia, notifier=email_notifier)
+    await procesador.run_forever(intervalo_segundos)
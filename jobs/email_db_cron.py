@@ -1,48 +1,46 @@
-import time
-import threading
-from sqlalchemy.orm import Session
 from api.core.database import SessionLocal
+from api.core.notifications import email_notifier
+from ia.ia_client import IAClient
 from api.managers.email_manager import EmailManager
 from ia.langgraph.orquestador_langgraph import orquestador_langgraph
+from jobs.scene_worker_pool import SceneWorkerPool, EMAIL_WORKERS_MAX, EMAIL_PROCESSOR_IDLE_MAX
 
-def start_email_db_processor(intervalo_segundos=5):
+
+def _listar_escenas_pendientes():
+    db = SessionLocal()
+    try:
+        return EmailManager.get_claimable_scene_ids(db)
+    finally:
+        db.close()
+
+
+def _procesar_siguiente_email_de_escena(scene_id: int) -> bool:
+    """
+    Procesa el siguiente email de la escena (junto con los que se agrupan con él en un mismo turno).
+    Devuelve True si se procesó y False si no quedan emails (o se aplazaron por falta de presupuesto de tokens).
+    Lanza RuntimeError si el procesamiento falla, para que el pool aplique el enfriamiento a la escena.
+    """
+    resultado = orquestador_langgraph.procesar_email(scene_id=scene_id, agrupar=True)
+    if resultado.get('reason') in ('no_pending_emails', 'presupuesto_agotado'):
+        return False
+    if resultado.get('success') == True:
+        print(f"Email(s) procesado(s) exitosamente: {resultado.get('email_ids')} (escena {scene_id})")
+        return True
+    raise RuntimeError(f"Error en procesamiento del email {resultado.get('email_id')}: "
+                       f"{resultado.get('error', resultado.get('errors', 'Error desconocido'))}")
+
+
+def start_email_db_processor(intervalo_segundos=5, max_concurrencia=EMAIL_WORKERS_MAX):
     """
-    Cron que verifica cada X segundos si debe procesar emails.
-    Solo se ejecuta si no hay otro proceso de emails en marcha.
+    Procesa los emails pendientes de la base de datos con un pool de workers particionado por escena:
+    orden estricto dentro de cada escena y hasta max_concurrencia escenas en paralelo.
+    Se buscan nuevas escenas en cuanto la ingesta avisa de emails nuevos (email_notifier) o un worker queda libre;
+    sin avisos se sondea cada intervalo_segundos, alargando el intervalo mientras no haya trabajo.
     """
-    is_processing = False
-    processing_lock = threading.Lock()
-    print(f"Iniciando cron de emails de base de datos (cada {intervalo_segundos} segundos)...")
-    
-    while True:
-        try:
-            # Verificar si ya se está procesando
-            with processing_lock:
-                if is_processing:
-                    print("Proceso de emails de base de datos ya en ejecución. Esperando...")
-                    time.sleep(intervalo_segundos)
-                    continue
-                
-                # Marcar como en proceso
-                is_processing = True
-            
-            print("Iniciando procesamiento de emails pendientes...")
-            # Usar el nuevo orquestador LangGraph
-            resultado = orquestador_langgraph.procesar_email()
-            
-            if resultado.get('success') == True:
-                # Aquí podrías guardar el resultado en la base de datos si es necesario                
-                print(f"Email procesado exitosamente: {resultado.get('email_id')}")
-            else:
-                print(f"Error en procesamiento: {resultado.get('error', 'Error desconocido')}") 
-            
-        except Exception as e:
-            print(f"Error en cron de emails: {e}")
-            
-        finally:
-            # Liberar el lock
-            with processing_lock:
-                is_processing = False
-            print("Procesamiento de emails de base de datos completado. Esperando al próximo ciclo...")
-            
-        time.sleep(intervalo_segundos)
\ No newline at end of file
+    print(f"Iniciando procesador de emails de base de datos ({max_concurrencia} escenas en paralelo, "
+          f"sondeo de respaldo cada {intervalo_segundos}-{EMAIL_PROCESSOR_IDLE_MAX:.0f} segundos)...")
+    # Abrir la conexión con el LLM antes del primer email
+    IAClient.calentar_conexiones()
+    pool = SceneWorkerPool(_procesar_siguiente_email_de_escena, _listar_escenas_pendientes, max_concurrencia,
+                           notifier=email_notifier)
+    pool.run_forever(intervalo_segundos)
@@ -1,10 +1,39 @@
-# Tarea programada para consultar emails cada 15 segundos
+# Tarea programada para leer el correo entrante
 import time
-from services.gmail_service import GmailService
+from services.transports import get_transport
+from services.gmail_client_manager import gmail_client_manager
 
-def start_email_cron():
+def start_email_cron(intervalo_segundos=15):
+    """
+    Lee el correo con el transporte configurado (MAIL_TRANSPORT) reutilizando la misma instancia durante toda la vida del proceso.
+    Entre ciclos espera con wait_for_mail: los transportes push (IMAP IDLE, Maildir) despiertan en cuanto llega
+    un mensaje; Gmail REST sigue sondeando cada intervalo_segundos.
+    En cada ciclo informa del tiempo dedicado a preparar el cliente frente al trabajo real.
+    Mientras quede backlog en la bandeja (y el ciclo anterior haya avanzado) se lanza otro ciclo sin esperar.
+    """
+    transport = None
     while True:
         print("Buscando emails no leídos del correo...")
-        gmailService = GmailService()
-        gmailService.fetch_all_unread_emails()        
-        time.sleep(15)
+        inicio = time.perf_counter()
+        gmail_client_manager.consumir_tiempo_setup()
+        resumen = None
+        try:
+            if transport is None:
+                transport = get_transport()
+            resumen = transport.poll()
+        except Exception as e:
+            print(f"Error en cron de lectura de emails: {e}")
+        total = time.perf_counter() - inicio
+        setup = gmail_client_manager.consumir_tiempo_setup()
+        print(f"Ciclo de lectura completado en {total:.3f}s (preparación del cliente: {setup:.3f}s, trabajo: {total - setup:.3f}s)")
+        if resumen and resumen['pendientes'] > 0 and (resumen['guardados'] + resumen['ignorados'] + resumen['duplicados']) > 0:
+            print(f"Backlog pendiente: {resumen['pendientes']} mensajes. Continuando sin esperar...")
+            continue
+        if transport is None:
+            time.sleep(intervalo_segundos)
+            continue
+        try:
+            transport.wait_for_mail(intervalo_segundos)
+        except Exception as e:
+            print(f"Error esperando correo nuevo: {e}")
+            time.sleep(intervalo_segundos)
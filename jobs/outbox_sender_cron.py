@@ -0,0 +1,122 @@
+# Tarea programada que envía las respuestas encoladas en el outbox
+"""
+Drena la tabla outbox_emails:
+- Reclama lotes de respuestas pendientes (FOR UPDATE SKIP LOCKED).
+- Las envía en paralelo con un ThreadPoolExecutor, respetando la cuota de Gmail con un token bucket
+  (messages.send cuesta 100 unidades y el límite por usuario es 250 unidades/s).
+- Los fallos se reintentan con backoff exponencial; los errores permanentes (4xx salvo 429) no se reintentan.
+- Registra la latencia de entrega (desde que se encola hasta que Gmail acepta el envío).
+El procesamiento con IA nunca espera al envío, y un fallo de envío no obliga a reprocesar el email.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+from googleapiclient.errors import HttpError
+from api.core.database import SessionLocal
+from api.managers.outbox_manager import OutboxManager
+from utils.env_loader import get_env_variable
+from utils.rate_limit import TokenBucket
+
+OUTBOX_SENDER_WORKERS = int(get_env_variable("OUTBOX_SENDER_WORKERS", "4"))
+OUTBOX_BATCH_SIZE = int(get_env_variable("OUTBOX_BATCH_SIZE", "20"))
+OUTBOX_MAX_INTENTOS = int(get_env_variable("OUTBOX_MAX_INTENTOS", "5"))
+OUTBOX_BACKOFF_BASE = float(get_env_variable("OUTBOX_BACKOFF_BASE", "5"))
+OUTBOX_STALE_TIMEOUT = int(get_env_variable("OUTBOX_STALE_TIMEOUT", "300"))
+# Envíos por segundo y ráfaga máxima
+GMAIL_SEND_RATE = float(get_env_variable("GMAIL_SEND_RATE", "2"))
+GMAIL_SEND_BURST = float(get_env_variable("GMAIL_SEND_BURST", "5"))
+
+
+def _es_reintentable(error: Exception) -> bool:
+    """Los errores de red, 429 y 5xx se reintentan; el resto de 4xx son permanentes."""
+    if isinstance(error, HttpError):
+        status = getattr(error.resp, 'status', None)
+        return status is None or status == 429 or status >= 500
+    return True
+
+
+class OutboxSender:
+    """Remitente del outbox con concurrencia limitada y control de cuota."""
+
+    def __init__(self, gmail_service=None, workers=OUTBOX_SENDER_WORKERS,
+                 rate_limiter=None, batch_size=OUTBOX_BATCH_SIZE):
+        self._gmail_service = gmail_service
+        self.batch_size = batch_size
+        self.rate_limiter = rate_limiter or TokenBucket(GMAIL_SEND_RATE, GMAIL_SEND_BURST)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="outbox")
+
+    @property
+    def gmail_service(self):
+        if self._gmail_service is None:
+            # Creación diferida: GmailService valida el token contra la API al construirse
+            from services.gmail_service import GmailService
+            self._gmail_service = GmailService()
+        return self._gmail_service
+
+    def drain_once(self):
+        """
+        Reclama un lote y lo envía. Devuelve (enviados, fallidos).
+        """
+        db = SessionLocal()
+        try:
+            recuperados = OutboxManager.recover_stale(db, OUTBOX_STALE_TIMEOUT)
+            if recuperados:
+                print(f"Outbox: {recuperados} envíos colgados devueltos a pendiente.")
+            lote = OutboxManager.claim_batch(db, self.batch_size)
+        finally:
+            db.close()
+        if not lote:
+            return 0, 0
+        resultados = list(self.executor.map(self._enviar, lote))
+        enviados = sum(1 for ok in resultados if ok)
+        return enviados, len(resultados) - enviados
+
+    def _enviar(self, outbox) -> bool:
+        self.rate_limiter.acquire()
+        inicio = time.perf_counter()
+        try:
+            respuesta = self.gmail_service.send_message(
+                outbox.recipients, outbox.subject, outbox.body,
+                thread_id=outbox.thread_id or None,
+                in_reply_to_message_id=outbox.in_reply_to or None,
+            )
+        except Exception as e:
+            db = SessionLocal()
+            try:
+                estado = OutboxManager.mark_failed(
+                    db, outbox.id, str(e), max_intentos=OUTBOX_MAX_INTENTOS,
+                    backoff_base=OUTBOX_BACKOFF_BASE, reintentable=_es_reintentable(e)
+                )
+                print(f"Outbox: error enviando respuesta {outbox.id} (intento {outbox.intentos}, "
+                      f"estado {estado.estado.value if estado else '?'}): {e}")
+            finally:
+                db.close()
+            return False
+        duracion_ms = (time.perf_counter() - inicio) * 1000
+        db = SessionLocal()
+        try:
+            enviado = OutboxManager.mark_sent(db, outbox.id, respuesta.get('id'))
+            latencia = enviado.latencia_entrega_ms if enviado else None
+            print(f"Outbox: respuesta {outbox.id} enviada a {outbox.recipients} en {duracion_ms:.0f} ms"
+                  f"{f' (latencia de entrega {latencia:.0f} ms)' if latencia is not None else ''}")
+        finally:
+            db.close()
+        return True
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+
+def start_outbox_sender(intervalo_segundos=1):
+    """
+    Drena el outbox continuamente. Mientras haya lotes completos no espera entre ciclos.
+    """
+    sender = OutboxSender()
+    print(f"Iniciando remitente del outbox ({OUTBOX_SENDER_WORKERS} hilos, {GMAIL_SEND_RATE} envíos/s)...")
+    while True:
+        try:
+            enviados, fallidos = sender.drain_once()
+            if enviados + fallidos >= sender.batch_size:
+                continue
+        except Exception as e:
+            print(f"Error en remitente del outbox: {e}")
+        time.sleep(intervalo_segundos)
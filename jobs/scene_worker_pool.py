@@ -0,0 +1,128 @@
+# Pool de workers particionado por escena
+"""
+Procesa emails pendientes en paralelo entre escenas y en serie dentro de cada escena:
+- Cada escena con emails pendientes se asigna a un único worker, que la drena por orden de fecha.
+- Escenas distintas se procesan a la vez, hasta max_concurrencia workers.
+- Cuando un worker termina la escena se libera y se vuelve a planificar en el siguiente escaneo.
+  Si falla un email, la escena no se reintenta hasta pasado el enfriamiento (el resto sigue procesándose).
+Así una llamada lenta al LLM solo retrasa su propia mesa de juego.
+
+El bucle principal se despierta en cuanto un worker queda libre o la ingesta avisa de emails nuevos
+(notifier); si no hay nada que hacer, el intervalo de sondeo se duplica hasta EMAIL_PROCESSOR_IDLE_MAX.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Set
+from utils.env_loader import get_env_variable
+
+EMAIL_WORKERS_MAX = int(get_env_variable("EMAIL_WORKERS_MAX", "4"))
+EMAIL_SCENE_RETRY_SECONDS = float(get_env_variable("EMAIL_SCENE_RETRY_SECONDS", "5"))
+EMAIL_PROCESSOR_IDLE_MAX = float(get_env_variable("EMAIL_PROCESSOR_IDLE_MAX", "60"))
+
+
+class SceneWorkerPool:
+    """
+    :param procesar_escena: procesa el siguiente email de la escena; devuelve True si procesó uno y False si
+                            no quedaban emails. Si lanza una excepción la escena entra en enfriamiento.
+    :param listar_escenas: devuelve los ids de escena con emails pendientes, por antigüedad.
+    :param notifier: opcional, api.core.notifications.Notifier que avisa de emails nuevos.
+    """
+
+    def __init__(self, procesar_escena: Callable[[int], bool], listar_escenas: Callable[[], List[int]],
+                 max_concurrencia: int = EMAIL_WORKERS_MAX, enfriamiento: float = EMAIL_SCENE_RETRY_SECONDS,
+                 notifier=None):
+        self.procesar_escena = procesar_escena
+        self.listar_escenas = listar_escenas
+        self.max_concurrencia = max_concurrencia
+        self.enfriamiento = enfriamiento
+        self._reintentar_en = {}  # scene_id -> instante (monotonic) a partir del cual se puede reintentar
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrencia, thread_name_prefix="escena")
+        self._activas: Set[int] = set()
+        self._lock = threading.Lock()
+        # Se activa cuando un worker queda libre o llegan emails nuevos, para planificar sin esperar al intervalo
+        self._hueco_libre = threading.Event()
+        if notifier is not None:
+            notifier.suscribir(self._hueco_libre)
+        self.procesados = 0
+
+    @property
+    def escenas_activas(self) -> Set[int]:
+        with self._lock:
+            return set(self._activas)
+
+    def planificar(self) -> int:
+        """
+        Asigna workers a escenas pendientes que no estén ya en curso. Devuelve cuántas escenas se han lanzado.
+        """
+        with self._lock:
+            libres = self.max_concurrencia - len(self._activas)
+        if libres <= 0:
+            return 0
+        lanzadas = 0
+        ahora = time.monotonic()
+        for scene_id in self.listar_escenas():
+            with self._lock:
+                if scene_id in self._activas or len(self._activas) >= self.max_concurrencia:
+                    continue
+                if self._reintentar_en.get(scene_id, 0) > ahora:
+                    continue
+                self._reintentar_en.pop(scene_id, None)
+                self._activas.add(scene_id)
+            self.executor.submit(self._drenar_escena, scene_id)
+            lanzadas += 1
+        return lanzadas
+
+    def _drenar_escena(self, scene_id: int):
+        try:
+            while self.procesar_escena(scene_id):
+                with self._lock:
+                    self.procesados += 1
+        except Exception as e:
+            print(f"Error procesando la escena {scene_id}, se reintentará en {self.enfriamiento:.0f}s: {e}")
+            with self._lock:
+                self._reintentar_en[scene_id] = time.monotonic() + self.enfriamiento
+        finally:
+            with self._lock:
+                self._activas.discard(scene_id)
+            self._hueco_libre.set()
+
+    def esperar(self, timeout: float) -> bool:
+        """Espera a que un worker quede libre o a que pase timeout."""
+        liberado = self._hueco_libre.wait(timeout)
+        self._hueco_libre.clear()
+        return liberado
+
+    def drenar(self, timeout: float = None):
+        """Procesa hasta que no quedan escenas pendientes ni workers activos (útil en pruebas y benchmarks)."""
+        limite = None if timeout is None else time.monotonic() + timeout
+        while True:
+            self.planificar()
+            if not self.escenas_activas:
+                return
+            if limite is not None and time.monotonic() > limite:
+                return
+            self.esperar(0.05)
+
+    def run_forever(self, intervalo_segundos: float = 5, intervalo_maximo: float = EMAIL_PROCESSOR_IDLE_MAX):
+        """
+        Bucle principal: planifica escenas y espera a que haya huecos, lleguen emails nuevos o pase el intervalo.
+        Mientras no hay trabajo el intervalo se duplica hasta intervalo_maximo; vuelve al mínimo en cuanto hay actividad.
+        """
+        espera = intervalo_segundos
+        while True:
+            try:
+                hay_trabajo = self.planificar() > 0 or bool(self.escenas_activas)
+            except Exception as e:
+                print(f"Error planificando escenas: {e}")
+                hay_trabajo = False
+            if hay_trabajo:
+                espera = intervalo_segundos
+            despertado = self.esperar(espera)
+            if despertado:
+                espera = intervalo_segundos
+            elif not hay_trabajo:
+                espera = min(espera * 2, max(intervalo_maximo, intervalo_segundos))
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
@@ -2,12 +2,17 @@ from fastapi import FastAPI
 from contextlib import asynccontextmanager
 from sqlalchemy.exc import ProgrammingError
 from api.core.database import Base, engine
-import api.models.email, api.models.player, api.models.character, api.models.scene, api.models.story, api.models.turn, api.models.ruleset, api.models.campaign  # importa aquí todos los modelos que quieras crear
+from api.core.migrations import apply_migrations
+import api.models.email, api.models.player, api.models.character, api.models.scene, api.models.story, api.models.turn, api.models.ruleset, api.models.campaign, api.models.gmail_sync, api.models.outbox, api.models.graph_checkpoint, api.models.token_usage  # importa aquí todos los modelos que quieras crear
 import threading
 from jobs.gmail_service_cron import start_email_cron  # Importa desde la raíz del proyecto
 from jobs.email_db_cron import start_email_db_processor  # Importa desde la raíz del proyecto
-from api.endpoints import email, player, character, scene, story, turn, ruleset, campaign
+from jobs.async_email_processor import start_async_email_processor
+from jobs.outbox_sender_cron import start_outbox_sender
+from api.endpoints import email, player, character, scene, story, turn, ruleset, campaign, metrics
 from utils.logger_config import configure_logging
+from utils.env_loader import get_env_variable
+import asyncio
 
 # Configurar el logger
 logger = configure_logging()
@@ -16,6 +21,7 @@ logger = configure_logging()
 async def lifespan(app: FastAPI):
     try:
         Base.metadata.create_all(bind=engine)
+        apply_migrations(engine)
         logger.info("Tablas comprobadas/creadas correctamente.")
     except ProgrammingError as e:
         logger.error(f"Error al crear tablas: {e}")
@@ -24,10 +30,22 @@ async def lifespan(app: FastAPI):
     email_thread.start()
     logger.info("Proceso de lectura de emails del correo iniciado en segundo plano.")
     # Hilo2: Lanzar el proceso de lectura de emails desde la base de datos
-    email_db_thread = threading.Thread(target=start_email_db_processor, daemon=True)
-    email_db_thread.start()
-    logger.info("Proceso de lectura de emails desde la base de datos iniciado en segundo plano.")
+    # EMAIL_PROCESSOR_MODE=async lo ejecuta como tarea del bucle de eventos (muchos emails a la vez sin un hilo por cada uno)
+    email_db_task = None
+    if get_env_variable("EMAIL_PROCESSOR_MODE", "threads") == "async":
+        email_db_task = asyncio.create_task(start_async_email_processor(), name="email-db-processor")
+        logger.info("Proceso asíncrono de lectura de emails desde la base de datos iniciado.")
+    else:
+        email_db_thread = threading.Thread(target=start_email_db_processor, daemon=True)
+        email_db_thread.start()
+        logger.info("Proceso de lectura de emails desde la base de datos iniciado en segundo plano.")
+    # Hilo3: Enviar las respuestas encoladas en el outbox
+    outbox_thread = threading.Thread(target=start_outbox_sender, daemon=True)
+    outbox_thread.start()
+    logger.info("Remitente del outbox iniciado en segundo plano.")
     yield  # Aquí puede ir el código de shutdown si lo necesitas
+    if email_db_task is not None:
+        email_db_task.cancel()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -37,4 +55,5 @@ app.include_router(character.router)
 app.include_router(scene.router)
 app.include_router(story.router)
 app.include_router(turn.router)
-app.include_router(ruleset.router)
\ No newline at end of file
+app.include_router(ruleset.router)
+app.include_router(metrics.router)
@@ -0,0 +1,228 @@
+# Extracción y limpieza del cuerpo de los emails entrantes
+"""
+Pipeline de cuerpo de email para la ingesta:
+1. Decodifica el cuerpo completo (text/plain preferente, text/html como alternativa) con un tope de tamaño.
+2. Convierte HTML a texto descartando estilos, scripts, citas (blockquote, gmail_quote) y firmas.
+3. Elimina el historial citado ("El ... escribió:", "On ... wrote:", líneas con '>') y las firmas.
+Devuelve el texto limpio junto con los bytes y tokens ahorrados respecto al cuerpo original.
+"""
+import base64
+import re
+from dataclasses import dataclass
+from email.message import Message
+from html import unescape
+from html.parser import HTMLParser
+from utils.env_loader import get_env_variable
+from utils.tokens import count_tokens
+
+EMAIL_BODY_MAX_BYTES = int(get_env_variable("EMAIL_BODY_MAX_BYTES", "65536"))
+
+# Atribución en español de Gmail/Outlook ("El lun, 3 mar 2025 a las 10:00, Ana <ana@x.com> escribió:").
+# Solo cuenta si incluye una fecha, una hora o una dirección de email (ver _FECHA_O_EMAIL_RE): así una línea
+# narrativa como "El mago ... escribió:" no se toma por el inicio de una cita.
+_ATRIBUCION_ES_RE = re.compile(
+    r'^\s*El\s[^\n]{0,300}?(?:\n(?!\s*El\s)[^\n]{0,300}?){0,2}escribi[oó]:\s*$', re.MULTILINE | re.IGNORECASE)
+_FECHA_O_EMAIL_RE = re.compile(
+    r'\d{1,2}:\d{2}'                                                  # hora
+    r'|\d{1,4}[/.-]\d{1,2}[/.-]\d{1,4}'                               # fecha numérica
+    r'|\d{1,2}\s+(?:de\s+)?[a-záéíóú]{3,10}\.?,?\s+(?:de\s+)?\d{4}'  # 3 mar 2025, 3 de marzo de 2025
+    r'|[\w.+-]+@[\w-]+(?:\.[\w-]+)+',                                 # email
+    re.IGNORECASE)
+# Inicio del historial citado: se corta todo lo que venga después
+_QUOTE_HEADER_RES = [
+    re.compile(r'^\s*On\s[^\n]{0,300}?(?:\n[^\n]{0,300}?){0,2}wrote:\s*$', re.MULTILINE | re.IGNORECASE),
+    re.compile(r'^\s*-{2,}\s*(?:Mensaje original|Original Message|Forwarded message|Mensaje reenviado)\s*-{2,}', re.MULTILINE | re.IGNORECASE),
+    re.compile(r'^\s*(?:De|From):\s.+\n\s*(?:Enviado|Sent|Fecha|Date):\s', re.MULTILINE | re.IGNORECASE),
+]
+# Inicio de la firma
+_SIGNATURE_RES = [
+    re.compile(r'^--\s*$', re.MULTILINE),
+    re.compile(r'^\s*(?:Enviado desde mi|Sent from my|Enviado desde|Get Outlook for)\b.*$', re.MULTILINE | re.IGNORECASE),
+]
+_HTML_SKIP_TAGS = {'script', 'style', 'head', 'title', 'blockquote'}
+_HTML_SKIP_CLASSES = {'gmail_quote', 'gmail_signature', 'gmail_extra', 'moz-cite-prefix', 'moz-signature'}
+_HTML_BLOCK_TAGS = {'br', 'p', 'div', 'tr', 'li', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'table', 'hr'}
+
+
+@dataclass
+class CuerpoEmail:
+    """Cuerpo limpio de un email y métricas de ahorro."""
+    texto: str
+    bytes_originales: int
+    tokens_originales: int
+    bytes_finales: int
+    tokens_finales: int
+    truncado: bool = False
+
+    @property
+    def bytes_ahorrados(self) -> int:
+        return self.bytes_originales - self.bytes_finales
+
+    @property
+    def tokens_ahorrados(self) -> int:
+        return self.tokens_originales - self.tokens_finales
+
+
+class _HTMLATexto(HTMLParser):
+    """Convierte HTML en texto plano omitiendo citas, firmas y contenido no visible."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.partes = []
+        self._pila = []      # (tag, omitir) para cerrar correctamente los bloques omitidos
+        self._omitiendo = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ('br', 'hr', 'img', 'meta', 'link', 'input'):
+            if tag in ('br', 'hr') and not self._omitiendo:
+                self.partes.append('\n')
+            return
+        clases = set((dict(attrs).get('class') or '').split())
+        omitir = tag in _HTML_SKIP_TAGS or bool(clases & _HTML_SKIP_CLASSES)
+        self._pila.append((tag, omitir))
+        if omitir:
+            self._omitiendo += 1
+        elif tag in _HTML_BLOCK_TAGS and not self._omitiendo:
+            self.partes.append('\n')
+
+    def handle_endtag(self, tag):
+        while self._pila:
+            abierto, omitir = self._pila.pop()
+            if omitir:
+                self._omitiendo -= 1
+            if abierto == tag:
+                break
+        if tag in _HTML_BLOCK_TAGS and not self._omitiendo:
+            self.partes.append('\n')
+
+    def handle_data(self, data):
+        if not self._omitiendo:
+            self.partes.append(data)
+
+    def texto(self):
+        return ''.join(self.partes)
+
+
+def html_a_texto(html: str) -> str:
+    parser = _HTMLATexto()
+    parser.feed(html)
+    parser.close()
+    return unescape(parser.texto())
+
+
+def limpiar_texto(texto: str) -> str:
+    """Elimina historial citado, firmas y espacios sobrantes de un cuerpo en texto plano."""
+    texto = texto.replace('\r\n', '\n').replace('\r', '\n')
+    corte = len(texto)
+    for match in _ATRIBUCION_ES_RE.finditer(texto):
+        if _FECHA_O_EMAIL_RE.search(match.group()):
+            corte = match.start()
+            break
+    for patron in _QUOTE_HEADER_RES + _SIGNATURE_RES:
+        match = patron.search(texto)
+        if match and match.start() < corte:
+            corte = match.start()
+    texto = texto[:corte]
+    lineas = [linea.rstrip() for linea in texto.split('\n') if not linea.lstrip().startswith('>')]
+    texto = '\n'.join(lineas)
+    texto = re.sub(r'[ \t ]+', ' ', texto)
+    texto = re.sub(r'\n{3,}', '\n\n', texto)
+    return texto.strip()
+
+
+def _truncar(data: bytes, max_bytes: int):
+    if len(data) <= max_bytes:
+        return data, False
+    return data[:max_bytes], True
+
+
+def _decodificar_parte_gmail(part):
+    data = part.get('body', {}).get('data')
+    if not data:
+        return None
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+def _charset_parte_gmail(part) -> str:
+    """Charset de la cabecera Content-Type de la parte (utf-8 si no lo indica)."""
+    content_type = next((h['value'] for h in part.get('headers', []) if h['name'].lower() == 'content-type'), '')
+    cabeceras = Message()
+    cabeceras['Content-Type'] = content_type or 'text/plain'
+    return cabeceras.get_content_charset() or 'utf-8'
+
+
+def _buscar_partes_gmail(payload, encontradas):
+    mime_type = payload.get('mimeType', '')
+    if mime_type in ('text/plain', 'text/html') and mime_type not in encontradas:
+        disposicion = next((h['value'] for h in payload.get('headers', []) if h['name'].lower() == 'content-disposition'), '')
+        if 'attachment' not in disposicion.lower():
+            contenido = _decodificar_parte_gmail(payload)
+            if contenido is not None:
+                encontradas[mime_type] = (contenido, _charset_parte_gmail(payload))
+    for part in payload.get('parts', []) or []:
+        _buscar_partes_gmail(part, encontradas)
+
+
+def procesar_cuerpo(contenido: bytes, mime_type: str, max_bytes: int = EMAIL_BODY_MAX_BYTES, charset: str = 'utf-8') -> CuerpoEmail:
+    """Decodifica, limpia y mide un cuerpo de email."""
+    original = contenido.decode(charset or 'utf-8', errors='replace')
+    contenido, truncado = _truncar(contenido, max_bytes)
+    texto = contenido.decode(charset or 'utf-8', errors='ignore')
+    if mime_type == 'text/html':
+        texto = html_a_texto(texto)
+    texto = limpiar_texto(texto)
+    return CuerpoEmail(
+        texto=texto,
+        bytes_originales=len(original.encode('utf-8')),
+        tokens_originales=count_tokens(original),
+        bytes_finales=len(texto.encode('utf-8')),
+        tokens_finales=count_tokens(texto),
+        truncado=truncado,
+    )
+
+
+def extraer_cuerpo_gmail(msg_data, max_bytes: int = EMAIL_BODY_MAX_BYTES) -> CuerpoEmail:
+    """
+    Extrae el cuerpo completo de un mensaje de la API de Gmail (format=full).
+    Si no hay partes de texto decodificables, usa el snippet.
+    """
+    encontradas = {}
+    _buscar_partes_gmail(msg_data.get('payload', {}), encontradas)
+    cuerpo = _procesar_encontradas(encontradas, max_bytes)
+    if cuerpo is not None:
+        return cuerpo
+    snippet = unescape(msg_data.get('snippet', ''))
+    return procesar_cuerpo(snippet.encode('utf-8'), 'text/plain', max_bytes)
+
+
+def extraer_cuerpo_mime(mensaje, max_bytes: int = EMAIL_BODY_MAX_BYTES) -> CuerpoEmail:
+    """
+    Extrae el cuerpo de un email.message.Message (IMAP, Maildir...), con el mismo criterio que extraer_cuerpo_gmail:
+    text/plain preferente, text/html como alternativa, sin adjuntos.
+    """
+    encontradas = {}
+    for parte in mensaje.walk():
+        mime_type = parte.get_content_type()
+        if mime_type not in ('text/plain', 'text/html') or mime_type in encontradas:
+            continue
+        if 'attachment' in str(parte.get('Content-Disposition', '')).lower():
+            continue
+        contenido = parte.get_payload(decode=True)
+        if contenido is not None:
+            encontradas[mime_type] = (contenido, parte.get_content_charset() or 'utf-8')
+    cuerpo = _procesar_encontradas(encontradas, max_bytes)
+    if cuerpo is not None:
+        return cuerpo
+    return procesar_cuerpo(b'', 'text/plain', max_bytes)
+
+
+def _procesar_encontradas(encontradas, max_bytes: int):
+    """Procesa la parte text/plain (o text/html) con su charset; utf-8 si el charset no se reconoce."""
+    for mime_type in ('text/plain', 'text/html'):
+        if mime_type in encontradas:
+            contenido, charset = encontradas[mime_type]
+            try:
+                return procesar_cuerpo(contenido, mime_type, max_bytes, charset)
+            except LookupError:
+                return procesar_cuerpo(contenido, mime_type, max_bytes)
+    return None
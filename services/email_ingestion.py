@@ -0,0 +1,94 @@
+# Pipeline de ingesta común a todos los transportes de correo
+"""
+Recibe mensajes ya descargados por un transporte (Gmail, IMAP, Maildir...), los enruta con
+subject_router y guarda en bloque los que pertenecen a una partida activa.
+El transporte decide después qué hacer con cada mensaje (marcarlo como leído, moverlo a ignorados...).
+"""
+from dataclasses import dataclass, field
+from typing import List, Optional
+from email.utils import getaddresses
+from sqlalchemy.orm import Session
+from api.schemas.email import EmailCreate
+from api.models.email import EmailType
+from api.managers.email_manager import EmailManager
+from api.core.notifications import email_notifier
+from services.email_body import CuerpoEmail
+from services.subject_router import subject_router
+
+
+@dataclass
+class IncomingMessage:
+    """Mensaje entrante independiente del transporte."""
+    message_id: str
+    subject: str
+    sender: str
+    recipients: List[str]
+    cuerpo: CuerpoEmail
+    thread_id: str = ""
+    referencia: Optional[str] = None  # id propio del transporte (id de Gmail, UID de IMAP, fichero Maildir)
+    snippet: str = ""
+
+    @property
+    def ref(self):
+        return self.referencia if self.referencia is not None else self.message_id
+
+
+@dataclass
+class ResultadoIngesta:
+    """Resultado de ingestar un bloque: referencias de transporte guardadas e ignoradas."""
+    guardados: List[str] = field(default_factory=list)
+    ignorados: List[str] = field(default_factory=list)
+    duplicados: int = 0
+    email_ids: List[int] = field(default_factory=list)
+
+
+def parse_recipients(valor: str) -> List[str]:
+    """Convierte una cabecera To/Cc en una lista de direcciones."""
+    return [direccion for _nombre, direccion in getaddresses([valor or '']) if direccion]
+
+
+def ingest_messages(db: Session, mensajes: List[IncomingMessage]) -> ResultadoIngesta:
+    """
+    Enruta y guarda un bloque de mensajes en una única transacción (EmailManager.bulk_ingest).
+    Los mensajes sin partida, historia, escena o jugador válidos se devuelven como ignorados.
+    La tabla de rutas debe estar al día (subject_router.ensure_fresh) antes de llamar a esta función.
+    """
+    resultado = ResultadoIngesta()
+    nuevos_emails = []
+    for mensaje in mensajes:
+        # Resolver campaña, historia, escena, jugador y personaje en memoria
+        ruta, _motivo = subject_router.route(mensaje.subject, mensaje.sender)
+        if not ruta:
+            resultado.ignorados.append(mensaje.ref)
+            continue
+
+        cuerpo = mensaje.cuerpo
+        print(f"Email {mensaje.message_id}: cuerpo {cuerpo.bytes_finales} B / {cuerpo.tokens_finales} tokens "
+              f"(ahorrados {cuerpo.bytes_ahorrados} B / {cuerpo.tokens_ahorrados} tokens"
+              f"{', truncado' if cuerpo.truncado else ''})")
+        nuevos_emails.append(EmailCreate(
+            player_id=ruta.player_id,
+            character_id=ruta.character_id,
+            campaign_id=ruta.campaign_id,
+            scene_id=ruta.scene_id,
+            type=EmailType.ENTRADA,
+            subject=mensaje.subject,
+            body=cuerpo.texto or mensaje.snippet,
+            sender=mensaje.sender,
+            recipients=mensaje.recipients,
+            thread_id=mensaje.thread_id,
+            message_id=mensaje.message_id,
+            processed=False,
+            resumido=False
+        ))
+        resultado.guardados.append(mensaje.ref)
+    # Los emails del bloque se guardan en una única transacción antes de confirmarlos en el transporte;
+    # si el ciclo falla después, la siguiente lectura los omite por message_id
+    resultado.email_ids = EmailManager.bulk_ingest(db, nuevos_emails)
+    resultado.duplicados = len(nuevos_emails) - len(resultado.email_ids)
+    if resultado.duplicados:
+        print(f"{resultado.duplicados} emails ya estaban guardados y se han omitido.")
+    if resultado.email_ids:
+        # Despierta al procesador (bulk_ingest ya ha hecho commit)
+        email_notifier.notify(f"{len(resultado.email_ids)}")
+    return resultado
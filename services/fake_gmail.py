@@ -0,0 +1,278 @@
+# Doble local de la API de Gmail para pruebas y benchmarks sin red
+"""
+Imita la parte de la API de Gmail (googleapiclient) que usa GmailService:
+users().messages(), users().labels(), new_batch_http_request(), etc.
+Cuenta las llamadas a la API y los round trips HTTP para poder medir el rendimiento
+de la ingesta de forma offline.
+"""
+import base64
+import time
+import threading
+from collections import Counter
+
+
+def construir_mensaje_gmail(message_id, subject, sender, to, body, thread_id=None, label_ids=None):
+    """
+    Construye un mensaje con el mismo formato que devuelve users.messages.get (format=full).
+    """
+    data = base64.urlsafe_b64encode(body.encode('utf-8')).decode()
+    return {
+        'id': message_id,
+        'threadId': thread_id or message_id,
+        'labelIds': list(label_ids or ['INBOX', 'UNREAD']),
+        'snippet': body[:200],
+        'payload': {
+            'mimeType': 'text/plain',
+            'headers': [
+                {'name': 'Subject', 'value': subject},
+                {'name': 'From', 'value': sender},
+                {'name': 'To', 'value': to},
+                {'name': 'Message-ID', 'value': f'<{message_id}@fake.gmail>'},
+            ],
+            'body': {'size': len(body), 'data': data},
+        },
+    }
+
+
+def _http_error(status):
+    """Construye un HttpError como el que lanza googleapiclient."""
+    from googleapiclient.errors import HttpError
+    import httplib2
+    return HttpError(httplib2.Response({'status': str(status)}), f'{{"error": {{"code": {status}}}}}'.encode())
+
+
+class _FakeRequest:
+    """Petición diferida; execute() cuenta un round trip HTTP."""
+
+    def __init__(self, gmail, metodo, fn):
+        self.gmail = gmail
+        self.metodo = metodo
+        self.fn = fn
+
+    def execute(self):
+        self.gmail._round_trip()
+        return self._ejecutar()
+
+    def _ejecutar(self):
+        self.gmail._contar(self.metodo)
+        return self.fn()
+
+
+class _FakeBatch:
+    """Petición batch HTTP: todas las subpeticiones viajan en un único round trip."""
+
+    def __init__(self, gmail, callback=None):
+        self.gmail = gmail
+        self.callback = callback
+        self.peticiones = []
+
+    def add(self, request, callback=None, request_id=None):
+        request_id = request_id or str(len(self.peticiones))
+        self.peticiones.append((request_id, request, callback or self.callback))
+
+    def execute(self):
+        self.gmail._round_trip()
+        for request_id, request, callback in self.peticiones:
+            try:
+                response, exception = request._ejecutar(), None
+            except Exception as e:
+                response, exception = None, e
+            if callback:
+                callback(request_id, response, exception)
+
+
+class _FakeMessages:
+    def __init__(self, gmail):
+        self.gmail = gmail
+
+    def list(self, userId='me', labelIds=None, q=None, pageToken=None, maxResults=100, **kwargs):
+        def _list():
+            ids = [m['id'] for m in self.gmail.mensajes.values()
+                   if all(label in m['labelIds'] for label in (labelIds or []))]
+            inicio = int(pageToken or 0)
+            pagina = ids[inicio:inicio + maxResults]
+            resultado = {
+                'messages': [{'id': i, 'threadId': self.gmail.mensajes[i]['threadId']} for i in pagina],
+                'resultSizeEstimate': len(ids),
+            }
+            if inicio + maxResults < len(ids):
+                resultado['nextPageToken'] = str(inicio + maxResults)
+            if not pagina:
+                resultado.pop('messages')
+            return resultado
+        return _FakeRequest(self.gmail, 'messages.list', _list)
+
+    def get(self, userId='me', id=None, format='full', **kwargs):
+        def _get():
+            if id not in self.gmail.mensajes:
+                raise KeyError(f"Mensaje {id} no encontrado")
+            return dict(self.gmail.mensajes[id])
+        return _FakeRequest(self.gmail, 'messages.get', _get)
+
+    def modify(self, userId='me', id=None, body=None):
+        def _modify():
+            self.gmail._modificar_etiquetas([id], body or {})
+            return self.gmail.mensajes.get(id)
+        return _FakeRequest(self.gmail, 'messages.modify', _modify)
+
+    def batchModify(self, userId='me', body=None):
+        def _batch_modify():
+            self.gmail._modificar_etiquetas((body or {}).get('ids', []), body or {})
+            return {}
+        return _FakeRequest(self.gmail, 'messages.batchModify', _batch_modify)
+
+    def send(self, userId='me', body=None):
+        def _send():
+            self.gmail.enviados.append(body)
+            return {'id': f'enviado-{len(self.gmail.enviados)}', 'threadId': (body or {}).get('threadId', '')}
+        return _FakeRequest(self.gmail, 'messages.send', _send)
+
+
+class _FakeLabels:
+    def __init__(self, gmail):
+        self.gmail = gmail
+
+    def list(self, userId='me'):
+        return _FakeRequest(self.gmail, 'labels.list',
+                            lambda: {'labels': [dict(l) for l in self.gmail.labels.values()]})
+
+    def get(self, userId='me', id=None):
+        def _get():
+            if id not in self.gmail.labels:
+                raise _http_error(404)
+            label = dict(self.gmail.labels[id])
+            etiquetados = [m for m in self.gmail.mensajes.values() if id in m['labelIds']]
+            label['messagesTotal'] = len(etiquetados)
+            label['messagesUnread'] = sum(1 for m in etiquetados if 'UNREAD' in m['labelIds'])
+            return label
+        return _FakeRequest(self.gmail, 'labels.get', _get)
+
+    def create(self, userId='me', body=None):
+        def _create():
+            nombre = body['name']
+            if any(l['name'] == nombre for l in self.gmail.labels.values()):
+                raise _http_error(409)
+            label = {'id': f'Label_{len(self.gmail.labels) + 1}', 'name': nombre, 'type': 'user'}
+            self.gmail.labels[label['id']] = label
+            return label
+        return _FakeRequest(self.gmail, 'labels.create', _create)
+
+
+class _FakeHistory:
+    def __init__(self, gmail):
+        self.gmail = gmail
+
+    def list(self, userId='me', startHistoryId=None, historyTypes=None, labelId=None, pageToken=None, maxResults=100):
+        def _list():
+            inicio = int(startHistoryId)
+            if inicio < self.gmail.historial_minimo:
+                # Igual que Gmail: el historyId ya no está disponible
+                raise _http_error(404)
+            registros = [r for r in self.gmail.historial if r['id'] > inicio]
+            desde = int(pageToken or 0)
+            resultado = {
+                'history': [{'id': str(r['id']), 'messagesAdded': r['messagesAdded']} for r in registros[desde:desde + maxResults]],
+                'historyId': str(self.gmail.history_id),
+            }
+            if desde + maxResults < len(registros):
+                resultado['nextPageToken'] = str(desde + maxResults)
+            return resultado
+        return _FakeRequest(self.gmail, 'history.list', _list)
+
+
+class _FakeUsers:
+    def __init__(self, gmail):
+        self.gmail = gmail
+
+    def messages(self):
+        return _FakeMessages(self.gmail)
+
+    def labels(self):
+        return _FakeLabels(self.gmail)
+
+    def history(self):
+        return _FakeHistory(self.gmail)
+
+    def getProfile(self, userId='me'):
+        return _FakeRequest(self.gmail, 'getProfile', lambda: {
+            'emailAddress': 'narrador@fake.gmail',
+            'messagesTotal': len(self.gmail.mensajes),
+            'historyId': str(self.gmail.history_id),
+        })
+
+
+class FakeGmailService:
+    """
+    Sustituto en memoria del servicio construido con build('gmail', 'v1').
+    latencia: segundos simulados por cada round trip HTTP.
+    """
+
+    def __init__(self, mensajes=None, latencia=0.0):
+        self.mensajes = {}
+        self.labels = {
+            'INBOX': {'id': 'INBOX', 'name': 'INBOX', 'type': 'system'},
+            'UNREAD': {'id': 'UNREAD', 'name': 'UNREAD', 'type': 'system'},
+        }
+        self.enviados = []
+        self.history_id = 1000
+        self.historial = []
+        self.historial_minimo = 0
+        self.latencia = latencia
+        self.llamadas = Counter()
+        self.peticiones_http = 0
+        self._lock = threading.Lock()
+        for mensaje in mensajes or []:
+            self.añadir_mensaje(mensaje)
+
+    def añadir_mensaje(self, mensaje):
+        self.mensajes[mensaje['id']] = mensaje
+        self.history_id += 1
+        self.historial.append({
+            'id': self.history_id,
+            'messagesAdded': [{'message': {
+                'id': mensaje['id'],
+                'threadId': mensaje['threadId'],
+                'labelIds': list(mensaje['labelIds']),
+            }}],
+        })
+
+    def expirar_historial(self):
+        """Simula que Gmail ha descartado el historial anterior al historyId actual."""
+        self.historial_minimo = self.history_id
+        self.historial = []
+
+    def users(self):
+        return _FakeUsers(self)
+
+    def new_batch_http_request(self, callback=None):
+        return _FakeBatch(self, callback)
+
+    @property
+    def llamadas_api(self):
+        """Nº total de llamadas a la API (cada subpetición de un batch cuenta como una)."""
+        return sum(self.llamadas.values())
+
+    def reiniciar_contadores(self):
+        self.llamadas.clear()
+        self.peticiones_http = 0
+
+    def _contar(self, metodo):
+        with self._lock:
+            self.llamadas[metodo] += 1
+
+    def _round_trip(self):
+        with self._lock:
+            self.peticiones_http += 1
+        if self.latencia:
+            time.sleep(self.latencia)
+
+    def _modificar_etiquetas(self, ids, body):
+        if any(label not in self.labels for label in body.get('addLabelIds', [])):
+            raise _http_error(400)
+        for message_id in ids:
+            mensaje = self.mensajes.get(message_id)
+            if not mensaje:
+                continue
+            etiquetas = [l for l in mensaje['labelIds'] if l not in body.get('removeLabelIds', [])]
+            etiquetas += [l for l in body.get('addLabelIds', []) if l not in etiquetas]
+            mensaje['labelIds'] = etiquetas
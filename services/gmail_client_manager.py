@@ -0,0 +1,151 @@
+# Gestor del cliente de Gmail compartido por todo el proceso
+"""
+Mantiene un único cliente autorizado de Gmail durante toda la vida del proceso:
+- Las credenciales se leen de token.json una sola vez y se refrescan antes de caducar.
+- El documento de discovery se carga una vez y se reutiliza (build_from_document).
+- Cada hilo reutiliza su propio transporte HTTP autorizado (httplib2 no es thread-safe).
+- Mide el tiempo de preparación del cliente para separarlo del trabajo real de cada ciclo.
+"""
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+import httplib2
+from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import AuthorizedHttp
+from google_auth_oauthlib.flow import InstalledAppFlow
+from google.auth.transport.requests import Request
+from google.auth.exceptions import RefreshError
+from googleapiclient.discovery import build, build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from utils.env_loader import get_env_variable
+
+# Variables globales para configuración y autenticación
+CONFIG_DIR = os.path.join(os.path.dirname(__file__), '..', 'config')
+CREDENTIALS_PATH = os.path.join(CONFIG_DIR, 'credentials.json')
+TOKEN_PATH = os.path.join(CONFIG_DIR, 'token.json')
+SCOPES = get_env_variable("GMAIL_SCOPES").split(",")
+# Margen con el que se refresca el token antes de que caduque
+GMAIL_TOKEN_REFRESH_MARGIN = int(get_env_variable("GMAIL_TOKEN_REFRESH_MARGIN", "300"))
+GMAIL_HTTP_TIMEOUT = int(get_env_variable("GMAIL_HTTP_TIMEOUT", "60"))
+
+
+class GmailClientManager:
+    """Cliente de Gmail de larga duración, compartido entre ciclos de lectura."""
+
+    def __init__(self, credentials_path=CREDENTIALS_PATH, token_path=TOKEN_PATH, scopes=SCOPES,
+                 refresh_margin=GMAIL_TOKEN_REFRESH_MARGIN):
+        self.credentials_path = credentials_path
+        self.token_path = token_path
+        self.scopes = scopes
+        self.refresh_margin = timedelta(seconds=refresh_margin)
+        self._creds = None
+        self._discovery_document = None
+        self._validado = False
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._tiempo_setup = 0.0
+
+    def get_service(self):
+        """
+        Devuelve el servicio de Gmail del hilo actual, refrescando las credenciales si están a punto de caducar.
+        """
+        inicio = time.perf_counter()
+        try:
+            self._ensure_credentials()
+            service = getattr(self._local, 'service', None)
+            if service is None:
+                http = AuthorizedHttp(self._creds, http=httplib2.Http(timeout=GMAIL_HTTP_TIMEOUT))
+                service = build_from_document(self._get_discovery_document(), http=http)
+                self._local.service = service
+                if not self._validado:
+                    # Solo se valida el token contra la API la primera vez
+                    service.users().getProfile(userId='me').execute()
+                    self._validado = True
+                    print("Credenciales válidas y servicio de Gmail inicializado correctamente.")
+            return service
+        finally:
+            with self._lock:
+                self._tiempo_setup += time.perf_counter() - inicio
+
+    def consumir_tiempo_setup(self):
+        """Devuelve el tiempo de preparación acumulado desde la última llamada y lo reinicia."""
+        with self._lock:
+            tiempo, self._tiempo_setup = self._tiempo_setup, 0.0
+        return tiempo
+
+    def invalidate(self):
+        """Descarta credenciales y transportes (p. ej. tras revocar el token)."""
+        with self._lock:
+            self._creds = None
+            self._validado = False
+            self._local = threading.local()
+
+    def _ensure_credentials(self):
+        with self._lock:
+            if self._creds is None:
+                if not os.path.exists(self.token_path):
+                    print(f"El archivo {self.token_path} no existe. Es necesario realizar el flujo OAuth2.")
+                    self._create_valid_token()
+                self._creds = Credentials.from_authorized_user_file(self.token_path, self.scopes)
+            if self._needs_refresh():
+                try:
+                    self._creds.refresh(Request())
+                    self._save_token()
+                    print("Token de Gmail refrescado antes de caducar.")
+                except RefreshError as e:
+                    print(f"Error al refrescar el token de Gmail, creando un token.json nuevo: {e}")
+                    self._create_valid_token()
+                    self._creds = Credentials.from_authorized_user_file(self.token_path, self.scopes)
+                    self._local = threading.local()
+
+    def _needs_refresh(self):
+        if not self._creds.refresh_token:
+            return False
+        if not self._creds.token or not self._creds.expiry:
+            return True
+        # google-auth guarda expiry como datetime UTC sin zona horaria
+        return self._creds.expiry - datetime.utcnow() < self.refresh_margin
+
+    def _save_token(self):
+        with open(self.token_path, 'w') as token:
+            token.write(self._creds.to_json())
+
+    def _get_discovery_document(self):
+        if self._discovery_document is None:
+            document = get_static_doc('gmail', 'v1')
+            if document is None:
+                document = build('gmail', 'v1', credentials=self._creds, static_discovery=False)._rootDesc
+            self._discovery_document = document
+        return self._discovery_document
+
+    def _create_valid_token(self):
+        """
+        Crea un token válido para la API de Gmail.
+        """
+        if not os.path.exists(self.credentials_path):
+            raise Exception(f"No se encontró {self.credentials_path}. Asegúrate de tener las credenciales de la API de Gmail.")
+
+        creds = None
+        try:
+            if os.path.exists(self.token_path):
+                creds = Credentials.from_authorized_user_file(self.token_path, self.scopes)
+            if not creds or not creds.valid:
+                if creds and creds.expired and creds.refresh_token:
+                    creds.refresh(Request())
+                    with open(self.token_path, 'w') as token:
+                        token.write(creds.to_json())
+                else:
+                    raise RefreshError  # Forzar flujo OAuth2 si el refresh falla
+        except RefreshError:
+            print("El token ha sido revocado o expirado. Generando uno nuevo...")
+            flow = InstalledAppFlow.from_client_secrets_file(self.credentials_path, self.scopes)
+            creds = flow.run_local_server(port=0)
+            with open(self.token_path, 'w') as token:
+                token.write(creds.to_json())
+
+        print(f"Token creado y guardado en {self.token_path}")
+
+
+# Instancia global del gestor de cliente Gmail
+gmail_client_manager = GmailClientManager()
@@ -0,0 +1,68 @@
+# Registro de etiquetas de Gmail con caché
+"""
+Resuelve nombres de etiqueta a ids una sola vez y los mantiene en caché.
+La caché caduca tras GMAIL_LABEL_CACHE_TTL segundos y puede invalidarse explícitamente
+(por ejemplo, si Gmail rechaza un id porque la etiqueta se borró desde la web).
+"""
+import threading
+import time
+from googleapiclient.errors import HttpError
+from utils.env_loader import get_env_variable
+
+GMAIL_LABEL_CACHE_TTL = int(get_env_variable("GMAIL_LABEL_CACHE_TTL", "3600"))
+
+
+class LabelRegistry:
+    """Caché nombre -> id de las etiquetas del buzón."""
+
+    def __init__(self, service_provider, ttl_segundos=GMAIL_LABEL_CACHE_TTL):
+        """
+        :param service_provider: callable que devuelve el servicio de Gmail (p. ej. GmailService.get_service).
+        """
+        self._get_service = service_provider
+        self.ttl_segundos = ttl_segundos
+        self._labels = {}
+        self._cargado_en = None
+        self._lock = threading.Lock()
+
+    def resolve(self, label_name, create=True):
+        """
+        Devuelve el id de la etiqueta, creándola si no existe y create es True.
+        Solo llama a labels.list cuando la caché está vacía, caducada o invalidada.
+        """
+        with self._lock:
+            if self._caducada():
+                self._recargar()
+            label_id = self._labels.get(label_name)
+            if label_id is None and create:
+                label_id = self._crear(label_name)
+            return label_id
+
+    def invalidate(self, label_name=None):
+        """Invalida una etiqueta concreta o la caché completa."""
+        with self._lock:
+            if label_name is None:
+                self._labels = {}
+                self._cargado_en = None
+            else:
+                self._labels.pop(label_name, None)
+
+    def _caducada(self):
+        return self._cargado_en is None or time.monotonic() - self._cargado_en > self.ttl_segundos
+
+    def _recargar(self):
+        labels = self._get_service().users().labels().list(userId='me').execute().get('labels', [])
+        self._labels = {label['name']: label['id'] for label in labels}
+        self._cargado_en = time.monotonic()
+
+    def _crear(self, label_name):
+        try:
+            label = self._get_service().users().labels().create(userId='me', body={'name': label_name}).execute()
+        except HttpError as e:
+            if getattr(e.resp, 'status', None) != 409:
+                raise
+            # La etiqueta ya existe (creada por otro proceso o desde la web): recargar
+            self._recargar()
+            return self._labels.get(label_name)
+        self._labels[label_name] = label['id']
+        return label['id']
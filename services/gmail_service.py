@@ -1,146 +1,87 @@
 # Servicio para interactuar con Gmail
 from typing import List, Dict
+from itertools import islice
 from utils.env_loader import get_env_variable
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from google.auth.exceptions import RefreshError
-import os
+from googleapiclient.errors import HttpError
 from datetime import datetime
 from email.mime.text import MIMEText
 from email.utils import COMMASPACE
 import base64
-import re
 from api.core.database import SessionLocal
-from api.schemas.email import EmailCreate
-from api.models.email import EmailType
-from api.models.player import Player
-from api.models.character import Character
-from api.models.associations import campaign_characters
-from api.managers.campaign_manager import CampaignManager
-from api.managers.story_manager import StoryManager
-from api.managers.scene_manager import SceneManager
-from api.managers.character_manager import CharacterManager
-from api.managers.player_manager import PlayerManager
-from api.managers.email_manager import EmailManager
-from api.models.campaign import Campaign
-from api.models.story import Story
-from api.managers.story_manager import StoryManager
+from api.managers.gmail_sync_manager import GmailSyncManager
+from services.gmail_client_manager import gmail_client_manager, CONFIG_DIR, CREDENTIALS_PATH, TOKEN_PATH, SCOPES
+from services.gmail_labels import LabelRegistry
+from services.email_body import extraer_cuerpo_gmail
+from services.email_ingestion import IncomingMessage, ingest_messages
+from services.subject_router import subject_router
 
-# Variables globales para configuración y autenticación
-CONFIG_DIR = os.path.join(os.path.dirname(__file__), '..', 'config')
-CREDENTIALS_PATH = os.path.join(CONFIG_DIR, 'credentials.json')
-TOKEN_PATH = os.path.join(CONFIG_DIR, 'token.json')
-SCOPES = get_env_variable("GMAIL_SCOPES").split(",")
+# Ingesta por lotes: nº de mensajes por petición batch HTTP (Gmail recomienda no superar 50)
+GMAIL_BATCH_SIZE = int(get_env_variable("GMAIL_BATCH_SIZE", "50"))
+GMAIL_BATCH_MODE = get_env_variable("GMAIL_BATCH_MODE", "true").lower() == "true"
+# Límite de ids admitido por users.messages.batchModify
+GMAIL_BATCH_MODIFY_MAX = 1000
+# Sincronización incremental con historyId (si es False se lista UNREAD completo en cada ciclo)
+GMAIL_INCREMENTAL_SYNC = get_env_variable("GMAIL_INCREMENTAL_SYNC", "true").lower() == "true"
+# Paginación y límites de la ingesta: tamaño de página de messages.list, máximo de mensajes por ciclo
+# y tamaño de los bloques que se descargan y guardan de una vez
+GMAIL_LIST_PAGE_SIZE = int(get_env_variable("GMAIL_LIST_PAGE_SIZE", "500"))
+GMAIL_MAX_MESSAGES_PER_CYCLE = int(get_env_variable("GMAIL_MAX_MESSAGES_PER_CYCLE", "500"))
+GMAIL_INGEST_CHUNK_SIZE = int(get_env_variable("GMAIL_INGEST_CHUNK_SIZE", "100"))
+# Máximo de ciclos seguidos drenando backlog antes de volver a la sincronización incremental con historyId
+GMAIL_MAX_DRAIN_CYCLES = int(get_env_variable("GMAIL_MAX_DRAIN_CYCLES", "20"))
 
 class GmailService:
-    def __init__(self):
+    def __init__(self, service=None, client_manager=None):
         """
-        Inicializa el servicio de Gmail y valida el token.
+        Inicializa el servicio de Gmail.
+        Por defecto usa el cliente compartido del proceso (gmail_client_manager), que reutiliza
+        credenciales, discovery y transporte HTTP entre ciclos.
+        Si se recibe un servicio ya construido (p. ej. FakeGmailService) se usa directamente.
         """
         self.config_dir = CONFIG_DIR
         self.credentials_path = CREDENTIALS_PATH
         self.token_path = TOKEN_PATH
         self.scopes = SCOPES
-        self.service = None
-        self._initialize_service()
+        self.service = service
+        self.client_manager = client_manager or gmail_client_manager
+        self.labels = LabelRegistry(self.get_service)
+        # True mientras quede backlog: los ciclos listan UNREAD paginado en lugar de usar el historial
+        self._drenando = False
+        self._ciclos_drenando = 0
+        if self.service is None:
+            # Valida el token al crear el servicio, como hasta ahora
+            self.client_manager.get_service()
 
-    def _initialize_service(self):
+    def get_service(self):
         """
-        Inicializa el servicio de Gmail y valida el token.
-        Si el token no es válido, intenta refrescarlo o generar uno nuevo.
+        Devuelve la instancia del servicio de Gmail.
         """
-        if not os.path.exists(self.token_path):
-            print(f"El archivo {self.token_path} no existe. Es necesario realizar el flujo OAuth2.")
-            self._create_valid_token()
-
-        try:
-            creds = Credentials.from_authorized_user_file(self.token_path, self.scopes)
-            # Realizar una solicitud de prueba para validar las credenciales
-            try:
-                service = build('gmail', 'v1', credentials=creds)
-                service.users().getProfile(userId='me').execute()
-                self.service = service
-                print("Credenciales válidas y servicio inicializado correctamente.")
-            except Exception as e:
-                print(f"Error al validar las credenciales: {e}. Intentando refrescar o regenerar el token...")
-                if creds.refresh_token:
-                    creds.refresh(Request())
-                    with open(self.token_path, 'w') as token:
-                        token.write(creds.to_json())
-                    print("Token refrescado exitosamente.")
-                    self.service = build('gmail', 'v1', credentials=creds)
-                else:
-                    self._create_valid_token()
-        except Exception as e:
-            print(f"Error crítico al inicializar el servicio de Gmail: {e}")
-            self._create_valid_token()
+        if self.service is not None:
+            return self.service
+        return self.client_manager.get_service()
 
-    def _create_service(self):
+    def move_to_label(self, message_id, label_name):
         """
-        Comprueba si el servicio de Gmail está inicializado.
-        Si no lo está, lanza una excepción.
+        Mueve un mensaje a la etiqueta indicada (la añade y quita INBOX).
         """
-        if not os.path.exists(self.token_path):
-            print(f"El archivo {self.token_path} no existe. Es necesario realizar el flujo OAuth2.")
-            self._create_valid_token()           
-        try:
-            creds = Credentials.from_authorized_user_file(self.token_path, self.scopes)
-            service = build('gmail', 'v1', credentials=creds)
-            service.users().getProfile(userId='me').execute()
-            return creds  # Si la solicitud tiene éxito, las credenciales son válidas
-        except RefreshError as e:
-            print(f"Error al validar las credenciales del servicio gmail, creando un token.json nuevo: {e}")    
-            return False
+        self.move_messages_to_label([message_id], label_name)
 
-    def _create_valid_token(self):
+    def move_messages_to_label(self, message_ids, label_name):
         """
-        Crea un token válido para la API de Gmail.
+        Mueve varios mensajes a una etiqueta con batchModify, resolviendo el id desde la caché de etiquetas.
+        Si Gmail rechaza el id cacheado (etiqueta borrada), se invalida la caché y se reintenta una vez.
         """
-        if not os.path.exists(self.credentials_path):
-            raise Exception(f"No se encontró {self.credentials_path}. Asegúrate de tener las credenciales de la API de Gmail.")
-
-        creds = None
+        if not message_ids:
+            return
+        label_id = self.labels.resolve(label_name)
         try:
-            if os.path.exists(self.token_path):
-                creds = Credentials.from_authorized_user_file(self.token_path, self.scopes)
-            if not creds or not creds.valid:
-                if creds and creds.expired and creds.refresh_token:
-                    creds.refresh(Request())
-                else:
-                    raise RefreshError  # Forzar flujo OAuth2 si el refresh falla
-        except RefreshError:
-            print("El token ha sido revocado o expirado. Generando uno nuevo...")
-            flow = InstalledAppFlow.from_client_secrets_file(self.credentials_path, self.scopes)
-            creds = flow.run_local_server(port=0)
-            with open(self.token_path, 'w') as token:
-                token.write(creds.to_json())
-
-        print(f"Token creado y guardado en {self.token_path}")
-
-    def get_service(self):
-        """
-        Devuelve la instancia del servicio de Gmail.
-        """
-        if self.service is None:
-            raise Exception("El servicio de Gmail no ha sido inicializado. Llama a initialize_gmail_service() primero.")
-        return self.service
-
-    def move_to_label(self, message_id, label_name):
-        service = self.get_service()
-        # Buscar o crear la etiqueta
-        labels = service.users().labels().list(userId='me').execute().get('labels', [])
-        label_id = next((l['id'] for l in labels if l['name'] == label_name), None)
-        if not label_id:
-            label = service.users().labels().create(userId='me', body={'name': label_name}).execute()
-            label_id = label['id']
-        # Añadir la etiqueta y quitar INBOX
-        service.users().messages().modify(
-            userId='me',
-            id=message_id,
-            body={'addLabelIds': [label_id], 'removeLabelIds': ['INBOX']}
-        ).execute()
+            self.batch_modify(message_ids, add_label_ids=[label_id], remove_label_ids=['INBOX'])
+        except HttpError as e:
+            if getattr(e.resp, 'status', None) not in (400, 404):
+                raise
+            self.labels.invalidate(label_name)
+            label_id = self.labels.resolve(label_name)
+            self.batch_modify(message_ids, add_label_ids=[label_id], remove_label_ids=['INBOX'])
 
     def send_reply_email(self, email):
         """
@@ -171,6 +112,17 @@ class GmailService:
         service.users().messages().send(userId='me', body=message).execute()
         print(f"Email enviado a: {email.recipients} con asunto: {email.subject}")
 
+    def send_message(self, to, subject, body, thread_id=None, in_reply_to_message_id=None):
+        """
+        Envía un mensaje (nuevo o respuesta en un hilo) y devuelve la respuesta de la API ({'id', 'threadId', ...}).
+        Las excepciones (HttpError, errores de red) se propagan para que el llamador decida si reintentar.
+        """
+        service = self.get_service()
+        message = {'raw': self.create_message_raw(to, subject, body, in_reply_to_message_id)}
+        if thread_id:
+            message['threadId'] = thread_id
+        return service.users().messages().send(userId='me', body=message).execute()
+
     def create_message_raw(self, to, subject, body, in_reply_to_message_id):
         mime_message = MIMEText(body)
         mime_message['to'] = COMMASPACE.join(to) if isinstance(to, list) else to
@@ -185,6 +137,191 @@ class GmailService:
         service = self.get_service()
         service.users().messages().modify(userId='me', id=message_id, body={'removeLabelIds': ['UNREAD']}).execute()
 
+    def get_or_create_label_id(self, label_name):
+        """
+        Devuelve el id de una etiqueta por su nombre, creándola si no existe.
+        """
+        return self.labels.resolve(label_name)
+
+    def batch_modify(self, message_ids, add_label_ids=None, remove_label_ids=None):
+        """
+        Aplica cambios de etiquetas a varios mensajes con users.messages.batchModify
+        (una llamada por cada bloque de hasta GMAIL_BATCH_MODIFY_MAX ids).
+        """
+        if not message_ids:
+            return
+        service = self.get_service()
+        body = {}
+        if add_label_ids:
+            body['addLabelIds'] = add_label_ids
+        if remove_label_ids:
+            body['removeLabelIds'] = remove_label_ids
+        for inicio in range(0, len(message_ids), GMAIL_BATCH_MODIFY_MAX):
+            body['ids'] = message_ids[inicio:inicio + GMAIL_BATCH_MODIFY_MAX]
+            service.users().messages().batchModify(userId='me', body=body).execute()
+
+    def get_messages_batch(self, message_ids, batch_size=None, errores=None):
+        """
+        Recupera varios mensajes agrupando las llamadas messages.get en peticiones batch HTTP.
+        Devuelve los mensajes en el mismo orden que message_ids (omitiendo los que fallen).
+        Si se pasa la lista errores, se añaden los ids que han fallado por un error distinto de 404
+        (429, 5xx...); un 404 es un mensaje borrado desde que se listó y no se reintenta.
+        """
+        if not message_ids:
+            return []
+        service = self.get_service()
+        batch_size = batch_size or GMAIL_BATCH_SIZE
+        mensajes = {}
+
+        def _callback(request_id, response, exception):
+            if exception is not None:
+                print(f"Error recuperando el mensaje {request_id}: {exception}")
+                if errores is not None and getattr(getattr(exception, 'resp', None), 'status', None) != 404:
+                    errores.append(request_id)
+                return
+            mensajes[request_id] = response
+
+        for inicio in range(0, len(message_ids), batch_size):
+            batch = service.new_batch_http_request(callback=_callback)
+            for message_id in message_ids[inicio:inicio + batch_size]:
+                batch.add(service.users().messages().get(userId='me', id=message_id), request_id=message_id)
+            batch.execute()
+        return [mensajes[message_id] for message_id in message_ids if message_id in mensajes]
+
+    def iter_unread_message_ids(self, limit=None, page_size=None):
+        """
+        Generador de ids de mensajes no leídos de la bandeja de entrada, recorriendo todas las páginas
+        (nextPageToken) bajo demanda. Se detiene al llegar a limit.
+        Los ignorados salen de INBOX, así que no se vuelven a listar en cada ciclo.
+        """
+        service = self.get_service()
+        page_size = page_size or GMAIL_LIST_PAGE_SIZE
+        if limit:
+            page_size = min(page_size, limit)
+        emitidos = 0
+        page_token = None
+        while True:
+            response = service.users().messages().list(
+                userId='me', labelIds=['INBOX', 'UNREAD'], maxResults=page_size, pageToken=page_token
+            ).execute()
+            for msg in response.get('messages', []):
+                yield msg['id']
+                emitidos += 1
+                if limit and emitidos >= limit:
+                    return
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                return
+
+    def list_unread_message_ids(self, limit=None):
+        """
+        Lista los ids de los mensajes no leídos de la bandeja de entrada (todas las páginas, hasta limit).
+        """
+        return list(self.iter_unread_message_ids(limit=limit))
+
+    def count_backlog(self):
+        """
+        Profundidad del backlog: nº de mensajes no leídos que siguen en la bandeja de entrada.
+        """
+        service = self.get_service()
+        return service.users().labels().get(userId='me', id='INBOX').execute().get('messagesUnread', 0)
+
+    def get_current_history_id(self):
+        """
+        historyId actual del buzón.
+        """
+        service = self.get_service()
+        return service.users().getProfile(userId='me').execute().get('historyId')
+
+    def get_messages(self, message_ids, batched=None, errores=None):
+        """
+        Recupera el contenido completo de los mensajes indicados.
+        En modo lote usa peticiones batch HTTP; si no, una llamada messages.get por mensaje.
+        errores recoge los ids que no se pudieron descargar en modo lote (ver get_messages_batch).
+        """
+        batched = GMAIL_BATCH_MODE if batched is None else batched
+        if batched:
+            return self.get_messages_batch(message_ids, errores=errores)
+        service = self.get_service()
+        return [service.users().messages().get(userId='me', id=message_id).execute() for message_id in message_ids]
+
+    def fetch_unread_messages(self, batched=None):
+        """
+        Lista los mensajes no leídos y recupera su contenido completo.
+        """
+        return self.get_messages(self.list_unread_message_ids(), batched)
+
+    def full_resync(self, limit=None):
+        """
+        Resincronización completa: toma el historyId actual del buzón y lista todo UNREAD.
+        El historyId se lee antes de listar para no perder mensajes que lleguen durante el listado.
+        Devuelve (message_ids, history_id).
+        """
+        history_id = self.get_current_history_id()
+        return self.list_unread_message_ids(limit=limit), history_id
+
+    def list_history_message_ids(self, start_history_id):
+        """
+        Devuelve los ids de los mensajes no leídos añadidos desde start_history_id y el historyId más reciente.
+        Lanza HttpError 404 si el historyId ya no está disponible en Gmail (ventana de historial expirada).
+        """
+        service = self.get_service()
+        message_ids = []
+        vistos = set()
+        latest_history_id = start_history_id
+        page_token = None
+        while True:
+            response = service.users().history().list(
+                userId='me',
+                startHistoryId=start_history_id,
+                historyTypes=['messageAdded'],
+                pageToken=page_token
+            ).execute()
+            for record in response.get('history', []):
+                for added in record.get('messagesAdded', []):
+                    message = added.get('message', {})
+                    if 'UNREAD' in message.get('labelIds', []) and message['id'] not in vistos:
+                        vistos.add(message['id'])
+                        message_ids.append(message['id'])
+            latest_history_id = response.get('historyId', latest_history_id)
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                break
+        return message_ids, latest_history_id
+
+    def list_new_message_ids(self, db, cuenta="me", limit=None):
+        """
+        Devuelve los ids de mensajes nuevos desde el último checkpoint guardado en base de datos.
+        Si no hay checkpoint o el historial ha expirado, hace una resincronización completa.
+        Devuelve (message_ids, history_id, resincronizacion).
+        """
+        history_id = GmailSyncManager.get_history_id(db, cuenta)
+        if history_id:
+            try:
+                message_ids, latest_history_id = self.list_history_message_ids(history_id)
+                return message_ids, latest_history_id, False
+            except HttpError as e:
+                if getattr(e.resp, 'status', None) != 404:
+                    raise
+                print(f"El historyId {history_id} ha expirado. Realizando resincronización completa...")
+        message_ids, latest_history_id = self.full_resync(limit=limit)
+        return message_ids, latest_history_id, True
+
+    def apply_ingestion_labels(self, read_ids, ignored_ids, label_ignore="IGNORADOS_POR_IA", batched=None):
+        """
+        Marca como leídos los mensajes guardados y mueve los ignorados a label_ignore.
+        Los ignorados de todo el ciclo se mueven siempre en bloque (un batchModify, id de etiqueta cacheado).
+        En modo lote la marca de leídos también es un único batchModify.
+        """
+        batched = GMAIL_BATCH_MODE if batched is None else batched
+        self.move_messages_to_label(ignored_ids, label_ignore)
+        if not batched:
+            for message_id in read_ids:
+                self.mark_as_read(message_id)
+            return
+        if read_ids:
+            self.batch_modify(read_ids, remove_label_ids=['UNREAD'])
+
     def send_new_thread_email(self, email):
         """
         Envía un mensaje nuevo (no respuesta) a todos los jugadores para iniciar el combate.
@@ -198,71 +335,120 @@ class GmailService:
         service.users().messages().send(userId='me', body=message).execute()
         print(f"Mensaje inicial enviado a: {email.recipients} con asunto: {email.subject}")
 
-    def fetch_all_unread_emails(self, label_ignore="IGNORADOS_POR_IA"):
+    def fetch_all_unread_emails(self, label_ignore="IGNORADOS_POR_IA", batched=None, max_mensajes=None, tamano_bloque=None):
         """
-        Recupera todos los emails no leídos de la bandeja de entrada.
+        Recupera los emails no leídos de la bandeja de entrada.
         Si el subject contiene una palabra clave de campaña activa, los guarda en la base de datos con toda la información relevante.
         Si no, los mueve a la etiqueta/carpeta 'IGNORADOS_POR_IA' (o la que se indique).
+        En modo lote (GMAIL_BATCH_MODE) los cambios de etiquetas se aplican con batchModify.
+        Con GMAIL_INCREMENTAL_SYNC solo se piden a Gmail los mensajes añadidos desde el último historyId guardado.
+        Cada ciclo procesa como mucho max_mensajes (GMAIL_MAX_MESSAGES_PER_CYCLE), en bloques de tamano_bloque
+        mensajes (GMAIL_INGEST_CHUNK_SIZE): cada bloque se descarga, se guarda y se etiqueta antes de pedir el
+        siguiente, así la memoria no crece con el tamaño del backlog.
+        Devuelve un resumen con los mensajes guardados, ignorados, duplicados, fallidos (no se pudieron
+        descargar o interpretar en este ciclo) y los que siguen pendientes (sin leer en la bandeja, fallidos
+        incluidos, así el drenaje vuelve a listarlos).
+        Si algún mensaje no se pudo descargar (429, 5xx...) el historyId no avanza: el siguiente ciclo
+        incremental vuelve a listar desde el checkpoint anterior y los ya guardados salen como duplicados.
         """
+        batched = GMAIL_BATCH_MODE if batched is None else batched
+        max_mensajes = max_mensajes or GMAIL_MAX_MESSAGES_PER_CYCLE
+        tamano_bloque = tamano_bloque or GMAIL_INGEST_CHUNK_SIZE
+        resumen = {'guardados': 0, 'ignorados': 0, 'duplicados': 0, 'fallidos': 0, 'pendientes': 0}
         db = SessionLocal()
-        # Recupera todas las palabras clave de campañas activas usando CampaignManager
-        #storystates_keywords = StoryStateManager.get_active_storystate_keywords(db, campaign_id=None) 
-        service = self.get_service()
-        results = service.users().messages().list(userId='me', labelIds=['UNREAD']).execute()
-        messages = results.get('messages', [])
-        for msg in messages:
-            msg_data = service.users().messages().get(userId='me', id=msg['id']).execute()
-            headers = msg_data['payload']['headers']
-            subject = next((h['value'] for h in headers if h['name'] == 'Subject'), '')
-
-            # Verificar si el asunto contiene una palabra clave de campaña activa
-            campaign_keyword_match = re.search(r'\[(.*?)\]', subject)
-            if not campaign_keyword_match:
-                self.move_to_label(msg['id'], label_ignore)
-                continue
-
-            campaign_keyword = campaign_keyword_match.group(1)
-            campaign = CampaignManager.get_campaign_by_keyword(db, campaign_keyword)
-            if not campaign:
-                self.move_to_label(msg['id'], label_ignore)
-                continue
-
-            sender = next((h['value'] for h in headers if h['name'] == 'From'), '')
-            player_id = PlayerManager.get_player_id_by_email(db, sender)
-            character_id = CharacterManager.get_character_id_by_player_and_campaign(db, player_id, campaign.id)
+        try:
+            history_id, resincronizacion = None, False
+            if GMAIL_INCREMENTAL_SYNC and not self._drenando:
+                message_ids, history_id, resincronizacion = self.list_new_message_ids(db, limit=max_mensajes + 1)
+                if len(message_ids) > max_mensajes:
+                    # Demasiados mensajes nuevos: se procesan los primeros y el resto se drena listando UNREAD
+                    self._drenando = True
+                message_ids = iter(message_ids[:max_mensajes])
+            elif GMAIL_INCREMENTAL_SYNC:
+                # Drenando backlog: listado paginado de UNREAD con el historyId tomado antes de listar
+                history_id = self.get_current_history_id()
+                resincronizacion = True
+                message_ids = self.iter_unread_message_ids(limit=max_mensajes)
+            else:
+                message_ids = self.iter_unread_message_ids(limit=max_mensajes)
+            subject_router.ensure_fresh(db)
+            sin_descargar = 0
+            while True:
+                bloque = list(islice(message_ids, tamano_bloque))
+                if not bloque:
+                    break
+                guardados, ignorados, duplicados, fallidos, reintentables = self._ingest_block(db, bloque, label_ignore, batched)
+                resumen['guardados'] += guardados
+                resumen['ignorados'] += ignorados
+                resumen['duplicados'] += duplicados
+                resumen['fallidos'] += fallidos
+                sin_descargar += reintentables
+            # El checkpoint solo avanza cuando el ciclo se ha completado sin mensajes por descargar
+            if history_id and sin_descargar:
+                print(f"{sin_descargar} mensajes no se pudieron descargar; el historyId no avanza para reintentarlos.")
+            elif history_id:
+                GmailSyncManager.save_history_id(db, history_id, resincronizacion=resincronizacion)
+        finally:
+            db.close()
+        resumen['pendientes'] = self.count_backlog()
+        if GMAIL_INCREMENTAL_SYNC:
+            self._actualizar_drenaje(resumen['pendientes'])
+        print(f"Ingesta: {resumen['guardados']} guardados, {resumen['ignorados']} ignorados, "
+              f"{resumen['duplicados']} duplicados, {resumen['fallidos']} fallidos, "
+              f"{resumen['pendientes']} pendientes en la bandeja.")
+        return resumen
 
-            story_keyword_match = re.search(r'\((.*?)\)', subject)
-            story = None
-            if story_keyword_match:
-                story_keyword = story_keyword_match.group(1)
-                story = StoryManager.get_active_story_by_keyword(db, story_keyword, campaign.id)
+    def _actualizar_drenaje(self, pendientes):
+        """
+        Decide si el siguiente ciclo sigue drenando el backlog (listado UNREAD) o vuelve al historyId.
+        Tras GMAIL_MAX_DRAIN_CYCLES ciclos seguidos drenando se vuelve a la sincronización incremental,
+        aunque queden mensajes sin leer, para no listar toda la bandeja indefinidamente.
+        """
+        if pendientes <= 0:
+            self._drenando, self._ciclos_drenando = False, 0
+            return
+        if self._drenando:
+            self._ciclos_drenando += 1
+        if self._ciclos_drenando >= GMAIL_MAX_DRAIN_CYCLES:
+            print(f"Backlog sin vaciar tras {self._ciclos_drenando} ciclos drenando ({pendientes} pendientes). "
+                  f"Se vuelve a la sincronización incremental.")
+            self._drenando, self._ciclos_drenando = False, 0
+            return
+        self._drenando = True
 
-            if not story:
-                # Handle missing story case
-                self.move_to_label(msg['id'], label_ignore)
-                continue
+    def _ingest_block(self, db, message_ids, label_ignore, batched):
+        """
+        Descarga un bloque de mensajes, lo pasa al pipeline de ingesta y aplica las etiquetas.
+        Devuelve (guardados, ignorados, duplicados, fallidos, reintentables); fallidos son los mensajes que
+        no se pudieron descargar o interpretar, y reintentables los que fallaron al descargar por un error
+        transitorio.
+        """
+        mensajes = []
+        errores = []
+        descargados = self.get_messages(message_ids, batched, errores)
+        for msg_data in descargados:
+            try:
+                mensajes.append(gmail_a_incoming(msg_data))
+            except (KeyError, TypeError, ValueError) as e:
+                print(f"Error interpretando el mensaje {msg_data.get('id')}: {e}")
+        fallidos = len(message_ids) - len(mensajes)
+        resultado = ingest_messages(db, mensajes)
+        self.apply_ingestion_labels(resultado.guardados, resultado.ignorados, label_ignore, batched)
+        return len(resultado.email_ids), len(resultado.ignorados), resultado.duplicados, fallidos, len(errores)
 
-            scene_id = SceneManager.get_active_scene_by_story(db, story.id) if story else None
-            body = msg_data['snippet']  # O msg_data['payload']['body'] si está disponible
-            recipients = next((h['value'] for h in headers if h['name'] == 'To'), '').split(',')
-            thread_id = msg_data.get('threadId', '')
-            message_id = msg_data.get('id', '')
-            email_obj = EmailCreate(
-                player_id=player_id,
-                character_id=character_id,
-                campaign_id=campaign.id,
-                scene_id=scene_id,
-                type=EmailType.ENTRADA,
-                subject=subject,
-                body=body,
-                sender=sender,
-                recipients=recipients,
-                thread_id=thread_id,
-                message_id=message_id,
-                processed=False,
-                resumido=False
-            )
-            EmailManager.create(db, email_obj)
-            self.mark_as_read(msg['id'])
-        db.close()
 
+def gmail_a_incoming(msg_data) -> IncomingMessage:
+    """Convierte un mensaje de la API de Gmail (format=full) en un IncomingMessage."""
+    headers = msg_data['payload']['headers']
+    subject = next((h['value'] for h in headers if h['name'] == 'Subject'), '')
+    sender = next((h['value'] for h in headers if h['name'] == 'From'), '')
+    recipients = next((h['value'] for h in headers if h['name'] == 'To'), '').split(',')
+    return IncomingMessage(
+        message_id=msg_data.get('id', ''),
+        subject=subject,
+        sender=sender,
+        recipients=recipients,
+        cuerpo=extraer_cuerpo_gmail(msg_data),
+        thread_id=msg_data.get('threadId', ''),
+        snippet=msg_data.get('snippet', ''),
+    )
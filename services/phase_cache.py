@@ -0,0 +1,100 @@
+# Caché de la fase actual (narración/combate) por escena
+"""
+Evita consultar Scene.fase_actual cada vez que el orquestador procesa un email:
+- Cada entrada guarda la versión "scene" de su escena en el momento de leerla; tras cada escritura se
+  incrementa esa versión, así que una entrada con versión antigua se descarta.
+- La versión se lee antes de la consulta: si la escena cambia mientras se carga, la entrada nace ya caducada.
+- Los cambios hechos por otros procesos llegan por LISTEN/NOTIFY (scene_notifier, payload scene_id) e
+  incrementan la versión local. SceneManager.update_actual_phase envía el aviso dentro de la transacción
+  del procesamiento, así que se entrega en el mismo commit que hace visible la nueva fase. El siguiente
+  email de la escena no se puede reclamar hasta ese commit, y el aviso sale del servidor en ese momento:
+  solo queda la latencia de entrega, menor que la de listar y reclamar el email en el otro proceso.
+- Sin escucha activa en PostgreSQL no se sirve nada desde la caché (se podrían haber perdido avisos), y cada
+  entrada guarda la época de la escucha: al reconectar se descartan las cargadas antes.
+- Tamaño acotado (LRU) y TTL como respaldo.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+from sqlalchemy.orm import Session
+from api.core.cache_versions import bump_version, get_version
+from api.core.notifications import Notifier, scene_notifier
+from api.managers.scene_manager import SceneManager
+from utils.env_loader import get_env_variable
+
+PHASE_CACHE_MAX_SCENES = int(get_env_variable("PHASE_CACHE_MAX_SCENES", "1024"))
+PHASE_CACHE_TTL = int(get_env_variable("PHASE_CACHE_TTL", "300"))
+
+
+class PhaseCache:
+    """LRU de scene_id -> (fase, versión, época de la escucha, instante de carga)."""
+
+    def __init__(self, max_escenas: int = PHASE_CACHE_MAX_SCENES, ttl_segundos: float = PHASE_CACHE_TTL,
+                 cargar: Callable[[Session, int], Optional[str]] = SceneManager.get_actual_phase_by_scene_id,
+                 notifier: Notifier = scene_notifier):
+        self.max_escenas = max_escenas
+        self.ttl_segundos = ttl_segundos
+        self.cargar = cargar
+        self.notifier = notifier
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        self._suscrito = False
+        self.aciertos = 0
+        self.fallos = 0
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entradas)
+
+    def get(self, db: Session, scene_id: int) -> Optional[str]:
+        """Devuelve la fase actual de la escena, desde la caché si la entrada sigue vigente."""
+        self._suscribir()
+        version = get_version("scene", scene_id)
+        epoca = self.notifier.epoca
+        with self._lock:
+            entrada = self._entradas.get(scene_id)
+            if entrada is not None:
+                fase, version_entrada, epoca_entrada, cargado_en = entrada
+                if (version_entrada == version and epoca_entrada == epoca and self._avisos_fiables()
+                        and time.monotonic() - cargado_en <= self.ttl_segundos):
+                    self._entradas.move_to_end(scene_id)
+                    self.aciertos += 1
+                    return fase
+                del self._entradas[scene_id]
+            self.fallos += 1
+        fase = self.cargar(db, scene_id)
+        with self._lock:
+            self._entradas[scene_id] = (fase, version, epoca, time.monotonic())
+            self._entradas.move_to_end(scene_id)
+            while len(self._entradas) > self.max_escenas:
+                self._entradas.popitem(last=False)
+        return fase
+
+    def _avisos_fiables(self) -> bool:
+        """Sin PostgreSQL no hay otros procesos que avisen; con PostgreSQL hace falta la escucha activa."""
+        return not self.notifier.usa_postgres or self.notifier.escuchando
+
+    def _suscribir(self):
+        # La escucha se arranca en el primer uso, no al importar el módulo
+        with self._lock:
+            if self._suscrito:
+                return
+            self._suscrito = True
+        self.notifier.suscribir_payload(self._al_notificar)
+
+    def _al_notificar(self, payload: str):
+        if payload and payload.isdigit():
+            bump_version("scene", int(payload))
+
+    def invalidate(self, scene_id: int = None):
+        """Descarta la entrada de una escena, o todas si no se indica."""
+        with self._lock:
+            if scene_id is None:
+                self._entradas.clear()
+            else:
+                self._entradas.pop(scene_id, None)
+
+
+# Instancia global de la caché de fases
+phase_cache = PhaseCache()
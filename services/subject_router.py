@@ -0,0 +1,123 @@
+# Enrutado de emails entrantes a campaña/historia/escena/jugador/personaje
+"""
+Tabla de enrutado precompilada para la ingesta.
+Se construye con una consulta para campañas/historias/escenas activas y dos mapas ligeros
+(jugadores y personajes por campaña). Después cada mensaje se resuelve en memoria.
+La tabla se reconstruye cuando los managers registran cambios (versión "routing")
+o, como red de seguridad, cuando caduca ROUTING_TABLE_TTL.
+"""
+import re
+import threading
+import time
+from dataclasses import dataclass
+from email.utils import parseaddr
+from typing import Optional, Tuple
+from sqlalchemy import and_
+from sqlalchemy.orm import Session
+from api.core.cache_versions import get_version
+from api.models.campaign import Campaign
+from api.models.story import Story
+from api.models.scene import Scene
+from api.models.player import Player
+from api.models.character import Character
+from api.models.associations import campaign_characters
+from utils.env_loader import get_env_variable
+
+ROUTING_TABLE_TTL = int(get_env_variable("ROUTING_TABLE_TTL", "300"))
+# Asunto: [NOMBRE_CLAVE_CAMPAÑA](NOMBRE_CLAVE_HISTORIA) texto libre
+CAMPAIGN_KEYWORD_RE = re.compile(r'\[(.*?)\]')
+STORY_KEYWORD_RE = re.compile(r'\((.*?)\)')
+
+
+@dataclass(frozen=True)
+class RutaEmail:
+    """Destino completo de un email entrante."""
+    campaign_id: int
+    story_id: int
+    scene_id: Optional[int]
+    player_id: int
+    character_id: int
+
+
+class SubjectRouter:
+    """Resuelve en memoria el enrutado de un email a partir de su asunto y remitente."""
+
+    def __init__(self, ttl_segundos=ROUTING_TABLE_TTL):
+        self.ttl_segundos = ttl_segundos
+        self._campaigns = {}   # nombre_clave campaña -> (campaign_id, {nombre_clave historia: (story_id, scene_id)})
+        self._players = {}     # email -> player_id
+        self._characters = {}  # (player_id, campaign_id) -> character_id
+        self._version = None
+        self._cargado_en = None
+        self._lock = threading.Lock()
+
+    def ensure_fresh(self, db: Session):
+        """Reconstruye la tabla si ha habido cambios registrados o si ha caducado."""
+        with self._lock:
+            caducada = self._cargado_en is None or time.monotonic() - self._cargado_en > self.ttl_segundos
+            if caducada or self._version != get_version("routing"):
+                self._refresh(db)
+
+    def refresh(self, db: Session):
+        """Fuerza la reconstrucción de la tabla de enrutado."""
+        with self._lock:
+            self._refresh(db)
+
+    def _refresh(self, db: Session):
+        version = get_version("routing")
+        campaigns = {}
+        filas = (
+            db.query(Campaign.id, Campaign.nombre_clave, Story.id, Story.nombre_clave, Scene.id)
+            .outerjoin(Story, and_(Story.campaign_id == Campaign.id, Story.activa == True))
+            .outerjoin(Scene, and_(Scene.story_id == Story.id, Scene.activa == True))
+            .filter(Campaign.activa == True)
+            .order_by(Campaign.id, Story.id, Scene.id.desc())
+            .all()
+        )
+        for campaign_id, campaign_kw, story_id, story_kw, scene_id in filas:
+            _, stories = campaigns.setdefault(campaign_kw, (campaign_id, {}))
+            if story_id is not None:
+                # Si una historia tuviera varias escenas activas se queda la de menor id (orden descendente)
+                stories[story_kw] = (story_id, scene_id)
+        players = {email: player_id for player_id, email in db.query(Player.id, Player.email).all()}
+        characters = {}
+        filas_personajes = (
+            db.query(Character.player_id, campaign_characters.c.campaign_id, Character.id)
+            .join(campaign_characters, campaign_characters.c.character_id == Character.id)
+            .order_by(Character.id.desc())
+            .all()
+        )
+        for player_id, campaign_id, character_id in filas_personajes:
+            characters[(player_id, campaign_id)] = character_id
+        self._campaigns, self._players, self._characters = campaigns, players, characters
+        self._version = version
+        self._cargado_en = time.monotonic()
+
+    def route(self, subject: str, sender: str) -> Tuple[Optional[RutaEmail], str]:
+        """
+        Devuelve (ruta, motivo). Si el email no pertenece a ninguna partida activa, ruta es None
+        y motivo explica por qué se ignora.
+        """
+        campaign_match = CAMPAIGN_KEYWORD_RE.search(subject)
+        if not campaign_match:
+            return None, "sin palabra clave de campaña"
+        campaign = self._campaigns.get(campaign_match.group(1))
+        if not campaign:
+            return None, "campaña desconocida o inactiva"
+        campaign_id, stories = campaign
+        story_match = STORY_KEYWORD_RE.search(subject)
+        story = stories.get(story_match.group(1)) if story_match else None
+        if not story:
+            return None, "historia desconocida o inactiva"
+        story_id, scene_id = story
+        player_id = self._players.get(parseaddr(sender)[1])
+        if player_id is None:
+            return None, "remitente no registrado como jugador"
+        character_id = self._characters.get((player_id, campaign_id))
+        if character_id is None:
+            return None, "el jugador no tiene personaje en la campaña"
+        return RutaEmail(campaign_id, story_id, scene_id, player_id, character_id), ""
+
+
+# Instancia global del enrutador de asuntos
+subject_router = SubjectRouter()
@@ -0,0 +1,30 @@
+"""
+Transportes de correo entrante (Gmail REST, IMAP IDLE, Maildir local).
+El transporte activo se elige con la variable de entorno MAIL_TRANSPORT.
+"""
+
+from utils.env_loader import get_env_variable
+from .base import MailTransport
+
+MAIL_TRANSPORT = get_env_variable("MAIL_TRANSPORT", "gmail").lower()
+
+
+def get_transport(nombre: str = None) -> MailTransport:
+    """Crea el transporte indicado (o el de MAIL_TRANSPORT)."""
+    nombre = (nombre or MAIL_TRANSPORT).lower()
+    if nombre == "gmail":
+        from .gmail_transport import GmailTransport
+        return GmailTransport()
+    if nombre == "imap":
+        from .imap_transport import ImapTransport
+        return ImapTransport()
+    if nombre == "maildir":
+        from .maildir_transport import MaildirTransport
+        return MaildirTransport()
+    raise ValueError(f"MAIL_TRANSPORT desconocido: {nombre}. Valores válidos: gmail, imap, maildir")
+
+
+__all__ = [
+    "MailTransport",
+    "get_transport",
+]
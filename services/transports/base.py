@@ -0,0 +1,68 @@
+# Interfaz común de los transportes de correo entrante
+"""
+Un transporte sabe descargar mensajes pendientes, confirmarlos una vez guardados y, si el backend lo
+permite, esperar a que llegue correo nuevo (push) en lugar de dormir un intervalo fijo.
+"""
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, List
+from api.core.database import SessionLocal
+from services.email_ingestion import IncomingMessage, ingest_messages
+from services.subject_router import subject_router
+from utils.env_loader import get_env_variable
+
+MAIL_MAX_MESSAGES_PER_CYCLE = int(get_env_variable("MAIL_MAX_MESSAGES_PER_CYCLE", "500"))
+
+
+class MailTransport(ABC):
+    """Transporte de correo entrante."""
+
+    nombre = "base"
+    # True si wait_for_mail se despierta al llegar correo (no es un simple sleep)
+    push = False
+
+    @abstractmethod
+    def fetch_pending(self, limit: int) -> List[IncomingMessage]:
+        """Devuelve hasta limit mensajes pendientes, sin marcarlos todavía como leídos."""
+
+    @abstractmethod
+    def acknowledge(self, guardados: List[str], ignorados: List[str], label_ignore: str):
+        """Confirma los mensajes guardados y aparta los ignorados (por referencia del transporte)."""
+
+    def count_backlog(self) -> int:
+        """Nº de mensajes que siguen pendientes tras el ciclo."""
+        return 0
+
+    def wait_for_mail(self, timeout: float) -> bool:
+        """
+        Bloquea hasta que llegue correo nuevo o pase timeout segundos.
+        Devuelve True si hay correo nuevo. Por defecto es un sondeo con sleep.
+        """
+        time.sleep(timeout)
+        return True
+
+    def poll(self, label_ignore="IGNORADOS_POR_IA", max_mensajes=None) -> Dict[str, int]:
+        """
+        Ciclo de ingesta: descarga, enruta y guarda los mensajes pendientes y después los confirma.
+        Devuelve el mismo resumen que GmailService.fetch_all_unread_emails.
+        """
+        mensajes = self.fetch_pending(max_mensajes or MAIL_MAX_MESSAGES_PER_CYCLE)
+        resumen = {'guardados': 0, 'ignorados': 0, 'duplicados': 0, 'pendientes': 0}
+        if mensajes:
+            db = SessionLocal()
+            try:
+                subject_router.ensure_fresh(db)
+                resultado = ingest_messages(db, mensajes)
+            finally:
+                db.close()
+            self.acknowledge(resultado.guardados, resultado.ignorados, label_ignore)
+            resumen['guardados'] = len(resultado.email_ids)
+            resumen['ignorados'] = len(resultado.ignorados)
+            resumen['duplicados'] = resultado.duplicados
+        resumen['pendientes'] = self.count_backlog()
+        print(f"Ingesta ({self.nombre}): {resumen['guardados']} guardados, {resumen['ignorados']} ignorados, "
+              f"{resumen['duplicados']} duplicados, {resumen['pendientes']} pendientes.")
+        return resumen
+
+    def close(self):
+        """Libera conexiones abiertas."""
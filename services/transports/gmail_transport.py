@@ -0,0 +1,37 @@
+# Transporte Gmail (API REST con sondeo)
+"""
+Adapta GmailService a la interfaz MailTransport. La API REST no ofrece push sin Pub/Sub,
+así que la espera entre ciclos sigue siendo un sondeo con el intervalo configurado.
+"""
+from services.transports.base import MailTransport
+
+
+class GmailTransport(MailTransport):
+    nombre = "gmail"
+    push = False
+
+    def __init__(self, gmail_service=None):
+        self._gmail_service = gmail_service
+
+    @property
+    def gmail_service(self):
+        if self._gmail_service is None:
+            # Import diferido: gmail_service exige GMAIL_SCOPES al importarse y otros transportes no lo necesitan
+            from services.gmail_service import GmailService
+            self._gmail_service = GmailService()
+        return self._gmail_service
+
+    def poll(self, label_ignore="IGNORADOS_POR_IA", max_mensajes=None):
+        # GmailService ya gestiona historyId, paginación, bloques y etiquetas por lotes
+        return self.gmail_service.fetch_all_unread_emails(label_ignore=label_ignore, max_mensajes=max_mensajes)
+
+    def fetch_pending(self, limit):
+        from services.gmail_service import gmail_a_incoming
+        ids = self.gmail_service.list_unread_message_ids(limit=limit)
+        return [gmail_a_incoming(msg) for msg in self.gmail_service.get_messages(ids)]
+
+    def acknowledge(self, guardados, ignorados, label_ignore):
+        self.gmail_service.apply_ingestion_labels(guardados, ignorados, label_ignore)
+
+    def count_backlog(self):
+        return self.gmail_service.count_backlog()
@@ -0,0 +1,159 @@
+# Transporte IMAP con IDLE (push)
+"""
+Lee el buzón por IMAP y espera correo nuevo con IDLE (RFC 2177): el servidor avisa con
+"* n EXISTS" en cuanto llega un mensaje, así que la ingesta empieza en milisegundos en lugar
+de esperar al siguiente sondeo.
+- Los mensajes guardados se marcan con \\Seen.
+- Los ignorados se mueven a IMAP_IGNORE_FOLDER (MOVE si el servidor lo soporta, si no COPY + \\Deleted).
+- El Message-ID de la cabecera es la clave de deduplicación en base de datos.
+"""
+import email
+import imaplib
+import select
+from email import policy
+from typing import List
+from utils.env_loader import get_env_variable
+from services.email_body import extraer_cuerpo_mime
+from services.email_ingestion import IncomingMessage, parse_recipients
+from services.transports.base import MailTransport
+
+IMAP_HOST = get_env_variable("IMAP_HOST", "imap.gmail.com")
+IMAP_PORT = int(get_env_variable("IMAP_PORT", "993"))
+IMAP_USER = get_env_variable("IMAP_USER", "")
+IMAP_PASSWORD = get_env_variable("IMAP_PASSWORD", "")
+IMAP_FOLDER = get_env_variable("IMAP_FOLDER", "INBOX")
+IMAP_FETCH_CHUNK = int(get_env_variable("IMAP_FETCH_CHUNK", "50"))
+# Los servidores cortan IDLE a los 30 minutos; se renueva antes
+IMAP_IDLE_MAX_SECONDS = 29 * 60
+
+
+class ImapTransport(MailTransport):
+    nombre = "imap"
+    push = True
+
+    def __init__(self, host=IMAP_HOST, port=IMAP_PORT, user=IMAP_USER, password=IMAP_PASSWORD,
+                 folder=IMAP_FOLDER, ssl=True):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.folder = folder
+        self.ssl = ssl
+        self._conn = None
+
+    def _connection(self):
+        if self._conn is None:
+            conn = imaplib.IMAP4_SSL(self.host, self.port) if self.ssl else imaplib.IMAP4(self.host, self.port)
+            conn.login(self.user, self.password)
+            conn.select(self.folder)
+            self._conn = conn
+        return self._conn
+
+    def _descartar_conexion(self):
+        try:
+            if self._conn is not None:
+                self._conn.logout()
+        except Exception:
+            pass
+        self._conn = None
+
+    def _uid(self, *args):
+        """Ejecuta un comando UID; si la conexión se ha caído se descarta para reconectar en la siguiente llamada."""
+        try:
+            typ, data = self._connection().uid(*args)
+        except (imaplib.IMAP4.abort, OSError):
+            self._descartar_conexion()
+            raise
+        if typ != 'OK':
+            raise imaplib.IMAP4.error(f"IMAP UID {args[0]} falló: {data}")
+        return data
+
+    def _unseen_uids(self) -> List[str]:
+        data = self._uid('SEARCH', None, 'UNSEEN')
+        return data[0].decode().split() if data and data[0] else []
+
+    def fetch_pending(self, limit):
+        uids = self._unseen_uids()[:limit]
+        mensajes = []
+        for inicio in range(0, len(uids), IMAP_FETCH_CHUNK):
+            bloque = uids[inicio:inicio + IMAP_FETCH_CHUNK]
+            # BODY.PEEK no marca el mensaje como leído hasta que se confirma
+            data = self._uid('FETCH', ','.join(bloque), '(UID BODY.PEEK[])')
+            for item in data:
+                if not isinstance(item, tuple):
+                    continue
+                cabecera = item[0].decode(errors='replace')
+                uid = cabecera.split('UID ', 1)[1].split()[0].rstrip(')') if 'UID ' in cabecera else None
+                mensaje = email.message_from_bytes(item[1], policy=policy.default)
+                mensajes.append(mime_a_incoming(mensaje, uid))
+        return mensajes
+
+    def acknowledge(self, guardados, ignorados, label_ignore):
+        if guardados:
+            self._uid('STORE', ','.join(guardados), '+FLAGS', '(\\Seen)')
+        if ignorados:
+            conn = self._connection()
+            conn.create(label_ignore)  # NO si ya existe; se ignora
+            uids = ','.join(ignorados)
+            if 'MOVE' in conn.capabilities:
+                self._uid('MOVE', uids, label_ignore)
+            else:
+                self._uid('COPY', uids, label_ignore)
+                self._uid('STORE', uids, '+FLAGS', '(\\Deleted)')
+                conn.expunge()
+
+    def count_backlog(self):
+        return len(self._unseen_uids())
+
+    def wait_for_mail(self, timeout):
+        """
+        Entra en IDLE y espera a que el servidor anuncie mensajes nuevos (EXISTS) o a que pase timeout.
+        """
+        conn = self._connection()
+        if 'IDLE' not in conn.capabilities:
+            return super().wait_for_mail(timeout)
+        timeout = min(timeout, IMAP_IDLE_MAX_SECONDS)
+        tag = conn._new_tag().decode()
+        hay_correo = False
+        try:
+            conn.send(f"{tag} IDLE\r\n".encode())
+            respuesta = conn.readline()
+            if not respuesta.startswith(b'+'):
+                raise imaplib.IMAP4.error(f"El servidor rechazó IDLE: {respuesta!r}")
+            sock = conn.socket()
+            # Con SSL puede haber datos ya descifrados en el buffer que select no ve
+            pendiente = getattr(sock, 'pending', lambda: 0)()
+            if pendiente or select.select([sock], [], [], timeout)[0]:
+                hay_correo = b'EXISTS' in conn.readline()
+            conn.send(b"DONE\r\n")
+            while True:
+                linea = conn.readline()
+                if not linea:
+                    raise imaplib.IMAP4.abort("Conexión IMAP cerrada durante IDLE")
+                if b'EXISTS' in linea:
+                    hay_correo = True
+                if linea.startswith(tag.encode()):
+                    break
+        except (imaplib.IMAP4.abort, OSError):
+            self._descartar_conexion()
+            raise
+        return hay_correo
+
+    def close(self):
+        self._descartar_conexion()
+
+
+def mime_a_incoming(mensaje, referencia=None) -> IncomingMessage:
+    """Convierte un email.message.Message en un IncomingMessage."""
+    message_id = str(mensaje.get('Message-ID', '') or '').strip()
+    references = str(mensaje.get('References', '') or '').split()
+    return IncomingMessage(
+        message_id=message_id,
+        subject=str(mensaje.get('Subject', '') or ''),
+        sender=str(mensaje.get('From', '') or ''),
+        recipients=parse_recipients(str(mensaje.get('To', '') or '')),
+        cuerpo=extraer_cuerpo_mime(mensaje),
+        # El primer mensaje de la cadena identifica el hilo
+        thread_id=references[0] if references else message_id,
+        referencia=referencia,
+    )
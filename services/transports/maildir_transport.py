@@ -0,0 +1,84 @@
+# Transporte Maildir local (pruebas y benchmarks)
+"""
+Vigila un directorio Maildir: cada fichero que aparece en new/ es un mensaje entrante.
+- Los guardados se mueven a cur/ con el flag S (leído).
+- Los ignorados se mueven a la subcarpeta Maildir++ .<label_ignore>.
+La espera comprueba new/ cada MAILDIR_POLL_INTERVAL segundos (por defecto 20 ms), sin llamadas de red,
+así que un mensaje entra en el pipeline casi en cuanto se escribe.
+"""
+import os
+import time
+from email import message_from_binary_file, policy
+from utils.env_loader import get_env_variable
+from services.transports.base import MailTransport
+from services.transports.imap_transport import mime_a_incoming
+
+MAILDIR_PATH = get_env_variable("MAILDIR_PATH", os.path.join(os.path.dirname(__file__), '..', '..', 'maildir'))
+MAILDIR_POLL_INTERVAL = float(get_env_variable("MAILDIR_POLL_INTERVAL", "0.02"))
+
+
+class MaildirTransport(MailTransport):
+    nombre = "maildir"
+    push = True
+
+    def __init__(self, path=MAILDIR_PATH, poll_interval=MAILDIR_POLL_INTERVAL):
+        self.path = path
+        self.poll_interval = poll_interval
+        for subdir in ('new', 'cur', 'tmp'):
+            os.makedirs(os.path.join(self.path, subdir), exist_ok=True)
+
+    def _new_dir(self):
+        return os.path.join(self.path, 'new')
+
+    def _pendientes(self):
+        # Orden de llegada: los nombres Maildir empiezan por la marca de tiempo de entrega
+        return sorted(n for n in os.listdir(self._new_dir()) if not n.startswith('.'))
+
+    def fetch_pending(self, limit):
+        mensajes = []
+        for nombre in self._pendientes()[:limit]:
+            with open(os.path.join(self._new_dir(), nombre), 'rb') as f:
+                mensaje = message_from_binary_file(f, policy=policy.default)
+            mensajes.append(mime_a_incoming(mensaje, nombre))
+        return mensajes
+
+    def acknowledge(self, guardados, ignorados, label_ignore):
+        for nombre in guardados:
+            self._mover(nombre, self.path, 'S')
+        if ignorados:
+            carpeta = os.path.join(self.path, f'.{label_ignore}')
+            for subdir in ('new', 'cur', 'tmp'):
+                os.makedirs(os.path.join(carpeta, subdir), exist_ok=True)
+            for nombre in ignorados:
+                self._mover(nombre, carpeta, '')
+
+    def _mover(self, nombre, destino, flags):
+        origen = os.path.join(self._new_dir(), nombre)
+        if os.path.exists(origen):
+            os.rename(origen, os.path.join(destino, 'cur', f"{nombre.split(':')[0]}:2,{flags}"))
+
+    def count_backlog(self):
+        return len(self._pendientes())
+
+    def wait_for_mail(self, timeout):
+        limite = time.monotonic() + timeout
+        while True:
+            if self._pendientes():
+                return True
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                return False
+            time.sleep(min(self.poll_interval, restante))
+
+
+def entregar_en_maildir(path, contenido: bytes):
+    """
+    Entrega un mensaje en un Maildir (escritura en tmp/ y rename atómico a new/).
+    Útil para pruebas y benchmarks.
+    """
+    nombre = f"{time.time_ns()}.{os.getpid()}.aimailrol"
+    tmp = os.path.join(path, 'tmp', nombre)
+    with open(tmp, 'wb') as f:
+        f.write(contenido)
+    os.rename(tmp, os.path.join(path, 'new', nombre))
+    return nombre
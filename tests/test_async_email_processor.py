@@ -0,0 +1,67 @@
+import asyncio
+import threading
+import unittest
+from collections import defaultdict
+from api.core.notifications import Notifier
+from jobs.async_email_processor import AsyncSceneProcessor
+
+
+class TestAsyncSceneProcessor(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.pendientes = {1: [10, 11, 12], 2: [20, 21], 3: [30]}
+        self.orden = defaultdict(list)
+        self.activos_por_escena = defaultdict(int)
+        self.max_simultaneos_por_escena = 0
+        self.activos = 0
+        self.max_activos = 0
+
+    async def listar(self):
+        return [s for s, emails in self.pendientes.items() if emails]
+
+    async def procesar(self, scene_id):
+        if not self.pendientes[scene_id]:
+            return False
+        self.activos += 1
+        self.activos_por_escena[scene_id] += 1
+        self.max_activos = max(self.max_activos, self.activos)
+        self.max_simultaneos_por_escena = max(self.max_simultaneos_por_escena, self.activos_por_escena[scene_id])
+        await asyncio.sleep(0.02)  # llamada al LLM
+        self.orden[scene_id].append(self.pendientes[scene_id].pop(0))
+        self.activos -= 1
+        self.activos_por_escena[scene_id] -= 1
+        return True
+
+    async def test_concurrente_entre_escenas_y_ordenado_dentro(self):
+        procesador = AsyncSceneProcessor(self.procesar, self.listar, max_concurrencia=2)
+        await procesador.drenar(timeout=5)
+        self.assertEqual(self.orden, {1: [10, 11, 12], 2: [20, 21], 3: [30]})
+        self.assertEqual(self.max_simultaneos_por_escena, 1)
+        self.assertEqual(self.max_activos, 2)
+        self.assertEqual(procesador.procesados, 6)
+
+    async def test_escena_con_error_entra_en_enfriamiento(self):
+        llamadas = []
+
+        async def falla(scene_id):
+            llamadas.append(scene_id)
+            raise RuntimeError("LLM caído")
+
+        async def listar():
+            return [1]
+
+        procesador = AsyncSceneProcessor(falla, listar, max_concurrencia=1, enfriamiento=60)
+        await procesador.drenar(timeout=1)
+        await procesador.planificar()
+        self.assertEqual(llamadas, [1])
+
+    async def test_notificacion_desde_otro_hilo_despierta_la_espera(self):
+        notifier = Notifier("emails_test")
+        procesador = AsyncSceneProcessor(self.procesar, self.listar, notifier=notifier)
+        threading.Timer(0.05, notifier.notify).start()
+        inicio = asyncio.get_running_loop().time()
+        self.assertTrue(await procesador.esperar(5))
+        self.assertLess(asyncio.get_running_loop().time() - inicio, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import base64
+import unittest
+from services.email_body import extraer_cuerpo_gmail, limpiar_texto, html_a_texto
+
+
+def _parte(mime_type, texto):
+    data = base64.urlsafe_b64encode(texto.encode('utf-8')).decode('ascii')
+    return {'mimeType': mime_type, 'headers': [], 'body': {'data': data}}
+
+
+class TestEmailBody(unittest.TestCase):
+    def test_elimina_historial_citado_y_firma(self):
+        texto = (
+            "Darkcon baja al muelle y observa la niebla.\n\n"
+            "--\nAna\n\n"
+            "El lun, 3 mar 2025 a las 10:00, Narrador <narrador@example.com>\nescribió:\n"
+            "> La niebla cubre el puerto.\n"
+        )
+        self.assertEqual(limpiar_texto(texto), "Darkcon baja al muelle y observa la niebla.")
+
+    def test_html_sin_citas_ni_estilos(self):
+        html = ("<html><head><style>p{color:red}</style></head><body>"
+                "<p>Ataco al ghoul &amp; huyo.</p>"
+                "<div class=\"gmail_quote\"><blockquote>Texto anterior</blockquote></div>"
+                "</body></html>")
+        self.assertEqual(limpiar_texto(html_a_texto(html)), "Ataco al ghoul & huyo.")
+
+    def test_prefiere_texto_plano_y_mide_ahorro(self):
+        cita = "\n".join("> línea citada %d" % i for i in range(50))
+        msg = {
+            'snippet': 'Subo las escaleras',
+            'payload': {'mimeType': 'multipart/alternative', 'headers': [], 'parts': [
+                _parte('text/plain', "Subo las escaleras.\n\nOn Mon, Narrador wrote:\n" + cita),
+                _parte('text/html', "<p>Subo las escaleras.</p>"),
+            ]},
+        }
+        cuerpo = extraer_cuerpo_gmail(msg)
+        self.assertEqual(cuerpo.texto, "Subo las escaleras.")
+        self.assertGreater(cuerpo.bytes_ahorrados, 0)
+        self.assertGreater(cuerpo.tokens_ahorrados, 0)
+
+    def test_narracion_que_termina_en_escribio_no_es_una_cita(self):
+        texto = ("El mago Zhor toma la pluma y, tras pensarlo mucho, escribió:\n"
+                 "Que la runa del norte se apague.\n\n"
+                 "El 3/3/2025 10:00, Narrador escribió:\n> Texto anterior")
+        self.assertEqual(limpiar_texto(texto), "El mago Zhor toma la pluma y, tras pensarlo mucho, escribió:\n"
+                                               "Que la runa del norte se apague.")
+
+    def test_respeta_el_charset_de_la_parte_gmail(self):
+        texto = "Cojo la poción y salto al río.\n\nEl lun, 3 mar 2025 a las 10:00, Narrador escribió:\n> cita"
+        data = base64.urlsafe_b64encode(texto.encode('iso-8859-1')).decode('ascii')
+        parte = {'mimeType': 'text/plain', 'headers': [{'name': 'Content-Type', 'value': 'text/plain; charset="ISO-8859-1"'}],
+                 'body': {'data': data}}
+        self.assertEqual(extraer_cuerpo_gmail({'snippet': '', 'payload': parte}).texto, "Cojo la poción y salto al río.")
+
+    def test_tope_de_tamano(self):
+        msg = {'snippet': '', 'payload': _parte('text/plain', "a" * 1000)}
+        cuerpo = extraer_cuerpo_gmail(msg, max_bytes=100)
+        self.assertTrue(cuerpo.truncado)
+        self.assertEqual(len(cuerpo.texto), 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
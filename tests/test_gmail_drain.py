@@ -0,0 +1,79 @@
+import unittest
+from unittest import mock
+import services.gmail_service as gmail_service
+from services.email_ingestion import ResultadoIngesta
+from services.gmail_service import GmailService
+
+
+def _servicio():
+    servicio = GmailService.__new__(GmailService)
+    servicio._drenando = False
+    servicio._ciclos_drenando = 0
+    return servicio
+
+
+class TestDrenajeGmail(unittest.TestCase):
+    def test_vuelve_al_historial_tras_el_maximo_de_ciclos(self):
+        servicio = _servicio()
+        with mock.patch.object(gmail_service, "GMAIL_MAX_DRAIN_CYCLES", 3):
+            servicio._actualizar_drenaje(10)
+            self.assertTrue(servicio._drenando)
+            servicio._actualizar_drenaje(10)
+            servicio._actualizar_drenaje(10)
+            self.assertTrue(servicio._drenando)
+            servicio._actualizar_drenaje(10)
+            self.assertFalse(servicio._drenando)
+            self.assertEqual(servicio._ciclos_drenando, 0)
+
+    def test_sin_pendientes_deja_de_drenar(self):
+        servicio = _servicio()
+        servicio._actualizar_drenaje(5)
+        servicio._actualizar_drenaje(0)
+        self.assertFalse(servicio._drenando)
+
+    def test_cuenta_los_mensajes_que_no_se_descargan_o_interpretan(self):
+        servicio = _servicio()
+        valido = {'id': 'a', 'threadId': 't', 'snippet': '', 'payload': {'headers': [], 'mimeType': 'text/plain', 'body': {}}}
+        roto = {'id': 'b'}  # Sin payload: no se puede interpretar
+
+        def descargar(ids, batched, errores):
+            errores.append('c')  # 'c' no se pudo descargar (p. ej. 429)
+            return [valido, roto]
+
+        servicio.get_messages = descargar
+        servicio.apply_ingestion_labels = mock.Mock()
+        with mock.patch.object(gmail_service, "ingest_messages", return_value=ResultadoIngesta()) as ingest:
+            _, _, _, fallidos, reintentables = servicio._ingest_block(None, ['a', 'b', 'c'], "IGNORADOS_POR_IA", True)
+        self.assertEqual(fallidos, 2)
+        self.assertEqual(reintentables, 1)
+        self.assertEqual(len(ingest.call_args[0][1]), 1)
+
+    def test_no_avanza_el_historial_si_falla_una_descarga(self):
+        servicio = _servicio()
+        servicio.list_new_message_ids = mock.Mock(return_value=(['a', 'b'], '200', False))
+        servicio._ingest_block = mock.Mock(return_value=(1, 0, 0, 1, 1))
+        servicio.count_backlog = mock.Mock(return_value=1)  # 'b' sigue sin leer en la bandeja
+        with mock.patch.object(gmail_service, "SessionLocal"), \
+                mock.patch.object(gmail_service, "subject_router"), \
+                mock.patch.object(gmail_service, "GMAIL_INCREMENTAL_SYNC", True), \
+                mock.patch.object(gmail_service.GmailSyncManager, "save_history_id") as guardar:
+            resumen = servicio.fetch_all_unread_emails()
+        guardar.assert_not_called()
+        self.assertEqual(resumen['pendientes'], 1)
+        self.assertTrue(servicio._drenando)  # El siguiente ciclo lista UNREAD y vuelve a pedir 'b'
+
+        servicio._ingest_block = mock.Mock(return_value=(1, 0, 0, 0, 0))
+        servicio.get_current_history_id = mock.Mock(return_value='210')
+        servicio.iter_unread_message_ids = mock.Mock(return_value=iter(['b']))
+        servicio.count_backlog = mock.Mock(return_value=0)
+        with mock.patch.object(gmail_service, "SessionLocal"), \
+                mock.patch.object(gmail_service, "subject_router"), \
+                mock.patch.object(gmail_service, "GMAIL_INCREMENTAL_SYNC", True), \
+                mock.patch.object(gmail_service.GmailSyncManager, "save_history_id") as guardar:
+            servicio.fetch_all_unread_emails()
+        self.assertEqual(guardar.call_args[0][1], '210')
+        self.assertFalse(servicio._drenando)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import os
+import tempfile
+import unittest
+from typing import Any, Optional, TypedDict
+from langgraph.graph import StateGraph, END
+from sqlalchemy import create_engine
+from api.models.graph_checkpoint import GraphCheckpoint
+from ia.langgraph.checkpointer import SQLAlchemySaver
+
+
+class Estado(TypedDict):
+    pasos: list
+    db_session: Optional[Any]
+
+
+class TestSQLAlchemySaver(unittest.TestCase):
+    def setUp(self):
+        # Fichero temporal: LangGraph guarda los checkpoints desde hilos de fondo, cada uno con su conexión
+        fd, self.ruta = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        self.engine = create_engine(f"sqlite:///{self.ruta}", connect_args={"check_same_thread": False})
+        self.saver = SQLAlchemySaver(self.engine, crear_tablas=True)
+        self.llamadas = []
+        self.fallar = True
+
+        def analizar(state, config):
+            self.llamadas.append("analizar")
+            assert config["configurable"]["db_session"] == "sesion"
+            return {"pasos": state["pasos"] + ["analizar"], "db_session": "sesion"}
+
+        def responder(state, config):
+            self.llamadas.append("responder")
+            if self.fallar:
+                raise RuntimeError("proceso caído")
+            return {"pasos": state["pasos"] + ["responder"]}
+
+        workflow = StateGraph(Estado)
+        workflow.add_node("analizar", analizar)
+        workflow.add_node("responder", responder)
+        workflow.set_entry_point("analizar")
+        workflow.add_edge("analizar", "responder")
+        workflow.add_edge("responder", END)
+        self.graph = workflow.compile(checkpointer=self.saver)
+        self.config = {"configurable": {"thread_id": "email_1", "db_session": "sesion"}}
+
+    def tearDown(self):
+        self.engine.dispose()
+        os.remove(self.ruta)
+
+    def test_reanuda_desde_el_ultimo_nodo_completado(self):
+        with self.assertRaises(RuntimeError):
+            self.graph.invoke({"pasos": []}, self.config)
+        previo = self.graph.get_state(self.config)
+        self.assertEqual(previo.next, ("responder",))
+        self.assertNotIn("db_session", previo.values)
+
+        self.fallar = False
+        resultado = self.graph.invoke(None, self.config)
+        self.assertEqual(resultado["pasos"], ["analizar", "responder"])
+        self.assertEqual(self.llamadas, ["analizar", "responder", "responder"])
+
+    def test_compacta_y_elimina_la_ejecucion(self):
+        self.fallar = False
+        self.graph.invoke({"pasos": []}, self.config)
+        with self.saver._sesiones() as db:
+            self.assertLessEqual(db.query(GraphCheckpoint).count(), 2)
+        self.saver.delete_thread("email_1")
+        self.assertIsNone(self.saver.get_tuple(self.config))
+
+
+if __name__ == '__main__':
+    unittest.main()
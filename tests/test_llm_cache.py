@@ -0,0 +1,51 @@
+import os
+import tempfile
+import time
+import unittest
+from langchain_core.messages import HumanMessage, SystemMessage
+from ia.llm_cache import LLMCache, clave_cache
+
+
+class TestLLMCache(unittest.TestCase):
+    def setUp(self):
+        self.carpeta = tempfile.TemporaryDirectory()
+        self.ruta = os.path.join(self.carpeta.name, "llm_cache.sqlite")
+
+    def tearDown(self):
+        self.carpeta.cleanup()
+
+    def test_clave_depende_de_mensajes_y_parametros(self):
+        mensajes = [SystemMessage(content="Resume"), HumanMessage(content="Texto")]
+        parametros = {"temperature": 0.3, "top_p": 0.8, "max_tokens": 4096}
+        clave = clave_cache("gpt", parametros, mensajes)
+        self.assertEqual(clave, clave_cache("gpt", dict(parametros), list(mensajes)))
+        self.assertNotEqual(clave, clave_cache("gpt", {**parametros, "temperature": 0.2}, mensajes))
+        self.assertNotEqual(clave, clave_cache("gpt", parametros, [HumanMessage(content="Resume"), HumanMessage(content="Texto")]))
+
+    def test_acierto_fallo_y_ttl(self):
+        cache = LLMCache(self.ruta, ttl_segundos=60, perfiles=["resumen"])
+        self.assertIsNone(cache.get("a", "resumen"))
+        cache.put("a", "resumen", "respuesta")
+        self.assertEqual(LLMCache(self.ruta, ttl_segundos=60).get("a", "resumen"), "respuesta")  # persiste en disco
+        self.assertEqual(cache.get("a", "resumen"), "respuesta")
+        self.assertEqual((cache.aciertos, cache.fallos), (1, 1))
+        caducada = LLMCache(self.ruta, ttl_segundos=0)
+        time.sleep(0.01)
+        self.assertIsNone(caducada.get("a", "resumen"))
+
+    def test_desalojo_por_tamano(self):
+        cache = LLMCache(self.ruta, max_bytes=25)
+        for clave in ["a", "b", "c"]:
+            cache.put(clave, "resumen", "x" * 10)
+            time.sleep(0.01)
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get("a", "resumen"))
+
+    def test_perfil_creativo_no_se_cachea_por_defecto(self):
+        cache = LLMCache(self.ruta)
+        self.assertFalse(cache.activa_para("creativa"))
+        self.assertTrue(cache.activa_para("clasificacion"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import asyncio
+import unittest
+import httpx
+import openai
+from ia.llm_governor import CircuitBreaker, CircuitoAbierto, ConcurrenciaAdaptativa, LLMGovernor
+
+PETICION = httpx.Request("POST", "https://test.openai.azure.com/openai/deployments/gpt/chat/completions")
+
+
+def rate_limit(retry_after_ms="20"):
+    respuesta = httpx.Response(429, headers={"retry-after-ms": retry_after_ms}, request=PETICION)
+    return openai.RateLimitError("Too Many Requests", response=respuesta, body=None)
+
+
+def error_servidor():
+    return openai.InternalServerError("Bad Gateway", response=httpx.Response(502, request=PETICION), body=None)
+
+
+class TestLLMGovernor(unittest.TestCase):
+    def governor(self, **kwargs):
+        return LLMGovernor(rpm=0, tpm=0, concurrencia=ConcurrenciaAdaptativa(inicial=8, minimo=1, maximo=16),
+                           backoff_base=0.01, **kwargs)
+
+    def test_429_respeta_retry_after_y_reduce_la_concurrencia(self):
+        governor = self.governor()
+        fallos = [rate_limit(), rate_limit()]
+
+        def llamada():
+            if fallos:
+                raise fallos.pop(0)
+            return "ok"
+
+        self.assertEqual(governor.ejecutar("precisa", llamada), "ok")
+        self.assertEqual(int(governor.concurrencia.limite), 4)  # dos 429 seguidos reducen el límite una sola vez
+        self.assertEqual(governor.concurrencia.en_curso, 0)
+
+    def test_error_no_transitorio_no_se_reintenta(self):
+        governor = self.governor()
+        llamadas = []
+
+        def llamada():
+            llamadas.append(1)
+            raise ValueError("respuesta inválida")
+
+        with self.assertRaises(ValueError):
+            governor.ejecutar("precisa", llamada)
+        self.assertEqual(len(llamadas), 1)
+
+    def test_circuito_se_abre_tras_fallos_seguidos(self):
+        governor = self.governor(circuito=CircuitBreaker(fallos_para_abrir=3, enfriamiento=60), max_reintentos=10)
+        llamadas = []
+
+        def llamada():
+            llamadas.append(1)
+            raise error_servidor()
+
+        with self.assertRaises(CircuitoAbierto):
+            governor.ejecutar("precisa", llamada)
+        self.assertEqual(len(llamadas), 3)
+        with self.assertRaises(CircuitoAbierto):
+            governor.ejecutar("precisa", lambda: "ok")
+
+    def test_semiabierto_deja_pasar_una_prueba_que_cierra_el_circuito(self):
+        circuito = CircuitBreaker(fallos_para_abrir=1, enfriamiento=0)
+        circuito.registrar_fallo()
+        self.assertTrue(circuito.permitir())
+        self.assertEqual(circuito.estado, CircuitBreaker.SEMIABIERTO)
+        circuito.registrar_exito()
+        self.assertEqual(circuito.estado, CircuitBreaker.CERRADO)
+
+    def test_limite_de_concurrencia_asincrono(self):
+        governor = self.governor()
+        governor.concurrencia.limite = 2
+        simultaneas = {"actual": 0, "max": 0}
+
+        async def llamada():
+            simultaneas["actual"] += 1
+            simultaneas["max"] = max(simultaneas["max"], simultaneas["actual"])
+            await asyncio.sleep(0.01)
+            simultaneas["actual"] -= 1
+            return "ok"
+
+        async def varias():
+            return await asyncio.gather(*(governor.aejecutar("precisa", llamada) for _ in range(6)))
+
+        governor.concurrencia.maximo = 2  # que los éxitos no suban el límite durante la prueba
+        self.assertEqual(asyncio.run(varias()), ["ok"] * 6)
+        self.assertEqual(simultaneas["max"], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
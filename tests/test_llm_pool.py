@@ -0,0 +1,34 @@
+import os
+import unittest
+from langchain_core.messages import HumanMessage
+
+os.environ.setdefault("AZURE_OPENAI_ENDPOINT", "https://test.openai.azure.com/")
+os.environ.setdefault("AZURE_OPENAI_API_KEY", "test")
+
+from ia.ia_client import IAClient
+from ia.llm_pool import LLMPool
+
+
+class TestLLMPool(unittest.TestCase):
+    def test_un_modelo_base_con_parametros_por_perfil(self):
+        pool = LLMPool(IAClient.PERFILES)
+        creativa, precisa = pool.modelo("creativa"), pool.modelo("precisa")
+        self.assertIs(creativa, pool.modelo("creativa"))
+        self.assertIs(creativa.bound, precisa.bound)
+        payload = precisa.bound._get_request_payload([HumanMessage(content="Hola")], **precisa.kwargs)
+        self.assertEqual((payload["temperature"], payload["top_p"], payload["max_tokens"]), (0.2, 0.7, 1024))
+        with self.assertRaises(ValueError):
+            pool.modelo("inexistente")
+
+    def test_perfil_con_otro_despliegue(self):
+        pool = LLMPool(IAClient.PERFILES, despliegues={"creativa_economica": "gpt-barato", "resumen_economico": ""})
+        economica = pool.modelo("creativa_economica")
+        self.assertEqual(economica.bound.deployment_name, "gpt-barato")
+        self.assertIsNot(economica.bound, pool.modelo("creativa").bound)
+        self.assertIs(pool.modelo("resumen_economico").bound, pool.base)
+        payload = economica.bound._get_request_payload([HumanMessage(content="Hola")], **economica.kwargs)
+        self.assertEqual(payload["max_tokens"], IAClient.PERFILES["creativa"]["max_tokens"])
+
+
+if __name__ == '__main__':
+    unittest.main()
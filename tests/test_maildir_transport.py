@@ -0,0 +1,50 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from email.message import EmailMessage
+from services.transports.maildir_transport import MaildirTransport, entregar_en_maildir
+
+
+def _mensaje(message_id, subject, cuerpo):
+    msg = EmailMessage()
+    msg['Message-ID'] = message_id
+    msg['From'] = "Ana <ana@example.com>"
+    msg['To'] = "narrador@example.com"
+    msg['Subject'] = subject
+    msg.set_content(cuerpo)
+    return msg.as_bytes()
+
+
+class TestMaildirTransport(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.transport = MaildirTransport(self.tmp.name, poll_interval=0.005)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_lee_y_confirma_mensajes(self):
+        entregar_en_maildir(self.tmp.name, _mensaje("<a1@example.com>", "[NOCHE](PUERTO) Hola", "Entro en la taberna.\n\n-- \nAna"))
+        entregar_en_maildir(self.tmp.name, _mensaje("<a2@example.com>", "Oferta", "Compra ya"))
+        mensajes = self.transport.fetch_pending(10)
+        self.assertEqual([m.message_id for m in mensajes], ["<a1@example.com>", "<a2@example.com>"])
+        self.assertEqual(mensajes[0].cuerpo.texto, "Entro en la taberna.")
+        self.assertEqual(mensajes[0].recipients, ["narrador@example.com"])
+
+        self.transport.acknowledge([mensajes[0].ref], [mensajes[1].ref], "IGNORADOS_POR_IA")
+        self.assertEqual(self.transport.count_backlog(), 0)
+        self.assertEqual(len(os.listdir(os.path.join(self.tmp.name, 'cur'))), 1)
+        self.assertEqual(len(os.listdir(os.path.join(self.tmp.name, '.IGNORADOS_POR_IA', 'cur'))), 1)
+
+    def test_wait_for_mail_despierta_al_llegar_correo(self):
+        self.assertFalse(self.transport.wait_for_mail(0.01))
+        threading.Timer(0.05, entregar_en_maildir, (self.tmp.name, _mensaje("<b@example.com>", "x", "y"))).start()
+        inicio = time.monotonic()
+        self.assertTrue(self.transport.wait_for_mail(5))
+        self.assertLess(time.monotonic() - inicio, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
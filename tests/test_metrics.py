@@ -0,0 +1,37 @@
+import unittest
+from utils.metrics import RegistroMetricas, RitmoPorMinuto
+
+
+class TestMetricas(unittest.TestCase):
+    def test_exportacion_prometheus(self):
+        registro = RegistroMetricas()
+        emails = registro.contador("emails_total", "Emails procesados", ["resultado"])
+        latencia = registro.histograma("nodo_segundos", "Latencia por nodo", ["nodo"], buckets=(0.1, 1))
+        emails.inc(resultado="ok")
+        emails.inc(2, resultado="ok")
+        latencia.observe(0.5, nodo="gather_context")
+        latencia.observe(3, nodo="gather_context")
+
+        texto = registro.exportar()
+        self.assertIn("# TYPE emails_total counter", texto)
+        self.assertIn('emails_total{resultado="ok"} 3', texto)
+        self.assertIn('nodo_segundos_bucket{nodo="gather_context",le="0.1"} 0', texto)
+        self.assertIn('nodo_segundos_bucket{nodo="gather_context",le="1"} 1', texto)
+        self.assertIn('nodo_segundos_bucket{nodo="gather_context",le="+Inf"} 2', texto)
+        self.assertIn('nodo_segundos_sum{nodo="gather_context"} 3.5', texto)
+        self.assertIn('nodo_segundos_count{nodo="gather_context"} 2', texto)
+
+    def test_etiquetas_incorrectas(self):
+        contador = RegistroMetricas().contador("llm_total", "Llamadas", ["perfil"])
+        with self.assertRaises(ValueError):
+            contador.inc(nodo="x")
+
+    def test_ritmo_por_minuto(self):
+        ritmo = RitmoPorMinuto(ventana_segundos=60)
+        ritmo.registrar(3)
+        ritmo.registrar()
+        self.assertEqual(ritmo.por_minuto(), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
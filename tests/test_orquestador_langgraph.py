@@ -0,0 +1,211 @@
+import importlib
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+from sqlalchemy import ARRAY, create_engine
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import sessionmaker
+from api.core.database import Base
+from api.core.notifications import Notifier
+from api.models.campaign import Campaign
+from api.models.email import Email, EmailType
+from api.models.scene import Scene, PhaseType
+from api.models.story import Story
+from ia.langgraph.checkpointer import SQLAlchemySaver
+from ia.langgraph.graphs.processing_graph import ProcessingGraph
+from ia.langgraph.nodes.context_gathering_node import ContextGatheringNode
+from ia.langgraph.nodes.narrative_email_analysis_node import NarrativeEmailAnalysisNode
+from ia.langgraph.nodes.narrative_response_generation_node import NarrativeResponseGenerationNode
+from ia.langgraph.nodes.registry import node_registry
+from ia.langgraph.nodes.rules_validation_node import RulesValidationNode
+from ia.langgraph.orquestador_langgraph import OrquestadorLangGraph
+from services.phase_cache import PhaseCache
+
+# ia.langgraph exporta la instancia orquestador_langgraph con el mismo nombre que el módulo
+orquestador_modulo = importlib.import_module("ia.langgraph.orquestador_langgraph")
+
+
+@compiles(ARRAY, "sqlite")
+def _array_en_sqlite(tipo, compilador, **kw):
+    # Email.recipients es un ARRAY de PostgreSQL; en la base de datos de prueba basta con una columna de texto
+    return "TEXT"
+
+
+class BaseOrquestador(unittest.TestCase):
+    """Orquestador real sobre una base de datos sqlite con una escena y sus emails."""
+
+    def setUp(self):
+        fd, self.ruta = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        self.engine = create_engine(f"sqlite:///{self.ruta}", connect_args={"check_same_thread": False})
+        Base.metadata.create_all(self.engine, tables=[
+            Campaign.__table__, Story.__table__, Scene.__table__, Email.__table__])
+        self.sesiones = sessionmaker(bind=self.engine, autoflush=False)
+        db = self.sesiones()
+        campaign = Campaign(nombre="Noche eterna", nombre_clave="NOCHE", activa=True)
+        db.add(campaign)
+        db.flush()
+        story = Story(campaign_id=campaign.id, nombre="El puerto", nombre_clave="PUERTO", activa=True)
+        db.add(story)
+        db.flush()
+        scene = Scene(story_id=story.id, nombre="Muelle", descripcion="Niebla", activa=True, fase_actual=PhaseType.narracion)
+        db.add(scene)
+        db.commit()
+        self.campaign_id, self.scene_id = campaign.id, scene.id
+        db.close()
+        parche = mock.patch.object(orquestador_modulo, "SessionLocal", self.sesiones)
+        parche.start()
+        self.addCleanup(parche.stop)
+        self.orquestador = OrquestadorLangGraph()
+        self.orquestador.narrative_graph = mock.Mock()
+        self.orquestador.phase_cache = PhaseCache(cargar=lambda db, scene_id: PhaseType.narracion, notifier=Notifier("fases"))
+
+    def tearDown(self):
+        self.engine.dispose()
+        os.remove(self.ruta)
+
+    def crear_email(self, cuerpo: str) -> int:
+        db = self.sesiones()
+        email = Email(campaign_id=self.campaign_id, scene_id=self.scene_id, type=EmailType.ENTRADA,
+                      subject="NOCHE", body=cuerpo, sender="ana@example.com", recipients=None,
+                      message_id=f"<{cuerpo}@example.com>", date=datetime.now(tz=timezone.utc))
+        db.add(email)
+        db.commit()
+        email_id = email.id
+        db.close()
+        return email_id
+
+    def leer_email(self, email_id: int) -> Email:
+        db = self.sesiones()
+        try:
+            return db.get(Email, email_id)
+        finally:
+            db.close()
+
+
+class TestPresupuestoAgotado(BaseOrquestador):
+    def test_aplaza_sin_llamar_al_llm_ni_gastar_intentos(self):
+        email_id = self.crear_email("Ataco al orco")
+        with mock.patch.object(orquestador_modulo.medidor_tokens, "bloqueada", return_value=True):
+            for _ in range(orquestador_modulo.EMAIL_MAX_ATTEMPTS + 1):
+                resultado = self.orquestador.procesar_email(worker_id="w1")
+                db = self.sesiones()
+                db.query(Email).update({Email.claimed_until: None})  # Simula que ha pasado la espera
+                db.commit()
+                db.close()
+        self.assertEqual(resultado['reason'], 'presupuesto_agotado')
+        self.orquestador.narrative_graph.process_email_group.assert_not_called()
+        email = self.leer_email(email_id)
+        self.assertEqual(email.intentos, 0)
+        self.assertFalse(email.fallido)
+        self.assertFalse(email.processed)
+
+    def test_corte_durante_el_grafo_no_cuenta_el_intento(self):
+        email_id = self.crear_email("Ataco al orco")
+        self.orquestador.narrative_graph.process_email_group.return_value = {'success': False, 'errors': ['corte']}
+        with mock.patch.object(orquestador_modulo.medidor_tokens, "bloqueada", side_effect=[False, True]):
+            resultado = self.orquestador.procesar_email(worker_id="w1")
+        self.assertEqual(resultado['reason'], 'presupuesto_agotado')
+        email = self.leer_email(email_id)
+        self.assertEqual(email.intentos, 0)
+        self.assertIsNone(email.claimed_by)
+        self.assertIsNotNone(email.claimed_until)
+        self.assertEqual(email.ultimo_error, "Presupuesto de tokens agotado")
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+class Contador:
+    """Nodo de prueba que cuenta sus llamadas y aplica cambios fijos al estado."""
+
+    def __init__(self, cambios: dict, fallar: int = 0):
+        self.cambios = cambios
+        self.fallar = fallar
+        self.llamadas = 0
+
+    def __call__(self, state):
+        self.llamadas += 1
+        if self.fallar:
+            self.fallar -= 1
+            raise RuntimeError("Azure OpenAI no responde")
+        state.update(self.cambios)
+        return state
+
+
+class ValidacionVacia(RulesValidationNode):
+    def __init__(self):
+        pass
+
+
+class TestReanudacionTrasCaida(BaseOrquestador):
+    def setUp(self):
+        super().setUp()
+        self.contexto = Contador({'contexto_usuario': {'escena': 'Muelle'}})
+        self.analisis = Contador({'intenciones': []})
+        self.respuesta = Contador({'respuesta_ia': 'El orco retrocede.', 'processed': True})
+        self.originales = dict(node_registry._instancias)
+        node_registry._instancias.update({
+            ContextGatheringNode: self.contexto,
+            NarrativeEmailAnalysisNode: self.analisis,
+            RulesValidationNode: ValidacionVacia(),
+            NarrativeResponseGenerationNode: self.respuesta,
+        })
+        grafo = ProcessingGraph.__new__(ProcessingGraph)
+        grafo.checkpointer = SQLAlchemySaver(self.engine, crear_tablas=True)
+        grafo.graph = grafo._build_graph()
+        self.orquestador.narrative_graph = grafo
+
+    def tearDown(self):
+        node_registry._instancias.clear()
+        node_registry._instancias.update(self.originales)
+        super().tearDown()
+
+    def caducar_leases(self):
+        db = self.sesiones()
+        db.query(Email).update({Email.claimed_until: datetime.now(tz=timezone.utc) - timedelta(seconds=1)})
+        db.commit()
+        db.close()
+
+    def test_reanuda_el_grupo_aunque_hayan_llegado_mas_emails(self):
+        grupo = [self.crear_email("Ataco al orco"), self.crear_email("Cubro a Ana"), self.crear_email("Huyo")]
+        # El proceso muere con el grafo ya terminado, antes del commit
+        with mock.patch.object(self.orquestador, "_confirmar", side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                self.orquestador.procesar_email(self.scene_id, worker_id="w1", agrupar=True)
+        self.assertEqual((self.contexto.llamadas, self.analisis.llamadas, self.respuesta.llamadas), (1, 1, 1))
+        checkpoint = self.orquestador.narrative_graph.checkpointer.get_tuple(
+            {"configurable": {"thread_id": f"email_{grupo[0]}"}})
+        self.assertEqual(checkpoint.metadata["grupo_emails"], ",".join(str(email_id) for email_id in grupo))
+
+        tardio = self.crear_email("Grito pidiendo ayuda")
+        self.caducar_leases()
+        resultado = self.orquestador.procesar_email(self.scene_id, worker_id="w2", agrupar=True)
+
+        self.assertTrue(resultado['success'])
+        self.assertEqual(resultado['email_ids'], grupo)
+        self.assertEqual((self.contexto.llamadas, self.analisis.llamadas, self.respuesta.llamadas), (1, 1, 1))
+        self.assertTrue(all(self.leer_email(email_id).processed for email_id in grupo))
+        pendiente = self.leer_email(tardio)
+        self.assertFalse(pendiente.processed)
+        self.assertIsNone(pendiente.claimed_by)
+        self.assertEqual(pendiente.intentos, 0)
+        self.assertIsNone(self.orquestador.narrative_graph.checkpointer.get_tuple(
+            {"configurable": {"thread_id": f"email_{grupo[0]}"}}))
+
+    def test_un_fallo_en_la_respuesta_reanuda_sin_repetir_el_analisis(self):
+        self.respuesta.fallar = 1
+        grupo = [self.crear_email("Ataco al orco"), self.crear_email("Cubro a Ana")]
+        resultado = self.orquestador.procesar_email(self.scene_id, worker_id="w1", agrupar=True)
+        self.assertFalse(resultado['success'])
+
+        self.crear_email("Huyo")
+        self.caducar_leases()
+        resultado = self.orquestador.procesar_email(self.scene_id, worker_id="w1", agrupar=True)
+
+        self.assertTrue(resultado['success'])
+        self.assertEqual(resultado['email_ids'], grupo)
+        self.assertEqual((self.contexto.llamadas, self.analisis.llamadas, self.respuesta.llamadas), (1, 1, 2))
@@ -0,0 +1,75 @@
+import unittest
+from api.core.cache_versions import bump_version
+from api.core.notifications import Notifier
+from services.phase_cache import PhaseCache
+
+
+class NotifierPostgres(Notifier):
+    """Notifier que se comporta como si usara PostgreSQL, sin conexión real de escucha."""
+    usa_postgres = True
+
+    def _arrancar_escucha(self):
+        pass
+
+
+class TestPhaseCache(unittest.TestCase):
+    def setUp(self):
+        self.fases = {1: "narracion", 2: "combate", 3: "narracion"}
+        self.cargas = []
+
+    def cargar(self, db, scene_id):
+        self.cargas.append(scene_id)
+        return self.fases[scene_id]
+
+    def test_acierto_hasta_que_cambia_la_version(self):
+        cache = PhaseCache(cargar=self.cargar, notifier=Notifier("fases"))
+        self.assertEqual(cache.get(None, 1), "narracion")
+        self.assertEqual(cache.get(None, 1), "narracion")
+        self.assertEqual(self.cargas, [1])
+        self.fases[1] = "combate"
+        bump_version("scene", 1)
+        self.assertEqual(cache.get(None, 1), "combate")
+        self.assertEqual(self.cargas, [1, 1])
+
+    def test_lru_y_ttl(self):
+        cache = PhaseCache(max_escenas=2, cargar=self.cargar, notifier=Notifier("fases"))
+        cache.get(None, 1)
+        cache.get(None, 2)
+        cache.get(None, 1)
+        cache.get(None, 3)  # expulsa la escena 2, la menos usada
+        self.assertEqual(len(cache), 2)
+        cache.get(None, 2)
+        self.assertEqual(self.cargas, [1, 2, 3, 2])
+        caducada = PhaseCache(ttl_segundos=-1, cargar=self.cargar, notifier=Notifier("fases"))
+        caducada.get(None, 1)
+        caducada.get(None, 1)
+        self.assertEqual(self.cargas[-2:], [1, 1])
+
+    def test_aviso_de_otro_proceso_invalida_la_entrada(self):
+        notifier = NotifierPostgres("fases")
+        cache = PhaseCache(cargar=self.cargar, notifier=notifier)
+        notifier._cambiar_escucha(True)
+        cache.get(None, 1)
+        cache.get(None, 1)
+        self.assertEqual(self.cargas, [1])
+        self.fases[1] = "combate"  # Cambio hecho por otro proceso: llega como NOTIFY con el scene_id
+        notifier._despertar("1")
+        self.assertEqual(cache.get(None, 1), "combate")
+        self.assertEqual(self.cargas, [1, 1])
+
+    def test_sin_escucha_no_sirve_desde_la_cache(self):
+        notifier = NotifierPostgres("fases")
+        cache = PhaseCache(cargar=self.cargar, notifier=notifier)
+        cache.get(None, 1)
+        cache.get(None, 1)
+        self.assertEqual(self.cargas, [1, 1])
+        notifier._cambiar_escucha(True)  # Lo cargado antes de conectar la escucha no vale
+        cache.get(None, 1)
+        cache.get(None, 1)
+        self.assertEqual(self.cargas, [1, 1, 1])
+        notifier._cambiar_escucha(False)  # Se cae la escucha: se pueden haber perdido avisos
+        cache.get(None, 1)
+        self.assertEqual(self.cargas, [1, 1, 1, 1])
+
+if __name__ == '__main__':
+    unittest.main()
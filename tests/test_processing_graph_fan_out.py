@@ -0,0 +1,167 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+from sqlalchemy import ARRAY, create_engine, event
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import sessionmaker
+from api.core.database import Base
+from api.models.associations import campaign_characters, story_characters
+from api.models.campaign import Campaign
+from api.models.character import Character, CharacterType
+from api.models.email import Email
+from api.models.player import Player
+from api.models.ruleset import Ruleset
+from api.models.scene import Scene, PhaseType
+from api.models.story import Story
+from ia.langgraph.checkpointer import SQLAlchemySaver
+from ia.langgraph.graphs.processing_graph import ProcessingGraph
+from ia.langgraph.nodes.context_gathering_node import ContextGatheringNode
+from ia.langgraph.nodes.narrative_email_analysis_node import NarrativeEmailAnalysisNode
+from ia.langgraph.nodes.narrative_response_generation_node import NarrativeResponseGenerationNode
+from ia.langgraph.nodes.registry import node_registry
+from ia.langgraph.nodes.rules_validation_node import RulesValidationNode
+
+ESPERA_LLM = 0.3
+
+
+@compiles(ARRAY, "sqlite")
+def _array_en_sqlite(tipo, compilador, **kw):
+    # Email.recipients es un ARRAY de PostgreSQL; en la base de datos de prueba basta con una columna de texto
+    return "TEXT"
+
+
+class ContextoLento:
+    def __call__(self, state):
+        time.sleep(ESPERA_LLM)
+        state['ruleset'] = {'reglas': 'Las acciones arriesgadas requieren tirada.'}
+        state['contexto_usuario'] = {'ultimo_email': state['email_data']['body']}
+        return state
+
+
+class AnalisisLento:
+    def __call__(self, state):
+        time.sleep(ESPERA_LLM)
+        state['intenciones'] = [
+            {'tipo': 'combate', 'bloque': 'Ataco al orco'},
+            {'tipo': 'accion_sencilla', 'bloque': 'Abro la puerta'},
+            {'tipo': 'dialogo', 'bloque': 'Saludo al posadero'},
+        ]
+        state['errors'].append("Error en análisis: de prueba")
+        return state
+
+
+class ValidacionLenta(RulesValidationNode):
+    def __init__(self):
+        pass
+
+    def _validate_intention(self, intencion, reglas, personaje, estado_juego):
+        time.sleep(ESPERA_LLM)
+        return {'intencion_original': intencion, 'valida': True}
+
+
+class Respuesta:
+    def __call__(self, state):
+        state['respuesta_ia'] = f"{len(state['validaciones'])} validaciones"
+        return state
+
+
+class TestProcessingGraphFanOut(unittest.TestCase):
+    def setUp(self):
+        fd, self.ruta = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        self.engine = create_engine(f"sqlite:///{self.ruta}", connect_args={"check_same_thread": False})
+        self.originales = dict(node_registry._instancias)
+        node_registry._instancias.update({
+            ContextGatheringNode: ContextoLento(),
+            NarrativeEmailAnalysisNode: AnalisisLento(),
+            RulesValidationNode: ValidacionLenta(),
+            NarrativeResponseGenerationNode: Respuesta(),
+        })
+        self.grafo = ProcessingGraph.__new__(ProcessingGraph)
+        self.grafo.checkpointer = SQLAlchemySaver(self.engine, crear_tablas=True)
+        self.grafo.graph = self.grafo._build_graph()
+
+    def tearDown(self):
+        node_registry._instancias.clear()
+        node_registry._instancias.update(self.originales)
+        self.engine.dispose()
+        os.remove(self.ruta)
+
+    def test_ramas_independientes_en_paralelo(self):
+        email = SimpleNamespace(id=1, sender="jugador@example.com", recipients=[], subject="Turno", body="Ataco al orco",
+                                thread_id="t1", message_id="m1", campaign_id=1, scene_id=1, player_id=1)
+        estado = self.grafo._build_initial_state(email, None, "narracion")
+        inicio = time.perf_counter()
+        resultado = self.grafo.graph.invoke(estado, {"configurable": {"thread_id": "email_1"}})
+        duracion = time.perf_counter() - inicio
+
+        self.assertEqual(resultado['respuesta_ia'], "2 validaciones")
+        self.assertEqual(sorted(v['intencion_original']['bloque'] for v in resultado['validaciones']),
+                         ['Abro la puerta', 'Ataco al orco'])
+        self.assertEqual(resultado['errors'], ["Error en análisis: de prueba"])
+        # En serie serían 4 esperas (contexto, análisis y dos validaciones); en paralelo, dos
+        self.assertLess(duracion, 3.5 * ESPERA_LLM)
+
+
+class TestRamasConSesionReal(unittest.TestCase):
+    """Contexto y análisis reales en paralelo sobre una base de datos de verdad."""
+
+    def setUp(self):
+        fd, self.ruta = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        self.engine = create_engine(f"sqlite:///{self.ruta}", connect_args={"check_same_thread": False})
+        Base.metadata.create_all(self.engine, tables=[
+            Campaign.__table__, Story.__table__, Scene.__table__, Player.__table__, Character.__table__,
+            Ruleset.__table__, Email.__table__, campaign_characters, story_characters])
+        self.db = sessionmaker(bind=self.engine)()
+        campaign = Campaign(nombre="Noche eterna", nombre_clave="NOCHE", activa=True)
+        self.db.add(campaign)
+        self.db.flush()
+        story = Story(campaign_id=campaign.id, nombre="El puerto", nombre_clave="PUERTO", activa=True)
+        self.db.add(story)
+        self.db.flush()
+        scene = Scene(story_id=story.id, nombre="Muelle", descripcion="Niebla", activa=True, fase_actual=PhaseType.narracion)
+        player = Player(email="ana@example.com", nickname="ana")
+        self.db.add_all([scene, player])
+        self.db.flush()
+        character = Character(player_id=player.id, nombre="Darkcon", tipo=CharacterType.vampiro, hoja_json={}, estado_actual={})
+        character.campaigns.append(campaign)
+        character.stories.append(story)
+        self.db.add(character)
+        self.db.commit()
+        self.ids = SimpleNamespace(campaign=campaign.id, scene=scene.id, player=player.id)
+        self.originales = dict(node_registry._instancias)
+        node_registry._instancias.pop(ContextGatheringNode, None)
+        node_registry._instancias.pop(NarrativeEmailAnalysisNode, None)
+        node_registry._instancias.update({RulesValidationNode: ValidacionLenta(), NarrativeResponseGenerationNode: Respuesta()})
+        self.grafo = ProcessingGraph.__new__(ProcessingGraph)
+        self.grafo.checkpointer = SQLAlchemySaver(self.engine, crear_tablas=True)
+        self.grafo.graph = self.grafo._build_graph()
+
+    def tearDown(self):
+        node_registry._instancias.clear()
+        node_registry._instancias.update(self.originales)
+        self.db.close()
+        self.engine.dispose()
+        os.remove(self.ruta)
+
+    def test_solo_una_rama_usa_la_sesion_del_email(self):
+        hilos = set()
+        event.listen(self.db, "do_orm_execute", lambda contexto: hilos.add(threading.get_ident()))
+        email = SimpleNamespace(id=1, sender="ana@example.com", recipients=[], subject="[NOCHE](PUERTO) Turno",
+                                body="Saco mi cuchillo", thread_id="t1", message_id="m1",
+                                campaign_id=self.ids.campaign, scene_id=self.ids.scene, player_id=self.ids.player)
+        estado = self.grafo._build_initial_state(email, self.db, PhaseType.narracion)
+        resultado = self.grafo.graph.invoke(estado, self.grafo._config("email_1", self.db))
+
+        self.assertEqual(resultado['errors'], [])
+        self.assertEqual(resultado['nombre_personaje_email'], "Darkcon")  # Rama de análisis, con su propia sesión
+        self.assertEqual(resultado['nombre_personajes_pj'], ["Darkcon"])  # Rama de contexto, con la sesión del email
+        self.assertEqual(len(hilos), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,24 @@
+import time
+import unittest
+from utils.rate_limit import TokenBucket
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_rafaga_y_tasa_sostenida(self):
+        bucket = TokenBucket(tasa=50, capacidad=5)
+        self.assertTrue(all(bucket.try_acquire() for _ in range(5)))
+        self.assertFalse(bucket.try_acquire())
+        inicio = time.monotonic()
+        for _ in range(5):
+            bucket.acquire()
+        # 5 tokens a 50/s necesitan ~0.1s
+        self.assertGreaterEqual(time.monotonic() - inicio, 0.08)
+
+    def test_timeout(self):
+        bucket = TokenBucket(tasa=1, capacidad=1)
+        bucket.acquire()
+        self.assertFalse(bucket.acquire(timeout=0.01))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import threading
+import time
+import unittest
+from collections import defaultdict
+from api.core.notifications import Notifier
+from jobs.scene_worker_pool import SceneWorkerPool
+
+
+class TestSceneWorkerPool(unittest.TestCase):
+    def setUp(self):
+        self.pendientes = {1: [10, 11, 12], 2: [20, 21], 3: [30]}
+        self.orden = defaultdict(list)
+        self.activos_por_escena = defaultdict(int)
+        self.max_simultaneos_por_escena = 0
+        self.activos = 0
+        self.max_activos = 0
+        self.lock = threading.Lock()
+
+    def listar(self):
+        with self.lock:
+            return [s for s, emails in self.pendientes.items() if emails]
+
+    def procesar(self, scene_id):
+        with self.lock:
+            if not self.pendientes[scene_id]:
+                return False
+            self.activos += 1
+            self.activos_por_escena[scene_id] += 1
+            self.max_activos = max(self.max_activos, self.activos)
+            self.max_simultaneos_por_escena = max(self.max_simultaneos_por_escena, self.activos_por_escena[scene_id])
+        time.sleep(0.02)
+        with self.lock:
+            self.orden[scene_id].append(self.pendientes[scene_id].pop(0))
+            self.activos -= 1
+            self.activos_por_escena[scene_id] -= 1
+        return True
+
+    def test_paralelo_entre_escenas_y_ordenado_dentro(self):
+        pool = SceneWorkerPool(self.procesar, self.listar, max_concurrencia=2)
+        pool.drenar(timeout=5)
+        pool.shutdown()
+        self.assertEqual(self.orden, {1: [10, 11, 12], 2: [20, 21], 3: [30]})
+        self.assertEqual(self.max_simultaneos_por_escena, 1)
+        self.assertEqual(self.max_activos, 2)
+        self.assertEqual(pool.procesados, 6)
+
+    def test_escena_con_error_entra_en_enfriamiento(self):
+        llamadas = []
+
+        def falla(scene_id):
+            llamadas.append(scene_id)
+            raise RuntimeError("LLM caído")
+
+        pool = SceneWorkerPool(falla, lambda: [1], max_concurrencia=1, enfriamiento=60)
+        pool.drenar(timeout=1)
+        pool.planificar()
+        pool.shutdown()
+        self.assertEqual(llamadas, [1])
+
+    def test_notificacion_despierta_la_espera(self):
+        notifier = Notifier("pruebas")
+        pool = SceneWorkerPool(self.procesar, self.listar, max_concurrencia=1, notifier=notifier)
+        threading.Timer(0.05, notifier.notify).start()
+        inicio = time.monotonic()
+        self.assertTrue(pool.esperar(5))
+        self.assertLess(time.monotonic() - inicio, 1)
+        pool.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import asyncio
+import json
+import unittest
+from unittest import mock
+from langchain_core.messages import AIMessage, AIMessageChunk
+from ia.ia_client import IAClient
+from ia.langgraph.nodes.narrative_response_generation_node import NarrativeResponseGenerationNode, recortar_a_frase_completa
+from ia.token_metering import medidor_tokens
+from utils.json_stream import ParserJSONIncremental
+
+RESPUESTA = json.dumps({
+    "fecha_y_lugar": "Noche, la posada",
+    "cuerpo_mensaje": "El guardia se gira y ve el \"cuchillo\".",
+    "cambio_estado": False,
+    "estado_actual_personaje": [{"nombre": "Aria", "cambios": []}],
+}, ensure_ascii=False)
+
+
+class LLMEnStreaming:
+    """Devuelve la respuesta en fragmentos de 8 caracteres y cuenta cuántos se han llegado a generar."""
+
+    def __init__(self, respuesta=RESPUESTA):
+        self.respuesta = respuesta
+        self.generados = 0
+
+    def _fragmentos(self):
+        return [self.respuesta[i:i + 8] for i in range(0, len(self.respuesta), 8)]
+
+    async def ainvoke(self, mensajes, **kwargs):
+        return AIMessage(content="Respuesta en texto libre.")
+
+    def stream(self, mensajes, **kwargs):
+        for fragmento in self._fragmentos():
+            self.generados += 1
+            yield AIMessageChunk(content=fragmento)
+
+    async def astream(self, mensajes, **kwargs):
+        for fragmento in self._fragmentos():
+            self.generados += 1
+            yield AIMessageChunk(content=fragmento)
+
+
+class TestStreamingResponse(unittest.TestCase):
+    def setUp(self):
+        self.llm = LLMEnStreaming()
+        self.cliente = IAClient(perfil="creativa")
+        self.cliente.llm = self.llm
+        self.nodo = NarrativeResponseGenerationNode.__new__(NarrativeResponseGenerationNode)
+        self.nodo.ia_client = self.cliente
+        self.persistidos = []
+        parche = mock.patch.object(medidor_tokens, "persistir", lambda *fila: self.persistidos.append(fila))
+        parche.start()
+        self.addCleanup(parche.stop)
+
+    def test_parser_incremental(self):
+        parser = ParserJSONIncremental()
+        completados = []
+        for i in range(0, len(RESPUESTA), 5):
+            completados += parser.alimentar(RESPUESTA[i:i + 5])
+        self.assertEqual(completados, ["fecha_y_lugar", "cuerpo_mensaje", "cambio_estado", "estado_actual_personaje"])
+        self.assertEqual(parser.campos, json.loads(RESPUESTA))
+        self.assertTrue(parser.completo)
+
+    def test_corta_al_completar_cuerpo_mensaje(self):
+        state = {'email_data': {'subject': 'Turno', 'body': 'Ataco', 'sender': 'a@example.com'}}
+        resultado = self.nodo(state)
+        self.assertEqual(resultado['respuesta_ia'], 'El guardia se gira y ve el "cuchillo".')
+        self.assertLess(self.llm.generados, len(self.llm._fragmentos()))
+        self.assertEqual(len(self.persistidos), 1)  # el consumo se registra aunque se corte el stream
+
+    def test_corta_por_longitud_en_la_ultima_frase_completa(self):
+        self.llm.respuesta = json.dumps({
+            "fecha_y_lugar": "Noche",
+            "cuerpo_mensaje": "El guardia se gira. Ve el cuchillo y grita pidiendo ayuda a los demás guardias del puerto.",
+        }, ensure_ascii=False)
+        state = {'email_data': {'subject': 'Turno', 'body': 'Ataco', 'sender': 'a@example.com'}}
+        with mock.patch("ia.langgraph.nodes.narrative_response_generation_node.RESPUESTA_MAX_CARACTERES", 90):
+            resultado = asyncio.run(self.nodo.acall(state))
+        self.assertEqual(resultado['respuesta_ia'], "El guardia se gira.")
+        self.assertTrue(resultado['respuesta_truncada'])
+
+    def test_corta_por_longitud_sin_frase_completa_pide_texto_libre(self):
+        state = {'email_data': {'subject': 'Turno', 'body': 'Ataco', 'sender': 'a@example.com'}}
+        with mock.patch("ia.langgraph.nodes.narrative_response_generation_node.RESPUESTA_MAX_CARACTERES", 70):
+            resultado = asyncio.run(self.nodo.acall(state))
+        self.assertEqual(resultado['respuesta_ia'], "Respuesta en texto libre.")
+        self.assertFalse(resultado['respuesta_truncada'])
+
+    def test_recorta_a_la_ultima_frase_completa(self):
+        self.assertEqual(recortar_a_frase_completa('Cae al suelo. «¡Socorro!» Y luego'), 'Cae al suelo. «¡Socorro!»')
+        self.assertEqual(recortar_a_frase_completa('Mide 1.80 de alto y'), '')
+
+if __name__ == '__main__':
+    unittest.main()
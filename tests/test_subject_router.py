@@ -0,0 +1,76 @@
+import unittest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from api.core.database import Base
+from api.core.cache_versions import bump_version
+from api.models.campaign import Campaign
+from api.models.story import Story
+from api.models.scene import Scene, PhaseType
+from api.models.player import Player
+from api.models.character import Character, CharacterType
+from api.models.turn import Turn
+from api.models.associations import campaign_characters, story_characters
+from services.subject_router import SubjectRouter
+
+
+class TestSubjectRouter(unittest.TestCase):
+    def setUp(self):
+        engine = create_engine("sqlite://")
+        tablas = [Campaign.__table__, Story.__table__, Scene.__table__, Player.__table__,
+                  Character.__table__, Turn.__table__, campaign_characters, story_characters]
+        Base.metadata.create_all(engine, tables=tablas)
+        self.db = sessionmaker(bind=engine)()
+        campaign = Campaign(nombre="Noche eterna", nombre_clave="NOCHE", activa=True)
+        inactiva = Campaign(nombre="Olvidada", nombre_clave="VIEJA", activa=False)
+        self.db.add_all([campaign, inactiva])
+        self.db.flush()
+        story = Story(campaign_id=campaign.id, nombre="El puerto", nombre_clave="PUERTO", activa=True)
+        self.db.add(story)
+        self.db.flush()
+        self.scene = Scene(story_id=story.id, nombre="Muelle", descripcion="Niebla", activa=True, fase_actual=PhaseType.narracion)
+        player = Player(email="ana@example.com", nickname="ana")
+        self.db.add_all([self.scene, player])
+        self.db.flush()
+        self.character = Character(player_id=player.id, nombre="Darkcon", tipo=CharacterType.vampiro, hoja_json={}, estado_actual={})
+        self.character.campaigns.append(campaign)
+        self.db.add(self.character)
+        self.db.commit()
+        self.campaign, self.story, self.player = campaign, story, player
+        self.router = SubjectRouter()
+        self.router.ensure_fresh(self.db)
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_resuelve_ruta_completa(self):
+        ruta, motivo = self.router.route("[NOCHE](PUERTO) Bajo al muelle", "Ana <ana@example.com>")
+        self.assertEqual(motivo, "")
+        self.assertEqual(ruta.campaign_id, self.campaign.id)
+        self.assertEqual(ruta.story_id, self.story.id)
+        self.assertEqual(ruta.scene_id, self.scene.id)
+        self.assertEqual(ruta.player_id, self.player.id)
+        self.assertEqual(ruta.character_id, self.character.id)
+
+    def test_ignora_asuntos_sin_partida(self):
+        self.assertIsNone(self.router.route("Oferta especial", "ana@example.com")[0])
+        self.assertIsNone(self.router.route("[VIEJA](PUERTO) hola", "ana@example.com")[0])
+        self.assertIsNone(self.router.route("[NOCHE](OTRA) hola", "ana@example.com")[0])
+        self.assertIsNone(self.router.route("[NOCHE](PUERTO) hola", "desconocido@example.com")[0])
+
+    def test_se_reconstruye_al_cambiar_la_version(self):
+        nuevo = Player(email="luis@example.com", nickname="luis")
+        self.db.add(nuevo)
+        self.db.commit()
+        self.router.ensure_fresh(self.db)
+        self.assertEqual(self.router.route("[NOCHE](PUERTO) hola", "luis@example.com")[1],
+                         "remitente no registrado como jugador")
+        self.character.player_id = nuevo.id
+        self.db.commit()
+        bump_version("routing")
+        self.router.ensure_fresh(self.db)
+        ruta, _ = self.router.route("[NOCHE](PUERTO) hola", "luis@example.com")
+        self.assertEqual(ruta.character_id, self.character.id)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+from types import SimpleNamespace
+from langchain_core.messages import HumanMessage, SystemMessage
+from ia.token_metering import MedidorTokens, PresupuestoAgotado, atribuir_consumo
+
+
+class TestMedidorTokens(unittest.TestCase):
+    def setUp(self):
+        self.consumo = {1: 900, 2: 0}
+        self.presupuestos = {1: 1000, 2: None}
+        self.filas = []
+        self.cargas = 0
+        self.medidor = MedidorTokens(self.cargar, self.filas_append, presupuesto_por_defecto=0)
+
+    def cargar(self, campaign_id, desde):
+        self.cargas += 1
+        return self.consumo[campaign_id], self.presupuestos[campaign_id]
+
+    def filas_append(self, *fila):
+        self.filas.append(fila)
+
+    def test_atribuye_el_consumo_y_usa_los_metadatos_de_la_respuesta(self):
+        respuesta = SimpleNamespace(content="Hola", usage_metadata={"input_tokens": 120, "output_tokens": 30})
+        with atribuir_consumo(2, scene_id=7):
+            self.medidor.registrar("precisa", [HumanMessage(content="x")], respuesta)
+        self.medidor.registrar("precisa", [HumanMessage(content="x")], respuesta)
+        self.assertEqual(self.filas, [("precisa", 120, 30, 2, None, 7), ("precisa", 120, 30, None, None, None)])
+
+    def test_sin_metadatos_estima_con_tiktoken(self):
+        respuesta = SimpleNamespace(content="El orco cae al suelo.", usage_metadata=None)
+        prompt, completion = self.medidor.registrar(
+            "neutral", [SystemMessage(content="Eres el narrador."), HumanMessage(content="Ataco al orco")], respuesta)
+        self.assertGreater(prompt, 0)
+        self.assertGreater(completion, 0)
+
+    def test_presupuesto_agotado_degrada_el_perfil(self):
+        medidor = MedidorTokens(self.cargar, self.filas_append, presupuesto_por_defecto=0,
+                                perfiles_economicos={"creativa": "creativa_economica", "resumen": "resumen_economico"})
+        with atribuir_consumo(1):
+            self.assertEqual(medidor.perfil_para("creativa"), "creativa")
+            # El consumo local se suma al leído de la base de datos sin volver a consultarla
+            respuesta = SimpleNamespace(content="", usage_metadata={"input_tokens": 80, "output_tokens": 20})
+            medidor.registrar("creativa", [], respuesta)
+            self.assertEqual(medidor.perfil_para("creativa"), "creativa_economica")
+            self.assertEqual(medidor.perfil_para("resumen"), "resumen_economico")
+            self.assertEqual(medidor.perfil_para("clasificacion"), "clasificacion")
+        self.assertEqual(self.cargas, 1)
+        self.assertEqual(medidor.perfil_para("creativa"), "creativa")  # sin campaña no hay presupuesto
+        with atribuir_consumo(2):
+            self.assertEqual(medidor.perfil_para("creativa"), "creativa")  # 0 = sin límite
+
+    def test_sin_despliegue_economico_no_degrada(self):
+        self.consumo[1] = 1000
+        with atribuir_consumo(1):
+            self.assertEqual(self.medidor.perfil_para("creativa"), "creativa")
+
+    def test_corta_las_llamadas_al_superar_el_margen(self):
+        medidor = MedidorTokens(self.cargar, self.filas_append, presupuesto_por_defecto=0, margen_corte=0.1)
+        self.consumo[1] = 1099
+        with atribuir_consumo(1):
+            self.assertEqual(medidor.perfil_para("creativa"), "creativa")
+            medidor.registrar("creativa", [], SimpleNamespace(content="", usage_metadata={"input_tokens": 1, "output_tokens": 0}))
+            with self.assertRaises(PresupuestoAgotado):
+                medidor.perfil_para("clasificacion")
+        self.assertTrue(medidor.bloqueada(1))
+
+    def test_sin_margen_nunca_corta(self):
+        self.consumo[1] = 10000
+        with atribuir_consumo(1):
+            self.assertEqual(self.medidor.perfil_para("creativa"), "creativa")
+        self.assertFalse(self.medidor.bloqueada(1))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+# Lectura incremental de un objeto JSON que llega por fragmentos
+"""
+Permite usar los campos de la respuesta JSON del LLM en cuanto se han generado, sin esperar al final:
+cada fragmento del stream se añade con alimentar() y los campos de primer nivel cuyo valor ya está
+completo aparecen en `campos`. Lo que haya antes de la primera llave (p. ej. un bloque ```json) se ignora.
+"""
+import json
+from typing import Any, Dict, List, Optional
+
+
+class ParserJSONIncremental:
+    """Extrae los campos de primer nivel de un objeto JSON a medida que se completan."""
+
+    def __init__(self):
+        self.texto = ""
+        self.campos: Dict[str, Any] = {}
+        self.completo = False  # Se ha cerrado la llave del objeto
+        self._pos = 0
+        self._profundidad = 0
+        self._en_cadena = False
+        self._escape = False
+        self._fase = "clave"  # clave -> dos_puntos -> valor -> coma (solo en el primer nivel)
+        self._inicio_clave = None
+        self._clave = None
+        self._inicio_valor = None
+
+    def alimentar(self, fragmento: str) -> List[str]:
+        """Añade un fragmento y devuelve los campos que se han completado con él."""
+        self.texto += fragmento
+        completados = []
+        texto = self.texto
+        for i in range(self._pos, len(texto)):
+            if self.completo:
+                break
+            c = texto[i]
+            if self._en_cadena:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._en_cadena = False
+                    if self._profundidad == 1 and self._fase == "clave":
+                        self._clave = json.loads(texto[self._inicio_clave:i + 1])
+                        self._fase = "dos_puntos"
+                    elif self._profundidad == 1 and self._fase == "valor":
+                        self._cerrar_valor(i + 1, completados)
+                continue
+            if self._profundidad == 0:
+                if c == "{":
+                    self._profundidad = 1
+                continue
+            if c == '"':
+                self._en_cadena = True
+                if self._profundidad == 1 and self._fase == "clave":
+                    self._inicio_clave = i
+                elif self._profundidad == 1 and self._fase == "valor":
+                    self._inicio_valor = i
+            elif c in "{[":
+                if self._profundidad == 1 and self._fase == "valor":
+                    self._inicio_valor = i
+                self._profundidad += 1
+            elif c in "}]":
+                self._profundidad -= 1
+                if self._profundidad == 1:
+                    self._cerrar_valor(i + 1, completados)
+                elif self._profundidad == 0:
+                    if self._fase == "valor" and self._inicio_valor is not None:
+                        self._cerrar_valor(i, completados)
+                    self.completo = True
+            elif self._profundidad == 1:
+                if c == ":" and self._fase == "dos_puntos":
+                    self._fase = "valor"
+                    self._inicio_valor = None
+                elif c == ",":
+                    if self._fase == "valor" and self._inicio_valor is not None:
+                        self._cerrar_valor(i, completados)
+                    self._fase = "clave"
+                elif not c.isspace() and self._fase == "valor" and self._inicio_valor is None:
+                    self._inicio_valor = i  # número, true, false o null
+        self._pos = len(texto)
+        return completados
+
+    def _cerrar_valor(self, fin: int, completados: List[str]):
+        try:
+            self.campos[self._clave] = json.loads(self.texto[self._inicio_valor:fin])
+            completados.append(self._clave)
+        except ValueError:
+            pass  # Valor mal formado: el campo no se da por completado
+        self._fase = "coma"
+        self._inicio_valor = None
+
+    def tiene(self, *claves: str) -> bool:
+        """True si todos los campos indicados están completos."""
+        return all(clave in self.campos for clave in claves)
+
+    def valor_parcial(self, clave: str) -> Optional[str]:
+        """Texto recibido hasta ahora del campo de tipo cadena que se está generando (None si no es ese campo)."""
+        if clave in self.campos:
+            valor = self.campos[clave]
+            return valor if isinstance(valor, str) else None
+        if not (self._en_cadena and self._profundidad == 1 and self._fase == "valor" and self._clave == clave):
+            return None
+        parcial = self.texto[self._inicio_valor + 1:]
+        if self._escape:
+            parcial = parcial[:-1]
+        for corte in range(6):  # Un escape \uXXXX puede haber quedado a medias
+            try:
+                return json.loads('"' + parcial[:len(parcial) - corte] + '"')
+            except ValueError:
+                continue
+        return None
@@ -0,0 +1,252 @@
+# Métricas de procesamiento en formato de texto de Prometheus
+"""
+Registro de métricas en memoria del proceso, sin dependencias externas:
+- Contador: valor que solo crece (emails procesados, tokens, fallos).
+- Indicador: valor instantáneo (profundidad de la cola, emails por minuto).
+- Histograma: distribución por buckets (latencia de cada nodo del grafo y de cada llamada al LLM).
+Todas admiten etiquetas. RegistroMetricas.exportar() genera el formato de exposición de texto de Prometheus
+que sirve GET /metrics (api/endpoints/metrics.py).
+"""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+LATENCIA_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _formatear_valor(valor: float) -> str:
+    if valor == float("inf"):
+        return "+Inf"
+    return repr(float(valor)) if not float(valor).is_integer() else str(int(valor))
+
+
+def _formatear_etiquetas(nombres: Sequence[str], valores: Sequence[str], extra: Tuple[str, str] = None) -> str:
+    pares = list(zip(nombres, valores))
+    if extra:
+        pares.append(extra)
+    if not pares:
+        return ""
+    escapar = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{nombre}="{escapar(valor)}"' for nombre, valor in pares) + "}"
+
+
+class _Metrica:
+    tipo = ""
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = ()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def _clave(self, etiquetas: Dict[str, str]) -> Tuple[str, ...]:
+        if set(etiquetas) != set(self.etiquetas):
+            raise ValueError(f"La métrica {self.nombre} espera las etiquetas {self.etiquetas}, recibidas {tuple(etiquetas)}")
+        return tuple(str(etiquetas[nombre]) for nombre in self.etiquetas)
+
+    def _muestras(self):
+        raise NotImplementedError
+
+    def exportar(self) -> str:
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} {self.tipo}"]
+        lineas.extend(self._muestras())
+        return "\n".join(lineas)
+
+
+class Contador(_Metrica):
+    tipo = "counter"
+
+    def inc(self, valor: float = 1, **etiquetas):
+        if valor < 0:
+            raise ValueError("Un contador solo puede incrementarse")
+        clave = self._clave(etiquetas)
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0) + valor
+
+    def valor(self, **etiquetas) -> float:
+        with self._lock:
+            return self._valores.get(self._clave(etiquetas), 0)
+
+    def _muestras(self):
+        with self._lock:
+            valores = dict(self._valores)
+        return [f"{self.nombre}{_formatear_etiquetas(self.etiquetas, clave)} {_formatear_valor(valor)}"
+                for clave, valor in sorted(valores.items())]
+
+
+class Indicador(_Metrica):
+    """Valor instantáneo. Con funcion (solo sin etiquetas) el valor se calcula al exportar."""
+    tipo = "gauge"
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = (), funcion: Callable[[], float] = None):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.funcion = funcion
+
+    def set(self, valor: float, **etiquetas):
+        clave = self._clave(etiquetas)
+        with self._lock:
+            self._valores[clave] = valor
+
+    def valor(self, **etiquetas) -> Optional[float]:
+        if self.funcion is not None:
+            return self.funcion()
+        with self._lock:
+            return self._valores.get(self._clave(etiquetas))
+
+    def _muestras(self):
+        if self.funcion is not None:
+            return [f"{self.nombre} {_formatear_valor(self.funcion())}"]
+        with self._lock:
+            valores = dict(self._valores)
+        return [f"{self.nombre}{_formatear_etiquetas(self.etiquetas, clave)} {_formatear_valor(valor)}"
+                for clave, valor in sorted(valores.items())]
+
+
+class Histograma(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = (), buckets: Sequence[float] = LATENCIA_BUCKETS):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, valor: float, **etiquetas):
+        clave = self._clave(etiquetas)
+        with self._lock:
+            conteos, suma, total = self._valores.get(clave) or ([0] * len(self.buckets), 0.0, 0)
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    conteos[i] += 1
+            self._valores[clave] = (conteos, suma + valor, total + 1)
+
+    @contextmanager
+    def cronometrar(self, **etiquetas):
+        """Observa la duración del bloque en segundos (también si lanza una excepción)."""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - inicio, **etiquetas)
+
+    def total(self, **etiquetas) -> int:
+        with self._lock:
+            entrada = self._valores.get(self._clave(etiquetas))
+        return entrada[2] if entrada else 0
+
+    def _muestras(self):
+        with self._lock:
+            valores = {clave: (list(conteos), suma, total) for clave, (conteos, suma, total) in self._valores.items()}
+        lineas = []
+        for clave, (conteos, suma, total) in sorted(valores.items()):
+            for limite, conteo in zip(self.buckets, conteos):
+                etiquetas = _formatear_etiquetas(self.etiquetas, clave, ("le", _formatear_valor(limite)))
+                lineas.append(f"{self.nombre}_bucket{etiquetas} {conteo}")
+            etiquetas = _formatear_etiquetas(self.etiquetas, clave)
+            lineas.append(f"{self.nombre}_sum{etiquetas} {_formatear_valor(suma)}")
+            lineas.append(f"{self.nombre}_count{etiquetas} {total}")
+        return lineas
+
+
+class RitmoPorMinuto:
+    """Eventos registrados en el último minuto (ventana deslizante)."""
+
+    def __init__(self, ventana_segundos: float = 60):
+        self.ventana_segundos = ventana_segundos
+        self._eventos = deque()
+        self._lock = threading.Lock()
+
+    def registrar(self, cantidad: int = 1):
+        with self._lock:
+            self._eventos.append((time.monotonic(), cantidad))
+
+    def por_minuto(self) -> float:
+        limite = time.monotonic() - self.ventana_segundos
+        with self._lock:
+            while self._eventos and self._eventos[0][0] < limite:
+                self._eventos.popleft()
+            total = sum(cantidad for _, cantidad in self._eventos)
+        return total * 60 / self.ventana_segundos
+
+
+class RegistroMetricas:
+    """Conjunto de métricas del proceso, en el orden en que se registran."""
+
+    def __init__(self):
+        self._metricas = {}
+        self._lock = threading.Lock()
+
+    def _registrar(self, metrica: _Metrica) -> _Metrica:
+        with self._lock:
+            if metrica.nombre in self._metricas:
+                raise ValueError(f"Métrica duplicada: {metrica.nombre}")
+            self._metricas[metrica.nombre] = metrica
+        return metrica
+
+    def contador(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = ()) -> Contador:
+        return self._registrar(Contador(nombre, ayuda, etiquetas))
+
+    def indicador(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = (), funcion: Callable[[], float] = None) -> Indicador:
+        return self._registrar(Indicador(nombre, ayuda, etiquetas, funcion))
+
+    def histograma(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = (), buckets: Sequence[float] = LATENCIA_BUCKETS) -> Histograma:
+        return self._registrar(Histograma(nombre, ayuda, etiquetas, buckets))
+
+    def exportar(self) -> str:
+        """Todas las métricas en el formato de texto de Prometheus (versión 0.0.4)."""
+        with self._lock:
+            metricas = list(self._metricas.values())
+        return "\n".join(metrica.exportar() for metrica in metricas) + "\n"
+
+
+# Registro global y métricas del procesamiento de emails
+metricas = RegistroMetricas()
+ritmo_emails = RitmoPorMinuto()
+
+EMAILS_PENDIENTES = metricas.indicador(
+    "aimailrol_email_queue_depth", "Emails pendientes de procesar (se calcula en cada lectura de /metrics)")
+EMAILS_PROCESADOS = metricas.contador(
+    "aimailrol_emails_processed_total", "Emails procesados por resultado", ["resultado"])
+EMAILS_POR_MINUTO = metricas.indicador(
+    "aimailrol_emails_per_minute", "Emails procesados con éxito en el último minuto", funcion=ritmo_emails.por_minuto)
+LATENCIA_NODOS = metricas.histograma(
+    "aimailrol_node_latency_seconds", "Duración de cada nodo del grafo de procesamiento", ["nodo"])
+LLM_LATENCIA = metricas.histograma(
+    "aimailrol_llm_latency_seconds", "Duración de las llamadas al LLM por perfil", ["perfil"])
+LLM_LLAMADAS = metricas.contador(
+    "aimailrol_llm_requests_total", "Llamadas al LLM por perfil y resultado", ["perfil", "resultado"])
+LLM_TOKENS = metricas.contador(
+    "aimailrol_llm_tokens_total", "Tokens consumidos por perfil y tipo (prompt o completion)", ["perfil", "tipo"])
+LLM_CACHE = metricas.contador(
+    "aimailrol_llm_cache_total", "Consultas a la caché de respuestas del LLM por perfil y resultado (hit o miss)",
+    ["perfil", "resultado"])
+LLM_DEGRADADAS = metricas.contador(
+    "aimailrol_llm_budget_downgrades_total", "Llamadas al LLM degradadas a un perfil más barato por presupuesto agotado",
+    ["perfil", "perfil_degradado"])
+LLM_BLOQUEADAS = metricas.contador(
+    "aimailrol_llm_budget_blocked_total",
+    "Llamadas al LLM rechazadas por superar el presupuesto de tokens de la campaña más el margen", ["perfil"])
+LLM_REINTENTOS = metricas.contador(
+    "aimailrol_llm_retries_total", "Reintentos de llamadas al LLM por perfil y motivo (rate_limit o error)",
+    ["perfil", "motivo"])
+LLM_CONCURRENCIA = metricas.indicador(
+    "aimailrol_llm_concurrency_limit", "Límite actual de llamadas simultáneas al LLM (concurrencia adaptativa)")
+LLM_CIRCUITO = metricas.indicador(
+    "aimailrol_llm_circuit_open", "Estado del circuit breaker del LLM (0 cerrado, 1 abierto, 0.5 semiabierto)")
+
+
+def registrar_emails_procesados(cantidad: int, exito: bool):
+    """Cuenta emails procesados (o descartados por error) tras cerrar su transacción."""
+    EMAILS_PROCESADOS.inc(cantidad, resultado="ok" if exito else "error")
+    if exito:
+        ritmo_emails.registrar(cantidad)
+
+
+def registrar_llamada_llm(perfil: str, segundos: float, uso: Optional[Dict[str, int]] = None, error: bool = False):
+    """Latencia, resultado y tokens (usage_metadata de la respuesta de LangChain) de una llamada al LLM."""
+    LLM_LATENCIA.observe(segundos, perfil=perfil)
+    LLM_LLAMADAS.inc(perfil=perfil, resultado="error" if error else "ok")
+    if uso:
+        LLM_TOKENS.inc(uso.get("input_tokens", 0), perfil=perfil, tipo="prompt")
+        LLM_TOKENS.inc(uso.get("output_tokens", 0), perfil=perfil, tipo="completion")
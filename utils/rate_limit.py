@@ -0,0 +1,66 @@
+# Limitador de tasa tipo token bucket
+import asyncio
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Token bucket thread-safe: admite ráfagas de hasta `capacidad` operaciones
+    y una tasa sostenida de `tasa` operaciones por segundo.
+    """
+
+    def __init__(self, tasa: float, capacidad: float = None):
+        self.tasa = float(tasa)
+        self.capacidad = float(capacidad if capacidad is not None else max(1.0, tasa))
+        self._tokens = self.capacidad
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _rellenar(self):
+        ahora = time.monotonic()
+        self._tokens = min(self.capacidad, self._tokens + (ahora - self._ultimo) * self.tasa)
+        self._ultimo = ahora
+
+    def _reservar(self, tokens: float) -> float:
+        """Consume tokens si hay disponibles (devuelve 0) o devuelve los segundos que faltan para tenerlos."""
+        with self._lock:
+            self._rellenar()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.tasa
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """Consume tokens si hay disponibles, sin esperar."""
+        return self._reservar(tokens) == 0
+
+    def acquire(self, tokens: float = 1.0, timeout: float = None) -> bool:
+        """
+        Espera hasta poder consumir tokens. Devuelve False si se agota el timeout.
+        """
+        limite = None if timeout is None else time.monotonic() + timeout
+        while True:
+            espera = self._reservar(tokens)
+            if espera == 0:
+                return True
+            if limite is not None:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    return False
+                espera = min(espera, restante)
+            time.sleep(espera)
+
+    async def aacquire(self, tokens: float = 1.0, timeout: float = None) -> bool:
+        """Versión asíncrona de acquire: espera con asyncio.sleep sin bloquear el bucle de eventos."""
+        limite = None if timeout is None else time.monotonic() + timeout
+        while True:
+            espera = self._reservar(tokens)
+            if espera == 0:
+                return True
+            if limite is not None:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    return False
+                espera = min(espera, restante)
+            await asyncio.sleep(espera)
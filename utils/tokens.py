@@ -0,0 +1,45 @@
+# Utilidad para estimar tokens con tiktoken
+import time
+import tiktoken
+from utils.env_loader import get_env_variable
+
+TIKTOKEN_ENCODING = get_env_variable("TIKTOKEN_ENCODING", "o200k_base")
+# Tras un fallo al cargar la codificación (p. ej. sin red) no se reintenta hasta pasados estos segundos
+TIKTOKEN_RETRY_SECONDS = float(get_env_variable("TIKTOKEN_RETRY_SECONDS", "300"))
+
+_codificaciones = {}
+_fallos = {}  # nombre -> instante (monotonic) del último fallo al cargarla
+
+
+def _get_encoding(nombre: str):
+    """
+    Carga la codificación una sola vez. Si no está disponible devuelve None y no se reintenta
+    durante TIKTOKEN_RETRY_SECONDS, así un fallo transitorio no desactiva el conteo para siempre.
+    """
+    codificacion = _codificaciones.get(nombre)
+    if codificacion is not None:
+        return codificacion
+    fallo = _fallos.get(nombre)
+    if fallo is not None and time.monotonic() - fallo < TIKTOKEN_RETRY_SECONDS:
+        return None
+    try:
+        codificacion = tiktoken.get_encoding(nombre)
+    except Exception:
+        _fallos[nombre] = time.monotonic()
+        return None
+    _codificaciones[nombre] = codificacion
+    _fallos.pop(nombre, None)
+    return codificacion
+
+
+def count_tokens(texto: str, encoding: str = None) -> int:
+    """
+    Cuenta los tokens de un texto con tiktoken.
+    Si la codificación no está disponible (p. ej. sin red para descargarla), estima ~4 caracteres por token.
+    """
+    if not texto:
+        return 0
+    codificacion = _get_encoding(encoding or TIKTOKEN_ENCODING)
+    if codificacion is None:
+        return max(1, len(texto) // 4)
+    return len(codificacion.encode(texto, disallowed_special=()))